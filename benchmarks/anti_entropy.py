@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede o custo da sincronização das chaves entre vizinhos (src/merkle.py) em função do número de chaves diferentes.
+#
+#  Sobe um Rendezvous e dois peers neste processo (via UDP em 127.0.0.1), A e o seu sucessor B, com os logs em um diretório
+#  temporário. Para cada N e d, B guarda N chaves da faixa de A, e A guarda as mesmas chaves menos d delas (ex.: escritas que B recebeu
+#  enquanto A estava fora da DHT). Os armazenamentos são preenchidos diretamente, e então A sincroniza a faixa com B (ver
+#  peer.Peer.syncRange()). São impressos o número de chaves trazidas, as requisições feitas por A, os bytes enviados pelos dois peers,
+#  o tempo, e, para comparação, o tamanho de uma listagem de todas as chaves da faixa (chave + hash de 8 bytes por chave).
+#
+#  Uso: python benchmarks/anti_entropy.py [N[,N...]] [d[,d...]] [tamanho_do_valor]
+
+import os, sys, threading, time, tempfile, shutil
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import merkle
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 24000
+
+## O número máximo de nós da DHT.
+K = 2**20
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def startPeer(port, directory):
+    peer = Peer(('127.0.0.1', port), ('127.0.0.1', BASE_PORT), True, False, os.path.join(directory, 'dht-%d.log' % port))
+    thread = threading.Thread(target=peer.run)
+    thread.daemon = True
+    thread.start()
+    while peer.nextAddress is None:
+        time.sleep(0.01)
+    return peer
+
+def sent(peers):
+    return sum(peer.metrics.bytesSent for peer in peers)
+
+def run(A, B, keys, d, value):
+    storeA, storeB = A.openStore(), B.openStore()
+    for key in storeA.keys():
+        storeA.delete(key)
+    for key in keys:
+        storeB.put(key, value)
+    for key in keys[d:]:
+        storeA.put(key, value)
+
+    requests = sum(A.metrics.sent[name] for name in merkle.REQUESTS)
+    bytesBefore = sent((A, B))
+    start = time.time()
+    fetched = A.syncRange(B.address)
+    seconds = time.time() - start
+
+    missing = len([key for key in keys if storeA.get(key) == None])
+    left = len([key for key in keys if storeB.get(key) != None])
+    return (fetched, sum(A.metrics.sent[name] for name in merkle.REQUESTS) - requests, sent((A, B)) - bytesBefore, seconds * 1000,
+            sum(len(key) + 8 for key in keys), missing, left)
+
+def main(sizes, diffs, valueSize):
+    merkle.SYNC_INTERVAL = 1e9 # apenas as sincronizações feitas pelo benchmark
+    directory = tempfile.mkdtemp()
+    try:
+        rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), K, 1)
+        thread = threading.Thread(target=rendezvous.run)
+        thread.daemon = True
+        thread.start()
+
+        peers = [startPeer(BASE_PORT + 1, directory), startPeer(BASE_PORT + 2, directory)]
+        while peers[0].nextAddress != peers[1].address or peers[1].nextAddress != peers[0].address:
+            time.sleep(0.1)
+        time.sleep(1.0)
+        A, B = peers # com dois peers, cada um é o sucessor do outro
+
+        value = 'v' * valueSize
+        print >>results, 'tree: %d leaves (branching %d), value size %d bytes' % (merkle.LEAVES, merkle.BRANCHING, valueSize)
+        print >>results, '%7s %6s | %7s %8s %10s %9s | %12s | %7s %5s' % ('N', 'd', 'fetched', 'requests', 'bytes', 'ms', 'full listing',
+                                                                         'missing', 'left')
+        for N in sizes:
+            keys = []
+            i = 0
+            while len(keys) < N:
+                key = 'key-%d' % i
+                if A.isResponsible(A.hashKey(key)):
+                    keys.append(key)
+                i += 1
+
+            for d in diffs:
+                if d > N:
+                    continue
+                print >>results, '%7d %6d | %7d %8d %10d %9.1f | %12d | %7d %5d' % ((N, d) + run(A, B, keys, d, value))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    if len(sys.argv) <= 4:
+        sys.stdout = open(os.devnull, 'w')
+        main([int(N) for N in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1000, 10000, 100000],
+             [int(d) for d in sys.argv[2].split(',')] if len(sys.argv) > 2 else [0, 1, 10, 100, 1000],
+             int(sys.argv[3]) if len(sys.argv) > 3 else 100)
+    else:
+        print >>sys.stderr, 'usage: anti_entropy.py [N[,N...]] [d[,d...]] [value_size]'
+        sys.exit(1)
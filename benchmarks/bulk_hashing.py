@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Compara o cálculo dos hashes e dos responsáveis chave a chave com o cálculo em lote de partition.py.
+#
+#  O caminho chave a chave usa common.hashKey() e, para o responsável, uma busca binária nos IDs do anel (como um peer faria com uma
+#  cópia do anel). O cálculo em lote usa partition.hashKeys() e partition.RingSnapshot.ownerIndexes(), com o NumPy (caso esteja
+#  instalado) e com as listas usadas sem ele. Os resultados dos dois caminhos são comparados, e a vazão é impressa em chaves por segundo.
+#
+#  Uso: python benchmarks/bulk_hashing.py chaves K opção [N]
+
+import os, sys, time, random, bisect
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common, partition
+
+def measure(label, function, count, baseline = None):
+    start = time.time()
+    result = function()
+    seconds = time.time() - start
+    print '%-34s %10.0f keys/s%s' % (label, count / seconds, '' if baseline == None else '  (%.1fx)' % (baseline / seconds))
+    return result, seconds
+
+def main(count, K, method, N):
+    keys = ['key-%d' % i for i in range(count)]
+    positions = random.sample(xrange(K + 1), min(N, K + 1))
+    snapshot = partition.RingSnapshot([position if method == 1 else 2**position for position in positions],
+                                      [('127.0.0.1', 3000 + i) for i in range(len(positions))], K, method)
+    print 'K=%d method=%d keys=%d peers=%d numpy=%s' % (K, method, count, len(snapshot.ids), partition.numpy != None)
+
+    hashes, hashSeconds = measure('per-key hashKey', lambda: [common.hashKey(key, K, method) for key in keys], count)
+    owners, ownerSeconds = measure('per-key hashKey + owner', lambda: [bisect.bisect_left(snapshot.ids, common.hashKey(key, K, method)) % len(snapshot.ids)
+                                                                       for key in keys], count)
+
+    backends = [('numpy', partition.numpy)] if partition.numpy != None else []
+    for name, module in backends + [('lists', None)]:
+        partition.numpy = module
+        bulkHashes = measure('bulk hashKeys (%s)' % name, lambda: partition.hashKeys(keys, K, method), count, hashSeconds)[0]
+        bulkOwners = measure('bulk ownerIndexes (%s)' % name, lambda: snapshot.ownerIndexes(keys), count, ownerSeconds)[0]
+        if [int(hash) for hash in bulkHashes] != hashes or [int(owner) for owner in bulkOwners] != owners:
+            print 'the %s results differ from the per-key path' % name
+
+if __name__ == '__main__':
+    if len(sys.argv) in (4, 5):
+        main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]) if len(sys.argv) == 5 else 1000)
+    else:
+        print >>sys.stderr, 'usage: bulk_hashing.py keys K method<1 or 2> [N]'
+        sys.exit(1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede a vazão e a latência de muitas pesquisas (Peer.lookup()) feitas ao mesmo tempo, a partir de todos os peers do anel.
+#
+#  Sobe um Rendezvous e N peers neste processo (via UDP em 127.0.0.1), espera as finger tables ficarem completas e dispara
+#  as pesquisas a partir de \c concorrência threads, cada uma pesquisando chaves aleatórias a partir de um peer diferente
+#  (sem o cache de responsáveis, para que toda pesquisa percorra o anel). Opcionalmente, derruba um dos peers antes das
+#  pesquisas, de forma que os peers que o têm na finger table esperam pelo timeout ao encaminhar pesquisas para ele.
+#
+#  Uso: python benchmarks/concurrent_lookups.py N K concorrência pesquisas [derrubar_um_peer (0 ou 1)]
+
+import os, sys, random, socket, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 28000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def main(N, K, concurrency, lookups, crash):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), K, 1, None)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    ring = []
+    for i in range(N):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), True, False)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        ring.append(peer)
+
+    # esperando cada peer atualizar todas as entradas da sua finger table com o anel completo (uma entrada a cada 3s)
+    time.sleep(3.0 * len(common.fingerTargets(0, K, 1)) + 1.0)
+
+    if crash:
+        # o peer para de responder (o socket continua aberto, e os datagramas para ele são descartados)
+        victim = ring.pop(len(ring) // 2)
+        victim.sock.close()
+
+    latencies = []
+    timeouts = [0]
+    lock = threading.Lock()
+    def worker(peer, count):
+        for _ in range(count):
+            start = time.time()
+            try:
+                peer.lookup(random.randint(0, K), 10.0, False)
+            except socket.timeout:
+                with lock:
+                    timeouts[0] += 1
+                continue
+            with lock:
+                latencies.append(time.time() - start)
+
+    threads = [threading.Thread(target=worker, args=(ring[i % len(ring)], lookups // concurrency)) for i in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.time() - start
+
+    print >>results, 'lookups=%d concurrency=%d time=%.2f s (%.0f lookups/s) timeouts=%d' % (len(latencies) + timeouts[0], concurrency, seconds,
+                                                                                         (len(latencies) + timeouts[0]) / seconds, timeouts[0])
+    if len(latencies) > 0:
+        print >>results, 'latency ms p50=%.1f p90=%.1f p99=%.1f max=%.1f' % (1e3 * percentile(latencies, 0.5), 1e3 * percentile(latencies, 0.9),
+                                                                             1e3 * percentile(latencies, 0.99), 1e3 * max(latencies))
+
+if __name__ == '__main__':
+    if len(sys.argv) in (5, 6):
+        sys.stdout = sys.stderr = open(os.devnull, 'w') # inclusive os erros das threads do peer derrubado
+        random.seed(1)
+        main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), len(sys.argv) == 6 and sys.argv[5] == '1')
+    else:
+        print >>sys.stderr, 'usage: concurrent_lookups.py N K concurrency lookups [crash_one_peer (0 or 1)]'
+        sys.exit(1)
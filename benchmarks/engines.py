@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Compara o peer com threads (peer.Peer) com o peer sobre o laço de eventos (asyncpeer.AsyncPeer).
+#
+#  "pings": dois peers no mesmo processo, com C requisições Ping concorrentes do primeiro para o segundo, medindo
+#  requisições por segundo e trocas de contexto (voluntárias + involuntárias, via getrusage) por requisição.
+#  "join": sobe um AsyncRendezvous e N AsyncPeer em um único processo e mede o tempo até todos entrarem na DHT.
+#
+#  Uso: python benchmarks/engines.py pings seconds concurrency
+#       python benchmarks/engines.py join N K
+
+import os, resource, socket, sys, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import eventloop
+from peer import Peer
+from rendezvous import Rendezvous
+from asyncpeer import AsyncPeer, AsyncRendezvous, startPeers
+
+BASE_PORT = 24000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def contextSwitches():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+def report(label, completed, seconds, switches):
+    print >>results, '%-8s %9.1f requests/s  %6.3f context switches/request' % (label, completed / seconds, float(switches) / max(completed, 1))
+
+def threadedPings(seconds, concurrency):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), 1024, 1)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    peers = []
+    for i in range(2):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), False, False)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.5)
+        peers.append(peer)
+
+    completed = [0] * concurrency
+    deadline = time.time() + seconds
+    def worker(i):
+        while time.time() < deadline:
+            try:
+                peers[0].sendRequest(['Ping'], peers[1].address, 3.0)
+                completed[i] += 1
+            except socket.timeout:
+                pass
+
+    switches = contextSwitches()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report('threads', sum(completed), seconds, contextSwitches() - switches)
+
+def asyncPings(seconds, concurrency):
+    loop = eventloop.EventLoop()
+    rendezvous = AsyncRendezvous(loop, ('127.0.0.1', BASE_PORT + 10), 1024, 1)
+    rendezvous.start()
+    peers = startPeers(loop, '127.0.0.1', BASE_PORT + 11, 2, rendezvous.address, loop.stop)
+    loop.run()
+
+    completed = [0]
+    deadline = [0]
+    def ping(reply = None):
+        if reply != None:
+            completed[0] += 1
+        if loop.time() < deadline[0]:
+            peers[0].sendRequest(['Ping'], peers[1].address, 3.0, ping)
+
+    switches = contextSwitches()
+    deadline[0] = loop.time() + seconds
+    for i in range(concurrency):
+        ping()
+    loop.callLater(seconds + 0.1, loop.stop)
+    loop.run()
+    report('events', completed[0], seconds, contextSwitches() - switches)
+
+def join(N, K):
+    loop = eventloop.EventLoop()
+    rendezvous = AsyncRendezvous(loop, ('127.0.0.1', BASE_PORT + 100), K, 1)
+    rendezvous.start()
+    start = time.time()
+    startPeers(loop, '127.0.0.1', BASE_PORT + 101, N, rendezvous.address, loop.stop)
+    loop.run()
+    print >>results, '%d AsyncPeer joined one at a time in %.2f s (one process, one thread)' % (N, time.time() - start)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'pings':
+        sys.stdout = open(os.devnull, 'w')
+        asyncPings(float(sys.argv[2]), int(sys.argv[3]))
+        threadedPings(float(sys.argv[2]), int(sys.argv[3]))
+        os._exit(0) # sem esperar pelas threads dos peers
+    elif len(sys.argv) == 4 and sys.argv[1] == 'join':
+        sys.stdout = open(os.devnull, 'w')
+        join(int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        print >>sys.stderr, 'usage: engines.py pings seconds concurrency'
+        print >>sys.stderr, '   or: engines.py join N K'
+        sys.exit(1)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede o tempo de volta ao anel de peers reiniciados com e sem o arquivo de estado (src/snapshot.py), e a volta do Rendezvous.
+#
+#  Sobe um Rendezvous e N peers, cada um em um processo próprio (via UDP em 127.0.0.1), todos com arquivos de estado em um diretório
+#  temporário, e espera o anel ficar consistente. Em seguida, simula um deploy gradual: R peers são reiniciados, um de cada vez.
+#
+#  - snapshot: o processo é encerrado e iniciado de novo imediatamente, com o arquivo de estado (ver peer.Peer.rejoin()).
+#  - fresh: o arquivo de estado é apagado, e o processo só é iniciado de novo depois que os vizinhos o removem do anel (um peer que
+#    volta antes disso, com o mesmo ID, não consegue procurar o seu lugar, pois os vizinhos ainda apontam para ele), entrando como um
+#    peer novo.
+#
+#  Para cada reinício, são medidos o tempo entre o encerramento e o anel voltar a ser consistente em volta do peer (o antecessor e o
+#  sucessor apontando para ele), e as mensagens enviadas pelo peer nos seus primeiros WINDOW segundos (que incluem as pesquisas da
+#  finger table). Por último, o Rendezvous é reiniciado, com e sem o seu arquivo de estado, e um peer novo entra na DHT: sem o
+#  registro, ele recebe um ID como se fosse o primeiro peer, e forma um anel separado.
+#
+#  Uso: python benchmarks/fast_restart.py N [reinícios]
+
+import os, sys, socket, time, tempfile, shutil, json, multiprocessing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common, metrics
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 24000
+
+## O número máximo de nós da DHT.
+K = 2**20
+
+## O tempo, em segundos, depois do reinício em que as mensagens enviadas pelo peer são contadas.
+WINDOW = 5.0
+
+## O tempo máximo, em segundos, de espera pela consistência do anel.
+TIMEOUT = 60.0
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+rendezvousAddress = ('127.0.0.1', BASE_PORT)
+
+def runRendezvous(snapshotPath):
+    Rendezvous(rendezvousAddress, K, 1, None, snapshotPath = snapshotPath).run()
+
+def runPeer(address, directory):
+    Peer(address, rendezvousAddress, True, False, os.path.join(directory, 'dht-%d.log' % address[1]),
+         snapshotPath = os.path.join(directory, 'dht-%d.ring' % address[1])).run()
+
+def startProcess(target, *args):
+    process = multiprocessing.Process(target=target, args=args)
+    process.start()
+    return process
+
+def ringState(sock, address):
+    try:
+        reply = common.request(sock, ['Request', 'ID', 'previousID', 'previousAddress', 'nextID', 'nextAddress'], 0, address, 0.5)
+        return int(reply[1]), int(reply[2]), common.strToAddr(reply[3]), int(reply[4]), common.strToAddr(reply[5])
+    except (socket.timeout, socket.error, ValueError, IndexError):
+        return None
+
+## Verifica se o antecessor e o sucessor de um peer apontam para ele.
+#  @return O estado do peer (ver ringState()), ou \c None.
+def consistentAround(sock, address):
+    state = ringState(sock, address)
+    if state == None:
+        return None
+    previous, next = ringState(sock, state[2]), ringState(sock, state[4])
+    if previous == None or next == None or (previous[3], previous[4]) != (state[0], address) or (next[1], next[2]) != (state[0], address):
+        return None
+    return state
+
+def waitFor(condition):
+    deadline = time.time() + TIMEOUT
+    while time.time() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.05)
+    return None
+
+def sentMessages(address):
+    try:
+        return sum(json.loads(metrics.query(address, 1.0))['sent'].values())
+    except socket.timeout:
+        return None
+
+def restartPeer(sock, processes, addresses, i, directory, useSnapshot):
+    address = addresses[i]
+    state = ringState(sock, address)
+    processes[i].terminate()
+    processes[i].join()
+    stopped = time.time()
+
+    if not useSnapshot:
+        os.remove(os.path.join(directory, 'dht-%d.ring' % address[1]))
+        # espera o antecessor deixar de apontar para o peer
+        waitFor(lambda: (ringState(sock, state[2]) or (None,) * 5)[4] != address)
+
+    started = time.time()
+    processes[i] = startProcess(runPeer, address, directory)
+    consistent = waitFor(lambda: consistentAround(sock, address))
+    downtime = time.time() - stopped
+    time.sleep(max(0.0, started + WINDOW - time.time()))
+    return downtime if consistent else None, sentMessages(address), consistent != None and consistent[0] == state[0]
+
+def summary(values):
+    values = sorted(value for value in values if value != None)
+    if len(values) == 0:
+        return 'n/a'
+    return 'p50 %6.2f max %6.2f' % (values[len(values) // 2], values[-1])
+
+def restartRendezvous(sock, rendezvous, directory, useSnapshot, port):
+    rendezvous.terminate()
+    rendezvous.join()
+    if not useSnapshot:
+        os.remove(os.path.join(directory, 'rendezvous.state'))
+    rendezvous = startProcess(runRendezvous, os.path.join(directory, 'rendezvous.state'))
+    time.sleep(0.5)
+
+    address = ('127.0.0.1', port)
+    newcomer = startProcess(runPeer, address, directory)
+    state = waitFor(lambda: ringState(sock, address))
+    time.sleep(2.0)
+    state = ringState(sock, address)
+    joined = state != None and state[4] != address and consistentAround(sock, address) != None
+    time.sleep(4.0) # revalidação do registro restaurado
+    try:
+        peers = json.loads(metrics.query(rendezvousAddress, 1.0))['gauges']['peers']
+    except socket.timeout:
+        peers = None
+    return rendezvous, newcomer, joined, peers
+
+def main(N, restarts):
+    directory = tempfile.mkdtemp()
+    processes = []
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rendezvous = startProcess(runRendezvous, os.path.join(directory, 'rendezvous.state'))
+        addresses = [('127.0.0.1', BASE_PORT + 1 + i) for i in range(N)]
+        for address in addresses:
+            processes.append(startProcess(runPeer, address, directory))
+            waitFor(lambda: consistentAround(sock, address))
+        time.sleep(2 * 5.0) # os arquivos de estado são escritos a cada snapshot.INTERVAL segundos
+
+        print >>results, 'N=%d restarts=%d (one at a time)' % (N, restarts)
+        for useSnapshot in (True, False):
+            rows = [restartPeer(sock, processes, addresses, i, directory, useSnapshot) for i in range(restarts)]
+            time.sleep(2 * 5.0)
+            print >>results, '%-8s downtime s: %-24s | messages in the first %.0f s: %-24s | same ID: %d/%d | failed: %d' % (
+                'snapshot' if useSnapshot else 'fresh', summary([row[0] for row in rows]), WINDOW, summary([row[1] for row in rows]),
+                sum(1 for row in rows if row[2]), restarts, sum(1 for row in rows if row[0] == None))
+
+        for useSnapshot in (True, False):
+            rendezvous, newcomer, joined, peers = restartRendezvous(sock, rendezvous, directory, useSnapshot, BASE_PORT + 1 + N + len(processes))
+            processes.append(newcomer)
+            print >>results, 'rendezvous restart %-8s: new peer joined the existing ring: %-5s | registered peers after revalidation: %s' % (
+                'snapshot' if useSnapshot else 'fresh', joined, peers)
+    finally:
+        for process in processes + [rendezvous]:
+            process.terminate()
+            process.join()
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    if len(sys.argv) in (2, 3):
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) == 3 else 4)
+    else:
+        print >>sys.stderr, 'usage: fast_restart.py N [restarts]'
+        sys.exit(1)
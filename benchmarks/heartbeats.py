@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede quantos Pings cada peer envia com o anel ocioso e com o anel ocupado por pesquisas, e quantos peers vivos são removidos por engano.
+#
+#  Sobe um Rendezvous e N peers neste processo (via UDP em 127.0.0.1) e conta os Pings enviados durante \c segundos sem tráfego e,
+#  em seguida, durante \c segundos com \c concorrência threads pesquisando chaves aleatórias (sem o cache de responsáveis). Como
+#  qualquer mensagem recebida de um vizinho conta como batimento (ver detector.py), o anel ocupado precisa de menos Pings.
+#  Ao final, imprime quantos peers (todos vivos) o Rendezvous removeu.
+#
+#  Uso: python benchmarks/heartbeats.py N K segundos concorrência [limite_de_suspeita]
+
+import os, sys, random, socket, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 31000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def countPings(peer, counter):
+    startRequest = peer.startRequest
+    def counting(sendMsg, address, timeout, optMessageID = None):
+        if sendMsg[0] == 'Ping':
+            counter[0] += 1
+        return startRequest(sendMsg, address, timeout, optMessageID)
+    peer.startRequest = counting
+
+def main(N, K, seconds, concurrency, threshold):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), K, 1, None)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    ring = []
+    counter = [0]
+    for i in range(N):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), True, False, suspicionThreshold = threshold)
+        countPings(peer, counter)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        ring.append(peer)
+    time.sleep(10.0)
+
+    counter[0] = 0
+    time.sleep(seconds)
+    print >>results, 'idle: %.2f pings/s per peer' % (counter[0] / float(seconds * N))
+
+    stop = [False]
+    lookups = [0]
+    def worker(peer):
+        while not stop[0]:
+            try:
+                peer.lookup(random.randint(0, K), 10.0, False)
+                lookups[0] += 1
+            except socket.timeout:
+                pass
+
+    threads = [threading.Thread(target=worker, args=(ring[i % len(ring)],)) for i in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    time.sleep(2.0)
+
+    counter[0] = 0
+    lookups[0] = 0
+    time.sleep(seconds)
+    stop[0] = True
+    for thread in threads:
+        thread.join()
+    print >>results, 'busy: %.2f pings/s per peer (%.0f lookups/s)' % (counter[0] / float(seconds * N), lookups[0] / float(seconds))
+    print >>results, 'live peers removed by the rendezvous: %d' % (N - len(rendezvous.ring))
+
+if __name__ == '__main__':
+    if len(sys.argv) in (5, 6):
+        sys.stdout = sys.stderr = open(os.devnull, 'w')
+        random.seed(1)
+        main(int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5]) if len(sys.argv) == 6 else 8.0)
+    else:
+        print >>sys.stderr, 'usage: heartbeats.py N K seconds concurrency [suspicion_threshold]'
+        sys.exit(1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede a carga sobre os responsáveis pelas chaves mais pesquisadas com uma distribuição de Zipf, com e sem o cache das chaves
+#  populares ao longo do caminho das pesquisas (src/hotkeys.py), sobre o simulador (src/simulator.py).
+#
+#  Para cada configuração, uma simulação com a mesma semente coloca N peers na DHT e espera o anel estabilizar. Em seguida, durante
+#  DURATION segundos do relógio virtual, são feitas RATE pesquisas por segundo, a partir de peers sorteados, por chaves sorteadas entre
+#  M chaves com a distribuição de Zipf de expoente s (a chave de posição i tem probabilidade proporcional a 1 / i^s), sem o cache de
+#  responsáveis de quem pesquisa (cache.OwnerCache). São impressas as mensagens Search recebidas pelo responsável pela chave mais
+#  pesquisada e pelo peer que mais recebeu mensagens Search, por segundo, a média por peer, o número médio de saltos, a fração das
+#  pesquisas corretas (o responsável encontrado é o peer responsável pela chave) e as mensagens Cache enviadas.
+#
+#  Uso: python benchmarks/hot_keys.py N [chaves] [expoente] [pesquisas_por_segundo] [semente]
+
+import os, sys, random, bisect
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import simulator, hotkeys
+
+## O número máximo de nós da DHT.
+K = 2**20
+
+## A latência da rede simulada, em segundos (mais até a mesma quantidade de variação).
+LATENCY = 0.005
+
+## O tempo, em segundos do relógio virtual, de espera para que o anel estabilize depois das entradas.
+SETTLE = 30.0
+
+## O tempo, em segundos do relógio virtual, durante o qual as pesquisas são feitas.
+DURATION = 60.0
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+## Cria uma função que sorteia uma chave entre \c count chaves, com a distribuição de Zipf de expoente \c exponent.
+def zipf(count, exponent):
+    cumulative = []
+    total = 0.0
+    for i in range(count):
+        total += 1.0 / (i + 1) ** exponent
+        cumulative.append(total)
+    return lambda: 'key-%d' % bisect.bisect_left(cumulative, random.random() * total)
+
+def run(N, keyCount, exponent, rate, seed, threshold):
+    simulation = simulator.Simulation(K, 1, seed, {'latency': LATENCY, 'jitter': LATENCY}, {'hotKeyThreshold': threshold})
+    simulation.join(N)
+    simulation.loop.runFor(SETTLE)
+
+    peers = list(simulation.peers)
+    before = dict((peer.address, peer.metrics.received['Search']) for peer in peers)
+    answers = []
+    draw = zipf(keyCount, exponent)
+
+    def onFound(key, result):
+        owner = [peer for peer in simulation.peers if peer.isResponsible(key)]
+        answers.append((result != None and len(owner) == 1 and owner[0].id == result[0], result[2] if result != None else None))
+
+    def lookup():
+        peer = random.choice(peers)
+        key = peer.hashKey(draw())
+        peer.lookup(key, lambda result, key = key: onFound(key, result), 10.0, False)
+
+    for i in range(int(rate * DURATION)):
+        simulation.loop.callLater(i / float(rate), lookup)
+    simulation.loop.runFor(DURATION + 11.0)
+
+    searches = dict((peer.address, peer.metrics.received['Search'] - before[peer.address]) for peer in peers)
+    hottest = [peer for peer in peers if peer.isResponsible(peer.hashKey('key-0'))][0]
+    hops = [answer[1] for answer in answers if answer[1] != None]
+    pushes = sum(peer.hotKeys.stats()['pushes'] for peer in peers if peer.hotKeys != None)
+    simulation.close()
+    return (searches[hottest.address] / DURATION, max(searches.values()) / DURATION, sum(searches.values()) / DURATION / len(peers),
+            sum(hops) / float(max(1, len(hops))), 100.0 * sum(1 for answer in answers if answer[0]) / max(1, len(answers)), pushes)
+
+def main(N, keyCount, exponent, rate, seed):
+    print >>results, 'N=%d K=%d keys=%d zipf s=%.2f lookups/s=%d duration=%.0f s seed=%d' % (N, K, keyCount, exponent, rate, DURATION, seed)
+    print >>results, '%-14s %16s %16s %14s %6s %6s %7s' % ('hot keys', 'hottest owner/s', 'busiest peer/s', 'mean peer/s', 'hops', 'ok%', 'Cache')
+    for label, threshold in (('off', None), ('on (t=%d)' % hotkeys.THRESHOLD, hotkeys.THRESHOLD)):
+        row = run(N, keyCount, exponent, rate, seed, threshold)
+        print >>results, '%-14s %16.1f %16.1f %14.1f %6.2f %6.1f %7d' % ((label,) + row)
+
+if __name__ == '__main__':
+    if 2 <= len(sys.argv) <= 6:
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 10000, float(sys.argv[3]) if len(sys.argv) > 3 else 1.0,
+             int(sys.argv[4]) if len(sys.argv) > 4 else 200, int(sys.argv[5]) if len(sys.argv) > 5 else 0)
+    else:
+        print >>sys.stderr, 'usage: hot_keys.py N [keys] [exponent] [lookups_per_second] [seed]'
+        sys.exit(1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Compara a distribuição dos arcos do anel com IDs sorteados e com a divisão do maior arco (ver rendezvous.Rendezvous.allocateGap()).
+#
+#  Para cada política, S sequências de entradas e saídas são entregues diretamente a Rendezvous.handleMessage(), neste processo (como
+#  em join_storm.py): N peers entram e, depois, C vezes, um peer sorteado sai (Removed) e um peer novo entra (hello). No final de cada
+#  sequência, são medidos o maior arco e o desvio padrão dos arcos, divididos pelo arco médio, e o mesmo para a carga dos peers, com
+#  as chaves de um décimo do anel (a partir da posição 0) HOT vezes mais pesquisadas que as demais.
+#
+#  Na política gap+load, antes de cada entrada, todos os peers informam essa carga ao Rendezvous com a mensagem Load (como
+#  peer.Peer.reportLoad()), de forma que o arco dividido é o do peer mais carregado (ver rendezvous.Rendezvous.allocateByLoad()).
+#  São impressas a média e o pior valor das S sequências.
+#
+#  Uso: python benchmarks/id_assignment.py N K [saídas] [sequências]
+
+import os, sys, math, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import wire
+from rendezvous import Rendezvous
+
+## O peso das pesquisas das chaves da região quente do anel, em relação às demais.
+HOT = 10
+
+## Saída dos resultados (a saída padrão é descartada, pois o rendezvous imprime o andamento da DHT).
+results = sys.stdout
+
+def address(i):
+    return ('127.1.%d.%d' % (i >> 8 & 255, i & 255), 9 + (i >> 16))
+
+## Calcula a carga de cada peer do anel: o tamanho do seu arco, com as posições da região quente valendo HOT.
+#  @return Um dicionário {ID: (tamanho do arco, carga)}.
+def arcsAndLoads(rendezvous):
+    size = rendezvous.K + 1
+    hotEnd = size // 10
+    arcs = {}
+    for i, id in enumerate(rendezvous.ring):
+        length = rendezvous.arcLength(rendezvous.ring[i - 1], id)
+        start = rendezvous.ring[i - 1] + 1
+        # as posições do arco, (início, fim], divididas em até duas faixas que não dão a volta no anel
+        ranges = [(start, start + length)] if start + length <= size else [(start, size), (0, start + length - size)]
+        hot = sum(max(0, min(end, hotEnd) - max(begin, 0)) for begin, end in ranges)
+        arcs[id] = (length, length + (HOT - 1) * hot)
+    return arcs
+
+def ratios(values):
+    mean = float(sum(values)) / len(values)
+    stdDeviation = math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+    return max(values) / mean, stdDeviation / mean
+
+def sequence(K, N, churn, assignment, reportLoads, seed):
+    random.seed(seed)
+    rendezvous = Rendezvous(('127.0.0.1', 0), K, 1, None, assignment = assignment)
+    joined = [0]
+
+    def join():
+        if reportLoads:
+            for id, (length, load) in arcsAndLoads(rendezvous).items():
+                rendezvous.handleMessage(wire.encodeText(['Load', id, load], True, 0), address(0))
+        rendezvous.handleMessage('hello', address(joined[0]))
+        joined[0] += 1
+
+    for i in range(N):
+        join()
+    for i in range(churn):
+        id = random.choice(rendezvous.ring)
+        rendezvous.handleMessage(wire.encodeText(['Removed', id], True, i), address(0))
+        join()
+
+    arcs = arcsAndLoads(rendezvous).values()
+    rendezvous.sock.close()
+    return ratios([length for length, load in arcs]) + ratios([load for length, load in arcs])
+
+def main(N, K, churn, sequences):
+    print >>results, 'N=%d K=%d leaves=%d sequences=%d hot=%dx' % (N, K, churn, sequences, HOT)
+    print >>results, '%-9s %-22s %-22s %-22s %-22s' % ('ids', 'arc max/mean', 'arc std/mean', 'load max/mean', 'load std/mean')
+    for label, assignment, reportLoads in (('random', 'random', False), ('gap', 'gap', False), ('gap+load', 'gap', True)):
+        rows = [sequence(K, N, churn, assignment, reportLoads, seed) for seed in range(sequences)]
+        columns = ['avg %6.2f worst %6.2f' % (sum(row[i] for row in rows) / len(rows), max(row[i] for row in rows)) for i in range(4)]
+        print >>results, '%-9s %-22s %-22s %-22s %-22s' % tuple([label] + columns)
+
+if __name__ == '__main__':
+    if len(sys.argv) in (3, 4, 5):
+        sys.stdout = open(os.devnull, 'w')
+        N, K = int(sys.argv[1]), int(sys.argv[2])
+        main(N, K, int(sys.argv[3]) if len(sys.argv) >= 4 else N, int(sys.argv[4]) if len(sys.argv) == 5 else 20)
+    else:
+        print >>sys.stderr, 'usage: id_assignment.py N K [leaves] [sequences]'
+        sys.exit(1)
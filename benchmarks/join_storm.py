@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede quantas mensagens por segundo o Rendezvous trata durante a entrada (e a saída) de muitos peers de uma vez.
+#
+#  As mensagens (hello, ACK e Removed) são entregues diretamente a Rendezvous.handleMessage(), neste processo, como se viessem de
+#  N endereços diferentes (em 127.1.0.0/16), de forma que só o trabalho do Rendezvous é medido (as respostas são enviadas via UDP
+#  para endereços sem ninguém escutando). A vazão dos hellos é impressa a cada décimo dos peers, o que mostra se o custo de cada
+#  mensagem cresce com o tamanho do anel.
+#
+#  Uso: python benchmarks/join_storm.py N K [intervalo_de_impressão]
+#  (sem o intervalo, o anel não é impresso; com ele, o Rendezvous imprime o anel no máximo uma vez por intervalo, na saída descartada)
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import wire
+from rendezvous import Rendezvous
+
+## Saída dos resultados (a saída padrão é descartada, pois o rendezvous imprime o andamento da DHT).
+results = sys.stdout
+
+def address(i):
+    return ('127.1.%d.%d' % (i >> 8 & 255, i & 255), 9 + (i >> 16))
+
+def main(N, K, printInterval):
+    rendezvous = Rendezvous(('127.0.0.1', 0), K, 1, printInterval)
+    addresses = [address(i) for i in range(N)]
+
+    step = max(1, N // 10)
+    start = time.time()
+    for first in range(0, N, step):
+        blockStart = time.time()
+        for peerAddress in addresses[first:first + step]:
+            rendezvous.handleMessage('hello', peerAddress)
+        seconds = time.time() - blockStart
+        print >>results, 'hello  peers %6d-%-6d %9.0f msgs/s' % (first, min(N, first + step) - 1, len(addresses[first:first + step]) / seconds)
+    print >>results, 'hello  total %9.0f msgs/s' % (N / (time.time() - start))
+
+    ids = [rendezvous.peersByAddress[repr(peerAddress)].id for peerAddress in addresses]
+
+    start = time.time()
+    for id, peerAddress in zip(ids, addresses):
+        rendezvous.handleMessage('ACK|%d' % id, peerAddress)
+    print >>results, 'ACK    total %9.0f msgs/s' % (N / (time.time() - start))
+
+    start = time.time()
+    for i in range(0, N, 2):
+        rendezvous.handleMessage(wire.encodeText(['Removed', ids[i]], True, i), addresses[(i + 1) % N])
+    print >>results, 'Removed total %8.0f msgs/s' % ((N + 1) // 2 / (time.time() - start))
+
+    start = time.time()
+    for i in range(0, N, 2):
+        rendezvous.handleMessage('hello', addresses[i])
+    print >>results, 'rejoin total %9.0f msgs/s' % ((N + 1) // 2 / (time.time() - start))
+
+if __name__ == '__main__':
+    if len(sys.argv) in (3, 4):
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]) if len(sys.argv) == 4 else None)
+    else:
+        print >>sys.stderr, 'usage: join_storm.py N K [print_interval]'
+        sys.exit(1)
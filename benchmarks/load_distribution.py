@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede a distribuição das chaves entre os peers físicos, com IDs aleatórios e com nós virtuais.
+#
+#  Para cada combinação de N peers físicos e V nós virtuais por peer, os hellos são entregues diretamente a
+#  Rendezvous.handleMessage(), neste processo (como em join_storm.py), e as chaves são atribuídas ao peer responsável pelo seu hash
+#  (common.hashKey()) no anel resultante. Com V = 1 e hello, os IDs são os aleatórios originais; nas demais linhas, cada peer físico
+#  envia um hello|neighbours|vnode por nó virtual (ver asyncpeer.startVirtualNodes()). São impressos o máximo e o desvio padrão do
+#  número de chaves por peer físico, divididos pela média, e a fração dos peers físicos sem nenhuma chave.
+#
+#  Uso: python benchmarks/load_distribution.py K opção [chaves]
+
+import os, sys, bisect, math
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common
+from rendezvous import Rendezvous
+
+PHYSICAL_PEERS = (16, 64, 256)
+VIRTUAL_NODES = (1, 4, 16, 64)
+
+## Saída dos resultados (a saída padrão é descartada, pois o rendezvous imprime o andamento da DHT).
+results = sys.stdout
+
+def address(i):
+    return ('127.1.%d.%d' % (i >> 8 & 255, i & 255), 9 + (i >> 16))
+
+def distribution(K, method, keys, N, V, virtual):
+    rendezvous = Rendezvous(('127.0.0.1', 0), K, method, None, assignment = 'random')
+    for n in range(N):
+        physical = repr(address(n * V))
+        for i in range(V):
+            rendezvous.handleMessage('hello|neighbours|vnode|%s|%d' % (physical, i) if virtual else 'hello', address(n * V + i))
+
+    counts = dict((rendezvous.peersByID[id].physical, 0) for id in rendezvous.ring)
+    for key in keys:
+        owner = rendezvous.ring[bisect.bisect_left(rendezvous.ring, key) % len(rendezvous.ring)]
+        counts[rendezvous.peersByID[owner].physical] += 1
+    rendezvous.sock.close()
+
+    mean = float(len(keys)) / N
+    stdDeviation = math.sqrt(sum((count - mean) ** 2 for count in counts.values()) / N)
+    idle = sum(1 for count in counts.values() if count == 0)
+    return (max(counts.values()) / mean, stdDeviation / mean, float(idle) / N)
+
+def main(K, method, keyCount):
+    keys = [common.hashKey('key-%d' % i, K, method) for i in range(keyCount)]
+    print >>results, 'K=%d method=%d keys=%d' % (K, method, keyCount)
+    print >>results, '%5s %4s %-7s %8s %8s %6s' % ('N', 'V', 'ids', 'max/mean', 'std/mean', 'idle')
+    for N in PHYSICAL_PEERS:
+        for V in VIRTUAL_NODES:
+            for virtual in ([False, True] if V == 1 else [True]):
+                label = 'vnode' if virtual else 'random'
+                if N * V > K + 1:
+                    print >>results, '%5d %4d %-7s  n/a (only %d ring positions)' % (N, V, label, K + 1)
+                    continue
+                maxRatio, stdRatio, idle = distribution(K, method, keys, N, V, virtual)
+                print >>results, '%5d %4d %-7s %8.2f %8.2f %5.0f%%' % (N, V, label, maxRatio, stdRatio, 100 * idle)
+
+if __name__ == '__main__':
+    if len(sys.argv) in (3, 4):
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) == 4 else 100000)
+    else:
+        print >>sys.stderr, 'usage: load_distribution.py K method<1 or 2> [keys]'
+        sys.exit(1)
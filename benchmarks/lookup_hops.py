@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Compara o número de saltos e a latência das pesquisas com a finger table e com o percurso vizinho a vizinho do anel.
+#
+#  Modo "live": sobe um Rendezvous e N peers neste processo (via UDP em 127.0.0.1) e faz pesquisas reais.
+#  Modo "offline": monta o estado do anel diretamente em N objetos Peer e segue nextHop() até o responsável,
+#  o que permite medir o número de saltos para N grande sem subir as threads de cada peer.
+#
+#  Uso: python benchmarks/lookup_hops.py live|offline N K method [lookups]
+
+import os, sys, random, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 20000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def report(label, hops, latencies):
+    line = '%-12s lookups=%-5d hops mean=%.2f p50=%d p99=%d max=%d' % (label, len(hops), float(sum(hops)) / len(hops),
+                                                                      percentile(hops, 0.5), percentile(hops, 0.99), max(hops))
+    if latencies:
+        line += ' | latency ms mean=%.2f p50=%.2f p99=%.2f' % (1000 * sum(latencies) / len(latencies),
+                                                             1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.99))
+    print >>results, line
+
+def offline(N, K, method, lookups):
+    ids = sorted(random.sample(range(0, K + 1), N))
+    if method == 2:
+        ids = [2**x for x in ids]
+
+    for useFingers in (False, True):
+        ring = []
+        for id in ids:
+            peer = Peer(('127.0.0.1', 0), None, useFingers, False)
+            peer.address = peer.sock.getsockname()
+            peer.id, peer.K, peer.method = id, K, method
+            ring.append(peer)
+
+        for i, peer in enumerate(ring):
+            peer.previousID, peer.previousAddress = ring[i - 1].id, ring[i - 1].address
+            peer.nextID, peer.nextAddress = ring[(i + 1) % N].id, ring[(i + 1) % N].address
+            fingers = []
+            for target in common.fingerTargets(peer.id, K, method):
+                owner = [p for p in ring if p.isResponsible(target)][0]
+                if len(fingers) == 0 or fingers[-1][0] != owner.id:
+                    fingers.append((owner.id, owner.address))
+            peer.fingers = fingers
+
+        byAddress = dict((peer.address, peer) for peer in ring)
+        hops = []
+        for _ in range(lookups):
+            key = ring[0].hashKey(random.random())
+            current = random.choice(ring)
+            count = 0
+            while not current.isResponsible(key):
+                current = byAddress[current.nextHop(key)]
+                count += 1
+            hops.append(count)
+
+        report('fingers' if useFingers else 'ring walk', hops, None)
+        for peer in ring:
+            peer.sock.close()
+
+def live(N, K, method, lookups):
+    for useFingers in (False, True):
+        port = BASE_PORT + (1000 if useFingers else 0)
+        rendezvous = Rendezvous(('127.0.0.1', port), K, method)
+        thread = threading.Thread(target=rendezvous.run)
+        thread.daemon = True
+        thread.start()
+
+        ring = []
+        for i in range(N):
+            peer = Peer(('127.0.0.1', port + 1 + i), ('127.0.0.1', port), useFingers, False)
+            thread = threading.Thread(target=peer.run)
+            thread.daemon = True
+            thread.start()
+            while peer.nextAddress is None:
+                time.sleep(0.01)
+            time.sleep(0.2)
+            ring.append(peer)
+
+        if useFingers:
+            # esperando cada peer atualizar todas as entradas da sua finger table com o anel completo (uma entrada a cada 3s)
+            time.sleep(3.0 * len(common.fingerTargets(0, K, method)) + 1.0)
+
+        hops, latencies = [], []
+        for _ in range(lookups):
+            peer = random.choice(ring)
+            key = peer.hashKey(random.random())
+            start = time.time()
+            ownerID, ownerAddress, count = peer.lookup(key)
+            latencies.append(time.time() - start)
+            hops.append(count)
+
+        report('fingers' if useFingers else 'ring walk', hops, latencies)
+
+if __name__ == '__main__':
+    if len(sys.argv) in (5, 6) and sys.argv[1] in ('live', 'offline'):
+        N, K, method = int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+        lookups = int(sys.argv[5]) if len(sys.argv) == 6 else 200
+        random.seed(1)
+        sys.stdout = open(os.devnull, 'w')
+        (live if sys.argv[1] == 'live' else offline)(N, K, method, lookups)
+    else:
+        print >>sys.stderr, 'usage: lookup_hops.py live|offline N K method<1 or 2> [lookups]'
+        sys.exit(1)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Compara pesquisas independentes (Peer.lookup(), uma por chave) com a pesquisa em lote (Peer.lookupMany()).
+#
+#  Sobe um Rendezvous e N peers neste processo (via UDP em 127.0.0.1), espera as finger tables ficarem completas e resolve
+#  as mesmas chaves das duas formas, medindo o tempo total e o número de datagramas UDP enviados (contador OutDatagrams
+#  de /proc/net/snmp, que inclui qualquer outro tráfego UDP da máquina).
+#
+#  Uso: python benchmarks/lookup_many.py N K keys
+
+import os, sys, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common, cache
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 23000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+## Retorna o número de datagramas UDP enviados pela máquina até agora, ou \c None caso o contador não esteja disponível.
+def sentDatagrams():
+    try:
+        lines = [line.split() for line in open('/proc/net/snmp') if line.startswith('Udp:')]
+        return int(lines[1][lines[0].index('OutDatagrams')])
+    except (IOError, IndexError, ValueError):
+        return None
+
+def report(label, seconds, datagrams, keys):
+    line = '%-12s keys=%-6d time=%.2f s (%.0f keys/s)' % (label, keys, seconds, keys / seconds)
+    if datagrams != None:
+        line += ' datagrams=%d (%.2f per key)' % (datagrams, float(datagrams) / keys)
+    print >>results, line
+
+def main(N, K, keyCount):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), K, 1)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    ring = []
+    for i in range(N):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), True, False)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        ring.append(peer)
+
+    # esperando cada peer atualizar todas as entradas da sua finger table com o anel completo (uma entrada a cada 3s)
+    time.sleep(3.0 * len(common.fingerTargets(0, K, 1)) + 1.0)
+
+    peer = ring[0]
+    peer.ownerCache = cache.OwnerCache(0) # sem o cache de responsáveis, para que as duas formas usem a rede
+    keys = ['file-%d' % i for i in range(keyCount)]
+
+    datagrams, start = sentDatagrams(), time.time()
+    single = {}
+    for key in keys:
+        ownerID, ownerAddress, hops = peer.lookup(peer.hashKey(key))
+        single[key] = (ownerID, ownerAddress)
+    seconds = time.time() - start
+    report('lookup', seconds, sentDatagrams() - datagrams if datagrams != None else None, keyCount)
+
+    datagrams, start = sentDatagrams(), time.time()
+    batch = peer.lookupMany(keys)
+    seconds = time.time() - start
+    report('lookupMany', seconds, sentDatagrams() - datagrams if datagrams != None else None, keyCount)
+
+    mismatches = len([key for key in keys if batch.get(key) != single[key]])
+    print >>results, 'owners that differ between the two methods: %d' % mismatches
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4:
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        print >>sys.stderr, 'usage: lookup_many.py N K keys'
+        sys.exit(1)
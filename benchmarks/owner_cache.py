@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede o efeito do cache de responsáveis (cache.OwnerCache) nas pesquisas repetidas por chaves populares.
+#
+#  Sobe um Rendezvous e N peers neste processo (via UDP em 127.0.0.1), espera as finger tables ficarem completas e pesquisa,
+#  várias vezes, as mesmas chaves a partir de um peer: uma rodada pela rede (sem o cache), uma rodada que preenche o cache, e
+#  as demais rodadas, que são respondidas pelo cache. Para cada rodada, mede o tempo e o número de datagramas UDP enviados
+#  (contador OutDatagrams de /proc/net/snmp, que inclui qualquer outro tráfego UDP da máquina).
+#
+#  Uso: python benchmarks/owner_cache.py N K keys rounds
+
+import os, sys, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common, cache
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 24000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+## Retorna o número de datagramas UDP enviados pela máquina até agora, ou \c None caso o contador não esteja disponível.
+def sentDatagrams():
+    try:
+        lines = [line.split() for line in open('/proc/net/snmp') if line.startswith('Udp:')]
+        return int(lines[1][lines[0].index('OutDatagrams')])
+    except (IOError, IndexError, ValueError):
+        return None
+
+def run(label, peer, keys, useCache):
+    datagrams, start = sentDatagrams(), time.time()
+    owners = {}
+    for key in keys:
+        ownerID, ownerAddress, hops = peer.lookup(peer.hashKey(key), 10.0, useCache)
+        owners[key] = ownerID
+    seconds = time.time() - start
+
+    line = '%-10s keys=%-6d time=%.3f s (%.0f lookups/s)' % (label, len(keys), seconds, len(keys) / seconds)
+    if datagrams != None:
+        line += ' datagrams=%.2f per lookup' % (float(sentDatagrams() - datagrams) / len(keys))
+    print >>results, line
+    return owners
+
+def main(N, K, keyCount, rounds):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), K, 1)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    ring = []
+    for i in range(N):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), True, False)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        ring.append(peer)
+
+    # esperando cada peer atualizar todas as entradas da sua finger table com o anel completo (uma entrada a cada 3s)
+    time.sleep(3.0 * len(common.fingerTargets(0, K, 1)) + 1.0)
+
+    peer = ring[0]
+    keys = ['file-%d' % i for i in range(keyCount)]
+
+    network = run('no cache', peer, keys, False)
+    peer.ownerCache = cache.OwnerCache()
+    stale = 0
+    for i in range(rounds):
+        owners = run('round %d' % (i + 1), peer, keys, True)
+        stale += len([key for key in keys if owners[key] != network[key]])
+
+    print >>results, 'cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions, %(size)d entries' % peer.ownerCache.stats()
+    print >>results, 'owners that differ from the network lookups: %d' % stale
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5:
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        print >>sys.stderr, 'usage: owner_cache.py N K keys rounds'
+        sys.exit(1)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede o uso de CPU de peers ociosos e o tempo de ida e volta (RTT) de uma requisição entre dois peers.
+#
+#  Sobe um Rendezvous e N peers neste processo (via UDP em 127.0.0.1), deixa o anel ocioso por alguns segundos medindo
+#  o tempo de CPU consumido pelo processo, e depois mede o RTT de requisições Ping do primeiro peer para o segundo.
+#
+#  Uso: python benchmarks/request_rtt.py N idle_seconds pings
+
+import os, sys, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 22000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def main(N, idleSeconds, pings):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), 1024, 1)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    ring = []
+    for i in range(N):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), True, False)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.5)
+        ring.append(peer)
+
+    start, cpuStart = time.time(), sum(os.times()[:2])
+    time.sleep(idleSeconds)
+    cpu = (sum(os.times()[:2]) - cpuStart) / (time.time() - start)
+    print >>results, 'idle: %d peers, process CPU %.2f%% (%.2f%% per peer)' % (N, 100 * cpu, 100 * cpu / N)
+
+    latencies = []
+    for _ in range(pings):
+        start = time.time()
+        ring[0].sendRequest(['Ping'], ring[1].address, 3.0)
+        latencies.append(time.time() - start)
+    print >>results, 'Ping RTT ms: mean=%.3f p50=%.3f p99=%.3f max=%.3f' % (1000 * sum(latencies) / len(latencies), 1000 * percentile(latencies, 0.5),
+                                                                           1000 * percentile(latencies, 0.99), 1000 * max(latencies))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4:
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3]))
+    else:
+        print >>sys.stderr, 'usage: request_rtt.py N idle_seconds pings'
+        sys.exit(1)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede quantas requisições por segundo um peer completa em função do número de requisições concorrentes,
+#  e a latência de uma requisição a um peer vivo enquanto outra requisição espera por um peer que não responde.
+#
+#  Sobe um Rendezvous e 2 peers neste processo (via UDP em 127.0.0.1). Cada requisição é um Ping do primeiro peer para o segundo.
+#
+#  Uso: python benchmarks/request_throughput.py seconds_per_level [max_concurrency]
+
+import os, socket, sys, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 23000
+
+## Um endereço em que nenhum peer está escutando.
+DEAD_ADDRESS = ('127.0.0.1', BASE_PORT + 99)
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def startRing(N):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), 1024, 1)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    ring = []
+    for i in range(N):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), True, False)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.5)
+        ring.append(peer)
+    return ring
+
+def throughput(source, destination, concurrency, seconds):
+    completed = [0] * concurrency
+    deadline = time.time() + seconds
+
+    def worker(i):
+        while time.time() < deadline:
+            try:
+                source.sendRequest(['Ping'], destination, 3.0)
+                completed[i] += 1
+            except socket.timeout:
+                pass
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(completed) / float(seconds)
+
+def latencyBehindDeadPeer(source, destination):
+    def pingDeadPeer():
+        try:
+            source.sendRequest(['Ping'], DEAD_ADDRESS, 3.0)
+        except socket.timeout:
+            pass
+
+    thread = threading.Thread(target=pingDeadPeer)
+    thread.start()
+    time.sleep(0.05)
+    start = time.time()
+    source.sendRequest(['Ping'], destination, 3.0)
+    latency = time.time() - start
+    thread.join()
+    return latency
+
+def main(seconds, maxConcurrency):
+    source, destination = startRing(2)
+    concurrency = 1
+    while concurrency <= maxConcurrency:
+        print >>results, 'concurrency %3d: %8.1f requests/s' % (concurrency, throughput(source, destination.address, concurrency, seconds))
+        concurrency *= 2
+    print >>results, 'Ping to a live peer while a request to a dead peer is pending: %.1f ms' % (1000 * latencyBehindDeadPeer(source, destination.address))
+
+if __name__ == '__main__':
+    if len(sys.argv) in (2, 3):
+        sys.stdout = open(os.devnull, 'w')
+        main(float(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) == 3 else 32)
+    else:
+        print >>sys.stderr, 'usage: request_throughput.py seconds_per_level [max_concurrency]'
+        sys.exit(1)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede o ganho da retransmissão das requisições (src/retransmit.py) com perda de pacotes, sobre o simulador (src/simulator.py).
+#
+#  Para cada taxa de perda, duas simulações com a mesma semente, com e sem retransmissão, colocam N peers na DHT, esperam o anel
+#  estabilizar e deixam o anel ocioso por IDLE segundos, contando os peers vivos removidos por engano (vizinhos que pareceram mortos) e
+#  as mensagens por peer e por segundo. Em seguida, são feitas pesquisas sem o cache de responsáveis. São impressos a fração das
+#  pesquisas corretas, os percentis das suas latências, os percentis do RTT de todas as requisições (dos histogramas de metrics.py,
+#  arredondados para o limite superior do balde) e o número de reenvios por requisição. Os tempos são do relógio virtual.
+#
+#  Uso: python benchmarks/retransmission.py N [K] [pesquisas] [semente]
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import simulator, metrics
+
+## As taxas de perda de pacotes medidas.
+LOSSES = (0.0, 0.01, 0.02, 0.05)
+
+## A latência da rede simulada, em segundos (mais até a mesma quantidade de variação).
+LATENCY = 0.005
+
+## O tempo, em segundos do relógio virtual, de espera para que o anel estabilize depois das entradas.
+SETTLE = 30.0
+
+## O tempo, em segundos do relógio virtual, em que o anel fica ocioso.
+IDLE = 60.0
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if len(values) > 0 else float('nan')
+
+## Soma os histogramas de RTT de todos os tipos de requisição de todos os peers.
+def rttHistogram(peers):
+    total = metrics.Histogram()
+    for peer in peers:
+        for histogram in peer.metrics.rtt.values():
+            total.buckets = [a + b for a, b in zip(total.buckets, histogram.buckets)]
+            total.count += histogram.count
+            total.max = max(total.max, histogram.max)
+    return total
+
+def run(N, K, lookups, seed, loss, useRetransmission):
+    simulation = simulator.Simulation(K, 1, seed, {'latency': LATENCY, 'jitter': LATENCY, 'loss': loss},
+                                      {'useRetransmission': useRetransmission})
+    row = {}
+    row['joined'] = simulation.join(N)[1]
+    simulation.loop.runFor(SETTLE)
+
+    before = simulation.network.totalSent()
+    simulation.loop.runFor(IDLE)
+    row['idle'] = (simulation.network.totalSent() - before) / IDLE / len(simulation.peers)
+    row['removed'] = sum(1 for peer in simulation.peers if not peer.id in simulation.rendezvous.peersByID)
+
+    answers = simulation.lookups(lookups)
+    latencies = [answer[2] * 1000 for answer in answers if answer[0]]
+    row['ok'] = 100.0 * len(latencies) / lookups
+    row['latency'] = (percentile(latencies, 0.5), percentile(latencies, 0.99), max(latencies) if len(latencies) > 0 else float('nan'))
+
+    rtt = rttHistogram(simulation.peers)
+    row['rtt'] = tuple((rtt.percentile(fraction) or 0.0) * 1000 for fraction in (0.5, 0.99, 0.999))
+    requests = sum(rtt.count for peer in simulation.peers for rtt in peer.metrics.rtt.values()) + \
+               sum(sum(peer.metrics.timeouts.values()) for peer in simulation.peers)
+    row['retransmissions'] = float(sum(sum(peer.metrics.retransmissions.values()) for peer in simulation.peers)) / max(1, requests)
+    simulation.close()
+    return row
+
+def main(N, K, lookups, seed):
+    print >>results, 'N=%d K=%d latency=%.1f ms (+ up to %.1f ms of jitter) lookups=%d seed=%d idle=%.0f s' % (
+        N, K, LATENCY * 1000, LATENCY * 1000, lookups, seed, IDLE)
+    print >>results, '%5s %-6s | %6s %7s %8s | %6s %8s %8s %8s | %8s %8s %8s | %7s' % (
+        'loss', 'retx', 'joined', 'removed', 'idle m/s', 'ok%', 'p50 ms', 'p99 ms', 'max ms', 'rtt p50', 'rtt p99', 'p99.9', 'retx/rq')
+    for loss in LOSSES:
+        for useRetransmission in (False, True):
+            row = run(N, K, lookups, seed, loss, useRetransmission)
+            print >>results, '%4.0f%% %-6s | %6d %7d %8.2f | %6.1f %8.1f %8.1f %8.1f | %8.1f %8.1f %8.1f | %7.3f' % (
+                loss * 100, 'on' if useRetransmission else 'off', row['joined'], row['removed'], row['idle'], row['ok'],
+                row['latency'][0], row['latency'][1], row['latency'][2], row['rtt'][0], row['rtt'][1], row['rtt'][2], row['retransmissions'])
+
+if __name__ == '__main__':
+    if 2 <= len(sys.argv) <= 5:
+        sys.stdout = open(os.devnull, 'w')
+        main(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 2**20, int(sys.argv[3]) if len(sys.argv) > 3 else 500,
+             int(sys.argv[4]) if len(sys.argv) > 4 else 0)
+    else:
+        print >>sys.stderr, 'usage: retransmission.py N [K] [lookups] [seed]'
+        sys.exit(1)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede o tempo de reparo do anel depois da falha de vários peers consecutivos.
+#
+#  Sobe um Rendezvous e N peers neste processo (via UDP em 127.0.0.1), espera as listas de vizinhos ficarem completas e derruba
+#  \c falhas peers consecutivos do anel ao mesmo tempo. Mede o tempo até que os ponteiros de todos os peers que restaram (nextID e
+#  previousID) e o registro do Rendezvous voltem a corresponder ao anel sem os peers derrubados.
+#
+#  Uso: python benchmarks/ring_repair.py N K falhas [tamanho_das_listas]
+
+import os, sys, threading, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from peer import Peer
+from rendezvous import Rendezvous
+
+BASE_PORT = 30000
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def consistent(ring, rendezvous):
+    ids = sorted(peer.id for peer in ring)
+    byID = dict((peer.id, peer) for peer in ring)
+    for i, id in enumerate(ids):
+        if byID[id].nextID != ids[(i + 1) % len(ids)] or byID[id].previousID != ids[i - 1]:
+            return False
+    return rendezvous.ring == ids
+
+def main(N, K, failures, listSize):
+    rendezvous = Rendezvous(('127.0.0.1', BASE_PORT), K, 1, None)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    ring = []
+    for i in range(N):
+        peer = Peer(('127.0.0.1', BASE_PORT + 1 + i), ('127.0.0.1', BASE_PORT), True, False, neighbourListSize = listSize)
+        thread = threading.Thread(target=peer.run)
+        thread.daemon = True
+        thread.start()
+        while peer.nextAddress is None:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        ring.append(peer)
+
+    # esperando algumas rodadas da estabilização (uma a cada 3s), para que as listas de vizinhos fiquem completas
+    time.sleep(3.0 * listSize + 1.0)
+    if not consistent(ring, rendezvous):
+        print >>results, 'the ring is not consistent before the failures'
+        return
+
+    # os peers derrubados param de responder (os sockets são fechados, e as suas threads terminam com erro)
+    ring.sort(key=lambda peer: peer.id)
+    victims = ring[len(ring) // 2:len(ring) // 2 + failures]
+    start = time.time()
+    for victim in victims:
+        victim.sock.close()
+    ring = [peer for peer in ring if not peer in victims]
+
+    while not consistent(ring, rendezvous):
+        if time.time() - start > 60.0:
+            print >>results, 'failures=%d list_size=%d: the ring was not repaired in 60 s' % (failures, listSize)
+            return
+        time.sleep(0.05)
+    print >>results, 'failures=%d list_size=%d: ring repaired in %.2f s' % (failures, listSize, time.time() - start)
+
+if __name__ == '__main__':
+    if len(sys.argv) in (4, 5):
+        sys.stdout = sys.stderr = open(os.devnull, 'w') # inclusive os erros das threads dos peers derrubados
+        main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]) if len(sys.argv) == 5 else 4)
+    else:
+        print >>sys.stderr, 'usage: ring_repair.py N K failures [list_size]'
+        sys.exit(1)
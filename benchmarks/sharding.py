@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede quantas pesquisas por segundo um peer encaminha em função do número de processos de trabalho (ver src/shard.py).
+#
+#  Para cada número de processos W (0, 1, 2, 4, ... até max_workers), sobe um Rendezvous neste processo e dois peers em processos
+#  próprios (via UDP em 127.0.0.1): A e B, os dois com W processos de trabalho (com W = 0, peers comuns). Processos clientes enviam a A
+#  pesquisas por chaves das quais B é o responsável, mantendo WINDOW pesquisas pendentes cada um; A as encaminha para B, que responde
+#  Found diretamente aos clientes. É impressa a taxa de pesquisas respondidas, depois de WARMUP segundos. O kernel distribui os
+#  datagramas entre os sockets da porta pelo endereço de quem os enviou, por isso são usados vários clientes.
+#
+#  Uso: python benchmarks/sharding.py seconds_per_level [max_workers] [clients]
+
+import os, random, socket, sys, threading, time, multiprocessing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common, wire
+from peer import Peer
+from shard import ShardedPeer
+from rendezvous import Rendezvous
+
+BASE_PORT = 24000
+
+## O número máximo de nós da DHT.
+K = 2**20
+
+## O número de pesquisas pendentes de cada cliente.
+WINDOW = 16
+
+## O tempo, em segundos, antes do início da contagem.
+WARMUP = 1.0
+
+## O tempo, em segundos, depois do qual uma pesquisa sem resposta é substituída por outra.
+LOST = 1.0
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def runPeer(address, rendezvousAddress, workers):
+    peer = ShardedPeer(address, rendezvousAddress, workers, interactive = False) if workers > 0 else Peer(address, rendezvousAddress, True, False)
+    peer.run()
+
+def ringState(sock, address):
+    try:
+        reply = common.request(sock, ['Request', 'ID', 'previousID'], 0, address, 1.0)
+        return int(reply[1]), int(reply[2])
+    except (socket.timeout, ValueError):
+        return None
+
+def client(target, keys, seconds, completedQueue):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.1)
+    origin = sock.getsockname()
+    pending = {}
+    queryID = [random.randrange(2**31)]
+
+    def search():
+        queryID[0] += 1
+        pending[queryID[0]] = time.time()
+        sock.sendto(wire.encodeText(['Search', random.choice(keys), origin, queryID[0], 0], True, queryID[0]), target)
+
+    for i in range(WINDOW):
+        search()
+    start = time.time()
+    completed = 0
+    while time.time() < start + seconds:
+        try:
+            data, address = sock.recvfrom(common.MAX)
+            waitForReply, messageID, fields = wire.decode(data)
+        except socket.timeout:
+            fields = [None]
+
+        if fields[0] == 'Found':
+            sock.sendto(wire.encodeText(['FoundACK'], False, messageID), address)
+            if pending.pop(int(fields[1]), None) != None:
+                if time.time() >= start + WARMUP:
+                    completed += 1
+                search()
+
+        for lost in [query for query, sent in pending.items() if sent < time.time() - LOST]:
+            del pending[lost]
+            search()
+    completedQueue.put(completed)
+
+def relayRate(workers, level, seconds, clients):
+    rendezvousAddress = ('127.0.0.1', BASE_PORT + 10 * level)
+    rendezvous = Rendezvous(rendezvousAddress, K, 1)
+    thread = threading.Thread(target=rendezvous.run)
+    thread.daemon = True
+    thread.start()
+
+    addressA, addressB = ('127.0.0.1', BASE_PORT + 10 * level + 1), ('127.0.0.1', BASE_PORT + 10 * level + 2)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peers = []
+    for address in (addressA, addressB):
+        process = multiprocessing.Process(target=runPeer, args=(address, rendezvousAddress, workers))
+        process.start()
+        peers.append(process)
+        while ringState(sock, address) == None:
+            time.sleep(0.1)
+
+    # espera até que o anel tenha os dois peers
+    while True:
+        stateA, stateB = ringState(sock, addressA), ringState(sock, addressB)
+        if stateA != None and stateB != None and stateA[1] == stateB[0] and stateB[1] == stateA[0]:
+            break
+        time.sleep(0.1)
+    time.sleep(1.0)
+
+    keys = [key for key in random.sample(xrange(K + 1), 10000) if common.inInterval(key, stateA[0], stateB[0])]
+    completedQueue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(addressA, keys, seconds + WARMUP, completedQueue)) for i in range(clients)]
+    for process in processes:
+        process.start()
+    completed = sum(completedQueue.get() for process in processes)
+
+    for process in processes + peers:
+        process.terminate()
+        process.join()
+    return completed / float(seconds)
+
+def main(seconds, maxWorkers, clients):
+    print >>results, 'clients=%d window=%d cores=%d' % (clients, WINDOW, multiprocessing.cpu_count())
+    workers = 0
+    level = 0
+    while workers <= maxWorkers:
+        print >>results, 'workers %2d: %8.1f searches relayed/s' % (workers, relayRate(workers, level, seconds, clients))
+        workers = 1 if workers == 0 else 2 * workers
+        level += 1
+
+if __name__ == '__main__':
+    if len(sys.argv) in (2, 3, 4):
+        sys.stdout = open(os.devnull, 'w')
+        main(float(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) >= 3 else multiprocessing.cpu_count(), int(sys.argv[3]) if len(sys.argv) == 4 else 8)
+    else:
+        print >>sys.stderr, 'usage: sharding.py seconds_per_level [max_workers] [clients]'
+        sys.exit(1)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Suíte de benchmarks sobre o simulador (src/simulator.py): entrada, pesquisas, manutenção ociosa e falhas, para vários tamanhos de anel.
+#
+#  Para cada N, uma simulação nova (com a mesma semente) coloca N peers na DHT, um após o outro, espera o anel estabilizar, faz
+#  pesquisas sem o cache de responsáveis, mede as mensagens de manutenção com o anel ocioso e derruba 10% dos peers ao mesmo tempo.
+#  Os tempos são do relógio virtual da simulação (exceto a última coluna, o tempo real gasto com cada N), e as mensagens são as
+#  contadas pela rede simulada. Com os mesmos argumentos, os resultados são sempre os mesmos, de forma que podem ser comparados
+#  entre versões para encontrar regressões.
+#
+#  Uso: python benchmarks/simulation.py N[,N...] [K] [latência_ms] [perda] [reordenação] [semente]
+
+import os, sys, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import simulator
+
+## O número de pesquisas feitas em cada rodada.
+LOOKUPS = 500
+
+## O tempo, em segundos do relógio virtual, de espera para que o anel estabilize depois das entradas e das falhas.
+SETTLE = 30.0
+
+## A fração dos peers derrubados.
+CHURN = 0.1
+
+## Os tipos das mensagens trocadas pelas pesquisas.
+LOOKUP_MESSAGES = ('Search', 'Searching', 'Found', 'FoundACK', 'SearchMany', 'FoundMany')
+
+## Saída dos resultados (a saída padrão é descartada, pois os peers e o rendezvous imprimem o andamento da DHT).
+results = sys.stdout
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if len(values) > 0 else float('nan')
+
+def lookupRound(simulation):
+    before = dict((name, simulation.network.sent[name]) for name in LOOKUP_MESSAGES)
+    answers = simulation.lookups(LOOKUPS)
+    messages = sum(simulation.network.sent[name] - before[name] for name in LOOKUP_MESSAGES)
+    correct = sum(1 for answer in answers if answer[0])
+    return answers, 100.0 * correct / LOOKUPS, float(messages) / LOOKUPS
+
+def run(N, K, latency, loss, reorder, seed):
+    wallStart = time.time()
+    simulation = simulator.Simulation(K, 1, seed, {'latency': latency, 'jitter': latency, 'loss': loss, 'reorder': reorder,
+                                                   'reorderDelay': 10 * latency})
+    row = {'N': N}
+
+    row['join'], row['joined'] = simulation.join(N)
+    row['joinMessages'] = float(simulation.network.totalSent()) / N
+    simulation.loop.runFor(SETTLE)
+
+    answers, row['ok'], row['lookupMessages'] = lookupRound(simulation)
+    hops = [answer[1] for answer in answers if answer[1] != None]
+    latencies = [answer[2] * 1000 for answer in answers if answer[2] != None]
+    row['hops'] = (sum(hops) / float(len(hops)) if len(hops) > 0 else float('nan'), percentile(hops, 0.99))
+    row['latency'] = (percentile(latencies, 0.5), percentile(latencies, 0.9), percentile(latencies, 0.99))
+
+    before = simulation.network.totalSent()
+    simulation.loop.runFor(10.0)
+    row['idle'] = (simulation.network.totalSent() - before) / 10.0 / N
+
+    victims = random.sample(simulation.peers, max(1, int(CHURN * N)))
+    simulation.crash(victims)
+    row['repair'] = simulation.waitFor(simulation.consistent, 120.0)
+    simulation.loop.runFor(SETTLE)
+    row['okAfterChurn'] = lookupRound(simulation)[1]
+
+    simulation.close()
+    row['wall'] = time.time() - wallStart
+    return row
+
+def seconds(value):
+    return '%7.2f' % value if value != None else '  never'
+
+def main(sizes, K, latency, loss, reorder, seed):
+    print >>results, 'K=%d latency=%.1f ms (+ up to %.1f ms of jitter) loss=%.1f%% reorder=%.1f%% seed=%d lookups=%d churn=%d%%' % (
+        K, latency * 1000, latency * 1000, loss * 100, reorder * 100, seed, LOOKUPS, CHURN * 100)
+    print >>results, '%6s | %8s %6s %9s | %5s %5s %8s %8s %8s %8s %6s | %9s | %7s %6s | %7s' % (
+        'N', 'join s', 'joined', 'msgs/peer', 'hops', 'p99', 'p50 ms', 'p90 ms', 'p99 ms', 'msgs/lk', 'ok%', 'idle m/p/s', 'repair', 'ok%', 'wall s')
+    for N in sizes:
+        row = run(N, K, latency, loss, reorder, seed)
+        print >>results, '%6d | %8.2f %6d %9.1f | %5.2f %5d %8.1f %8.1f %8.1f %8.1f %6.1f | %10.2f | %s %6.1f | %7.1f' % (
+            N, row['join'], row['joined'], row['joinMessages'], row['hops'][0], row['hops'][1], row['latency'][0],
+            row['latency'][1], row['latency'][2], row['lookupMessages'], row['ok'], row['idle'], seconds(row['repair']),
+            row['okAfterChurn'], row['wall'])
+
+if __name__ == '__main__':
+    if 2 <= len(sys.argv) <= 7:
+        sys.stdout = open(os.devnull, 'w')
+        main([int(N) for N in sys.argv[1].split(',')], int(sys.argv[2]) if len(sys.argv) > 2 else 2**20,
+             float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.005, float(sys.argv[4]) if len(sys.argv) > 4 else 0.0,
+             float(sys.argv[5]) if len(sys.argv) > 5 else 0.0, int(sys.argv[6]) if len(sys.argv) > 6 else 0)
+    else:
+        print >>sys.stderr, 'usage: simulation.py N[,N...] [K] [latency_ms] [loss] [reorder] [seed]'
+        sys.exit(1)
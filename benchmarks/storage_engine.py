@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Mede a vazão e a latência do armazenamento local dos peers (storage.LogStore).
+#
+#  Em um arquivo temporário: escreve N chaves, lê chaves aleatórias, faz uma carga mista (metade leituras, metade escritas),
+#  e mede o tempo da compactação e o tempo para reabrir o log (reconstruindo o índice).
+#
+#  Uso: python benchmarks/storage_engine.py N value_size
+
+import os, sys, random, shutil, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from storage import LogStore
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def report(label, latencies):
+    total = sum(latencies)
+    print '%-10s ops=%-7d %9.0f ops/s | latency us p50=%.1f p99=%.1f max=%.1f' % (label, len(latencies), len(latencies) / total,
+                                                                             1e6 * percentile(latencies, 0.5), 1e6 * percentile(latencies, 0.99),
+                                                                             1e6 * max(latencies))
+
+def timed(operation, arguments):
+    latencies = []
+    for args in arguments:
+        start = time.time()
+        operation(*args)
+        latencies.append(time.time() - start)
+    return latencies
+
+def main(N, valueSize):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'store.log')
+        store = LogStore(path)
+        keys = ['key-%d' % i for i in range(N)]
+        value = os.urandom(valueSize)
+
+        report('put', timed(store.put, [(key, value) for key in keys]))
+        report('get', timed(store.get, [(random.choice(keys),) for _ in range(N)]))
+
+        operations = [(store.put, (random.choice(keys), value)) if random.random() < 0.5 else (store.get, (random.choice(keys),)) for _ in range(N)]
+        report('mixed', timed(lambda operation, args: operation(*args), operations))
+
+        size = store.size
+        start = time.time()
+        store.compact()
+        print 'compaction: %.1f MB -> %.1f MB in %.3f s' % (size / 1e6, store.size / 1e6, time.time() - start)
+
+        store.close()
+        start = time.time()
+        store = LogStore(path)
+        print 'reopen: %d keys indexed in %.3f s' % (len(store), time.time() - start)
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        random.seed(1)
+        main(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        print >>sys.stderr, 'usage: storage_engine.py N value_size'
+        sys.exit(1)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Compara o formato de texto e o formato binário das mensagens (ver src/wire.py).
+#
+#  Para cada tipo de mensagem, mede o tamanho codificado e o tempo de codificação e de decodificação em cada formato.
+#  A decodificação de texto inclui a conversão dos campos (int() e common.strToAddr()), que o formato binário dispensa.
+#
+#  Uso: python benchmarks/wire_codec.py [iterations]
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import common, wire
+
+## Mensagens típicas do protocolo, com os campos que precisam ser convertidos depois de decodificadas.
+MESSAGES = [
+    ('Ping', ['Ping'], []),
+    ('Search', ['Search', 734, ('192.168.0.17', 40123), 18231, 3], [(1, int), (2, common.strToAddr), (3, int), (4, int)]),
+    ('Found', ['Found', 18231, ('192.168.0.42', 40077), 736, 5], [(1, int), (2, common.strToAddr), (3, int), (4, int)]),
+    ('Set', ['Set', 'nextID', 736, 'nextAddress', ('192.168.0.42', 40077), 'nextNextAddress', ('192.168.0.9', 40002)],
+     [(2, int), (4, common.strToAddr), (6, common.strToAddr)]),
+    ('Reply', ['Reply', 736, 512, ('192.168.0.5', 40011), ('192.168.0.3', 40019), 800, ('192.168.0.9', 40002), ('192.168.0.11', 40031)],
+     [(1, int), (2, int), (3, common.strToAddr), (4, common.strToAddr), (5, int), (6, common.strToAddr), (7, common.strToAddr)]),
+]
+
+def measure(function, iterations):
+    start = time.time()
+    for _ in xrange(iterations):
+        function()
+    return 1e6 * (time.time() - start) / iterations
+
+def main(iterations):
+    print '%-8s %8s %8s %14s %14s %14s %14s' % ('message', 'text B', 'binary B', 'text enc us', 'binary enc us', 'text dec us', 'binary dec us')
+    for name, fields, conversions in MESSAGES:
+        text = wire.encode(fields, True, 123456, False)
+        binary = wire.encode(fields, True, 123456, True)
+
+        def decodeText():
+            decoded = wire.decode(text)[2]
+            for i, convert in conversions:
+                decoded[i] = convert(decoded[i])
+
+        def decodeBinary():
+            decoded = wire.decode(binary)[2]
+            for i, convert in conversions:
+                decoded[i] = convert(decoded[i])
+
+        decodeText()
+        assert wire.decode(binary)[2] == fields
+
+        print '%-8s %8d %8d %14.2f %14.2f %14.2f %14.2f' % (name, len(text), len(binary),
+                                                            measure(lambda: wire.encode(fields, True, 123456, False), iterations),
+                                                            measure(lambda: wire.encode(fields, True, 123456, True), iterations),
+                                                            measure(decodeText, iterations), measure(decodeBinary, iterations))
+
+if __name__ == '__main__':
+    if len(sys.argv) <= 2:
+        main(int(sys.argv[1]) if len(sys.argv) == 2 else 100000)
+    else:
+        print >>sys.stderr, 'usage: wire_codec.py [iterations]'
+        sys.exit(1)
@@ -0,0 +1,1041 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import common, eventloop, wire, storage, cache, neighbours, detector, metrics, retransmit, merkle, hotkeys
+from rendezvous import Rendezvous
+import sys, time, threading, random
+
+## Um Peer que roda sobre um eventloop.EventLoop, ao invés de usar uma thread por tarefa.
+#
+#  Fala exatamente o mesmo protocolo que peer.Peer (hello/ACK com o Rendezvous, Request, Set, Ping, Neighbours, Search, Found, SearchMany,
+#  FoundMany, Put, Get, Delete, Removed e Cache),
+#  de forma que peers das duas implementações podem participar do mesmo anel. Como nada bloqueia, um único processo
+#  (e uma única thread) pode rodar milhares de peers lógicos, cada um com o seu socket.
+#
+#  Toda operação que espera por uma resposta recebe um callback, que é chamado com a resposta (uma lista de campos, ver wire.py),
+#  ou com \c None caso ocorra timeout. As requisições são enviadas e reenviadas pelo retransmit.Requester.
+class AsyncPeer(retransmit.Requester):
+    ## @var loop
+    #  O eventloop.EventLoop em que o peer roda.
+
+    ## @var address
+    #  O endereço associado ao peer.
+
+    ## @var sock
+    #  O socket associado ao peer.
+
+    ## @var id
+    #  O ID associado ao peer.
+
+    ## @var isRoot
+    #  Um bool para indicar se o peer é root ou não.
+
+    ## @var nextID
+    #  O ID do sucessor a este peer na DHT.
+
+    ## @var nextAddress
+    #  O endereço de IP:Porta do nó sucessor a este peer na DHT.
+
+    ## @var nextNextAddress
+    #  O endereço de IP:Porta do nó sucessor ao nó sucessor a este peer na DHT.
+
+    ## @var previousID
+    #  O ID do predecessor a este peer na DHT.
+
+    ## @var previousAddress
+    #  O endereço IP:Porta do nó antecessor a este na DHT.
+
+    ## @var previousPreviousAddress
+    #  O endereço IP:Porta do nó antecessor ao nó antecessor a este peer na DHT.
+
+    ## @var successors
+    #  A lista de sucessores do peer (ver peer.Peer.successors).
+
+    ## @var predecessors
+    #  A lista de antecessores do peer (ver peer.Peer.predecessors).
+
+    ## @var neighbourListSize
+    #  O número máximo de entradas de successors e de predecessors.
+
+    ## @var legacyNeighbours
+    #  Os endereços dos vizinhos que não conhecem a mensagem Neighbours (ver peer.Peer.legacyNeighbours).
+
+    ## @var failureDetector
+    #  O detector.PhiAccrualDetector das entradas de successors e de predecessors (ver peer.Peer.failureDetector).
+
+    ## @var rendezvousAddress
+    #  O endereço IP:Porta do Rendezvous.
+
+    ## @var K
+    #  O número máximo de nós na rede.
+
+    ## @var method
+    #  O método de como os IDs serão distribuídos na DHT (ver peer.Peer.method).
+
+    ## @var fingers
+    #  A finger table do peer (ver peer.Peer.fingers).
+
+    ## @var useFingers
+    #  Caso seja \c True, as pesquisas são encaminhadas pela finger table.
+
+    ## @var pendingRequests
+    #  Um dicionário, indexado pelo ID único da mensagem, contendo tuplas (callback, eventloop.Timer) das requisições que esperam por uma resposta.
+    #  O Timer é o do timeout ou, para as requisições em inFlight, o do próximo reenvio.
+    #  As pesquisas iniciadas por lookup() também ficam neste dicionário, indexadas pelo ID da pesquisa.
+
+    ## @var inFlight
+    #  As requisições enviadas que serão reenviadas enquanto não forem respondidas (ver peer.Peer.inFlight).
+
+    ## @var useRetransmission
+    #  Caso seja \c True, as requisições são reenviadas enquanto não forem respondidas (ver retransmit.py).
+
+    ## @var rttEstimator
+    #  O retransmit.RTTEstimator com os tempos de retransmissão de cada destino.
+
+    ## @var replyCache
+    #  O retransmit.ReplyCache com as respostas enviadas (ver peer.Peer.replyCache).
+
+    ## @var batchLookups
+    #  As pesquisas em lote iniciadas por lookupMany() que ainda esperam por respostas (ver peer.Peer.batchLookups).
+
+    ## @var wireFormats
+    #  O formato (wire.TEXT ou wire.BINARY) usado nas mensagens enviadas a cada endereço (ver peer.Peer.wireFormats).
+
+    ## @var messageID
+    #  O próximo ID que será alocado à próxima mensagem (que requer resposta) enviada por este Peer (ver peer.Peer.messageID).
+
+    ## @var rendezvousCallback
+    #  O callback que receberá a próxima resposta do Rendezvous durante o contato inicial, ou \c None fora dele.
+
+    ## @var rendezvousTimer
+    #  O eventloop.Timer que reenviará a mensagem ao Rendezvous caso ele não responda.
+
+    ## @var joined
+    #  \c True depois que o peer foi alocado na DHT.
+
+    ## @var onJoined
+    #  Uma função, sem argumentos, que será chamada quando o peer for alocado na DHT e os seus vizinhos tiverem sido atualizados, ou \c None.
+
+    ## @var deferredRequests
+    #  As requisições (tuplas (ID da mensagem, mensagem, endereço)) recebidas antes de o peer ser alocado na DHT, que só são
+    #  tratadas depois disso, como em peer.Peer (ex.: o Request de um peer que recebeu este peer como sugestão do Rendezvous).
+
+    ## @var storagePath
+    #  O caminho do arquivo de log do peer (ver peer.Peer.storagePath).
+
+    ## @var store
+    #  O storage.LogStore do peer, ou \c None enquanto ele não tiver sido aberto (ver openStore()).
+
+    ## @var incomingValues
+    #  Os valores divididos em pedaços que ainda estão sendo recebidos (ver storage.handleRequest()).
+
+    ## @var ownerCache
+    #  O cache.OwnerCache com os responsáveis pelas chaves já pesquisadas (ver peer.Peer.ownerCache).
+
+    ## @var hotKeys
+    #  O hotkeys.HotKeys do peer (ver peer.Peer.hotKeys), com o relógio do laço de eventos, ou \c None.
+
+    ## @var virtualNode
+    #  Uma tupla (endereço do peer físico, índice), caso o peer seja um nó virtual (ver startVirtualNodes()), ou \c None.
+
+    ## @var siblings
+    #  A lista dos nós virtuais do mesmo peer físico (incluindo este), compartilhada entre eles, ou uma lista vazia.
+
+    ## @var metrics
+    #  O metrics.Metrics do peer (ver peer.Peer.metrics). Os RTTs e as latências das pesquisas são medidos pelo relógio do laço de eventos.
+
+    ## @var metricsPath
+    #  O caminho do arquivo de métricas (ver peer.Peer.metricsPath), ou \c None.
+
+    ## @var metricsInterval
+    #  O intervalo, em segundos, entre as escritas no arquivo de métricas.
+
+    ## O construtor padrão.
+    #  @param loop O eventloop.EventLoop em que o peer rodará.
+    #  @param address O endereço de rede correspondente ao peer.
+    #  @param rendezvousAddress O endereço do rendezvous.
+    #  @param useFingers Caso seja \c True, as pesquisas são encaminhadas pela finger table.
+    #  @param storagePath O caminho do arquivo de log do peer. Caso seja \c None, o arquivo dht-<ip>-<porta>.log do diretório atual é usado.
+    #  @param neighbourListSize O número máximo de entradas das listas de sucessores e de antecessores (pelo menos 2).
+    #  @param suspicionThreshold O nível de suspeita a partir do qual um vizinho é considerado morto (ver detector.PhiAccrualDetector.threshold).
+    #  @param virtualNode Uma tupla (endereço do peer físico, índice), caso o peer seja um nó virtual, ou \c None.
+    #  @param siblings A lista dos nós virtuais do mesmo peer físico, ou \c None.
+    #  @param metricsPath O caminho do arquivo de métricas, ou \c None para não escrevê-lo.
+    #  @param metricsInterval O intervalo, em segundos, entre as escritas no arquivo de métricas.
+    #  @param useRetransmission Caso seja \c True, as requisições são reenviadas enquanto não forem respondidas.
+    #  @param hotKeyThreshold O número de pesquisas a partir do qual uma chave é considerada popular (ver hotkeys.py), ou \c None.
+    def __init__(self, loop, address, rendezvousAddress, useFingers = True, storagePath = None, neighbourListSize = 4, suspicionThreshold = 8.0,
+                 virtualNode = None, siblings = None, metricsPath = None, metricsInterval = 10.0, useRetransmission = True,
+                 hotKeyThreshold = hotkeys.THRESHOLD):
+        self.loop = loop
+        self.address = address
+        self.sock = loop.createSocket(address)
+        self.id = None
+        self.isRoot = False
+
+        self.nextID = None
+        self.nextAddress = None
+        self.nextNextAddress = None
+
+        self.previousID = None
+        self.previousAddress = None
+        self.previousPreviousAddress = None
+
+        self.successors = []
+        self.predecessors = []
+        self.neighbourListSize = max(2, neighbourListSize)
+        self.legacyNeighbours = set()
+        self.failureDetector = detector.PhiAccrualDetector(suspicionThreshold)
+
+        self.rendezvousAddress = rendezvousAddress
+        self.K = None
+        self.method = None
+
+        self.fingers = []
+        self.useFingers = useFingers
+
+        self.pendingRequests = {}
+        self.inFlight = {}
+        self.useRetransmission = useRetransmission
+        self.rttEstimator = retransmit.RTTEstimator()
+        self.replyCache = retransmit.ReplyCache(clock = loop.time)
+        self.batchLookups = {}
+        self.wireFormats = {}
+        self.messageID = random.randrange(2**31)
+
+        self.rendezvousCallback = None
+        self.rendezvousTimer = None
+        self.joined = False
+        self.deferredRequests = []
+        self.onJoined = None
+
+        self.storagePath = storagePath if storagePath != None else 'dht-%s-%d.log' % address
+        self.store = None
+        self.incomingValues = {}
+        self.ownerCache = cache.OwnerCache()
+        self.hotKeys = hotkeys.HotKeys(hotKeyThreshold, clock = loop.time) if hotKeyThreshold != None else None
+
+        self.virtualNode = virtualNode
+        self.siblings = siblings if siblings != None else []
+
+        self.metrics = metrics.Metrics(loop.time)
+        self.metrics.gauges = {'pendingRequests': lambda: len(self.pendingRequests), 'deferredRequests': lambda: len(self.deferredRequests)}
+        self.metricsPath = metricsPath
+        self.metricsInterval = metricsInterval
+
+    ## Manda uma mensagem para um endereço dado, sem esperar por uma resposta.
+    #  @param replyID O ID da mensagem que o destino irá receber para identificar essa mensagem.
+    #  @param sendMsg A mensagem que será enviada, como uma lista de campos.
+    #  @param address O endereço de destino, no formato: ('ip', porta).
+    def replyTo(self, replyID, sendMsg, address):
+        self.replyCache.store(address, replyID, sendMsg)
+        self.send(sendMsg, False, replyID, address)
+
+    ## Verifica se uma requisição recebida é repetida, reenviando a resposta guardada, caso haja uma (ver peer.Peer.isDuplicate()).
+    #  @param msgID O ID da requisição.
+    #  @param name O tipo da requisição.
+    #  @param address O endereço de quem enviou a requisição.
+    #  @return \c True caso a requisição seja repetida, e não deva ser tratada de novo.
+    def isDuplicate(self, msgID, name, address):
+        duplicate, reply = self.replyCache.check(address, msgID, name)
+        if duplicate:
+            self.metrics.duplicateReceived(name)
+            if reply != None:
+                self.replyTo(msgID, reply, address)
+        return duplicate
+
+    ## Inicia o peer: registra o seu socket no laço de eventos e faz o contato inicial com o Rendezvous.
+    #  @param onJoined Uma função, sem argumentos, que será chamada quando o peer for alocado na DHT e os seus vizinhos tiverem sido atualizados.
+    def start(self, onJoined = None):
+        self.onJoined = onJoined
+        self.loop.addReader(self.sock, self.onReadable)
+        if self.metricsPath != None:
+            self.loop.callLater(self.metricsInterval, self.dumpMetrics)
+        hello = 'hello|neighbours' if self.virtualNode == None else 'hello|neighbours|vnode|%s|%d' % self.virtualNode
+        self.contactRendezvous(hello, self.onRendezvousID, fallbackMessage = 'hello')
+
+    ## Envia uma mensagem ao Rendezvous, reenviando-a com o tempo de espera duplicado enquanto não houver resposta
+    #  (como em common.sendAndWaitForResponse()).
+    #
+    #  @param message A mensagem enviada.
+    #  @param callback A função que receberá a resposta (uma string).
+    #  @param delay O tempo de espera atual, em segundos.
+    #  @param fallbackMessage A mensagem enviada no lugar de \c message caso não haja resposta em 1 segundo (ver peer.Peer.firstContactWithRendezvous()), ou \c None.
+    def contactRendezvous(self, message, callback, delay = 0.2, fallbackMessage = None):
+        if delay > 10:
+            print >>sys.stderr, 'Peer at', repr(self.address), 'got no reply from the rendezvous'
+            self.rendezvousCallback = None
+            return
+
+        if delay > 1.0 and fallbackMessage != None:
+            message, fallbackMessage = fallbackMessage, None
+
+        self.rendezvousCallback = callback
+        self.sock.sendto(message, self.rendezvousAddress)
+        self.rendezvousTimer = self.loop.callLater(delay, self.contactRendezvous, message, callback, delay * 2, fallbackMessage)
+
+    ## Trata a resposta do Rendezvous ao "hello" (ver peer.Peer.firstContactWithRendezvous()).
+    #  @param response A resposta recebida.
+    def onRendezvousID(self, response):
+        data_splitted = response.split('|')
+        if len(data_splitted) < 5 or data_splitted[0] != 'ID':
+            return
+
+        try:
+            id, K, method = int(data_splitted[1]), int(data_splitted[3]), int(data_splitted[4])
+            isRoot = data_splitted[2] == 'root'
+            rootAddress = self.address if isRoot else common.parseAddress(data_splitted[2])
+            candidates = [common.parseAddress(hint) for hint in data_splitted[5:]] + [rootAddress]
+        except (ValueError, IndexError, TypeError):
+            print >>sys.stderr, 'Peer at', repr(self.address), 'got a malformed ID from the rendezvous:', repr(response)
+            return
+
+        self.id, self.isRoot, self.K, self.method = id, isRoot, K, method
+
+        self.contactRendezvous('ACK|%s' % self.id, lambda response: self.onRendezvousACK(candidates))
+
+    ## Trata o ACK do Rendezvous, começando a procurar pelo lugar do peer na DHT.
+    #  @param candidates Os endereços dos peers a partir dos quais o lugar será procurado: os sugeridos pelo Rendezvous e o root.
+    def onRendezvousACK(self, candidates):
+        if self.isRoot:
+            self.nextID = self.previousID = self.id
+            self.nextAddress = self.nextNextAddress = self.address
+            self.previousAddress = self.previousPreviousAddress = self.address
+            self.resetNeighbourLists()
+            self.join()
+        else:
+            self.findPlace(candidates[0], candidates[1:])
+
+    ## Pede a vizinhança de um peer da DHT para decidir se o peer atual deve ser inserido ao lado dele (ver peer.Peer.run()).
+    #  @param currAddress O endereço do peer consultado.
+    #  @param candidates Os endereços dos peers consultados caso \c currAddress não responda.
+    def findPlace(self, currAddress, candidates = []):
+        request = ['Request', 'ID', 'previousID', 'previousAddress', 'previousPreviousAddress', 'nextID', 'nextAddress', 'nextNextAddress']
+        self.sendRequest(request, currAddress, 3.0, lambda reply: self.onPlaceReply(currAddress, reply, candidates))
+
+    ## Trata a resposta de findPlace(), inserindo o peer na DHT ou continuando a procura.
+    #  @param currAddress O endereço do peer consultado.
+    #  @param data_splitted A resposta (uma lista de campos), ou \c None caso tenha ocorrido timeout.
+    #  @param candidates Os endereços dos peers consultados caso \c currAddress não tenha respondido.
+    def onPlaceReply(self, currAddress, data_splitted, candidates = []):
+        if data_splitted == None and len(candidates) > 0:
+            self.findPlace(candidates[0], candidates[1:])
+            return
+
+        try:
+            if data_splitted == None or len(data_splitted) != 8 or data_splitted[0] != 'Reply':
+                raise ValueError('no valid reply')
+            currID, currPreviousID, currNextID = int(data_splitted[1]), int(data_splitted[2]), int(data_splitted[5])
+            currPreviousAddress, currPreviousPreviousAddress = common.parseAddress(data_splitted[3]), common.parseAddress(data_splitted[4])
+            currNextAddress, currNextNextAddress = common.parseAddress(data_splitted[6]), common.parseAddress(data_splitted[7])
+        except (ValueError, IndexError, TypeError):
+            print >>sys.stderr, 'Peer', self.id, 'could not join the DHT: no valid reply from', repr(currAddress)
+            return
+
+        isSecondElement = currPreviousID == currID
+
+        if currID < self.id:
+            if currNextID > self.id or currNextID <= currID:
+                # colocar entre currID e currNextID
+                self.nextID, self.nextAddress = currNextID, currNextAddress
+                self.nextNextAddress = currNextNextAddress if not isSecondElement else self.address
+                self.previousID, self.previousAddress = currID, currAddress
+                self.previousPreviousAddress = currPreviousAddress if not isSecondElement else self.address
+                self.resetNeighbourLists()
+                self.join()
+            else:
+                self.findPlace(currNextAddress)
+        elif currID > self.id:
+            if currPreviousID < self.id or currPreviousID >= currID:
+                # colocar entre currPreviousID e currID
+                self.nextID, self.nextAddress = currID, currAddress
+                self.nextNextAddress = currNextAddress if not isSecondElement else self.address
+                self.previousID, self.previousAddress = currPreviousID, currPreviousAddress
+                self.previousPreviousAddress = currPreviousPreviousAddress if not isSecondElement else self.address
+                self.resetNeighbourLists()
+                self.join()
+            else:
+                self.findPlace(currPreviousAddress)
+        else:
+            print >>sys.stderr, 'Trying to allocate an already existing ID at the DHT:', self.id
+
+    ## Atualiza os ponteiros de vizinhança dos peers vizinhos (inclusive vizinhos de vizinhos).
+    #
+    #  As mensagens Set (ver neighbours.allocationUpdates()) são enviadas ao mesmo tempo, e o callback é chamado quando todas forem
+    #  respondidas (ou derem timeout).
+    #
+    #  @param callback Uma função, sem argumentos, chamada ao final.
+    def allocate(self, callback):
+        updates = neighbours.allocationUpdates(self.id, self.address, self.previousAddress, self.previousPreviousAddress,
+                                               self.nextAddress, self.nextNextAddress)
+        if len(updates) == 0:
+            callback()
+            return
+
+        remaining = [len(updates)]
+        def onSetReply(reply):
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                callback()
+
+        for address, setMsg in updates:
+            self.sendRequest(setMsg, address, 3.0, onSetReply)
+
+    ## Aloca o peer no lugar já definido pelos seus ponteiros de vizinhança: começa a tratar as requisições adiadas, a estabilizar e a
+    #  construir a finger table ao mesmo tempo em que envia as mensagens Set, sem esperar pelas respostas. onJoined é chamada quando os
+    #  vizinhos tiverem respondido.
+    def join(self):
+        self.finishJoin()
+        self.allocate(self.onAllocated)
+
+    ## Chamada quando os vizinhos respondem às mensagens Set da entrada do peer (ou dão timeout).
+    def onAllocated(self):
+        if self.onJoined != None:
+            self.onJoined()
+
+    ## Chamada quando o peer é alocado na DHT: começa a estabilizar as listas de vizinhos e a construir a finger table.
+    def finishJoin(self):
+        self.joined = True
+        for msgID, data_splitted, address in self.deferredRequests:
+            self.handleRequest(msgID, data_splitted, address)
+        self.deferredRequests = []
+        self.stabilize()
+        if self.useFingers:
+            self.refreshFinger(0, True)
+
+    ## Lê os datagramas recebidos pelo socket.
+    def onReadable(self):
+        for data, address in eventloop.readDatagrams(self.sock, common.MAX):
+            start = time.time()
+            self.datagramReceived(data, address)
+            self.metrics.messageHandled(time.time() - start)
+
+    ## Trata um datagrama recebido.
+    #  @param data O datagrama.
+    #  @param address O endereço de origem.
+    def datagramReceived(self, data, address):
+        try:
+            willWaitForReply, msgID, data_splitted = wire.decode(data)
+        except ValueError:
+            willWaitForReply, data_splitted = None, []
+
+        if willWaitForReply == None:
+            if self.rendezvousCallback != None and address == self.rendezvousAddress and len(data_splitted) > 0 and data_splitted[0] in ('ID', 'ACK'):
+                callback = self.rendezvousCallback
+                self.rendezvousCallback = None
+                self.rendezvousTimer.cancel()
+                callback(data)
+            else:
+                print 'Uh oh, unknown message coming from' + repr(address) + ':', repr(data)
+            return
+
+        self.failureDetector.heartbeat(address, self.loop.time())
+        self.metrics.messageReceived(data_splitted[0], len(data))
+        if wire.isBinary(data):
+            self.wireFormats[address] = wire.BINARY
+
+        if data_splitted[0] == 'Wire':
+            self.wireFormats[address] = wire.BINARY
+            if willWaitForReply:
+                self.replyTo(msgID, ['Wire', wire.VERSION], address)
+        elif data_splitted[0] == 'Stats':
+            if willWaitForReply:
+                self.replyTo(msgID, ['StatsReport', self.statsReport()], address)
+        elif willWaitForReply and self.isDuplicate(msgID, data_splitted[0], address):
+            pass
+        elif willWaitForReply and not self.joined:
+            self.deferredRequests.append((msgID, data_splitted, address))
+        elif willWaitForReply:
+            self.handleRequest(msgID, data_splitted, address)
+        else:
+            try:
+                self.completeRequest(msgID, data_splitted)
+            except (ValueError, IndexError, TypeError):
+                print 'Uh oh, malformed reply coming from' + repr(address) + ':', repr(wire.toText(data_splitted))
+
+    ## Trata uma requisição com handleMessage(), respondendo Invalid caso ela esteja mal formada (ex.: campos faltando ou que não são
+    #  números). Como o laço de eventos é compartilhado por todos os peers do processo, uma exceção aqui interromperia todos eles.
+    #  @param msgID O ID da mensagem, usado na resposta.
+    #  @param data_splitted A mensagem, como uma lista de campos.
+    #  @param address O endereço de quem enviou a mensagem.
+    def handleRequest(self, msgID, data_splitted, address):
+        try:
+            self.handleMessage(msgID, data_splitted, address)
+        except (ValueError, IndexError, TypeError):
+            print 'Uh oh, malformed message coming from' + repr(address) + ':', repr(wire.toText(data_splitted))
+            self.replyTo(msgID, ['Invalid'], address)
+
+    ## Trata uma mensagem de outro Peer que precisa ser respondida (ver peer.Peer.handleMessages()).
+    #  @param msgID O ID da mensagem, usado na resposta.
+    #  @param data_splitted A mensagem, como uma lista de campos.
+    #  @param address O endereço de quem enviou a mensagem.
+    def handleMessage(self, msgID, data_splitted, address):
+        if len(data_splitted) > 1 and data_splitted[0] == 'Request':
+            fields = [('address', self.address), ('ID', self.id),
+                      ('previousID', self.previousID), ('previousAddress', self.previousAddress), ('previousPreviousAddress', self.previousPreviousAddress),
+                      ('nextID', self.nextID), ('nextAddress', self.nextAddress), ('nextNextAddress', self.nextNextAddress)]
+            reply = ['Reply'] + [value for field, value in fields if field in data_splitted]
+            self.replyTo(msgID, reply, address)
+
+        elif len(data_splitted) > 1 and data_splitted[0] == 'Set':
+            oldPreviousID, oldNextID = self.previousID, self.nextID
+            # todos os campos são lidos antes de serem aplicados, para que um campo mal formado não deixe a vizinhança pela metade
+            updates = []
+            for i in range(1, len(data_splitted) - 1, 2):
+                field, value = data_splitted[i], data_splitted[i + 1]
+                if field in ('previousID', 'nextID'):
+                    updates.append((field, int(value)))
+                elif field in ('previousAddress', 'previousPreviousAddress', 'nextAddress', 'nextNextAddress'):
+                    updates.append((field, common.parseAddress(value)))
+            for field, value in updates:
+                setattr(self, field, value)
+            self.resetNeighbourLists()
+            self.neighbourhoodChanged(oldPreviousID, oldNextID)
+            self.replyTo(msgID, ['Setted'], address)
+
+        elif data_splitted[0] == 'Ping':
+            self.replyTo(msgID, ['Pinged'], address)
+
+        elif data_splitted[0] == 'Neighbours':
+            self.replyTo(msgID, neighbours.encode(self.successors, self.predecessors), address)
+
+        elif data_splitted[0] == 'Search':
+            keySearch = int(data_splitted[1])
+            addressSearching = common.parseAddress(data_splitted[2])
+            queryID = int(data_splitted[3])
+            hops = int(data_splitted[4]) if len(data_splitted) > 4 else 0
+
+            self.replyTo(msgID, ['Searching'], address)
+            self.search(keySearch, addressSearching, queryID, hops, address)
+
+        elif data_splitted[0] == 'Found':
+            queryID = int(data_splitted[1])
+            self.replyTo(msgID, ['FoundACK'], address)
+            self.completeRequest(queryID, data_splitted)
+
+        elif data_splitted[0] in ('Put', 'Get', 'Delete'):
+            try:
+                reply = storage.handleRequest(self.openStore(), self.incomingValues, data_splitted, address, lambda key: self.isResponsible(self.hashKey(key)))
+            except (ValueError, IndexError, TypeError): # requisição mal formada (ex.: campos faltando ou que não são números)
+                reply = ['Invalid']
+            self.replyTo(msgID, reply, address)
+
+        elif data_splitted[0] in merkle.REQUESTS:
+            # apenas responde à sincronização dos vizinhos (ver peer.Peer.syncRange()), sem iniciá-la
+            self.replyTo(msgID, merkle.handleRequest(self.store, data_splitted, lambda key: self.isResponsible(self.hashKey(key))), address)
+
+        elif data_splitted[0] == 'Cache':
+            self.replyTo(msgID, hotkeys.handleCache(self.hotKeys, data_splitted) if self.hotKeys != None else ['Cached'], address)
+
+        elif data_splitted[0] == 'SearchMany':
+            keys, addressSearching = [int(key) for key in data_splitted[4:]], common.parseAddress(data_splitted[1])
+            queryID, hops = int(data_splitted[2]), int(data_splitted[3])
+            self.replyTo(msgID, ['Searching'], address)
+            self.searchMany(keys, addressSearching, queryID, hops)
+
+        elif data_splitted[0] == 'FoundMany':
+            queryID, ownerID, ownerAddress = int(data_splitted[1]), int(data_splitted[3]), common.parseAddress(data_splitted[2])
+            keys = [int(key) for key in data_splitted[5:]]
+            self.replyTo(msgID, ['FoundACK'], address)
+            self.completeBatch(queryID, ownerID, ownerAddress, keys)
+
+        else:
+            print 'Uh oh, unknown message coming from' + repr(address) + ':', repr(wire.toText(data_splitted))
+
+    ## Monta o relatório das métricas do peer (ver metrics.report()).
+    #  @return O relatório, em JSON.
+    def statsReport(self):
+        return metrics.report(self.metrics, self.address, self.id)
+
+    ## Amostra as métricas (ver metrics.Metrics.sample()) e as escreve no arquivo de métricas, a cada metricsInterval segundos.
+    def dumpMetrics(self):
+        self.metrics.sample()
+        metrics.dump(self.metricsPath, self.statsReport())
+        self.loop.callLater(self.metricsInterval, self.dumpMetrics)
+
+    ## Abre o armazenamento local do peer, caso ainda não tenha sido aberto.
+    #  @return O storage.LogStore do peer.
+    def openStore(self):
+        if self.store == None:
+            self.store = storage.LogStore(self.storagePath, merkle.MerkleTree(lambda key: common.ringPosition(self.hashKey(key), self.method), self.K + 1))
+            self.loop.callLater(10.0, self.checkCompaction)
+        return self.store
+
+    ## Verifica (de 10 em 10 segundos) se o log do peer precisa ser compactado. A compactação é feita em uma thread, para não
+    #  bloquear o laço de eventos (storage.LogStore pode ser usado por várias threads).
+    def checkCompaction(self):
+        if self.store.needsCompaction():
+            thread_compaction = threading.Thread(target=self.store.compact)
+            thread_compaction.daemon = True
+            thread_compaction.start()
+        self.loop.callLater(10.0, self.checkCompaction)
+
+    ## Dado uma string, tem como saída um número 0 e K (ver common.hashKey()).
+    #  @param key A string em que será aplicado a função de Hash.
+    #  @return O resultado do hash módulo K.
+    def hashKey(self, key):
+        return common.hashKey(key, self.K, self.method)
+
+    ## Verifica se este peer é o responsável por uma chave, ou seja, se a chave está no intervalo (previousID, id] do anel.
+    #  @param key A chave (já passada por hashKey()).
+    def isResponsible(self, key):
+        return common.inInterval(key, self.previousID, self.id)
+
+    ## Invalida as entradas de ownerCache afetadas por uma mudança na vizinhança do peer (ver peer.Peer.neighbourhoodChanged()).
+    #  @param oldPreviousID O ID do antecessor antes da mudança.
+    #  @param oldNextID O ID do sucessor antes da mudança.
+    def neighbourhoodChanged(self, oldPreviousID, oldNextID):
+        if self.id == None:
+            return
+
+        if self.previousID != oldPreviousID:
+            for previousID in (oldPreviousID, self.previousID):
+                if previousID != None:
+                    self.ownerCache.invalidate(previousID, self.id)
+                    if self.hotKeys != None:
+                        self.hotKeys.invalidate(previousID, self.id)
+
+        if self.nextID != oldNextID:
+            for nextID in (oldNextID, self.nextID):
+                if nextID != None:
+                    self.ownerCache.invalidate(self.id, nextID)
+                    if self.hotKeys != None:
+                        self.hotKeys.invalidate(self.id, nextID)
+
+    ## Escolhe o endereço do próximo salto de uma pesquisa (ver peer.Peer.nextHop()).
+    #  @param key A chave pesquisada.
+    def nextHop(self, key):
+        if not self.useFingers:
+            return self.previousAddress if self.id > key else self.nextAddress
+
+        if common.inInterval(key, self.id, self.nextID):
+            return self.nextAddress
+
+        fingerAddress = common.closestPrecedingFinger(self.id, key, self.fingers)
+        return fingerAddress if fingerAddress != None else self.nextAddress
+
+    ## Escolhe o nó virtual do mesmo peer físico (ver siblings) que deve continuar uma pesquisa, sem mensagens pela rede.
+    #
+    #  Os irmãos funcionam como fingers extras, espalhados pelo anel, que não custam um salto: é escolhido o irmão responsável pela
+    #  chave ou, caso nenhum seja, o irmão que precede a chave mais de perto, desde que ele esteja mais perto dela do que o próximo
+    #  salto pela rede (ver nextHop()).
+    #
+    #  @param key A chave pesquisada.
+    #  @return O AsyncPeer irmão, ou \c None caso a pesquisa deva seguir pela rede.
+    def siblingFor(self, key):
+        best = None
+        for sibling in self.siblings:
+            if sibling is self or not sibling.joined:
+                continue
+            if sibling.isResponsible(key):
+                return sibling
+            if common.inInterval(sibling.id, self.id, key) and (best == None or common.inInterval(sibling.id, best.id, key)):
+                best = sibling
+
+        if best == None or common.inInterval(key, self.id, self.nextID):
+            return None
+
+        hopID = self.nextID
+        for finger in reversed(self.fingers if self.useFingers else []):
+            if finger != None and finger[0] != self.id and common.inInterval(finger[0], self.id, key):
+                hopID = finger[0]
+                break
+        return best if common.inInterval(best.id, hopID, key) else None
+
+    ## Responde a uma pesquisa, caso este peer seja o responsável pela chave ou tenha recebido o seu responsável com a mensagem Cache
+    #  (ver hotkeys.py), ou a encaminha para o próximo salto.
+    #  @param keySearch A chave pesquisada.
+    #  @param addressSearching O endereço do peer que iniciou a pesquisa.
+    #  @param queryID O ID da pesquisa.
+    #  @param hops O número de saltos feitos pela pesquisa até este peer.
+    #  @param previousHop O endereço do peer que encaminhou a pesquisa (o próprio peer, caso ele a tenha iniciado).
+    def search(self, keySearch, addressSearching, queryID, hops, previousHop):
+        if self.isResponsible(keySearch):
+            reply = ['Found', queryID, self.address, self.id, hops, self.previousID]
+            self.sendRequest(reply, addressSearching, 3.0, lambda reply: None)
+            self.pushHotKey(keySearch, previousHop, self.id, self.address, self.previousID)
+            return
+
+        sibling = self.siblingFor(keySearch)
+        if sibling != None:
+            sibling.search(keySearch, addressSearching, queryID, hops, previousHop)
+            return
+
+        cached = self.hotKeys.get(keySearch) if self.hotKeys != None else None
+        if cached != None:
+            self.sendRequest(['Found', queryID, cached[1], cached[0], hops, cached[2]], addressSearching, 3.0, lambda reply: None)
+            self.pushHotKey(keySearch, previousHop, *cached)
+            return
+
+        self.forwardMessage(['Search', keySearch, addressSearching, queryID, hops + 1], self.nextHop(keySearch))
+
+    ## Conta uma pesquisa respondida por este peer e, caso a chave seja popular, envia o seu responsável ao salto anterior com a mensagem
+    #  Cache (ver peer.Peer.pushHotKey()).
+    #  @param key A chave pesquisada.
+    #  @param address O endereço do salto anterior.
+    #  @param ownerID O ID do responsável.
+    #  @param ownerAddress O endereço do responsável.
+    #  @param previousID O ID do antecessor do responsável.
+    #  @param ttl O TTL, em segundos, do responsável enviado. Caso seja \c None (o responsável é este peer), é o TTL de hotKeys.
+    def pushHotKey(self, key, address, ownerID, ownerAddress, previousID, ttl = None):
+        if self.hotKeys == None or not self.hotKeys.record(key, address, self.address):
+            return
+
+        def onPushed(reply):
+            if reply == None:
+                self.hotKeys.refuse(address)
+        message = hotkeys.cacheMessage(key, ownerID, ownerAddress, previousID, ttl if ttl != None else self.hotKeys.ttl)
+        self.sendRequest(message, address, 3.0, onPushed)
+
+    ## Responde pelas chaves das quais este peer é o responsável e encaminha as demais, agrupadas pelo próximo salto
+    #  (ver peer.Peer.searchMany()).
+    #  @param keys As chaves pesquisadas.
+    #  @param addressSearching O endereço do peer que iniciou a pesquisa.
+    #  @param queryID O ID da pesquisa.
+    #  @param hops O número de saltos feitos pela pesquisa até este peer.
+    def searchMany(self, keys, addressSearching, queryID, hops):
+        owned = []
+        groups = {}
+        siblingGroups = {}
+        for key in keys:
+            if self.isResponsible(key):
+                owned.append(key)
+                continue
+
+            sibling = self.siblingFor(key)
+            if sibling != None:
+                siblingGroups.setdefault(sibling, []).append(key)
+            else:
+                groups.setdefault(self.nextHop(key), []).append(key)
+
+        for sibling, group in siblingGroups.iteritems():
+            sibling.searchMany(group, addressSearching, queryID, hops)
+
+        for i in range(0, len(owned), common.MAX_KEYS):
+            self.sendRequest(['FoundMany', queryID, self.address, self.id, hops] + owned[i:i + common.MAX_KEYS], addressSearching, 3.0, lambda reply: None)
+
+        for address, group in groups.iteritems():
+            for i in range(0, len(group), common.MAX_KEYS):
+                self.forwardMessage(['SearchMany', addressSearching, queryID, hops + 1] + group[i:i + common.MAX_KEYS], address)
+
+    ## Envia uma pesquisa para o próximo salto. Caso o finger escolhido não responda, ele é removido da finger table e a pesquisa
+    #  vai para o sucessor.
+    #  @param message A pesquisa, como uma lista de campos.
+    #  @param address O endereço do próximo salto.
+    def forwardMessage(self, message, address):
+        def onForwarded(reply):
+            if reply == None and address != self.nextAddress:
+                self.fingers = [finger if finger == None or finger[1] != address else None for finger in self.fingers]
+                self.sendRequest(message, self.nextAddress, 3.0, lambda reply: None)
+
+        self.sendRequest(message, address, 3.0, onForwarded)
+
+    ## Pesquisa qual peer da DHT é o responsável por uma chave, usando ownerCache (ver peer.Peer.lookup()).
+    #
+    #  @param keySearch A chave pesquisada (já passada por hashKey()).
+    #  @param callback A função que receberá uma tupla (ID do responsável, endereço do responsável, número de saltos), ou \c None caso ocorra timeout.
+    #  @param timeout O tempo, em segundos, de espera máximo pelo resultado.
+    #  @param useCache Caso seja \c False, a pesquisa é feita pela rede mesmo que o responsável esteja em ownerCache.
+    def lookup(self, keySearch, callback, timeout = 10.0, useCache = True):
+        if self.isResponsible(keySearch):
+            self.loop.callSoon(callback, (self.id, self.address, 0))
+            return
+
+        owner = self.ownerCache.get(keySearch) if useCache else None
+        if owner != None:
+            self.loop.callSoon(callback, (owner[0], owner[1], 0))
+            return
+
+        start = self.loop.time()
+        def onFound(resultMessage):
+            if resultMessage == None:
+                self.metrics.lookupCompleted(None, self.loop.time() - start)
+                callback(None)
+                return
+
+            ownerID, ownerAddress = int(resultMessage[3]), common.strToAddr(resultMessage[2])
+            hops = int(resultMessage[4]) if len(resultMessage) > 4 else 0
+            self.ownerCache.put(keySearch, ownerID, ownerAddress, int(resultMessage[5]) if len(resultMessage) > 5 else None)
+            self.metrics.lookupCompleted(hops, self.loop.time() - start)
+            callback((ownerID, ownerAddress, hops))
+
+        queryID = self.messageID
+        self.messageID += 1
+        self.pendingRequests[queryID] = (onFound, self.loop.callLater(timeout, self.completeRequest, queryID, None))
+        self.search(keySearch, self.address, queryID, 0, self.address)
+
+    ## Pesquisa, de uma só vez, quais peers da DHT são os responsáveis por várias chaves (ver peer.Peer.lookupMany()).
+    #
+    #  @param keys As chaves pesquisadas (strings, que ainda serão passadas por hashKey()).
+    #  @param callback A função que receberá um dicionário {chave: (ID do responsável, endereço do responsável)}. As chaves cujos
+    #  responsáveis não foram encontrados antes do timeout ficam de fora do dicionário.
+    #  @param timeout O tempo, em segundos, de espera máximo pelos resultados.
+    def lookupMany(self, keys, callback, timeout = 10.0):
+        keysByHash = {}
+        for key in keys:
+            keysByHash.setdefault(self.hashKey(key), []).append(key)
+
+        results = {}
+        remaining = set()
+        for keySearch in keysByHash:
+            if self.isResponsible(keySearch):
+                results[keySearch] = (self.id, self.address)
+                continue
+
+            owner = self.ownerCache.get(keySearch)
+            if owner != None:
+                results[keySearch] = owner
+            else:
+                remaining.add(keySearch)
+
+        def onDone(message):
+            self.batchLookups.pop(queryID, None)
+            callback(dict((key, results[keySearch]) for keySearch, sameHashKeys in keysByHash.iteritems() if keySearch in results for key in sameHashKeys))
+
+        queryID = self.messageID
+        self.messageID += 1
+        if len(remaining) == 0:
+            self.loop.callSoon(onDone, None)
+            return
+
+        self.pendingRequests[queryID] = (onDone, self.loop.callLater(timeout, self.completeRequest, queryID, None))
+        self.batchLookups[queryID] = (remaining, results)
+        self.searchMany(sorted(remaining), self.address, queryID, 0)
+
+    ## Registra os responsáveis encontrados para uma pesquisa em lote (ver peer.Peer.completeBatch()).
+    #  @param queryID O ID da pesquisa.
+    #  @param ownerID O ID do responsável pelas chaves.
+    #  @param ownerAddress O endereço do responsável pelas chaves.
+    #  @param keys As chaves.
+    def completeBatch(self, queryID, ownerID, ownerAddress, keys):
+        batch = self.batchLookups.get(queryID)
+        if batch == None:
+            return
+
+        remaining, results = batch
+        for key in keys:
+            self.ownerCache.put(key, ownerID, ownerAddress)
+            if key in remaining:
+                remaining.discard(key)
+                results[key] = (ownerID, ownerAddress)
+        if len(remaining) == 0:
+            self.completeRequest(queryID, results)
+
+    ## Pesquisa pelo responsável da i-ésima chave-alvo da finger table e atualiza a entrada (ver peer.Peer.findFinger()).
+    #
+    #  @param i O índice da entrada.
+    #  @param building \c True enquanto a finger table está sendo construída: a próxima entrada é pesquisada logo em seguida,
+    #  ao invés de esperar 3 segundos.
+    def refreshFinger(self, i, building = False):
+        targets = common.fingerTargets(self.id, self.K, self.method)
+        target = targets[i]
+
+        def update(finger):
+            if len(self.fingers) != len(targets):
+                self.fingers = [None] * len(targets)
+            self.fingers[i] = finger
+            if building and i + 1 < len(targets):
+                self.refreshFinger(i + 1, True)
+            else:
+                self.loop.callLater(3.0, self.refreshFinger, (i + 1) % len(targets))
+
+        if self.isResponsible(target):
+            update((self.id, self.address))
+        elif common.inInterval(target, self.id, self.nextID):
+            update((self.nextID, self.nextAddress))
+        else:
+            self.lookup(target, lambda result: update(result[:2] if result != None else None), 3.0, False)
+
+    ## Começa a estabilizar as listas de vizinhos do peer, a cada neighbours.TICK segundos (ver peer.Peer.stabilize()).
+    #
+    #  Os Pings e os pedidos das listas dos vizinhos não são esperados: as respostas são guardadas pelos callbacks e usadas na
+    #  verificação seguinte, e a própria resposta conta como batimento (ver datagramReceived()).
+    def stabilize(self):
+        pendingPings = set()
+        pendingLists = set()
+        replies = {}
+        lastRefresh = [0.0]
+
+        def onNeighbours(address, reply):
+            pendingLists.discard(address)
+            reply = neighbours.decode(reply) if reply != None else None
+            if reply != None:
+                replies[address] = reply
+            elif self.failureDetector.phi(address, self.loop.time()) <= self.failureDetector.threshold:
+                self.legacyNeighbours.add(address)
+
+        def tick():
+            self.loop.callLater(neighbours.TICK, tick)
+            if self.successors[0][1] == self.address:
+                return
+
+            now = self.loop.time()
+            intervals = neighbours.heartbeatIntervals(self.address, self.successors, self.predecessors)
+            self.failureDetector.retain(intervals)
+            for address, interval in intervals.iteritems():
+                self.failureDetector.monitor(address, interval, now)
+                if now - self.failureDetector.lastHeartbeat(address) >= interval and not address in pendingPings:
+                    pendingPings.add(address)
+                    self.sendRequest(['Ping'], address, 3.0, lambda reply, address = address: pendingPings.discard(address))
+
+            if now - lastRefresh[0] >= neighbours.REFRESH_INTERVAL:
+                lastRefresh[0] = now
+                for entry in (self.successors[0], self.predecessors[0]):
+                    if not entry[1] in pendingLists:
+                        pendingLists.add(entry[1])
+                        request = neighbours.LEGACY_REQUEST if entry[1] in self.legacyNeighbours else ['Neighbours']
+                        self.sendRequest(request, entry[1], 3.0, lambda reply, address = entry[1]: onNeighbours(address, reply))
+
+            dead = self.failureDetector.suspected(now)
+            if len(dead) == 0 and len(replies) == 0:
+                return
+
+            oldPreviousID, oldNextID = self.previousID, self.nextID
+            removed = self.applyNeighbours(dead, dict(replies))
+            replies.clear()
+            self.neighbourhoodChanged(oldPreviousID, oldNextID)
+
+            for removedID, removedAddress in removed:
+                self.sendRequest(['Removed', removedID], self.rendezvousAddress, 3.0, lambda reply: None)
+            if len(removed) > 0:
+                self.allocate(lambda: None)
+
+        tick()
+
+    ## Aplica o resultado de uma rodada da estabilização às listas e aos ponteiros de vizinhança do peer (ver peer.Peer.applyNeighbours()).
+    #  @param dead O conjunto dos endereços suspeitos.
+    #  @param replies Um dicionário {endereço: (sucessores, antecessores)} com as listas recebidas dos vizinhos.
+    #  @return Os vizinhos removidos, tuplas (ID, endereço) (ver neighbours.replaceDead()).
+    def applyNeighbours(self, dead, replies):
+        oldNextAddress, oldPreviousAddress = self.nextAddress, self.previousAddress
+        self.successors, self.predecessors, removed = neighbours.stabilize(self.id, self.address, self.successors, self.predecessors,
+                                                                           dead, replies, self.neighbourListSize)
+        self.nextID, self.nextAddress = self.successors[0]
+        self.previousID, self.previousAddress = self.predecessors[0]
+
+        if len(self.successors) > 1:
+            self.nextNextAddress = self.successors[1][1]
+        elif self.nextAddress != oldNextAddress or self.nextNextAddress in dead:
+            self.nextNextAddress = self.address # tratando o caso de quando restam 2 peers na DHT
+
+        if len(self.predecessors) > 1:
+            self.previousPreviousAddress = self.predecessors[1][1]
+        elif self.previousAddress != oldPreviousAddress or self.previousPreviousAddress in dead:
+            self.previousPreviousAddress = self.address
+
+        return removed
+
+    ## Refaz successors e predecessors depois que os vizinhos imediatos mudam (ver peer.Peer.resetNeighbourLists()).
+    def resetNeighbourLists(self):
+        self.successors = neighbours.buildList(self.id, (self.nextID, self.nextAddress), self.successors, self.neighbourListSize, True)
+        self.predecessors = neighbours.buildList(self.id, (self.previousID, self.previousAddress), self.predecessors, self.neighbourListSize, False)
+
+## Um Rendezvous que roda sobre um eventloop.EventLoop, ao invés de bloquear em recvfrom.
+#
+#  Trata as mensagens exatamente como rendezvous.Rendezvous (ver rendezvous.Rendezvous.handleMessage()), e pode dividir o
+#  laço de eventos com milhares de AsyncPeer.
+class AsyncRendezvous(Rendezvous):
+    ## O construtor padrão.
+    #  @param loop O eventloop.EventLoop em que o rendezvous rodará.
+    #  @param address O endereço de rede correspondente ao rendezvous.
+    #  @param K O número máximo de nós na rede.
+    #  @param method O método de como os IDs serão distribuídos na DHT.
+    #  @param printInterval O intervalo mínimo, em segundos, entre duas impressões do anel, ou \c None para não imprimi-lo.
+    def __init__(self, loop, address, K, method, printInterval = 1.0):
+        Rendezvous.__init__(self, address, K, method, printInterval, loop.createSocket(address))
+        self.loop = loop
+
+    ## Registra o socket do rendezvous no laço de eventos.
+    def start(self):
+        self.loop.addReader(self.sock, self.onReadable)
+        if self.printInterval != None:
+            self.loop.callLater(self.printInterval, self.printPending)
+
+    ## Faz a impressão do anel que ficou pendente (ver rendezvous.Rendezvous.ringChanged()), a cada printInterval segundos.
+    def printPending(self):
+        if self.pendingPrint:
+            self.ringChanged()
+        self.loop.callLater(self.printInterval, self.printPending)
+
+    ## Lê os datagramas recebidos pelo socket.
+    def onReadable(self):
+        for data, address in eventloop.readDatagrams(self.sock, common.MAX):
+            start = time.time()
+            self.handleMessage(data, address)
+            self.metrics.messageHandled(time.time() - start)
+
+## Inicia, um após o outro, vários AsyncPeer com portas consecutivas.
+#
+#  @param loop O eventloop.EventLoop em que os peers rodarão.
+#  @param ip O endereço IP dos peers.
+#  @param firstPort A porta do primeiro peer.
+#  @param count O número de peers.
+#  @param rendezvousAddress O endereço do rendezvous.
+#  @param onJoined Uma função, sem argumentos, chamada quando todos os peers tiverem sido alocados na DHT.
+#  @return A lista de peers.
+def startPeers(loop, ip, firstPort, count, rendezvousAddress, onJoined = None):
+    peers = [AsyncPeer(loop, (ip, firstPort + i), rendezvousAddress) for i in range(count)]
+
+    def startNext(i):
+        if i < count:
+            peers[i].start(lambda: startNext(i + 1))
+        elif onJoined != None:
+            onJoined()
+
+    startNext(0)
+    return peers
+
+## Cria e inicia os nós virtuais de um peer físico: \c count AsyncPeers com portas consecutivas, cada um com o seu lugar no anel.
+#
+#  Os IDs dos nós virtuais são calculados pelo Rendezvous a partir do endereço do primeiro deles, que identifica o peer físico
+#  (ver rendezvous.Rendezvous.allocateVirtual()), de forma que as chaves ficam distribuídas de maneira mais uniforme entre os peers
+#  físicos. As pesquisas que passam por um nó virtual continuam pelos seus irmãos sem mensagens (ver AsyncPeer.siblingFor()).
+#
+#  @param loop O eventloop.EventLoop em que os nós virtuais rodarão.
+#  @param ip O endereço IP dos nós virtuais.
+#  @param firstPort A porta do primeiro nó virtual.
+#  @param count O número de nós virtuais.
+#  @param rendezvousAddress O endereço do rendezvous.
+#  @param onJoined Uma função, sem argumentos, que será chamada quando todos os nós virtuais forem alocados na DHT, ou \c None.
+#  @return A lista dos AsyncPeers.
+def startVirtualNodes(loop, ip, firstPort, count, rendezvousAddress, onJoined = None):
+    siblings = []
+    physical = repr((ip, firstPort))
+    for i in range(count):
+        siblings.append(AsyncPeer(loop, (ip, firstPort + i), rendezvousAddress, virtualNode = (physical, i), siblings = siblings))
+
+    def startNext(i):
+        if i < count:
+            siblings[i].start(lambda: startNext(i + 1))
+        elif onJoined != None:
+            onJoined()
+
+    startNext(0)
+    return siblings
+
+if __name__ == '__main__':
+    if len(sys.argv) == 6 and sys.argv[1] == 'rendezvous':
+        loop = eventloop.EventLoop()
+        rendezvous = AsyncRendezvous(loop, (sys.argv[2], int(sys.argv[3])), int(sys.argv[4]), int(sys.argv[5]))
+        rendezvous.start()
+        print 'Listening at', rendezvous.sock.getsockname()
+        loop.run()
+    elif len(sys.argv) == 7 and sys.argv[1] == 'peers':
+        loop = eventloop.EventLoop()
+        start = time.time()
+        count = int(sys.argv[4])
+        startPeers(loop, sys.argv[2], int(sys.argv[3]), count, (sys.argv[5], int(sys.argv[6])),
+                   lambda: sys.stdout.write('%d peers joined the DHT in %.2f s\n' % (count, time.time() - start)))
+        loop.run()
+    elif len(sys.argv) == 7 and sys.argv[1] == 'vnodes':
+        loop = eventloop.EventLoop()
+        start = time.time()
+        count = int(sys.argv[4])
+        startVirtualNodes(loop, sys.argv[2], int(sys.argv[3]), count, (sys.argv[5], int(sys.argv[6])),
+                          lambda: sys.stdout.write('%d virtual nodes joined the DHT in %.2f s\n' % (count, time.time() - start)))
+        loop.run()
+    else:
+        print >>sys.stderr, 'usage: asyncpeer.py rendezvous ip_address port K method<1 or 2>'
+        print >>sys.stderr, '   or: asyncpeer.py peers ip_address first_port count rendezvous_ip_address rendezvous_port'
+        print >>sys.stderr, '   or: asyncpeer.py vnodes ip_address first_port count rendezvous_ip_address rendezvous_port'
+        sys.exit(1)
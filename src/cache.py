@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import common
+import collections, bisect, threading
+
+## Um cache, com política LRU, dos responsáveis pelas chaves pesquisadas por um peer.
+#
+#  Guarda dois tipos de entrada, cada um limitado a \c capacity entradas:
+#
+#  - chave -> (ID do responsável, endereço do responsável), para cada chave pesquisada;
+#  - faixa do anel (ID do antecessor do responsável, ID do responsável] -> endereço do responsável, aprendida das mensagens Found,
+#    que permite responder também por chaves que nunca foram pesquisadas, mas caem na faixa de um responsável já conhecido.
+#
+#  As entradas são invalidadas quando a vizinhança do peer muda (ver invalidate()), e quem usa o cache pode descartar uma entrada
+#  que se mostrou desatualizada (ver forget()). Pode ser usado por várias threads.
+class OwnerCache:
+    ## @var capacity
+    #  O número máximo de entradas de cada tipo.
+
+    ## @var owners
+    #  Um OrderedDict {chave: (ID do responsável, endereço do responsável)}, do menos para o mais recentemente usado.
+
+    ## @var ranges
+    #  Um OrderedDict {ID do responsável: (ID do antecessor do responsável, endereço do responsável)}, do menos para o mais recentemente usado.
+
+    ## @var rangeEnds
+    #  A lista ordenada das chaves de \c ranges, usada para encontrar, com uma busca binária, a faixa que pode conter uma chave.
+
+    ## @var hits
+    #  O número de consultas respondidas pelo cache.
+
+    ## @var misses
+    #  O número de consultas que o cache não soube responder.
+
+    ## @var evictions
+    #  O número de entradas descartadas por falta de espaço.
+
+    ## @var invalidations
+    #  O número de entradas descartadas por invalidate() ou forget().
+
+    ## @var lock
+    #  O Lock que protege o cache.
+
+    ## O construtor padrão.
+    #  @param capacity O número máximo de entradas de cada tipo.
+    def __init__(self, capacity = 1024):
+        self.capacity = capacity
+        self.owners = collections.OrderedDict()
+        self.ranges = collections.OrderedDict()
+        self.rangeEnds = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    ## Procura o responsável por uma chave.
+    #  @param key A chave (já passada por hashKey()).
+    #  @return Uma tupla (ID do responsável, endereço do responsável), ou \c None caso o cache não saiba o responsável.
+    def get(self, key):
+        with self.lock:
+            owner = self.owners.pop(key, None)
+            if owner != None:
+                self.owners[key] = owner
+                self.hits += 1
+                return owner
+
+            ownerRange = self.findRange(key)
+            if ownerRange != None:
+                end = ownerRange[0]
+                self.ranges[end] = self.ranges.pop(end)
+                self.hits += 1
+                return (end, ownerRange[2])
+
+            self.misses += 1
+            return None
+
+    ## Procura a faixa que contém uma chave. Precisa ser chamada com o lock.
+    #  @param key A chave.
+    #  @return Uma tupla (ID do responsável, ID do antecessor, endereço do responsável), ou \c None.
+    def findRange(self, key):
+        if len(self.rangeEnds) == 0:
+            return None
+
+        # como as faixas não se sobrepõem, a única candidata é a que termina no primeiro ID >= key (ou a primeira, dando a volta no anel)
+        end = self.rangeEnds[bisect.bisect_left(self.rangeEnds, key) % len(self.rangeEnds)]
+        start, address = self.ranges[end]
+        return (end, start, address) if common.inInterval(key, start, end) else None
+
+    ## Registra o responsável por uma chave.
+    #
+    #  @param key A chave.
+    #  @param ownerID O ID do responsável.
+    #  @param ownerAddress O endereço do responsável.
+    #  @param previousID O ID do antecessor do responsável, caso seja conhecido. Nesse caso, a faixa (previousID, ownerID] também é registrada.
+    def put(self, key, ownerID, ownerAddress, previousID = None):
+        with self.lock:
+            self.owners.pop(key, None)
+            self.owners[key] = (ownerID, ownerAddress)
+            if len(self.owners) > self.capacity:
+                self.owners.popitem(False)
+                self.evictions += 1
+
+            if previousID != None:
+                if self.ranges.pop(ownerID, None) == None:
+                    bisect.insort(self.rangeEnds, ownerID)
+                self.ranges[ownerID] = (previousID, ownerAddress)
+                if len(self.ranges) > self.capacity:
+                    end, value = self.ranges.popitem(False)
+                    self.rangeEnds.remove(end)
+                    self.evictions += 1
+
+    ## Descarta as entradas de uma chave: o seu responsável e a faixa que a contém (ex.: o responsável respondeu que não é mais o responsável).
+    #  @param key A chave.
+    def forget(self, key):
+        with self.lock:
+            if self.owners.pop(key, None) != None:
+                self.invalidations += 1
+            ownerRange = self.findRange(key)
+            if ownerRange != None:
+                self.removeRange(ownerRange[0])
+
+    ## Remove uma faixa. Precisa ser chamada com o lock.
+    #  @param end O ID do responsável pela faixa.
+    def removeRange(self, end):
+        del self.ranges[end]
+        self.rangeEnds.remove(end)
+        self.invalidations += 1
+
+    ## Descarta as entradas que envolvem um trecho do anel cujo responsável pode ter mudado.
+    #
+    #  São descartadas as chaves do trecho, as chaves cujo responsável está no trecho, e as faixas que se sobrepõem a ele.
+    #
+    #  @param start O início do trecho (exclusivo).
+    #  @param end O fim do trecho (inclusivo).
+    def invalidate(self, start, end):
+        with self.lock:
+            for key, (ownerID, ownerAddress) in self.owners.items():
+                if common.inInterval(key, start, end) or common.inInterval(ownerID, start, end):
+                    del self.owners[key]
+                    self.invalidations += 1
+
+            for rangeEnd, (rangeStart, address) in self.ranges.items():
+                if common.inInterval(rangeEnd, start, end) or common.inInterval(end, rangeStart, rangeEnd):
+                    self.removeRange(rangeEnd)
+
+    ## Retorna os contadores do cache.
+    #  @return Um dicionário com os contadores (hits, misses, evictions e invalidations) e o número de entradas (size).
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations,
+                    'size': len(self.owners) + len(self.ranges)}
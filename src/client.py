@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file client.py
+#  Um cliente da DHT que não faz parte do anel: ele não recebe um ID nem guarda chaves, apenas faz pesquisas e acessa valores.
+#
+#  O cliente pede ao Rendezvous alguns peers de entrada e distribui as suas pesquisas entre eles, que as encaminham pelo anel como se
+#  fossem suas. O responsável responde diretamente ao cliente (Found), e os valores são lidos e escritos diretamente no responsável:
+#
+#  Cliente: Peers|<número>   Rendezvous: PeerList|<K>|<método>|<endereço>|...
+#  Cliente: Search|<chave>|<endereço do cliente>|<ID da pesquisa>|0   Peer de entrada: Searching
+#  Responsável: Found|<ID da pesquisa>|<endereço>|<ID>|<saltos>|<ID do antecessor>   Cliente: FoundACK
+#  Cliente: Put|...  Get|...  Delete|...   Responsável: Stored  Value|...  NotFound  Deleted|...  NotResponsible (ver storage.handleRequest())
+#
+#  Como o asyncpeer.AsyncPeer, o cliente roda sobre um eventloop.EventLoop, e toda operação recebe um callback. O número de operações em
+#  andamento é limitado a Client.concurrency; as demais esperam em uma fila, na ordem em que foram pedidas.
+
+import common, eventloop, wire, cache, metrics, retransmit
+import collections, socket, sys, time, random
+
+## O número de peers de entrada pedidos ao Rendezvous.
+ENTRY_PEERS = 4
+
+## O número máximo de operações em andamento ao mesmo tempo.
+CONCURRENCY = 64
+
+## O tempo, em segundos, de espera máximo pela resposta de um peer (ex.: Searching, do peer de entrada).
+REQUEST_TIMEOUT = 3.0
+
+## Um cliente da DHT, que não faz parte do anel.
+#
+#  Toda operação recebe um callback, que é chamado com o resultado, ou com \c None caso ocorra timeout. As requisições são enviadas e
+#  reenviadas pelo retransmit.Requester, como as do asyncpeer.AsyncPeer.
+class Client(retransmit.Requester):
+    ## @var loop
+    #  O eventloop.EventLoop em que o cliente roda.
+
+    ## @var sock
+    #  O socket associado ao cliente.
+
+    ## @var address
+    #  O endereço associado ao cliente, para o qual os responsáveis enviam os resultados das pesquisas.
+
+    ## @var rendezvousAddress
+    #  O endereço do Rendezvous.
+
+    ## @var K
+    #  O número máximo de nós da DHT, informado pelo Rendezvous.
+
+    ## @var method
+    #  O método de distribuição dos IDs, informado pelo Rendezvous.
+
+    ## @var entryPeers
+    #  A lista dos endereços dos peers de entrada, aos quais as pesquisas são enviadas, um de cada vez.
+
+    ## @var entryPeerCount
+    #  O número de peers de entrada pedidos ao Rendezvous.
+
+    ## @var nextEntry
+    #  O índice, em entryPeers, do peer de entrada da próxima pesquisa.
+
+    ## @var refreshing
+    #  As funções que esperam pela lista de peers de entrada pedida ao Rendezvous, ou \c None caso nenhum pedido esteja em andamento.
+
+    ## @var concurrency
+    #  O número máximo de operações em andamento ao mesmo tempo.
+
+    ## @var active
+    #  O número de operações em andamento.
+
+    ## @var waiting
+    #  A fila das operações que esperam por uma vaga, como tuplas (operação, callback).
+
+    ## @var ownerCache
+    #  O cache.OwnerCache dos responsáveis encontrados, ou \c None para que toda pesquisa passe pelo anel.
+
+    ## @var pendingRequests
+    #  Um dicionário {ID: (callback, temporizador)}, com as requisições e as pesquisas que esperam por uma resposta.
+
+    ## @var inFlight
+    #  As requisições que podem ser reenviadas (ver retransmit.Requester).
+
+    ## @var useRetransmission
+    #  Caso seja \c True, as requisições são reenviadas enquanto não forem respondidas.
+
+    ## @var rttEstimator
+    #  O retransmit.RTTEstimator com os tempos de resposta de cada destino.
+
+    ## @var wireFormats
+    #  O formato (wire.TEXT ou wire.BINARY) usado com cada destino.
+
+    ## @var messageID
+    #  O ID da próxima mensagem enviada.
+
+    ## @var metrics
+    #  As métricas do cliente (ver metrics.Metrics).
+
+    ## O construtor padrão.
+    #  @param loop O eventloop.EventLoop em que o cliente roda.
+    #  @param rendezvousAddress O endereço do Rendezvous, no formato ('ip', porta).
+    #  @param address O endereço do cliente. Caso seja \c None, é usado o IP local pelo qual o Rendezvous é alcançado, com uma porta livre.
+    #  @param entryPeerCount O número de peers de entrada pedidos ao Rendezvous.
+    #  @param concurrency O número máximo de operações em andamento ao mesmo tempo.
+    #  @param useCache Caso seja \c False, os responsáveis encontrados não são guardados, e toda pesquisa passa pelo anel.
+    #  @param useRetransmission Caso seja \c True, as requisições são reenviadas enquanto não forem respondidas.
+    def __init__(self, loop, rendezvousAddress, address = None, entryPeerCount = ENTRY_PEERS, concurrency = CONCURRENCY, useCache = True,
+                 useRetransmission = True):
+        self.loop = loop
+        self.sock = loop.createSocket(address if address != None else (localIP(rendezvousAddress), 0))
+        self.address = self.sock.getsockname()
+        self.rendezvousAddress = rendezvousAddress
+        self.K = None
+        self.method = None
+
+        self.entryPeers = []
+        self.entryPeerCount = entryPeerCount
+        self.nextEntry = 0
+        self.refreshing = None
+
+        self.concurrency = max(1, concurrency)
+        self.active = 0
+        self.waiting = collections.deque()
+        self.ownerCache = cache.OwnerCache() if useCache else None
+
+        self.pendingRequests = {}
+        self.inFlight = {}
+        self.useRetransmission = useRetransmission
+        self.rttEstimator = retransmit.RTTEstimator()
+        self.wireFormats = {}
+        self.messageID = random.randrange(2**31)
+
+        self.metrics = metrics.Metrics(loop.time)
+        self.metrics.gauges = {'pendingRequests': lambda: len(self.pendingRequests), 'waitingOperations': lambda: len(self.waiting)}
+
+    ## Registra o socket no laço de eventos e pede ao Rendezvous os peers de entrada.
+    #  @param callback A função que receberá \c True quando o cliente estiver pronto, ou \c False caso o Rendezvous não responda ou não
+    #  conheça nenhum peer.
+    def start(self, callback):
+        self.loop.addReader(self.sock, self.onReadable)
+        self.refreshEntryPeers(callback)
+
+    ## Fecha o socket do cliente.
+    def close(self):
+        self.loop.removeReader(self.sock)
+        self.sock.close()
+
+    ## Pede ao Rendezvous uma nova lista de peers de entrada. Os pedidos feitos enquanto outro está em andamento esperam pelo mesmo resultado.
+    #  @param callback A função que receberá \c True caso a lista tenha pelo menos um peer, e \c False caso contrário.
+    def refreshEntryPeers(self, callback):
+        if self.refreshing != None:
+            self.refreshing.append(callback)
+            return
+
+        self.refreshing = [callback]
+        def onPeerList(reply):
+            if reply != None and reply[0] == 'PeerList' and len(reply) > 3:
+                self.K, self.method = int(reply[1]), int(reply[2])
+                self.entryPeers = [common.strToAddr(address) for address in reply[3:]]
+                self.nextEntry = 0
+
+            callbacks = self.refreshing
+            self.refreshing = None
+            for waiting in callbacks:
+                waiting(len(self.entryPeers) > 0)
+        self.sendRequest(['Peers', self.entryPeerCount], self.rendezvousAddress, REQUEST_TIMEOUT, onPeerList)
+
+    ## Descarta um peer de entrada que não respondeu. Quando não resta nenhum, uma nova lista é pedida ao Rendezvous na próxima pesquisa.
+    #  @param address O endereço do peer.
+    def entryPeerFailed(self, address):
+        if address in self.entryPeers:
+            self.entryPeers.remove(address)
+
+    ## Lê os datagramas recebidos pelo socket.
+    def onReadable(self):
+        for data, address in eventloop.readDatagrams(self.sock, common.MAX):
+            self.datagramReceived(data, address)
+
+    ## Trata um datagrama recebido: as respostas completam as requisições pendentes, e as requisições dos peers (Found, Cache, Ping,
+    #  Wire e Stats) são respondidas.
+    #  @param data O datagrama.
+    #  @param address O endereço de origem.
+    def datagramReceived(self, data, address):
+        try:
+            willWaitForReply, msgID, data_splitted = wire.decode(data)
+        except ValueError:
+            return
+        if willWaitForReply == None:
+            return
+
+        self.metrics.messageReceived(data_splitted[0], len(data))
+        if wire.isBinary(data):
+            self.wireFormats[address] = wire.BINARY
+
+        if not willWaitForReply:
+            if data_splitted[0] == 'Wire':
+                self.wireFormats[address] = wire.BINARY
+            self.completeRequest(msgID, data_splitted)
+        elif data_splitted[0] == 'Found':
+            # o Found pode ser repetido (reenvio do responsável); apenas o primeiro completa a pesquisa
+            self.send(['FoundACK'], False, msgID, address)
+            self.completeRequest(int(data_splitted[1]), data_splitted)
+        elif data_splitted[0] == 'Wire':
+            self.wireFormats[address] = wire.BINARY
+            self.send(['Wire', wire.VERSION], False, msgID, address)
+        elif data_splitted[0] == 'Cache':
+            # o cliente não encaminha pesquisas, então não guarda os responsáveis das chaves populares (ver hotkeys.py)
+            self.send(['Cached'], False, msgID, address)
+        elif data_splitted[0] == 'Ping':
+            self.send(['Pinged'], False, msgID, address)
+        elif data_splitted[0] == 'Stats':
+            self.send(['StatsReport', metrics.report(self.metrics, self.address, None)], False, msgID, address)
+
+    ## Dado uma string, tem como saída um número entre 0 e K (ver common.hashKey()).
+    #  @param key A string em que será aplicado a função de Hash.
+    def hashKey(self, key):
+        return common.hashKey(key, self.K, self.method)
+
+    ## Executa uma operação assim que houver uma vaga (ver concurrency).
+    #  @param operation A função que inicia a operação. Ela recebe a função que deve ser chamada com o resultado.
+    #  @param callback A função que receberá o resultado.
+    def submit(self, operation, callback):
+        if self.active >= self.concurrency:
+            self.waiting.append((operation, callback))
+            return
+
+        self.active += 1
+        def onDone(result):
+            self.active -= 1
+            if len(self.waiting) > 0:
+                self.submit(*self.waiting.popleft())
+            callback(result)
+        operation(onDone)
+
+    ## Pesquisa qual peer da DHT é o responsável por uma chave.
+    #  @param key A chave (uma string).
+    #  @param callback A função que receberá uma tupla (ID do responsável, endereço do responsável, número de saltos), ou \c None caso
+    #  ocorra timeout.
+    #  @param timeout O tempo, em segundos, de espera máximo pelo resultado.
+    def lookup(self, key, callback, timeout = 10.0):
+        self.submit(lambda done: self.findOwner(self.hashKey(key), done, timeout, True), callback)
+
+    ## Pesquisa o responsável por uma chave já passada por hashKey(), usando ownerCache, sem passar pelo limite de concurrency.
+    #
+    #  A pesquisa é enviada a um peer de entrada. Caso ele não confirme o recebimento (Searching), ele é descartado e a pesquisa é
+    #  enviada ao próximo, enquanto houver tempo.
+    #
+    #  @param keySearch A chave pesquisada.
+    #  @param callback A função que receberá uma tupla (ID do responsável, endereço do responsável, número de saltos), ou \c None.
+    #  @param timeout O tempo, em segundos, de espera máximo pelo resultado.
+    #  @param useCache Caso seja \c False, a pesquisa é feita pela rede mesmo que o responsável esteja em ownerCache.
+    def findOwner(self, keySearch, callback, timeout, useCache):
+        owner = self.ownerCache.get(keySearch) if useCache and self.ownerCache != None else None
+        if owner != None:
+            self.loop.callSoon(callback, (owner[0], owner[1], 0))
+            return
+
+        start = self.loop.time()
+        def onFound(resultMessage):
+            if resultMessage == None:
+                self.metrics.lookupCompleted(None, self.loop.time() - start)
+                callback(None)
+                return
+
+            ownerID, ownerAddress = int(resultMessage[3]), common.strToAddr(resultMessage[2])
+            hops = int(resultMessage[4]) if len(resultMessage) > 4 else 0
+            if self.ownerCache != None:
+                self.ownerCache.put(keySearch, ownerID, ownerAddress, int(resultMessage[5]) if len(resultMessage) > 5 else None)
+            self.metrics.lookupCompleted(hops, self.loop.time() - start)
+            callback((ownerID, ownerAddress, hops))
+
+        queryID = self.messageID
+        self.messageID += 1
+        self.pendingRequests[queryID] = (onFound, self.loop.callLater(timeout, self.completeRequest, queryID, None))
+        self.sendSearch(keySearch, queryID, start + timeout)
+
+    ## Envia uma pesquisa ao próximo peer de entrada, pedindo uma nova lista ao Rendezvous caso não reste nenhum.
+    #  @param keySearch A chave pesquisada.
+    #  @param queryID O ID da pesquisa.
+    #  @param deadline O instante a partir do qual a pesquisa não é mais reenviada.
+    def sendSearch(self, keySearch, queryID, deadline):
+        if not queryID in self.pendingRequests or self.loop.time() >= deadline:
+            return
+        if len(self.entryPeers) == 0:
+            self.refreshEntryPeers(lambda ok: self.sendSearch(keySearch, queryID, deadline) if ok else None)
+            return
+
+        entry = self.entryPeers[self.nextEntry % len(self.entryPeers)]
+        self.nextEntry += 1
+        def onSearching(reply):
+            if reply == None:
+                self.entryPeerFailed(entry)
+                self.sendSearch(keySearch, queryID, deadline)
+        self.sendRequest(['Search', keySearch, self.address, queryID, 0], entry, min(REQUEST_TIMEOUT, deadline - self.loop.time()), onSearching)
+
+    ## Envia uma requisição ao responsável por uma chave (ver peer.Peer.sendToOwner()).
+    #
+    #  Caso o responsável guardado em ownerCache não responda ou não se considere mais o responsável (NotResponsible), o responsável é
+    #  pesquisado de novo pelo anel.
+    #
+    #  @param key A chave (uma string).
+    #  @param message A requisição, como uma lista de campos.
+    #  @param callback A função que receberá uma tupla (endereço do responsável, resposta), ou \c None caso o responsável não seja
+    #  encontrado, não responda ou recuse a requisição (Invalid).
+    #  @param timeout O tempo, em segundos, de espera máximo pela pesquisa do responsável.
+    def sendToOwner(self, key, message, callback, timeout):
+        keySearch = self.hashKey(key)
+        def attempt(useCache):
+            def onOwner(owner):
+                if owner == None:
+                    callback(None)
+                    return
+
+                def onReply(reply):
+                    if reply != None and reply[0] == 'Invalid':
+                        callback(None)
+                        return
+                    if reply != None and reply[0] != 'NotResponsible':
+                        callback((owner[1], reply))
+                        return
+                    if self.ownerCache != None:
+                        self.ownerCache.forget(keySearch)
+                    if useCache:
+                        attempt(False)
+                    else:
+                        callback(None)
+                self.sendRequest(message, owner[1], REQUEST_TIMEOUT, onReply)
+            self.findOwner(keySearch, onOwner, timeout, useCache)
+        attempt(True)
+
+    ## Armazena um valor na DHT, no peer responsável pela chave. Valores maiores do que common.MAX_CHUNK são enviados em vários pedaços;
+    #  caso o responsável deixe de sê-lo durante o envio (NotResponsible), ele é pesquisado de novo e o envio é recomeçado (até 3 vezes).
+    #  @param key A chave (uma string).
+    #  @param value O valor (uma string).
+    #  @param callback A função que receberá \c True, ou \c None caso o responsável não seja encontrado, não responda ou não guarde algum
+    #  dos pedaços.
+    #  @param timeout O tempo, em segundos, de espera máximo pela pesquisa do responsável.
+    #  @throw ValueError Caso a chave ou o valor sejam grandes demais (ver common.MAX_KEY_LENGTH e common.MAX_VALUE).
+    def put(self, key, value, callback, timeout = 10.0):
+        if len(key) > common.MAX_KEY_LENGTH:
+            raise ValueError('key too long (%d bytes)' % len(key))
+        if len(value) > common.MAX_VALUE:
+            raise ValueError('value too long (%d bytes)' % len(value))
+
+        count = max(1, (len(value) + common.MAX_CHUNK - 1) // common.MAX_CHUNK)
+        def operation(done):
+            def transfer(attempt):
+                transferID = self.messageID
+                self.messageID += 1
+                def onStored(ownerAddress, index, reply):
+                    if reply != None and reply[0] == 'Stored':
+                        sendChunk(ownerAddress, index + 1)
+                    elif reply != None and reply[0] == 'NotResponsible' and attempt < 2:
+                        if self.ownerCache != None:
+                            self.ownerCache.forget(self.hashKey(key))
+                        transfer(attempt + 1)
+                    else:
+                        done(None)
+                def sendChunk(ownerAddress, index):
+                    if index == count:
+                        done(True)
+                        return
+                    chunk = value[index * common.MAX_CHUNK:(index + 1) * common.MAX_CHUNK]
+                    self.sendRequest(['Put', key, transferID, index, count, chunk], ownerAddress, REQUEST_TIMEOUT,
+                                     lambda reply: onStored(ownerAddress, index, reply))
+                self.sendToOwner(key, ['Put', key, transferID, 0, count, value[:common.MAX_CHUNK]],
+                                 lambda result: onStored(result[0], 0, result[1]) if result != None else done(None), timeout)
+            transfer(0)
+        self.submit(operation, callback)
+
+    ## Lê um valor armazenado na DHT. Valores maiores do que common.MAX_CHUNK são lidos em vários pedaços; caso o valor seja sobrescrito
+    #  durante a leitura, ela é recomeçada (até 3 vezes).
+    #  @param key A chave (uma string).
+    #  @param callback A função que receberá uma tupla (\c True, valor), ou (\c False, \c None) caso a chave não exista, ou \c None caso o
+    #  responsável não seja encontrado ou não responda, ou caso o valor mude a cada nova leitura.
+    #  @param timeout O tempo, em segundos, de espera máximo pela pesquisa do responsável.
+    def get(self, key, callback, timeout = 10.0):
+        def operation(done):
+            def onFirst(ownerAddress, reply, attempt):
+                if reply == None:
+                    done(None)
+                    return
+                if reply[0] != 'Value':
+                    done((False, None))
+                    return
+
+                count, version = int(reply[2]), int(reply[3])
+                chunks = [reply[4]]
+                def onChunk(reply):
+                    if reply == None:
+                        done(None)
+                    elif reply[0] != 'Value' or int(reply[3]) != version:
+                        if attempt < 2:
+                            self.sendRequest(['Get', key, 0], ownerAddress, REQUEST_TIMEOUT, lambda reply: onFirst(ownerAddress, reply, attempt + 1))
+                        else:
+                            done(None)
+                    else:
+                        chunks.append(reply[4])
+                        readNext()
+                def readNext():
+                    if len(chunks) == count:
+                        done((True, ''.join(chunks)))
+                    else:
+                        self.sendRequest(['Get', key, len(chunks)], ownerAddress, REQUEST_TIMEOUT, onChunk)
+                readNext()
+            self.sendToOwner(key, ['Get', key, 0], lambda result: onFirst(result[0], result[1], 0) if result != None else done(None), timeout)
+        self.submit(operation, callback)
+
+    ## Remove uma chave da DHT.
+    #  @param key A chave (uma string).
+    #  @param callback A função que receberá \c True caso a chave existisse, \c False caso contrário, ou \c None caso o responsável não
+    #  seja encontrado ou não responda.
+    #  @param timeout O tempo, em segundos, de espera máximo pela pesquisa do responsável.
+    def delete(self, key, callback, timeout = 10.0):
+        self.submit(lambda done: self.sendToOwner(key, ['Delete', key], lambda result: done(int(result[1][1]) == 1 if result != None else None),
+                                                  timeout), callback)
+
+    ## Executa uma operação e espera pelo seu resultado, rodando o laço de eventos enquanto isso. Não deve ser chamada de dentro do laço.
+    #
+    #  Ex.: client.wait(client.get, 'chave') retorna o que get('chave', callback) passaria ao callback.
+    #
+    #  @param operation A operação (ex.: lookup, put, get, delete ou start).
+    #  @param args Os argumentos da operação, antes do callback.
+    #  @return O resultado da operação.
+    def wait(self, operation, *args):
+        result = []
+        def onDone(value):
+            result.append(value)
+            self.loop.stop()
+        operation(*(args + (onDone,)))
+        if len(result) == 0:
+            self.loop.run()
+        return result[0]
+
+## Descobre o IP local pelo qual um endereço é alcançado (nenhum datagrama é enviado).
+#  @param address O endereço, no formato ('ip', porta).
+#  @return O IP local.
+def localIP(address):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(address)
+        return sock.getsockname()[0]
+    finally:
+        sock.close()
+
+## Lê comandos da entrada padrão e os executa na DHT: as linhas "put <chave> <valor>", "get <chave>" e "delete <chave>" armazenam, leem e
+#  removem valores, a linha "stats" imprime as métricas do cliente, e qualquer outra linha é pesquisada (ver peer.Peer.listenForInput()).
+#  @param client O Client, já iniciado.
+def listenForInput(client):
+    while True:
+        try:
+            query = raw_input('Consulte por: ')
+        except EOFError:
+            return
+        command = query.split(' ', 2)
+
+        if command[0] in ('put', 'get', 'delete') and len(command) == (3 if command[0] == 'put' else 2):
+            if command[0] == 'put':
+                result = client.wait(client.put, command[1], command[2])
+                print ('Stored ' + command[1]) if result != None else ('Could not store ' + command[1])
+            elif command[0] == 'get':
+                result = client.wait(client.get, command[1])
+                if result == None:
+                    print 'Timeout while accessing ' + command[1]
+                else:
+                    print (command[1] + ' = ' + result[1]) if result[0] else (command[1] + ' not found')
+            else:
+                result = client.wait(client.delete, command[1])
+                if result == None:
+                    print 'Timeout while accessing ' + command[1]
+                else:
+                    print ('Deleted ' + command[1]) if result else (command[1] + ' not found')
+            continue
+
+        if query == 'stats':
+            print metrics.report(client.metrics, client.address, None)
+            continue
+
+        result = client.wait(client.lookup, query)
+        if result == None:
+            print 'Timeout while searching for ' + query + ' (key = ' + str(client.hashKey(query)) + ')'
+        else:
+            print 'The peer with ID ' + str(result[0]) + ' ' + repr(result[1]) + ' has the file ' + query + ' (key = ' + str(client.hashKey(query)) + ', ' + str(result[2]) + ' hops)'
+
+if __name__ == '__main__':
+    if len(sys.argv) in (3, 4):
+        client = Client(eventloop.EventLoop(), (sys.argv[1], int(sys.argv[2])), (sys.argv[3], 0) if len(sys.argv) == 4 else None)
+        if not client.wait(client.start):
+            print >>sys.stderr, 'The rendezvous did not answer or knows no peers'
+            sys.exit(1)
+        print 'Entry peers: ' + ', '.join(repr(address) for address in client.entryPeers)
+        listenForInput(client)
+    else:
+        print >>sys.stderr, 'usage: client.py rendezvous_ip_address rendezvous_port [ip_address]'
+        sys.exit(1)
@@ -1,11 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*--
 
-import socket
+import wire
+import socket, threading, hashlib
 
 ## O número máximo de bytes que podem ser passados na rede.
 MAX = 65535
 
+## O número máximo de chaves em uma única mensagem SearchMany ou FoundMany (ver peer.Peer.lookupMany()), para que ela caiba em um datagrama.
+MAX_KEYS = 512
+
+## O tamanho máximo, em bytes, de um pedaço de um valor em uma única mensagem Put ou Value. Valores maiores são divididos em pedaços.
+MAX_CHUNK = 60000
+
+## O tamanho máximo, em bytes, de um valor armazenado na DHT (ver storage.handleRequest()), que limita o número de pedaços de um Put.
+MAX_VALUE = 64 * 2**20
+
+## O tamanho máximo, em bytes, das chaves armazenadas na DHT (ver peer.Peer.put()), para que uma mensagem Put caiba em um datagrama.
+MAX_KEY_LENGTH = 4096
+
 ## Envia uma mensagem dado um socket (que já foi conectado em um endereço de destino) e espera por uma resposta.
 #
 #  Quando um tempo de espera é atingido, ele é duplicado. A função interrompe sua execução quando uma resposta é recebida ou
@@ -34,12 +47,135 @@ def sendAndWaitForResponse(sendMsg, initialWait, timeout, address, sock):
             if addressReceived == address:
                 return data
 
+## Envia uma requisição (em texto) a um peer e espera pela resposta, reenviando-a com o tempo de espera duplicado
+#  (como em sendAndWaitForResponse()). As demais mensagens recebidas (ex.: a requisição Wire do peer) são ignoradas.
+#
+#  @param sock O socket usado.
+#  @param fields A requisição, como uma lista de campos.
+#  @param messageID O ID da requisição.
+#  @param address O endereço do peer.
+#  @param timeout O tempo de espera máximo, em segundos.
+#  @return A resposta, como uma lista de campos.
+#  @throw socket.timeout Caso o peer não responda.
+def request(sock, fields, messageID, address, timeout):
+    delay = 0.2
+    while True:
+        sock.sendto(wire.encodeText(fields, True, messageID), address)
+        sock.settimeout(delay)
+        try:
+            while True:
+                data, addressReceived = sock.recvfrom(MAX)
+                try:
+                    waitForReply, replyID, reply = wire.decode(data)
+                except ValueError:
+                    continue
+                if addressReceived == address and waitForReply == False and replyID == messageID:
+                    return reply
+        except socket.timeout:
+            delay *= 2
+            if delay > timeout:
+                raise
+
+## Representa o resultado de uma operação que ainda não terminou, como a resposta de uma requisição.
+#
+#  A thread que espera pelo resultado fica bloqueada (sem consumir CPU) até que outra thread o defina com setResult() ou setException().
+#  Quem não quer esperar pode registrar um callback com addCallback().
+class Future:
+    ## @var event
+    #  O evento que é sinalizado quando o resultado é definido.
+    
+    ## @var callbacks
+    #  As funções que serão chamadas quando o resultado for definido (ver addCallback()).
+    
+    ## @var lock
+    #  O Lock que protege \c callbacks.
+    
+    ## @var value
+    #  O resultado da operação.
+    
+    ## @var exception
+    #  A exceção que será lançada para quem esperar pelo resultado, ou \c None caso a operação tenha sido bem-sucedida.
+    
+    ## O construtor padrão.
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.exception = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+    
+    ## Define o resultado da operação, acordando quem estiver esperando por ele.
+    #  @param value O resultado.
+    def setResult(self, value):
+        self.value = value
+        self.finish()
+    
+    ## Define que a operação falhou, acordando quem estiver esperando pelo resultado.
+    #  @param exception A exceção que será lançada por result().
+    def setException(self, exception):
+        self.exception = exception
+        self.finish()
+    
+    ## Sinaliza que o resultado foi definido e chama os callbacks registrados, na thread que o definiu.
+    def finish(self):
+        with self.lock:
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+    
+    ## Registra uma função que será chamada, com este Future, quando o resultado for definido.
+    #
+    #  A função é chamada pela thread que definir o resultado (ou imediatamente, caso ele já tenha sido definido), e por isso
+    #  não deve bloquear.
+    #
+    #  @param callback A função.
+    def addCallback(self, callback):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+    
+    ## Espera até que o resultado seja definido.
+    #  @param timeout O tempo máximo de espera, em segundos. Caso seja \c None, espera indefinidamente.
+    #  @return Retorna \c True caso o resultado tenha sido definido, e \c False caso contrário.
+    def wait(self, timeout = None):
+        self.event.wait(timeout)
+        return self.event.is_set()
+    
+    ## Espera pelo resultado da operação e o retorna.
+    #  @return O resultado definido por setResult(). Caso a operação tenha falhado, a exceção definida por setException() é lançada.
+    def result(self):
+        self.event.wait()
+        if self.exception != None:
+            raise self.exception
+        return self.value
+
 ## Converte uma string no formato ('numero_de_ip', numero_de_porta) para uma tupla no mesmo formato
 #
+#  Endereços que já estão no formato de tupla (ex.: campos de mensagens binárias, ver wire.py) são retornados sem alteração.
+#
 # @param string A string que será convertida.
+# @return O endereço, ou \c None caso a string não esteja no formato esperado.
 def strToAddr(string):
-    values = string.translate(None, "('),").split(' ')
-    return (values[0], int(values[1])) if len(values) == 2 else None
+    if isinstance(string, tuple):
+        return string
+    values = string[2:-1].split("', ")
+    if len(values) != 2 or not values[1].isdigit():
+        return None
+    return (values[0], int(values[1]))
+
+## Converte um campo de uma mensagem recebida em um endereço, como strToAddr(), mas rejeitando os campos mal formados, para que um
+#  endereço inválido não seja guardado e usado mais tarde.
+#  @param field O campo (uma string ou um endereço já convertido).
+#  @return O endereço, no formato ('ip', porta).
+#  @throw ValueError Caso o campo não seja um endereço.
+def parseAddress(field):
+    address = strToAddr(field)
+    if address == None:
+        raise ValueError('malformed address: ' + repr(field))
+    return address
 
 ## Verifica se a string passada representa um número (inteiro ou real).
 #
@@ -51,3 +187,86 @@ def isNumber(string):
         return True
     except ValueError:
         return False
+
+## Converte um ID (ou chave) para a sua posição no anel, que vai de 0 a K.
+#
+#  No método 1 a posição é o próprio valor. No método 2 os valores são potências de 2, e a posição é o expoente.
+#
+#  @param value O ID ou a chave.
+#  @param method O método de distribuição dos IDs (1 ou 2).
+#  @return A posição de \c value no anel.
+def ringPosition(value, method):
+    return value if method == 1 else value.bit_length() - 1
+
+## Calcula a posição preferida de um nó virtual no anel (ver rendezvous.Rendezvous.allocateVirtual()).
+#
+#  A posição é o hash MD5 do endereço do peer físico e do índice do nó virtual, de forma que os nós virtuais de todos os peers
+#  ficam espalhados de maneira uniforme pelo anel, e um peer físico que volta à DHT recebe as mesmas posições, caso estejam livres.
+#
+#  @param physical O endereço do peer físico (no formato de string, ex.: "('127.0.0.1', 3000)").
+#  @param index O índice do nó virtual no peer físico.
+#  @param K O número máximo de nós na rede.
+#  @return Uma posição entre 0 e K.
+def virtualNodePosition(physical, index, K):
+    return int(hashlib.md5('%s#%d' % (physical, index)).hexdigest(), 16) % (K + 1)
+
+## Dado uma string, tem como saída um número entre 0 e K, tendo como base o algoritmo de Hash MD5.
+#
+#  Caso o método de criação de IDs seja o de potência de 2 (i.e. method == 2), a saída dessa função será uma potência de 2.
+#
+#  @param key A string em que será aplicado a função de Hash.
+#  @param K O número máximo de nós na rede.
+#  @param method O método de distribuição dos IDs (1 ou 2).
+#  @return O resultado do hash módulo K.
+def hashKey(key, K, method):
+    md5Result = hashlib.md5(str(key))
+    md5ResultDec = int(md5Result.hexdigest(), 16)
+    hashResult = md5ResultDec % K
+    return hashResult if method == 1 else 2**hashResult
+
+## Verifica se um valor pertence ao intervalo circular (start, end] do anel.
+#
+#  Caso \c start seja igual a \c end, o intervalo corresponde ao anel inteiro.
+#
+#  @param value O valor que será verificado.
+#  @param start O início do intervalo (exclusivo).
+#  @param end O fim do intervalo (inclusivo).
+#  @return Retorna \c True caso \c value pertença ao intervalo, e \c False caso contrário.
+def inInterval(value, start, end):
+    if start < end:
+        return start < value <= end
+    elif start > end:
+        return value > start or value <= end
+    return True
+
+## Calcula as chaves-alvo da finger table de um peer.
+#
+#  A i-ésima entrada da finger table aponta para o peer responsável pela posição (posição do peer + 2^i) módulo K+1,
+#  o que faz com que cada salto de uma pesquisa corte pela metade a distância até o destino.
+#
+#  @param id O ID do peer.
+#  @param K O número máximo de nós na rede.
+#  @param method O método de distribuição dos IDs (1 ou 2).
+#  @return A lista de chaves-alvo, da mais próxima para a mais distante do peer.
+def fingerTargets(id, K, method):
+    size = K + 1
+    position = ringPosition(id, method)
+    targets = []
+    distance = 1
+    while distance < size:
+        targetPosition = (position + distance) % size
+        targets.append(targetPosition if method == 1 else 2**targetPosition)
+        distance *= 2
+    return targets
+
+## Escolhe, na finger table de um peer, o finger mais distante que ainda precede (ou é o responsável por) uma chave.
+#
+#  @param id O ID do peer.
+#  @param key A chave pesquisada.
+#  @param fingers A finger table do peer: uma lista de tuplas (ID, endereço) ou \c None, da entrada mais próxima para a mais distante.
+#  @return O endereço do finger escolhido, ou \c None caso nenhum finger preceda a chave.
+def closestPrecedingFinger(id, key, fingers):
+    for finger in reversed(fingers):
+        if finger != None and finger[0] != id and inInterval(finger[0], id, key):
+            return finger[1]
+    return None
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections, math, threading
+
+## Um detector de falhas do tipo phi-accrual (Hayashibara et al.), usado para decidir quando um vizinho morreu.
+#
+#  Para cada endereço monitorado, o detector guarda os intervalos entre as mensagens recebidas dele (qualquer mensagem conta como
+#  batimento, ver heartbeat()) e calcula, a partir da média e do desvio padrão desses intervalos, o nível de suspeita phi do tempo
+#  que já passou desde a última mensagem: phi = -log10(probabilidade de uma mensagem ainda chegar). Um vizinho é suspeito quando
+#  phi passa de \c threshold, de forma que vizinhos com tráfego regular são detectados mais cedo, e enlaces com atrasos variáveis
+#  toleram atrasos maiores. Pode ser usado por várias threads.
+class PhiAccrualDetector:
+    ## @var threshold
+    #  O nível de suspeita a partir do qual um endereço é considerado morto (ex.: 8 corresponde a uma chance de 10^-8 de erro, caso
+    #  os intervalos sigam uma distribuição normal).
+
+    ## @var minStdDeviation
+    #  O desvio padrão mínimo, em segundos, usado no cálculo de phi, para que intervalos muito regulares não tornem o detector sensível demais.
+
+    ## @var acceptablePause
+    #  Um tempo, em segundos, somado à média dos intervalos, tolerado sem que a suspeita cresça (ex.: uma pausa curta da rede).
+
+    ## @var windowSize
+    #  O número máximo de intervalos guardados para cada endereço.
+
+    ## @var windows
+    #  Um dicionário {endereço: ArrivalWindow} com os endereços monitorados.
+
+    ## @var lock
+    #  O Lock que protege \c windows.
+
+    ## O construtor padrão.
+    #  @param threshold O nível de suspeita a partir do qual um endereço é considerado morto.
+    #  @param minStdDeviation O desvio padrão mínimo, em segundos.
+    #  @param acceptablePause O tempo, em segundos, somado à média dos intervalos.
+    #  @param windowSize O número máximo de intervalos guardados para cada endereço.
+    def __init__(self, threshold = 8.0, minStdDeviation = 0.2, acceptablePause = 0.25, windowSize = 50):
+        self.threshold = threshold
+        self.minStdDeviation = minStdDeviation
+        self.acceptablePause = acceptablePause
+        self.windowSize = windowSize
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    ## Começa a monitorar um endereço, caso ele ainda não seja monitorado com o mesmo intervalo esperado.
+    #
+    #  Como ainda não há intervalos medidos, o histórico começa com dois intervalos, de \c expectedInterval menos e mais um quarto,
+    #  e a última mensagem é considerada recebida agora.
+    #
+    #  @param address O endereço.
+    #  @param expectedInterval O intervalo esperado, em segundos, entre as mensagens (ex.: o intervalo entre os Pings enviados a ele).
+    #  @param now O instante atual.
+    def monitor(self, address, expectedInterval, now):
+        with self.lock:
+            window = self.windows.get(address)
+            if window == None or window.expectedInterval != expectedInterval:
+                window = ArrivalWindow(expectedInterval, now if window == None else window.last, self.windowSize)
+                self.windows[address] = window
+
+    ## Para de monitorar todos os endereços, exceto os de \c addresses.
+    #  @param addresses Os endereços que continuam monitorados.
+    def retain(self, addresses):
+        with self.lock:
+            for address in [address for address in self.windows if not address in addresses]:
+                del self.windows[address]
+
+    ## Registra a chegada de uma mensagem de um endereço. Endereços que não são monitorados são ignorados.
+    #
+    #  Mensagens que chegam em rajadas (com menos da metade do intervalo esperado entre elas) atualizam o instante da última
+    #  mensagem, mas não entram no histórico, para que o tráfego intenso não torne a suspeita rápida demais quando ele termina.
+    #
+    #  @param address O endereço de origem.
+    #  @param now O instante da chegada.
+    def heartbeat(self, address, now):
+        with self.lock:
+            window = self.windows.get(address)
+            if window == None:
+                return
+
+            interval = now - window.last
+            window.last = max(window.last, now)
+            if interval >= window.expectedInterval / 2:
+                window.add(interval)
+
+    ## Retorna o instante da última mensagem recebida de um endereço monitorado.
+    #  @param address O endereço.
+    #  @return O instante, ou \c None caso o endereço não seja monitorado.
+    def lastHeartbeat(self, address):
+        with self.lock:
+            window = self.windows.get(address)
+            return window.last if window != None else None
+
+    ## Calcula o nível de suspeita de um endereço.
+    #
+    #  Usa a aproximação logística da distribuição normal acumulada, com a média dos intervalos mais \c acceptablePause e o desvio
+    #  padrão (no mínimo \c minStdDeviation) dos intervalos.
+    #
+    #  @param address O endereço.
+    #  @param now O instante atual.
+    #  @return O nível de suspeita phi, ou 0 caso o endereço não seja monitorado.
+    def phi(self, address, now):
+        with self.lock:
+            window = self.windows.get(address)
+            if window == None:
+                return 0.0
+            elapsed = now - window.last
+            mean = window.mean() + self.acceptablePause
+            stdDeviation = max(window.stdDeviation(), self.minStdDeviation)
+
+        y = min(10.0, max(-10.0, (elapsed - mean) / stdDeviation)) # fora dessa faixa, phi fica abaixo de 1e-4 ou acima de 37
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if elapsed > mean:
+            return -math.log10(e / (1.0 + e))
+        return -math.log10(1.0 - 1.0 / (1.0 + e))
+
+    ## Retorna os endereços monitorados cujo nível de suspeita passou de \c threshold.
+    #  @param now O instante atual.
+    #  @return O conjunto dos endereços.
+    def suspected(self, now):
+        with self.lock:
+            addresses = list(self.windows)
+        return set(address for address in addresses if self.phi(address, now) > self.threshold)
+
+## O histórico dos intervalos entre as mensagens recebidas de um endereço (ver PhiAccrualDetector).
+class ArrivalWindow:
+    ## @var expectedInterval
+    #  O intervalo esperado entre as mensagens, em segundos.
+
+    ## @var last
+    #  O instante da última mensagem recebida.
+
+    ## @var intervals
+    #  Um deque com os últimos intervalos medidos.
+
+    ## @var total
+    #  A soma dos intervalos de \c intervals.
+
+    ## @var totalSquares
+    #  A soma dos quadrados dos intervalos de \c intervals.
+
+    ## O construtor padrão.
+    #  @param expectedInterval O intervalo esperado entre as mensagens, em segundos.
+    #  @param last O instante considerado como o da última mensagem.
+    #  @param size O número máximo de intervalos guardados.
+    def __init__(self, expectedInterval, last, size):
+        self.expectedInterval = expectedInterval
+        self.last = last
+        self.intervals = collections.deque(maxlen = max(2, size))
+        self.total = 0.0
+        self.totalSquares = 0.0
+        self.add(expectedInterval * 0.75)
+        self.add(expectedInterval * 1.25)
+
+    ## Adiciona um intervalo ao histórico, descartando o mais antigo caso ele esteja cheio.
+    #  @param interval O intervalo, em segundos.
+    def add(self, interval):
+        if len(self.intervals) == self.intervals.maxlen:
+            oldest = self.intervals.popleft()
+            self.total -= oldest
+            self.totalSquares -= oldest * oldest
+        self.intervals.append(interval)
+        self.total += interval
+        self.totalSquares += interval * interval
+
+    ## Retorna a média dos intervalos.
+    def mean(self):
+        return self.total / len(self.intervals)
+
+    ## Retorna o desvio padrão dos intervalos.
+    def stdDeviation(self):
+        mean = self.mean()
+        return math.sqrt(max(0.0, self.totalSquares / len(self.intervals) - mean * mean))
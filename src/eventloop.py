@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import select, heapq, time, errno, socket
+
+## Um temporizador agendado no EventLoop (ver EventLoop.callLater()).
+class Timer:
+    ## @var when
+    #  O instante (em segundos, como em time.time()) em que o callback será chamado.
+
+    ## @var sequence
+    #  O número de sequência do temporizador, usado para desempatar temporizadores com o mesmo instante (o agendado primeiro dispara primeiro).
+
+    ## @var callback
+    #  A função que será chamada.
+
+    ## @var args
+    #  Os argumentos passados para o callback.
+
+    ## @var cancelled
+    #  \c True caso o temporizador tenha sido cancelado.
+
+    ## O construtor padrão.
+    #  @param when O instante em que o callback será chamado.
+    #  @param sequence O número de sequência do temporizador.
+    #  @param callback A função que será chamada.
+    #  @param args Os argumentos passados para o callback.
+    def __init__(self, when, sequence, callback, args):
+        self.when = when
+        self.sequence = sequence
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    ## Cancela o temporizador. O callback não será chamado.
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return (self.when, self.sequence) < (other.when, other.sequence)
+
+## Um laço de eventos de uma única thread, que multiplexa vários sockets UDP e temporizadores.
+#
+#  É o equivalente, para Python 2, ao laço do asyncio: cada socket registrado tem um callback chamado quando há
+#  datagramas para serem lidos, e os temporizadores ficam em um heap ordenado pelo instante de disparo.
+#  Como tudo roda em uma única thread, os callbacks não precisam de locks, mas também não podem bloquear.
+class EventLoop:
+    ## @var readers
+    #  Um dicionário, indexado pelo descritor de arquivo, contendo tuplas (socket, callback) dos sockets registrados.
+
+    ## @var timers
+    #  Um heap de objetos Timer, ordenado pelo instante de disparo.
+
+    ## @var timerSequence
+    #  O número de sequência do próximo Timer criado.
+
+    ## @var poller
+    #  O objeto select.epoll usado para esperar por eventos, ou \c None caso epoll não esteja disponível (nesse caso, select.select é usado).
+
+    ## @var running
+    #  \c True enquanto run() estiver executando.
+
+    ## O construtor padrão.
+    def __init__(self):
+        self.readers = {}
+        self.timers = []
+        self.timerSequence = 0
+        self.poller = select.epoll() if hasattr(select, 'epoll') else None
+        self.running = False
+
+    ## Retorna o instante atual, em segundos.
+    def time(self):
+        return time.time()
+
+    ## Cria um socket UDP ligado a um endereço, para ser registrado neste laço (ver addReader()).
+    #
+    #  Os AsyncPeer e o AsyncRendezvous criam os seus sockets por aqui, de forma que um laço com outro transporte (ex.: a rede
+    #  em memória de simulator.py) pode ser usado no lugar deste.
+    #
+    #  @param address O endereço, no formato ('ip', porta).
+    #  @return O socket.
+    def createSocket(self, address):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(address)
+        return sock
+
+    ## Registra um socket no laço de eventos. O socket é colocado em modo não bloqueante.
+    #
+    #  @param sock O socket.
+    #  @param callback A função que será chamada, sem argumentos, quando houver dados para serem lidos do socket.
+    def addReader(self, sock, callback):
+        sock.setblocking(0)
+        self.readers[sock.fileno()] = (sock, callback)
+        if self.poller != None:
+            self.poller.register(sock.fileno(), select.EPOLLIN)
+
+    ## Remove um socket do laço de eventos.
+    #  @param sock O socket.
+    def removeReader(self, sock):
+        if self.readers.pop(sock.fileno(), None) != None and self.poller != None:
+            self.poller.unregister(sock.fileno())
+
+    ## Agenda uma função para ser chamada depois de um tempo.
+    #
+    #  @param delay O tempo, em segundos, até a chamada.
+    #  @param callback A função que será chamada.
+    #  @param args Os argumentos passados para a função.
+    #  @return O Timer criado, que pode ser cancelado.
+    def callLater(self, delay, callback, *args):
+        timer = Timer(self.time() + delay, self.timerSequence, callback, args)
+        self.timerSequence += 1
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    ## Agenda uma função para ser chamada na próxima iteração do laço.
+    #  @param callback A função que será chamada.
+    #  @param args Os argumentos passados para a função.
+    def callSoon(self, callback, *args):
+        return self.callLater(0, callback, *args)
+
+    ## Executa os temporizadores cujo instante de disparo já foi atingido.
+    #  @return O tempo, em segundos, até o próximo temporizador, ou \c None caso não haja nenhum.
+    def runTimers(self):
+        while len(self.timers) > 0:
+            timer = self.timers[0]
+            if timer.cancelled:
+                heapq.heappop(self.timers)
+                continue
+
+            delay = timer.when - self.time()
+            if delay > 0:
+                return delay
+
+            heapq.heappop(self.timers)
+            timer.callback(*timer.args)
+        return None
+
+    ## Espera por eventos nos sockets registrados e chama os callbacks correspondentes.
+    #  @param timeout O tempo máximo de espera, em segundos, ou \c None para esperar indefinidamente.
+    def poll(self, timeout):
+        if self.poller != None:
+            events = [fd for fd, event in self.poller.poll(-1 if timeout == None else timeout)]
+        else:
+            events, _, _ = select.select(self.readers.keys(), [], [], timeout)
+
+        for fd in events:
+            if fd in self.readers:
+                self.readers[fd][1]()
+
+    ## Executa o laço de eventos até que stop() seja chamado.
+    def run(self):
+        self.running = True
+        while self.running:
+            delay = self.runTimers()
+            if self.running:
+                self.poll(delay)
+
+    ## Interrompe o laço de eventos ao final da iteração atual.
+    def stop(self):
+        self.running = False
+
+## Lê todos os datagramas disponíveis em um socket não bloqueante.
+#
+#  @param sock O socket.
+#  @param maxSize O tamanho máximo de cada datagrama.
+#  @return Uma lista de tuplas (dados, endereço de origem).
+def readDatagrams(sock, maxSize):
+    datagrams = []
+    while True:
+        try:
+            datagrams.append(sock.recvfrom(maxSize))
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return datagrams
+            if e.errno == errno.ECONNREFUSED: # ICMP de uma mensagem enviada anteriormente a uma porta fechada
+                continue
+            raise
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file hotkeys.py
+#  Detecção das chaves mais pesquisadas e cache, ao longo do caminho das pesquisas, dos seus responsáveis.
+#
+#  Cada peer conta as pesquisas (Search) que responde em um CountMinSketch. Quando uma chave passa de HotKeys.threshold pesquisas, o
+#  peer envia o seu responsável ao peer que lhe encaminhou a pesquisa (o salto anterior do caminho), que passa a responder pela chave
+#  diretamente, sem encaminhar a pesquisa, até o fim do TTL:
+#
+#  Peer: Cache|<chave>|<endereço do responsável>|<ID do responsável>|<ID do antecessor do responsável>|<TTL em ms>   Vizinho: Cached
+#
+#  Como o salto anterior também conta as pesquisas que responde pelo cache, uma chave que continua popular se espalha, um salto por
+#  vez, pelos caminhos que levam ao responsável, dividindo a carga entre os peers desses caminhos. Os peers que recebem o responsável
+#  pelo cache o repassam com o TTL que resta, de forma que nenhuma cópia dura mais do que TTL segundos depois do último envio do
+#  responsável, que só reenvia a chave enquanto ela continua popular.
+
+import common
+import collections, threading, time
+
+## O número de pesquisas (com o decaimento de CountMinSketch.halve()) a partir do qual uma chave é considerada popular.
+THRESHOLD = 32
+
+## O tempo, em segundos, durante o qual um responsável enviado com a mensagem Cache pode ser usado.
+TTL = 5.0
+
+## O intervalo, em segundos, entre dois decaimentos das contagens (ver CountMinSketch.halve()).
+DECAY_INTERVAL = 10.0
+
+## Os multiplicadores das funções de hash de cada linha de CountMinSketch (primos ímpares, para espalhar chaves próximas).
+MULTIPLIERS = (2654435761, 2246822519, 3266489917, 668265263, 374761393, 1181783497)
+
+## O primo módulo o qual as funções de hash de CountMinSketch são calculadas.
+#
+#  As chaves do método 2 são potências de 2 (ver common.hashKey()), que não têm bits baixos para espalhar: reduzidas módulo este primo
+#  (de que 2 tem ordem 500000003), elas continuam distintas, e os hashes (chave * multiplicador) mod PRIME se espalham pelos contadores
+#  como os das chaves do método 1.
+PRIME = 1000000007
+
+## Uma estimativa, em memória constante, do número de vezes que cada chave foi vista.
+#
+#  São \c depth linhas de \c width contadores. Cada chave incrementa um contador por linha, escolhido por uma função de hash da linha, e
+#  a estimativa é o menor desses contadores: ela nunca é menor do que o número real, e só é maior quando outras chaves caem nos mesmos
+#  contadores em todas as linhas.
+class CountMinSketch:
+    ## @var width
+    #  O número de contadores de cada linha.
+
+    ## @var rows
+    #  As linhas de contadores.
+
+    ## O construtor padrão.
+    #  @param width O número de contadores de cada linha.
+    #  @param depth O número de linhas (no máximo len(MULTIPLIERS)).
+    def __init__(self, width = 1024, depth = 4):
+        self.width = width
+        self.rows = [[0] * width for i in range(depth)]
+
+    ## Conta uma ocorrência de uma chave.
+    #  @param key A chave (um inteiro, já passado por hashKey()).
+    #  @return A estimativa do número de ocorrências da chave, já contando esta.
+    def add(self, key):
+        estimate = None
+        for multiplier, row in zip(MULTIPLIERS, self.rows):
+            i = self.index(key, multiplier)
+            row[i] += 1
+            if estimate == None or row[i] < estimate:
+                estimate = row[i]
+        return estimate
+
+    ## Estima o número de ocorrências de uma chave.
+    #  @param key A chave.
+    def estimate(self, key):
+        return min(row[self.index(key, multiplier)] for multiplier, row in zip(MULTIPLIERS, self.rows))
+
+    ## Calcula o contador de uma chave em uma linha.
+    #  @param key A chave.
+    #  @param multiplier O multiplicador da função de hash da linha (ver MULTIPLIERS).
+    #  @return O índice do contador na linha.
+    def index(self, key, multiplier):
+        return key % PRIME * multiplier % PRIME % self.width
+
+    ## Divide todos os contadores por 2, para que as contagens reflitam as pesquisas recentes.
+    def halve(self):
+        for row in self.rows:
+            row[:] = [count >> 1 for count in row]
+
+## As chaves populares de um peer: a contagem das pesquisas que ele responde e o cache dos responsáveis recebidos com a mensagem Cache.
+#
+#  Pode ser usado por várias threads.
+class HotKeys:
+    ## @var threshold
+    #  O número de pesquisas a partir do qual uma chave é considerada popular.
+
+    ## @var ttl
+    #  O tempo, em segundos, durante o qual os responsáveis enviados por este peer podem ser usados.
+
+    ## @var capacity
+    #  O número máximo de entradas de \c entries.
+
+    ## @var clock
+    #  A função que retorna o instante atual (ex.: o relógio virtual do simulador).
+
+    ## @var sketch
+    #  O CountMinSketch das pesquisas respondidas pelo peer.
+
+    ## @var lastDecay
+    #  O instante do último decaimento do sketch.
+
+    ## @var entries
+    #  Um OrderedDict {chave: (ID do responsável, endereço do responsável, ID do antecessor do responsável, validade)}, com os
+    #  responsáveis recebidos, do menos para o mais recentemente usado.
+
+    ## @var pushed
+    #  Um dicionário {(chave, endereço): instante}, com o último envio do responsável por cada chave a cada salto anterior.
+
+    ## @var refusing
+    #  Os endereços dos peers que não responderam à mensagem Cache (ex.: peers antigos), para os quais ela não é mais enviada.
+
+    ## @var hits
+    #  O número de pesquisas respondidas pelo cache.
+
+    ## @var pushes
+    #  O número de mensagens Cache enviadas.
+
+    ## @var received
+    #  O número de mensagens Cache recebidas.
+
+    ## @var lock
+    #  O Lock que protege o objeto.
+
+    ## O construtor padrão.
+    #  @param threshold O número de pesquisas a partir do qual uma chave é considerada popular.
+    #  @param ttl O tempo, em segundos, durante o qual os responsáveis enviados podem ser usados.
+    #  @param capacity O número máximo de responsáveis guardados.
+    #  @param clock A função que retorna o instante atual.
+    def __init__(self, threshold = THRESHOLD, ttl = TTL, capacity = 1024, clock = time.time):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self.sketch = CountMinSketch()
+        self.lastDecay = clock()
+        self.entries = collections.OrderedDict()
+        self.pushed = {}
+        self.refusing = set()
+        self.hits = 0
+        self.pushes = 0
+        self.received = 0
+        self.lock = threading.Lock()
+
+    ## Conta uma pesquisa respondida pelo peer, e verifica se o responsável deve ser enviado ao salto anterior.
+    #
+    #  O responsável é enviado quando a chave é popular, no máximo uma vez a cada metade do TTL para cada salto anterior, e nunca para
+    #  o próprio peer (as pesquisas que ele inicia) nem para os peers de \c refusing.
+    #
+    #  @param key A chave pesquisada.
+    #  @param address O endereço do salto anterior.
+    #  @param selfAddress O endereço do peer.
+    #  @return \c True caso o responsável deva ser enviado com a mensagem Cache.
+    def record(self, key, address, selfAddress):
+        with self.lock:
+            now = self.clock()
+            if now - self.lastDecay >= DECAY_INTERVAL:
+                self.sketch.halve()
+                self.pushed = dict(item for item in self.pushed.iteritems() if now - item[1] < self.ttl / 2)
+                self.lastDecay = now
+
+            if self.sketch.add(key) < self.threshold or address == selfAddress or address in self.refusing:
+                return False
+            if now - self.pushed.get((key, address), now - self.ttl) < self.ttl / 2:
+                return False
+
+            self.pushed[(key, address)] = now
+            self.pushes += 1
+            return True
+
+    ## Procura o responsável por uma chave recebido com a mensagem Cache.
+    #  @param key A chave.
+    #  @return Uma tupla (ID do responsável, endereço do responsável, ID do antecessor do responsável, TTL restante em segundos), ou
+    #  \c None caso o responsável não esteja no cache ou tenha expirado.
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry == None:
+                return None
+
+            remaining = entry[3] - self.clock()
+            if remaining <= 0:
+                return None
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[:3] + (remaining,)
+
+    ## Guarda o responsável por uma chave, recebido com a mensagem Cache.
+    #  @param key A chave.
+    #  @param ownerID O ID do responsável.
+    #  @param ownerAddress O endereço do responsável.
+    #  @param previousID O ID do antecessor do responsável.
+    #  @param ttl O tempo, em segundos, durante o qual o responsável pode ser usado.
+    def put(self, key, ownerID, ownerAddress, previousID, ttl):
+        with self.lock:
+            self.received += 1
+            self.entries.pop(key, None)
+            self.entries[key] = (ownerID, ownerAddress, previousID, self.clock() + ttl)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(False)
+
+    ## Registra que um peer não respondeu à mensagem Cache, para que ela não lhe seja mais enviada.
+    #  @param address O endereço do peer.
+    def refuse(self, address):
+        with self.lock:
+            self.refusing.add(address)
+
+    ## Descarta os responsáveis que envolvem um trecho do anel cujo responsável pode ter mudado (ver cache.OwnerCache.invalidate()).
+    #  @param start O início do trecho (exclusivo).
+    #  @param end O fim do trecho (inclusivo).
+    def invalidate(self, start, end):
+        with self.lock:
+            for key, entry in self.entries.items():
+                if common.inInterval(key, start, end) or common.inInterval(entry[0], start, end):
+                    del self.entries[key]
+
+    ## Retorna os contadores.
+    #  @return Um dicionário com os contadores (hits, pushes e received) e o número de responsáveis guardados (size).
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'pushes': self.pushes, 'received': self.received, 'size': len(self.entries)}
+
+## Monta a mensagem Cache com o responsável por uma chave.
+#  @param key A chave.
+#  @param ownerID O ID do responsável.
+#  @param ownerAddress O endereço do responsável.
+#  @param previousID O ID do antecessor do responsável.
+#  @param ttl O tempo, em segundos, durante o qual o responsável pode ser usado.
+def cacheMessage(key, ownerID, ownerAddress, previousID, ttl):
+    return ['Cache', key, ownerAddress, ownerID, previousID, int(ttl * 1000)]
+
+## Lê uma mensagem Cache, guardando o responsável.
+#  @param hotKeys O HotKeys do peer que recebeu a mensagem.
+#  @param data_splitted A mensagem, como uma lista de campos.
+#  @return A resposta, como uma lista de campos.
+def handleCache(hotKeys, data_splitted):
+    hotKeys.put(int(data_splitted[1]), int(data_splitted[3]), common.parseAddress(data_splitted[2]), int(data_splitted[4]),
+                int(data_splitted[5]) / 1000.0)
+    return ['Cached']
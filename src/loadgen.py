@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file loadgen.py
+#  Gerador de carga: faz operações na DHT, com um client.Client, a uma taxa fixa durante um tempo, e imprime a vazão alcançada e as
+#  latências (mediana, p99 e p999).
+#
+#  As operações são iniciadas nos instantes agendados (1 / taxa segundos entre elas), independentemente de as anteriores já terem
+#  terminado, e a latência de cada uma é medida a partir do instante agendado: o tempo de espera na fila do cliente, quando a DHT não
+#  acompanha a taxa pedida, conta na latência. As chaves são sorteadas entre M chaves, com a distribuição uniforme ou com a
+#  distribuição de Zipf de expoente s (a chave de posição i tem probabilidade proporcional a 1 / i^s).
+#
+#  Uso: python loadgen.py <ip_rendezvous> <porta_rendezvous> <operações_por_segundo> <segundos> [uniform|zipf[:s]] [chaves]
+#       [concorrência] [lookup|get|put]
+
+import client, eventloop
+import sys, random, bisect
+
+## As operações que podem ser geradas.
+OPERATIONS = ('lookup', 'get', 'put')
+
+## O tamanho, em bytes, dos valores armazenados pela operação put.
+VALUE_SIZE = 100
+
+## O tempo, em segundos, de espera máximo por cada operação.
+TIMEOUT = 10.0
+
+## O intervalo, em segundos, entre as linhas de andamento.
+REPORT_INTERVAL = 1.0
+
+## Cria uma função que sorteia uma chave entre \c count chaves, com a distribuição uniforme.
+def uniform(count):
+    return lambda: 'key-%d' % random.randrange(count)
+
+## Cria uma função que sorteia uma chave entre \c count chaves, com a distribuição de Zipf de expoente \c exponent.
+def zipf(count, exponent):
+    cumulative = []
+    total = 0.0
+    for i in range(count):
+        total += 1.0 / (i + 1) ** exponent
+        cumulative.append(total)
+    return lambda: 'key-%d' % bisect.bisect_left(cumulative, random.random() * total)
+
+## Lê a distribuição das chaves da linha de comando.
+#  @param name "uniform", "zipf" (expoente 1) ou "zipf:<expoente>".
+#  @param count O número de chaves.
+#  @return A função que sorteia as chaves.
+def distribution(name, count):
+    if name == 'uniform':
+        return uniform(count)
+    if name == 'zipf' or name.startswith('zipf:'):
+        return zipf(count, float(name[5:]) if ':' in name else 1.0)
+    raise ValueError('unknown key distribution: ' + name)
+
+## Retorna um percentil de uma lista ordenada de latências.
+#  @param latencies A lista ordenada.
+#  @param fraction O percentil, entre 0 e 1 (ex.: 0.99).
+def percentile(latencies, fraction):
+    if len(latencies) == 0:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+## Gera a carga sobre a DHT e imprime o resultado.
+class LoadGenerator:
+    ## @var client
+    #  O client.Client usado nas operações.
+
+    ## @var rate
+    #  O número de operações iniciadas por segundo.
+
+    ## @var duration
+    #  O tempo, em segundos, durante o qual as operações são iniciadas.
+
+    ## @var draw
+    #  A função que sorteia a chave de cada operação.
+
+    ## @var operation
+    #  A operação gerada (um dos OPERATIONS).
+
+    ## @var start
+    #  O instante em que a geração começou.
+
+    ## @var issued
+    #  O número de operações iniciadas.
+
+    ## @var latencies
+    #  As latências, em segundos, das operações que terminaram com sucesso.
+
+    ## @var failures
+    #  O número de operações que terminaram com timeout.
+
+    ## @var lastReport
+    #  Uma tupla (instante, operações com sucesso, falhas) da última linha de andamento.
+
+    ## O construtor padrão.
+    #  @param client O client.Client, já iniciado.
+    #  @param rate O número de operações iniciadas por segundo.
+    #  @param duration O tempo, em segundos, durante o qual as operações são iniciadas.
+    #  @param draw A função que sorteia a chave de cada operação.
+    #  @param operation A operação gerada (um dos OPERATIONS).
+    def __init__(self, client, rate, duration, draw, operation):
+        self.client = client
+        self.rate = float(rate)
+        self.duration = duration
+        self.draw = draw
+        self.operation = operation
+        self.start = None
+        self.issued = 0
+        self.latencies = []
+        self.failures = 0
+        self.lastReport = None
+
+    ## Começa a geração e roda o laço de eventos até que todas as operações terminem.
+    def run(self):
+        self.start = self.client.loop.time()
+        self.lastReport = (self.start, 0, 0)
+        self.tick()
+        self.client.loop.callLater(REPORT_INTERVAL, self.report)
+        self.client.loop.run()
+
+    ## Inicia as operações cujo instante agendado já chegou e agenda a próxima chamada.
+    def tick(self):
+        now = self.client.loop.time()
+        total = int(self.rate * self.duration)
+        while self.issued < total and self.start + self.issued / self.rate <= now:
+            self.issue(self.start + self.issued / self.rate)
+            self.issued += 1
+
+        if self.issued < total:
+            self.client.loop.callLater(max(0.0, self.start + self.issued / self.rate - now), self.tick)
+        else:
+            self.client.loop.callLater(TIMEOUT + 1.0, self.client.loop.stop)
+
+    ## Inicia uma operação.
+    #  @param scheduled O instante agendado da operação, a partir do qual a sua latência é medida.
+    def issue(self, scheduled):
+        def onDone(result):
+            if result == None:
+                self.failures += 1
+            else:
+                self.latencies.append(self.client.loop.time() - scheduled)
+            if len(self.latencies) + self.failures == int(self.rate * self.duration):
+                self.client.loop.stop()
+
+        key = self.draw()
+        if self.operation == 'lookup':
+            self.client.lookup(key, onDone, TIMEOUT)
+        elif self.operation == 'get':
+            self.client.get(key, onDone, TIMEOUT)
+        else:
+            self.client.put(key, 'x' * VALUE_SIZE, onDone, TIMEOUT)
+
+    ## Imprime uma linha de andamento com a vazão e as falhas desde a linha anterior.
+    def report(self):
+        now = self.client.loop.time()
+        lastTime, lastDone, lastFailures = self.lastReport
+        elapsed = max(now - lastTime, 1e-9)
+        print '%6.1f s: %8.1f ops/s, %6.1f timeouts/s, %d waiting' % (now - self.start, (len(self.latencies) - lastDone) / elapsed,
+                                                                     (self.failures - lastFailures) / elapsed, len(self.client.waiting))
+        self.lastReport = (now, len(self.latencies), self.failures)
+        self.client.loop.callLater(REPORT_INTERVAL, self.report)
+
+    ## Imprime o resultado da geração.
+    def summary(self):
+        elapsed = self.client.loop.time() - self.start
+        latencies = sorted(self.latencies)
+        print 'operation=%s target=%.0f ops/s duration=%.0f s issued=%d completed=%d timeouts=%d' % (self.operation, self.rate, self.duration,
+                                                                                                    self.issued, len(latencies), self.failures)
+        print 'throughput %.1f ops/s' % (len(latencies) / max(elapsed, 1e-9))
+        print 'latency ms: p50 %.2f p99 %.2f p999 %.2f max %.2f' % tuple(1000 * value for value in
+                                                                      (percentile(latencies, 0.5), percentile(latencies, 0.99),
+                                                                       percentile(latencies, 0.999), percentile(latencies, 1.0)))
+        if self.operation == 'lookup':
+            hops = self.client.metrics.snapshot()['hops']
+            print 'hops: mean %.2f' % (sum(hopCount * count for hopCount, count in hops.items()) / float(max(1, sum(hops.values()))))
+
+if __name__ == '__main__':
+    if 5 <= len(sys.argv) <= 9 and (len(sys.argv) < 9 or sys.argv[8] in OPERATIONS):
+        operation = sys.argv[8] if len(sys.argv) == 9 else 'lookup'
+        # as pesquisas passam pelo anel todas as vezes; get e put usam o cache de responsáveis, como uma aplicação usaria
+        dhtClient = client.Client(eventloop.EventLoop(), (sys.argv[1], int(sys.argv[2])),
+                                  concurrency = int(sys.argv[7]) if len(sys.argv) > 7 else client.CONCURRENCY, useCache = operation != 'lookup')
+        if not dhtClient.wait(dhtClient.start):
+            print >>sys.stderr, 'The rendezvous did not answer or knows no peers'
+            sys.exit(1)
+
+        generator = LoadGenerator(dhtClient, float(sys.argv[3]), float(sys.argv[4]),
+                                  distribution(sys.argv[5] if len(sys.argv) > 5 else 'uniform', int(sys.argv[6]) if len(sys.argv) > 6 else 10000),
+                                  operation)
+        generator.run()
+        generator.summary()
+    else:
+        print >>sys.stderr, 'usage: loadgen.py rendezvous_ip_address rendezvous_port ops_per_second seconds [uniform|zipf[:s]] [keys] [concurrency] [lookup|get|put]'
+        sys.exit(1)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file merkle.py
+#  A sincronização (anti-entropia) das chaves entre vizinhos do anel, por árvores de Merkle.
+#
+#  Cada peer mantém uma MerkleTree sobre as chaves do seu storage.LogStore, agrupadas pela posição de hashKey() no anel. Periodicamente,
+#  e logo depois que a sua vizinhança muda (ex.: um peer entrou ao seu lado e passou a ser o responsável por parte das chaves do
+#  sucessor), um peer pergunta ao sucessor e ao antecessor pelo resumo das chaves que eles guardam na sua faixa do anel,
+#  (previousID, id], e desce apenas pelas subárvores em que o vizinho guarda alguma chave diferente das suas:
+#
+#  Peer:    Digest|<início>|<fim>|<nível>|<nó>...            Vizinho: Digests|<número de chaves>|<hash>...   (um par por nó)\n
+#  Peer:    Entries|<início>|<fim>|<posição>|<folha>...      Vizinho: EntryList|<folhas completas>|<próxima posição>|<chave>|<hash>...\n
+#  Peer:    Fetch|<índice do pedaço>|<chave>...              Vizinho: Fetched|<chave>|<número de pedaços>|<versão>|<pedaço do valor>...\n
+#  Peer:    Handoff|<início>|<fim>|<número de chaves>|<hash>  Vizinho: HandedOff|<número de chaves descartadas>
+#
+#  Os resumos de cada nó consideram apenas as chaves da faixa (início, fim], em posições do anel (ver common.ringPosition()). As listas
+#  de chaves e os valores vêm em lotes de até BATCH_BYTES bytes (com a posição onde continuar), e os valores maiores do que
+#  common.MAX_CHUNK em pedaços, como em storage.handleRequest(). O peer busca apenas as chaves que não tem: para uma chave que os dois
+#  têm com valores diferentes, vale o valor do responsável, que é quem recebe as escritas. No final, o vizinho descarta as chaves da
+#  faixa das quais não é o responsável, desde que elas não tenham mudado durante a sincronização (o resumo da faixa continua igual ao
+#  enviado no início). Assim, com os vizinhos em dia, uma sincronização custa uma única requisição por vizinho, e depois de uma mudança
+#  no anel o tráfego cresce com o número de chaves diferentes, e não com o número de chaves guardadas.
+#
+#  Sem registros de remoção, uma chave removida do responsável antes da primeira sincronização com o vizinho que ainda a guarda volta a
+#  existir.
+
+import common
+import hashlib, struct
+
+## O número de filhos de cada nó da árvore.
+BRANCHING = 16
+
+## A profundidade da árvore. As folhas ficam no nível DEPTH, e a raiz no nível 0.
+DEPTH = 3
+
+## O número de folhas da árvore.
+LEAVES = BRANCHING ** DEPTH
+
+## O número máximo de nós ou de folhas em uma única requisição Digest ou Entries.
+MAX_NODES = 256
+
+## O tamanho máximo aproximado, em bytes, das chaves e dos valores em uma única mensagem EntryList, Fetch ou Fetched.
+BATCH_BYTES = common.MAX_CHUNK
+
+## O intervalo, em segundos, entre duas sincronizações com os vizinhos (ver peer.Peer.antiEntropy()).
+SYNC_INTERVAL = 30.0
+
+## Os tipos das requisições da sincronização (ver handleRequest()).
+REQUESTS = ('Digest', 'Entries', 'Fetch', 'Handoff')
+
+## Calcula o hash de uma entrada da árvore, a partir da chave e do CRC32 do seu registro no log (que inclui o valor, ver storage.LogStore).
+#  @param key A chave.
+#  @param crc O CRC32 do registro.
+#  @return Um inteiro de 64 bits.
+def entryHash(key, crc):
+    return int(hashlib.md5(key + struct.pack('!I', crc)).hexdigest()[:16], 16)
+
+## Uma árvore de Merkle sobre as chaves guardadas por um peer, atualizada a cada escrita (ver storage.LogStore.tree).
+#
+#  As folhas dividem as posições do anel em LEAVES faixas contíguas do mesmo tamanho. Cada nó guarda o número de chaves abaixo dele e o
+#  XOR dos hashes das suas entradas (ver entryHash()), de forma que uma escrita atualiza um nó por nível, sem recalcular os irmãos.
+class MerkleTree:
+    ## @var position
+    #  A função que retorna a posição no anel de uma chave (uma string).
+
+    ## @var positions
+    #  O número de posições do anel (K + 1).
+
+    ## @var counts
+    #  Os números de chaves dos nós: counts[nível][índice do nó].
+
+    ## @var hashes
+    #  Os hashes dos nós, no mesmo formato de counts.
+
+    ## @var leafEntries
+    #  As entradas de cada folha: um dicionário {índice da folha: {chave: (hash, posição)}}.
+
+    ## @var entries
+    #  Um dicionário {chave: índice da folha}.
+
+    ## O construtor padrão.
+    #  @param position A função que retorna a posição no anel de uma chave.
+    #  @param positions O número de posições do anel.
+    def __init__(self, position, positions):
+        self.position = position
+        self.positions = positions
+        self.counts = [[0] * BRANCHING ** level for level in range(DEPTH + 1)]
+        self.hashes = [[0] * BRANCHING ** level for level in range(DEPTH + 1)]
+        self.leafEntries = {}
+        self.entries = {}
+
+    ## Atualiza a entrada de uma chave.
+    #  @param key A chave.
+    #  @param crc O CRC32 do novo registro da chave, ou \c None caso ela tenha sido removida.
+    def update(self, key, crc):
+        leaf = self.entries.pop(key, None)
+        if leaf != None:
+            self.apply(leaf, self.leafEntries[leaf].pop(key)[0], -1)
+            if len(self.leafEntries[leaf]) == 0:
+                del self.leafEntries[leaf]
+
+        if crc != None:
+            position = self.position(key)
+            leaf = position * LEAVES // self.positions
+            digest = entryHash(key, crc)
+            self.leafEntries.setdefault(leaf, {})[key] = (digest, position)
+            self.entries[key] = leaf
+            self.apply(leaf, digest, 1)
+
+    ## Soma (ou subtrai) uma entrada em todos os nós do caminho de uma folha até a raiz.
+    def apply(self, leaf, digest, delta):
+        index = leaf
+        for level in range(DEPTH, -1, -1):
+            self.counts[level][index] += delta
+            self.hashes[level][index] ^= digest
+            index //= BRANCHING
+
+    ## Retorna o hash da entrada de uma chave, ou \c None caso a chave não esteja na árvore.
+    def entry(self, key):
+        leaf = self.entries.get(key)
+        return self.leafEntries[leaf][key][0] if leaf != None else None
+
+    ## Calcula as posições cobertas por um nó.
+    #  @param level O nível do nó.
+    #  @param index O índice do nó no nível.
+    #  @return Uma tupla (primeira posição, posição seguinte à última).
+    def bounds(self, level, index):
+        leaves = BRANCHING ** (DEPTH - level)
+        return (-(-index * leaves * self.positions // LEAVES), -(-(index + 1) * leaves * self.positions // LEAVES))
+
+    ## Conta quantas das posições [low, high) pertencem à faixa circular (start, end] do anel (ver common.inInterval()).
+    def overlap(self, low, high, start, end):
+        if start < end:
+            segments = [(start + 1, end + 1)]
+        elif start > end:
+            segments = [(start + 1, self.positions), (0, end + 1)]
+        else:
+            segments = [(0, self.positions)]
+        return sum(max(0, min(high, b) - max(low, a)) for a, b in segments)
+
+    ## Calcula o resumo de um nó, considerando apenas as chaves da faixa (start, end].
+    #
+    #  Os nós inteiramente dentro da faixa usam os valores guardados, e apenas os nós que cruzam uma das suas pontas (no máximo dois por
+    #  nível) são calculados a partir dos filhos ou, nas folhas, das entradas.
+    #
+    #  @param level O nível do nó.
+    #  @param index O índice do nó no nível.
+    #  @param start O início da faixa (exclusivo), uma posição do anel.
+    #  @param end O fim da faixa (inclusivo), uma posição do anel.
+    #  @return Uma tupla (número de chaves, hash).
+    def summary(self, level, index, start, end):
+        low, high = self.bounds(level, index)
+        covered = self.overlap(low, high, start, end)
+        if covered == high - low:
+            return (self.counts[level][index], self.hashes[level][index])
+        if covered == 0 or self.counts[level][index] == 0:
+            return (0, 0)
+
+        count, digest = 0, 0
+        if level == DEPTH:
+            for entryDigest, position in self.leafEntries[index].itervalues():
+                if common.inInterval(position, start, end):
+                    count += 1
+                    digest ^= entryDigest
+        else:
+            for child in range(index * BRANCHING, (index + 1) * BRANCHING):
+                childCount, childDigest = self.summary(level + 1, child, start, end)
+                count += childCount
+                digest ^= childDigest
+        return (count, digest)
+
+    ## Retorna as entradas de uma folha que estão na faixa (start, end], ordenadas pela chave.
+    #  @return Uma lista de tuplas (chave, hash).
+    def leafKeys(self, leaf, start, end):
+        return sorted((key, entry[0]) for key, entry in self.leafEntries.get(leaf, {}).iteritems() if common.inInterval(entry[1], start, end))
+
+    ## Retorna todas as chaves da faixa (start, end].
+    def keysInRange(self, start, end):
+        return [key for leaf, entries in self.leafEntries.items() for key, entry in entries.items() if common.inInterval(entry[1], start, end)]
+
+## Trata uma requisição da sincronização (Digest, Entries, Fetch ou Handoff) recebida por um peer, e retorna a resposta.
+#
+#  @param store O storage.LogStore do peer, com a sua MerkleTree, ou \c None caso o peer ainda não o tenha aberto (nenhuma chave).
+#  @param message A requisição, como uma lista de campos.
+#  @param isResponsible Uma função que recebe uma chave (uma string) e retorna \c True caso o peer seja o responsável por ela.
+#  @return A resposta, como uma lista de campos.
+def handleRequest(store, message, isResponsible):
+    if store == None:
+        return emptyReply(message)
+
+    tree = store.tree
+    if message[0] == 'Digest':
+        start, end, level = int(message[1]), int(message[2]), int(message[3])
+        with store.lock:
+            return ['Digests'] + [field for index in message[4:] for field in tree.summary(level, int(index), start, end)]
+
+    elif message[0] == 'Entries':
+        start, end, offset = int(message[1]), int(message[2]), int(message[3])
+        fields = []
+        size = 0
+        served = 0
+        with store.lock:
+            for leaf in message[4:]:
+                for key, digest in tree.leafKeys(int(leaf), start, end)[offset:]:
+                    if len(fields) > 0 and size + len(key) > BATCH_BYTES:
+                        return ['EntryList', served, offset] + fields
+                    fields += [key, digest]
+                    size += len(key) + 24
+                    offset += 1
+                served += 1
+                offset = 0
+        return ['EntryList', served, 0] + fields
+
+    elif message[0] == 'Fetch':
+        index = int(message[1])
+        fields = []
+        size = 0
+        for key in message[2:]:
+            key = str(key)
+            result = store.readRange(key, index * common.MAX_CHUNK, common.MAX_CHUNK)
+            chunk, length, version = result if result != None else ('', 0, 0)
+            if len(fields) > 0 and size + len(key) + len(chunk) > BATCH_BYTES:
+                break
+            # a chave pode ter sido removida durante a sincronização: nesse caso, o número de pedaços é 0
+            fields += [key, max(1, (length + common.MAX_CHUNK - 1) // common.MAX_CHUNK) if result != None else 0, version, chunk]
+            size += len(key) + len(chunk)
+        return ['Fetched'] + fields
+
+    else:
+        start, end, count, digest = int(message[1]), int(message[2]), int(message[3]), int(message[4])
+        with store.lock:
+            if tree.summary(0, 0, start, end) != (count, digest): # a faixa mudou durante a sincronização
+                return ['HandedOff', 0]
+            keys = tree.keysInRange(start, end)
+
+        dropped = 0
+        for key in keys:
+            if not isResponsible(key) and store.delete(key):
+                dropped += 1
+        return ['HandedOff', dropped]
+
+## Retorna a resposta de um peer sem nenhuma chave a uma requisição da sincronização (ver handleRequest()).
+def emptyReply(message):
+    if message[0] == 'Digest':
+        return ['Digests'] + [0, 0] * len(message[4:])
+    elif message[0] == 'Entries':
+        return ['EntryList', len(message[4:]), 0]
+    elif message[0] == 'Fetch':
+        return ['Fetched'] + [field for key in message[2:] for field in (str(key), 0, 0, '')]
+    return ['HandedOff', 0]
+
+## Divide uma lista de chaves em lotes de até \c limit chaves e de até BATCH_BYTES bytes (com pelo menos uma chave cada).
+#  @param keys As chaves.
+#  @param limit O número máximo de chaves em cada lote.
+#  @return Uma lista de listas de chaves.
+def batches(keys, limit):
+    result = []
+    size = 0
+    for key in keys:
+        if len(result) == 0 or len(result[-1]) >= limit or size + len(key) > BATCH_BYTES:
+            result.append([])
+            size = 0
+        result[-1].append(key)
+        size += len(key)
+    return result
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file metrics.py
+#  As métricas de um peer (ou do Rendezvous): mensagens enviadas e recebidas por tipo, histogramas do RTT das requisições, timeouts,
+#  número de saltos das pesquisas, profundidade das filas e tempo de espera pelo lock.
+#
+#  As métricas são lidas de três formas:
+#
+#  - pela mensagem Stats, respondida com StatsReport|<métricas em JSON> (ver report()), inclusive por este módulo, na linha de comando:
+#    python metrics.py <ip> <porta> [intervalo];
+#  - pelo arquivo de métricas, em que o peer escreve uma linha JSON a cada intervalo (ver dump());
+#  - pelo comando "stats" do peer interativo.
+#
+#  No caminho das mensagens, cada registro custa apenas algumas operações em dicionários e listas, sem locks (ver Metrics); os
+#  histogramas têm baldes fixos em potências de 2, e as profundidades das filas são amostradas fora desse caminho (ver Metrics.sample()).
+
+import common, wire
+import collections, json, socket, sys, threading, time
+
+## O número de baldes dos histogramas.
+BUCKETS = 40
+
+## A unidade, em segundos, dos histogramas de tempo: o primeiro balde conta os tempos menores que 1 microssegundo.
+TIME_UNIT = 1e-6
+
+## Um histograma com baldes em potências de 2.
+#
+#  O balde 0 conta os valores menores que \c unit, e o balde i conta os valores em [unit * 2^(i-1), unit * 2^i). Os valores maiores
+#  caem no último balde. Não é protegido por nenhum lock: quem o usa deve garantir que ele não é modificado por duas threads ao mesmo tempo.
+class Histogram:
+    ## @var unit
+    #  O limite superior do primeiro balde.
+
+    ## @var scale
+    #  1 / \c unit.
+
+    ## @var buckets
+    #  A lista com o número de valores de cada balde.
+
+    ## @var count
+    #  O número de valores registrados.
+
+    ## @var total
+    #  A soma dos valores registrados.
+
+    ## @var max
+    #  O maior valor registrado.
+
+    ## O construtor padrão.
+    #  @param unit O limite superior do primeiro balde.
+    def __init__(self, unit = TIME_UNIT):
+        self.unit = unit
+        self.scale = 1.0 / unit
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    ## Registra um valor.
+    #  @param value O valor (não negativo).
+    def record(self, value):
+        i = int(value * self.scale).bit_length()
+        self.buckets[i if i < BUCKETS else BUCKETS - 1] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    ## Estima um percentil, pelo limite superior do balde em que ele cai.
+    #  @param fraction A fração dos valores abaixo do percentil (ex.: 0.99).
+    #  @return O limite superior do balde (ou o maior valor, caso seja menor), ou \c None caso nenhum valor tenha sido registrado.
+    def percentile(self, fraction):
+        if self.count == 0:
+            return None
+
+        seen = 0
+        for i, bucketCount in enumerate(self.buckets):
+            seen += bucketCount
+            if seen >= fraction * self.count:
+                return min(self.max, self.unit * 2**i)
+        return self.max
+
+    ## Retorna o histograma em um formato que pode ser convertido para JSON.
+    #  @return Um dicionário com count, sum, max, p50, p90, p99 e buckets, a lista de pares [limite superior do balde, número de valores]
+    #  dos baldes não vazios.
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.total, 'max': self.max,
+                'p50': self.percentile(0.5), 'p90': self.percentile(0.9), 'p99': self.percentile(0.99),
+                'buckets': [[self.unit * 2**i, bucketCount] for i, bucketCount in enumerate(self.buckets) if bucketCount > 0]}
+
+## Um Lock que mede o tempo de espera das aquisições.
+#
+#  A aquisição tenta primeiro pegar o lock sem esperar, e só mede o tempo quando ele está ocupado, de forma que uma aquisição
+#  sem disputa custa apenas uma chamada a mais. Os contadores são modificados com o próprio lock adquirido.
+class TimedLock:
+    ## @var lock
+    #  O threading.Lock.
+
+    ## @var acquisitions
+    #  O número de aquisições.
+
+    ## @var contended
+    #  O número de aquisições que precisaram esperar.
+
+    ## @var wait
+    #  O Histogram dos tempos de espera, em segundos, das aquisições que precisaram esperar.
+
+    ## O construtor padrão.
+    #  @param metrics O Metrics em que o lock é registrado, com o nome \c name (ver Metrics.locks).
+    #  @param name O nome do lock.
+    def __init__(self, metrics, name):
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait = Histogram()
+        metrics.locks[name] = self
+
+    ## Adquire o lock, esperando por ele caso esteja ocupado.
+    def acquire(self):
+        if not self.lock.acquire(False):
+            start = time.time()
+            self.lock.acquire()
+            self.contended += 1
+            self.wait.record(time.time() - start)
+        self.acquisitions += 1
+
+    __enter__ = acquire
+
+    ## Libera o lock.
+    def release(self):
+        self.lock.release()
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+    ## Retorna os contadores do lock em um formato que pode ser convertido para JSON.
+    #  @return Um dicionário com acquisitions, contended e wait (ver Histogram.snapshot()).
+    def snapshot(self):
+        return {'acquisitions': self.acquisitions, 'contended': self.contended, 'wait': self.wait.snapshot()}
+
+## As métricas de um peer ou do Rendezvous. Pode ser usado por várias threads.
+#
+#  Para que o custo no caminho das mensagens seja baixo, os registros das mensagens, das requisições, do tratamento e das filas não
+#  usam lock: cada um deles é feito por uma única thread (ex.: em peer.Peer, as mensagens enviadas são registradas pela thread de
+#  envio, e as recebidas e os RTTs pela thread de recebimento), e as inserções e remoções em dicionários são atômicas no CPython.
+#  Apenas os registros das pesquisas, que podem ser feitos por várias threads ao mesmo tempo, usam o lock. Valores que mudam a cada
+#  mensagem, como as profundidades das filas, são lidos apenas periodicamente (ver gauges).
+class Metrics:
+    ## @var clock
+    #  A função que retorna o instante atual, em segundos (ex.: time.time ou eventloop.EventLoop.time).
+
+    ## @var sent
+    #  Um Counter {tipo da mensagem: número de mensagens enviadas}.
+
+    ## @var received
+    #  Um Counter {tipo da mensagem: número de mensagens recebidas}.
+
+    ## @var bytesSent
+    #  O número de bytes enviados.
+
+    ## @var bytesReceived
+    #  O número de bytes recebidos.
+
+    ## @var requests
+    #  Um dicionário {ID da requisição: (tipo da mensagem, instante do envio)} com as requisições que ainda esperam por uma resposta.
+
+    ## @var rtt
+    #  Um dicionário {tipo da mensagem: Histogram dos RTTs, em segundos} das requisições respondidas.
+
+    ## @var timeouts
+    #  Um Counter {tipo da mensagem: número de requisições que deram timeout}.
+
+    ## @var retransmissions
+    #  Um Counter {tipo da mensagem: número de reenvios de requisições} (ver retransmit.py).
+
+    ## @var duplicates
+    #  Um Counter {tipo da mensagem: número de requisições repetidas recebidas}, que não foram tratadas de novo (ver retransmit.ReplyCache).
+
+    ## @var hops
+    #  Um Counter {número de saltos: número de pesquisas} das pesquisas feitas pela rede.
+
+    ## @var lookupLatency
+    #  O Histogram das latências, em segundos, das pesquisas feitas pela rede.
+
+    ## @var lookupTimeouts
+    #  O número de pesquisas que deram timeout.
+
+    ## @var handling
+    #  O Histogram dos tempos, em segundos, gastos tratando cada mensagem recebida.
+
+    ## @var gauges
+    #  Um dicionário {nome: função sem argumentos}, com valores que não são registrados no caminho das mensagens, mas lidos quando as
+    #  métricas são consultadas e amostrados por sample() (ex.: a profundidade de uma fila).
+
+    ## @var samples
+    #  Um dicionário {nome: Histogram} com as amostras de cada valor de \c gauges (ver sample()).
+
+    ## @var locks
+    #  Um dicionário {nome: TimedLock} com os locks medidos.
+
+    ## @var lock
+    #  O Lock que protege as métricas das pesquisas (hops, lookupLatency e lookupTimeouts).
+
+    ## O construtor padrão.
+    #  @param clock A função que retorna o instante atual, em segundos.
+    def __init__(self, clock = time.time):
+        self.clock = clock
+        self.sent = collections.Counter()
+        self.received = collections.Counter()
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.requests = {}
+        self.rtt = {}
+        self.timeouts = collections.Counter()
+        self.retransmissions = collections.Counter()
+        self.duplicates = collections.Counter()
+        self.hops = collections.Counter()
+        self.lookupLatency = Histogram()
+        self.lookupTimeouts = 0
+        self.handling = Histogram()
+        self.gauges = {}
+        self.samples = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    ## Registra uma mensagem enviada.
+    #  @param name O tipo da mensagem.
+    #  @param size O tamanho, em bytes, da mensagem codificada.
+    def messageSent(self, name, size):
+        self.sent[name] += 1
+        self.bytesSent += size
+
+    ## Registra uma mensagem recebida.
+    #  @param name O tipo da mensagem.
+    #  @param size O tamanho, em bytes, da mensagem codificada.
+    def messageReceived(self, name, size):
+        self.received[name] += 1
+        self.bytesReceived += size
+
+    ## Registra o envio de uma requisição, cujo RTT será medido quando ela for completada (ver requestCompleted()).
+    #  @param requestID O ID da requisição.
+    #  @param name O tipo da mensagem.
+    def requestSent(self, requestID, name):
+        self.requests[requestID] = (name, self.clock())
+
+    ## Registra a resposta ou o timeout de uma requisição. Requisições cujo envio não foi registrado são ignoradas.
+    #  @param requestID O ID da requisição.
+    #  @param timedOut \c True caso a requisição tenha dado timeout.
+    def requestCompleted(self, requestID, timedOut):
+        request = self.requests.pop(requestID, None)
+        if request == None:
+            return
+
+        name, start = request
+        if timedOut:
+            self.timeouts[name] += 1
+        else:
+            histogram = self.rtt.get(name)
+            if histogram == None:
+                histogram = self.rtt[name] = Histogram()
+            histogram.record(self.clock() - start)
+
+    ## Registra o reenvio de uma requisição.
+    #  @param name O tipo da mensagem.
+    def requestRetransmitted(self, name):
+        self.retransmissions[name] += 1
+
+    ## Registra uma requisição repetida recebida.
+    #  @param name O tipo da mensagem.
+    def duplicateReceived(self, name):
+        self.duplicates[name] += 1
+
+    ## Registra uma pesquisa feita pela rede.
+    #  @param hops O número de saltos da pesquisa, ou \c None caso ela tenha dado timeout.
+    #  @param latency O tempo, em segundos, até o resultado.
+    def lookupCompleted(self, hops, latency):
+        with self.lock:
+            if hops == None:
+                self.lookupTimeouts += 1
+            else:
+                self.hops[hops] += 1
+                self.lookupLatency.record(latency)
+
+    ## Registra o tempo gasto tratando uma mensagem recebida.
+    #  @param seconds O tempo, em segundos.
+    def messageHandled(self, seconds):
+        self.handling.record(seconds)
+
+    ## Amostra os valores de \c gauges, registrando-os em \c samples. Deve ser chamada periodicamente, sempre pela mesma thread.
+    def sample(self):
+        for name, gauge in self.gauges.items():
+            histogram = self.samples.get(name)
+            if histogram == None:
+                histogram = self.samples[name] = Histogram(1)
+            histogram.record(gauge())
+
+    ## Retorna as métricas em um formato que pode ser convertido para JSON.
+    #  @return Um dicionário com as métricas (os nomes dos campos são os dos atributos).
+    def snapshot(self):
+        # items() copia os dicionários de uma só vez, de forma que as threads que registram as métricas podem continuar enquanto isso
+        snapshot = {'sent': dict(self.sent), 'received': dict(self.received), 'bytesSent': self.bytesSent, 'bytesReceived': self.bytesReceived,
+                    'rtt': dict((name, histogram.snapshot()) for name, histogram in self.rtt.items()),
+                    'timeouts': dict(self.timeouts), 'pendingRequests': len(self.requests),
+                    'retransmissions': dict(self.retransmissions), 'duplicates': dict(self.duplicates),
+                    'handling': self.handling.snapshot(),
+                    'samples': dict((name, histogram.snapshot()) for name, histogram in self.samples.items()),
+                    'gauges': dict((name, gauge()) for name, gauge in self.gauges.items()),
+                    'locks': dict((name, lock.snapshot()) for name, lock in self.locks.items())}
+        with self.lock:
+            snapshot.update({'hops': dict(self.hops), 'lookupLatency': self.lookupLatency.snapshot(), 'lookupTimeouts': self.lookupTimeouts})
+        return snapshot
+
+## Monta o relatório de métricas de um peer ou do Rendezvous, enviado na mensagem StatsReport e escrito no arquivo de métricas.
+#  @param metrics O Metrics.
+#  @param address O endereço do peer (ou do Rendezvous).
+#  @param id O ID do peer, ou \c None.
+#  @return O relatório, em JSON (uma única linha).
+def report(metrics, address, id):
+    record = metrics.snapshot()
+    record['time'] = metrics.clock()
+    record['address'] = repr(address)
+    record['id'] = id
+    return json.dumps(record, sort_keys = True)
+
+## Acrescenta uma linha a um arquivo de métricas.
+#  @param path O caminho do arquivo.
+#  @param line A linha, sem a quebra de linha (ver report()).
+def dump(path, line):
+    with open(path, 'a') as metricsFile:
+        metricsFile.write(line + '\n')
+
+## Pede as métricas de um peer (ou do Rendezvous) com a mensagem Stats.
+#  @param address O endereço do peer, no formato ('ip', porta).
+#  @param timeout O tempo de espera máximo, em segundos.
+#  @return O relatório, em JSON (ver report()).
+#  @throw socket.timeout Caso o peer não responda.
+def query(address, timeout = 3.0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        return common.request(sock, ['Stats'], 0, address, timeout)[1]
+    finally:
+        sock.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) in (3, 4):
+        address = (sys.argv[1], int(sys.argv[2]))
+        while True:
+            print query(address)
+            if len(sys.argv) == 3:
+                break
+            time.sleep(float(sys.argv[3]))
+    else:
+        print >>sys.stderr, 'usage: metrics.py ip_address port [interval]'
+        sys.exit(1)
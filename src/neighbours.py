@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file neighbours.py
+#  As listas de sucessores e de antecessores de um peer, mantidas pela estabilização (ver peer.Peer.stabilize()).
+#
+#  Cada lista é uma lista de tuplas (ID, endereço), do vizinho imediato para o mais distante, com no máximo \c size entradas.
+#  As entradas das duas listas são monitoradas por um detector.PhiAccrualDetector: qualquer mensagem recebida de um vizinho conta
+#  como batimento, e o peer só pinga os vizinhos dos quais não recebe nada há mais do que o intervalo esperado (ver heartbeatIntervals()).
+#  A cada REFRESH_INTERVAL segundos, o peer também pede ao sucessor e ao antecessor as suas listas (mensagem Neighbours):
+#
+#  Peer:    Neighbours \n
+#  Vizinho: NeighbourList|<número de sucessores>|<ID>|<endereço>|...   (os sucessores, seguidos dos antecessores)
+#
+#  Peers antigos não conhecem a mensagem Neighbours; para eles é usado LEGACY_REQUEST, que informa apenas um vizinho de cada lado.
+#
+#  Quando o sucessor se torna suspeito, o novo sucessor é a próxima entrada da lista que não é suspeita, sem nenhuma requisição a mais
+#  (ver replaceDead()), de forma que o anel sobrevive à falha de até \c size - 1 peers consecutivos.
+
+import common
+
+## O intervalo, em segundos, entre as verificações da estabilização (ver peer.Peer.stabilize()).
+TICK = 0.5
+
+## O tempo, em segundos, sem mensagens do sucessor ou do antecessor depois do qual ele é pingado.
+HEARTBEAT_INTERVAL = 1.0
+
+## O tempo, em segundos, sem mensagens das demais entradas das listas depois do qual elas são pingadas.
+FAR_HEARTBEAT_INTERVAL = 5.0
+
+## O intervalo, em segundos, entre os pedidos das listas do sucessor e do antecessor.
+REFRESH_INTERVAL = 3.0
+
+## A requisição usada para obter a vizinhança de peers que não conhecem a mensagem Neighbours.
+LEGACY_REQUEST = ['Request', 'previousID', 'previousAddress', 'nextID', 'nextAddress']
+
+## Monta a lista de sucessores (ou de antecessores) de um peer.
+#
+#  A lista começa pelo vizinho imediato e segue com as entradas de \c entries que estão depois da última entrada aceita, no sentido
+#  da lista, e antes do próprio peer. Entradas fora de ordem, repetidas ou com o ID do próprio peer são descartadas, de forma que a
+#  lista pode ser montada tanto a partir da lista antiga (depois de uma mudança de vizinho) quanto a partir da lista do vizinho.
+#
+#  @param id O ID do peer.
+#  @param first O vizinho imediato, uma tupla (ID, endereço).
+#  @param entries As demais entradas candidatas, tuplas (ID, endereço), da mais próxima para a mais distante.
+#  @param size O tamanho máximo da lista.
+#  @param clockwise \c True para a lista de sucessores, e \c False para a de antecessores.
+#  @return A lista de tuplas (ID, endereço).
+def buildList(id, first, entries, size, clockwise):
+    result = [first]
+    if first[0] == id: # sozinho na DHT
+        return result
+
+    for entry in entries:
+        if len(result) >= size:
+            break
+
+        last = result[-1][0]
+        if entry[0] == id or entry[0] == last:
+            continue
+        if common.inInterval(entry[0], last, id) if clockwise else common.inInterval(entry[0], id, last):
+            result.append(entry)
+    return result
+
+## Calcula o intervalo esperado entre as mensagens de cada entrada das listas (ver detector.PhiAccrualDetector.monitor()).
+#
+#  O sucessor e o antecessor, cuja falha precisa ser detectada logo, são pingados a cada HEARTBEAT_INTERVAL segundos sem mensagens;
+#  as demais entradas, que só são usadas depois da falha de um vizinho imediato, a cada FAR_HEARTBEAT_INTERVAL segundos.
+#
+#  @param address O endereço do peer (que não é monitorado).
+#  @param successors A lista de sucessores.
+#  @param predecessors A lista de antecessores.
+#  @return Um dicionário {endereço: intervalo esperado, em segundos}.
+def heartbeatIntervals(address, successors, predecessors):
+    intervals = dict((entry[1], FAR_HEARTBEAT_INTERVAL) for entry in successors[1:] + predecessors[1:])
+    for entry in (successors[0], predecessors[0]):
+        intervals[entry[1]] = HEARTBEAT_INTERVAL
+    intervals.pop(address, None)
+    return intervals
+
+## Substitui os vizinhos suspeitos.
+#
+#  O novo sucessor é o primeiro sucessor que não está em \c dead. Caso todos estejam, é o antecessor vivo mais distante (o anel se
+#  fecha sem os peers entre eles, que não são conhecidos) e, caso nenhum vizinho esteja vivo, o próprio peer, que fica sozinho na DHT.
+#  O novo antecessor é escolhido da mesma forma, no sentido contrário.
+#
+#  @param id O ID do peer.
+#  @param address O endereço do peer.
+#  @param successors A lista de sucessores.
+#  @param predecessors A lista de antecessores.
+#  @param dead O conjunto dos endereços suspeitos.
+#  @param size O tamanho máximo das listas.
+#  @return Uma tupla (sucessores, antecessores, removidos), onde \c removidos são os sucessores que ficaram entre o peer e o novo
+#  sucessor e os antecessores que ficaram entre o novo antecessor e o peer, que devem ser informados ao Rendezvous por este peer.
+#  Os dois lados de um peer morto o informam, pois o sucessor dele pode atualizar os ponteiros do antecessor (ver peer.Peer.allocate())
+#  antes que o antecessor o detecte; o Rendezvous ignora as remoções repetidas.
+def replaceDead(id, address, successors, predecessors, dead, size):
+    liveSuccessors = [entry for entry in successors if not entry[1] in dead]
+    livePredecessors = [entry for entry in predecessors if not entry[1] in dead]
+
+    first = (liveSuccessors + livePredecessors[::-1] + [(id, address)])[0]
+    newSuccessors = buildList(id, first, liveSuccessors, size, True)
+    first = (livePredecessors + liveSuccessors[::-1] + [(id, address)])[0]
+    newPredecessors = buildList(id, first, livePredecessors, size, False)
+
+    removed = []
+    for entries in (successors, predecessors):
+        for entry in entries:
+            if not entry[1] in dead:
+                break
+            if not entry in removed:
+                removed.append(entry)
+    return (newSuccessors, newPredecessors, removed)
+
+## Monta a resposta a uma requisição Neighbours.
+#  @param successors A lista de sucessores.
+#  @param predecessors A lista de antecessores.
+#  @return A mensagem NeighbourList, como uma lista de campos.
+def encode(successors, predecessors):
+    return ['NeighbourList', len(successors)] + [field for entry in successors + predecessors for field in entry]
+
+## Lê as listas de um vizinho, da resposta a Neighbours ou a LEGACY_REQUEST.
+#  @param reply A resposta, como uma lista de campos.
+#  @return Uma tupla (sucessores, antecessores), ou \c None caso a resposta não esteja em nenhum dos dois formatos.
+def decode(reply):
+    if reply[0] == 'NeighbourList' and len(reply) >= 2 and len(reply) % 2 == 0:
+        entries = [(int(reply[i]), common.strToAddr(reply[i + 1])) for i in range(2, len(reply), 2)]
+        return (entries[:int(reply[1])], entries[int(reply[1]):])
+    if reply[0] == 'Reply' and len(reply) == 5:
+        return ([(int(reply[3]), common.strToAddr(reply[4]))], [(int(reply[1]), common.strToAddr(reply[2]))])
+    return None
+
+## Calcula as listas de um peer ao final de uma rodada da estabilização.
+#
+#  Os vizinhos mortos são substituídos (ver replaceDead()) e, em seguida, as listas são refeitas a partir das listas recebidas do
+#  sucessor e do antecessor (sem as entradas mortas), caso eles tenham respondido. As entradas antigas só completam as listas
+#  recebidas quando elas são curtas (ex.: a resposta de um peer antigo, que informa um único vizinho).
+#
+#  @param id O ID do peer.
+#  @param address O endereço do peer.
+#  @param successors A lista de sucessores.
+#  @param predecessors A lista de antecessores.
+#  @param dead O conjunto dos endereços suspeitos.
+#  @param replies Um dicionário {endereço: (sucessores, antecessores)} com as listas recebidas dos vizinhos (ver decode()).
+#  @param size O tamanho máximo das listas.
+#  @return Uma tupla (sucessores, antecessores, removidos) (ver replaceDead()).
+def stabilize(id, address, successors, predecessors, dead, replies, size):
+    successors, predecessors, removed = replaceDead(id, address, successors, predecessors, dead, size)
+
+    if successors[0][1] in replies:
+        entries = [entry for entry in replies[successors[0][1]][0] + successors[1:] if not entry[1] in dead]
+        successors = buildList(id, successors[0], entries, size, True)
+    if predecessors[0][1] in replies:
+        entries = [entry for entry in replies[predecessors[0][1]][1] + predecessors[1:] if not entry[1] in dead]
+        predecessors = buildList(id, predecessors[0], entries, size, False)
+    return (successors, predecessors, removed)
+
+## Monta as mensagens Set com que um peer que acabou de ocupar o seu lugar no anel (ou de trocar de vizinhos) atualiza os ponteiros de
+#  vizinhança dos vizinhos e dos vizinhos dos vizinhos (ver peer.Peer.allocate()).
+#
+#  As atualizações para o mesmo endereço (ex.: o sucessor que também é o antecessor do antecessor, em anéis pequenos) são juntadas em uma
+#  única mensagem. Um campo que aparece em duas delas fica com o último valor, como quando as mensagens eram enviadas uma após a outra, e
+#  aparece uma única vez, pois peers antigos leem apenas a primeira ocorrência de cada campo. Os vizinhos que são o próprio peer não
+#  recebem nada.
+#
+#  @param id O ID do peer.
+#  @param address O endereço do peer.
+#  @param previousAddress O endereço do antecessor.
+#  @param previousPreviousAddress O endereço do antecessor do antecessor.
+#  @param nextAddress O endereço do sucessor.
+#  @param nextNextAddress O endereço do sucessor do sucessor.
+#  @return Uma lista de tuplas (endereço, mensagem Set como uma lista de campos), com no máximo uma mensagem por endereço.
+def allocationUpdates(id, address, previousAddress, previousPreviousAddress, nextAddress, nextNextAddress):
+    updates = [(previousAddress, ['nextID', id, 'nextAddress', address, 'nextNextAddress', nextAddress]),
+               (previousPreviousAddress, ['nextNextAddress', address]),
+               (nextAddress, ['previousID', id, 'previousAddress', address, 'previousPreviousAddress', previousAddress]),
+               (nextNextAddress, ['previousPreviousAddress', address])]
+
+    destinations = []
+    values = {}         # formato: {endereço: {campo: valor}}
+    order = {}          # formato: {endereço: [campo]}
+    for destination, fields in updates:
+        if destination == address:
+            continue
+        if not destination in values:
+            destinations.append(destination)
+            values[destination] = {}
+            order[destination] = []
+        for i in range(0, len(fields), 2):
+            if not fields[i] in values[destination]:
+                order[destination].append(fields[i])
+            values[destination][fields[i]] = fields[i + 1]
+
+    return [(destination, ['Set'] + [field for name in order[destination] for field in (name, values[destination][name])])
+            for destination in destinations]
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file partition.py
+#  O cálculo, em lote, dos hashes de muitas chaves e dos peers responsáveis por elas, a partir de uma cópia do anel (ver RingSnapshot).
+#
+#  Serve para particionar um conjunto grande de dados antes de carregá-lo na DHT, sem uma pesquisa por chave. Os resultados são os
+#  mesmos de common.hashKey() e da regra de responsabilidade dos peers (cada peer responde pelo intervalo (ID do antecessor, ID]),
+#  nos dois métodos de distribuição dos IDs.
+#
+#  O NumPy é opcional: caso esteja instalado, os restos da divisão dos MD5 por K e a busca dos responsáveis são feitos com operações
+#  vetoriais, e os resultados são arrays do NumPy; caso contrário, são usadas listas e o módulo bisect.
+
+import common
+import hashlib, bisect, socket
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+## O maior K com o qual o resto da divisão dos MD5 por K é calculado com inteiros de 64 bits (ver hashPositions()).
+MAX_VECTOR_K = 2**32
+
+## Calcula as posições no anel dos hashes de várias chaves, ou seja, o MD5 de cada chave módulo K (ver common.hashKey()).
+#
+#  Com o NumPy, cada MD5 é lido como dois inteiros de 64 bits (alto e baixo), e o resto é calculado como
+#  ((alto mod K) * (2^64 mod K) + baixo mod K) mod K, sem inteiros de precisão arbitrária.
+#
+#  @param keys As chaves (um iterável de strings).
+#  @param K O número máximo de nós na rede.
+#  @return Um array do NumPy (int64) ou, caso o NumPy não esteja instalado ou K seja maior que MAX_VECTOR_K, uma lista.
+def hashPositions(keys, K):
+    md5 = hashlib.md5
+    if numpy == None or K > MAX_VECTOR_K:
+        return [int(md5(str(key)).hexdigest(), 16) % K for key in keys]
+
+    words = numpy.frombuffer(''.join([md5(str(key)).digest() for key in keys]), dtype='>u8').reshape(-1, 2).astype(numpy.uint64)
+    modulus = numpy.uint64(K)
+    high = words[:, 0] % modulus * numpy.uint64(2**64 % K) % modulus
+    return ((high + words[:, 1] % modulus) % modulus).astype(numpy.int64)
+
+## Calcula os hashes de várias chaves, com o mesmo resultado de common.hashKey() para cada uma.
+#  @param keys As chaves (um iterável de strings).
+#  @param K O número máximo de nós na rede.
+#  @param method O método de distribuição dos IDs (1 ou 2).
+#  @return Um array do NumPy, caso ele esteja instalado (int64 quando todos os hashes cabem em 64 bits, e de objetos caso contrário),
+#  ou uma lista.
+def hashKeys(keys, K, method):
+    positions = hashPositions(keys, K)
+    if numpy == None:
+        return positions if method == 1 else [2**position for position in positions]
+    if method == 1:
+        return positions if isinstance(positions, numpy.ndarray) else numpy.array(positions, dtype = numpy.int64 if K <= 2**63 else object)
+    if K <= 63:
+        return numpy.left_shift(numpy.int64(1), numpy.asarray(positions, dtype = numpy.int64))
+    return numpy.array([2**int(position) for position in positions], dtype = object)
+
+## Uma cópia do anel (os IDs e endereços dos peers em um instante), usada para encontrar os responsáveis por muitas chaves de uma vez.
+#
+#  Os responsáveis são encontrados pela posição no anel (ver common.ringPosition()), que tem a mesma ordem dos IDs nos dois métodos:
+#  o responsável por uma chave é o primeiro peer com posição maior ou igual à da chave ou, caso não haja nenhum, o primeiro do anel.
+class RingSnapshot:
+    ## @var ids
+    #  A lista ordenada dos IDs dos peers.
+
+    ## @var addresses
+    #  Os endereços dos peers, no formato ('ip', porta), na mesma ordem de \c ids.
+
+    ## @var K
+    #  O número máximo de nós na rede.
+
+    ## @var method
+    #  O método de distribuição dos IDs (1 ou 2).
+
+    ## @var positions
+    #  A lista das posições no anel dos peers, na mesma ordem de \c ids.
+
+    ## O construtor padrão.
+    #  @param ids Os IDs dos peers, em qualquer ordem.
+    #  @param addresses Os endereços dos peers, na mesma ordem de \c ids.
+    #  @param K O número máximo de nós na rede.
+    #  @param method O método de distribuição dos IDs (1 ou 2).
+    #  @throw ValueError Caso o anel esteja vazio.
+    def __init__(self, ids, addresses, K, method):
+        if len(ids) == 0:
+            raise ValueError('empty ring')
+
+        entries = sorted(zip(ids, addresses))
+        self.ids = [entry[0] for entry in entries]
+        self.addresses = [entry[1] for entry in entries]
+        self.K = K
+        self.method = method
+
+        self.positions = [common.ringPosition(id, method) for id in self.ids]
+
+    ## Encontra os responsáveis por várias chaves.
+    #  @param keys As chaves (um iterável de strings, que ainda serão passadas pelo hash).
+    #  @return Os índices, em \c ids e \c addresses, dos responsáveis pelas chaves, na mesma ordem: um array do NumPy ou uma lista.
+    def ownerIndexes(self, keys):
+        positions = hashPositions(keys, self.K)
+        if numpy != None and isinstance(positions, numpy.ndarray):
+            return numpy.searchsorted(numpy.array(self.positions, dtype = numpy.int64), positions, side = 'left') % len(self.ids)
+        bisectLeft, ringPositions, size = bisect.bisect_left, self.positions, len(self.ids)
+        return [bisectLeft(ringPositions, position) % size for position in positions]
+
+    ## Separa várias chaves pelos seus responsáveis.
+    #  @param keys As chaves (um iterável de strings).
+    #  @return Um dicionário {(ID do responsável, endereço do responsável): lista das chaves}. Peers sem nenhuma chave ficam de fora.
+    def partition(self, keys):
+        keys = list(keys)
+        indexes = self.ownerIndexes(keys)
+        groups = {}
+        if numpy != None and isinstance(indexes, numpy.ndarray):
+            order = numpy.argsort(indexes, kind = 'mergesort')
+            bounds = numpy.searchsorted(indexes[order], numpy.arange(len(self.ids) + 1), side = 'left')
+            for i in numpy.flatnonzero(bounds[1:] > bounds[:-1]):
+                groups[(self.ids[i], self.addresses[i])] = [keys[j] for j in order[bounds[i]:bounds[i + 1]]]
+            return groups
+
+        for key, i in zip(keys, indexes):
+            groups.setdefault((self.ids[i], self.addresses[i]), []).append(key)
+        return groups
+
+## Copia o anel de um Rendezvous que roda neste processo.
+#  @param rendezvous O rendezvous.Rendezvous.
+#  @return O RingSnapshot.
+#  @throw ValueError Caso nenhum peer tenha sido alocado.
+def snapshotFromRendezvous(rendezvous):
+    return RingSnapshot(rendezvous.ring, [common.strToAddr(rendezvous.peersByID[id].address) for id in rendezvous.ring],
+                        rendezvous.K, rendezvous.method)
+
+## Copia o anel percorrendo-o a partir de um peer da DHT, de sucessor em sucessor (uma requisição Request por peer).
+#
+#  O percurso termina quando volta a um peer já visitado. Como o anel pode mudar durante o percurso, a cópia pode ficar
+#  desatualizada caso peers entrem ou saiam da DHT ao mesmo tempo.
+#
+#  @param address O endereço de um peer da DHT, no formato ('ip', porta).
+#  @param K O número máximo de nós na rede (o mesmo passado ao Rendezvous).
+#  @param method O método de distribuição dos IDs (1 ou 2).
+#  @param timeout O tempo, em segundos, de espera máximo pela resposta de cada peer.
+#  @return O RingSnapshot.
+#  @throw socket.timeout Caso algum peer do percurso não responda.
+def snapshotFromPeer(address, K, method, timeout = 3.0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ids = []
+    addresses = []
+    visited = set()
+    try:
+        while True:
+            reply = common.request(sock, ['Request', 'ID', 'nextID', 'nextAddress'], len(ids), address, timeout)
+            id = int(reply[1])
+            if id in visited:
+                break
+            visited.add(id)
+            ids.append(id)
+            addresses.append(address)
+            address = common.strToAddr(reply[3])
+    finally:
+        sock.close()
+    return RingSnapshot(ids, addresses, K, method)
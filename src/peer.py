@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import common
-import socket, sys, random, threading, time, Queue, hashlib
+import common, wire, storage, cache, neighbours, detector, metrics, retransmit, merkle, snapshot, hotkeys
+import socket, sys, random, threading, time, Queue, heapq
+
+## O intervalo, em segundos, entre os envios da carga do peer ao Rendezvous (ver Peer.reportLoad()).
+LOAD_INTERVAL = 10.0
 
 ## Uma classe construída para representar um Peer externo do atual.
 class ExternalPeer:
@@ -48,6 +51,23 @@ class Peer:
     ## @var previousPreviousAddress
     #  O endereço IP:Porta do nó antecessor ao nó antecessor a este peer na DHT.
     
+    ## @var successors
+    #  A lista de sucessores do peer: tuplas (ID, endereço), começando por (nextID, nextAddress), com no máximo neighbourListSize entradas.
+    #  É mantida pela thread que executa stabilize() (ver neighbours.py), e permite substituir o sucessor que falhou sem nenhuma requisição a mais.
+    
+    ## @var predecessors
+    #  A lista de antecessores do peer, começando por (previousID, previousAddress) (ver successors).
+    
+    ## @var neighbourListSize
+    #  O número máximo de entradas de successors e de predecessors. O anel sobrevive à falha de até neighbourListSize - 1 peers consecutivos.
+    
+    ## @var legacyNeighbours
+    #  Os endereços dos vizinhos que não conhecem a mensagem Neighbours (peers antigos), para os quais stabilize() usa neighbours.LEGACY_REQUEST.
+    
+    ## @var failureDetector
+    #  O detector.PhiAccrualDetector que decide quando as entradas de successors e de predecessors morreram. Qualquer mensagem recebida
+    #  de uma delas conta como batimento (ver saveReceivedMessages()), de forma que vizinhos com tráfego não precisam ser pingados.
+    
     ## @var rendezvousAddress
     #  O endereço IP:Porta do Rendezvous.
     
@@ -55,45 +75,75 @@ class Peer:
     #  Uma fila contendo as mensagens que ainda precisam ser enviadas pelo Peer. Cada mensagem é representada por um dicionário, que podem possuir 2 formatos:
     #  
     #  {'MessageID': x, 'Message': x, 'ToAddress': x, 'Timeout': x} -> para mensagens que esperam por resposta do destino (esperando no máximo o tempo em 'Timeout').\n
-    #  {'MessageID': x, 'Message': x, 'ToAddress': x} -> para mensagens que não esperam por resposta.
+    #  {'MessageID': x, 'Message': x, 'ToAddress': x} -> para mensagens que não esperam por resposta.\n
+    #  {'Retransmit': x} -> para reenviar a requisição com o ID x, caso ela ainda não tenha sido respondida (ver inFlight).
     #
     #  Definição dos campos:\n
     #  - MessageID: ID único da mensagem, controlado por self.messageID. -> inteiro.\n
-    #  - Message: Mensagem a ser enviada. -> string.\n
+    #  - Message: Mensagem a ser enviada, como uma lista de campos (ver wire.py). -> lista.\n
     #  - ToAddress: O endereço de destino, no formato ('ip', porta). -> (string, inteiro).\n
     #  - Timeout: O tempo, em segundos, que o Peer atual irá esperar por uma resposta (contendo o mesmo MessageID) do Peer de destino. -> inteiro.
     
-    ## @var messagesReceived
-    #  Um dicionário, indexado pelo ID único da mensagem, contendo as mensagens recebidas. Essas mensagens são respostas de requisições feitas anteriormente, ou seja, o Peer que a enviou não está esperando por uma resposta.
-    #  Cada mensagem é representada por um dicionário, no formato:
-    #
-    #  {'MessageID': x, 'HasTimeout': x, 'Message': x, 'FromAddress': x, 'Acknowledged': x}
-    #
-    #  Definição dos campos:\n
-    #  - MessageID: ID da mensagem de requisição, para representar o que essa mensagem responde. -> inteiro.\n
-    #  - HasTimeout: True caso o tempo de espera por uma resposta excedeu o tempo de timeout, e False caso contrário.
-    #    Caso seja True, como consequência, o dicionário da mensagem não conterá os campos 'Message', 'FromAddress' e 'Acknowledged'. -> booleano\n
-    #  - Message: Mensagem de resposta. -> string.\n
-    #  - FromAddress: O endereço do Peer que enviou a resposta, no formato ('ip', porta). -> (string, inteiro).\n
-    #  - Acknowledged: True caso a thread que está aguardando por essa resposta já notou sua existência, e False caso contrário.
-    #    Isso foi feito para que a mensagem não fosse removida de messagesReceived antes de ser verificada pela thread que executa sendQueuedMessages(), pois isso poderia causar timeout mesmo com a mensagem chegando. -> booleano\n
+    ## @var pendingRequests
+    #  Um dicionário, indexado pelo ID único da mensagem, contendo as requisições feitas por este Peer que ainda esperam por uma resposta.
+    #  Cada requisição é representada por um common.Future, que recebe a mensagem de resposta (uma lista de campos) quando ela chega, ou a exceção
+    #  socket.timeout caso o tempo de espera seja excedido. A requisição é removida do dicionário por quem a completa, de forma que uma
+    #  resposta que chega depois do timeout é ignorada.
+    #  As pesquisas iniciadas por lookup() também ficam neste dicionário, indexadas pelo ID da pesquisa, e são completadas pela mensagem Found.
+    
+    ## @var requestDeadlines
+    #  Um heap (ver o módulo heapq) de tuplas (instante, MessageID), com o instante em que cada requisição pendente em pendingRequests dará timeout.
+    #  Os prazos são verificados pela thread que executa expireRequests(), o que permite que várias requisições fiquem pendentes ao mesmo tempo,
+    #  cada uma com o seu próprio prazo, sem que a thread que envia as mensagens tenha que esperar pelas respostas. Para as requisições
+    #  em inFlight, o prazo é o do próximo reenvio.
+    
+    ## @var inFlight
+    #  Um dicionário, indexado pelo ID da mensagem, com as requisições enviadas que serão reenviadas enquanto não forem respondidas
+    #  (ver retransmit.py). Cada requisição é uma lista [endereço, mensagem codificada, tipo da mensagem, instante do timeout,
+    #  tempo de espera até o próximo reenvio, instante do primeiro envio, \c True caso já tenha sido reenviada].
+    
+    ## @var useRetransmission
+    #  Caso seja \c True, as requisições são reenviadas enquanto não forem respondidas (ver inFlight); caso contrário, são enviadas uma única vez.
+    
+    ## @var rttEstimator
+    #  O retransmit.RTTEstimator com os tempos de retransmissão de cada destino.
+    
+    ## @var replyCache
+    #  O retransmit.ReplyCache com as respostas enviadas, usado para que as requisições repetidas não sejam executadas de novo.
+    
+    ## @var deadlinesCondition
+    #  A Condition que protege requestDeadlines e acorda a thread que executa expireRequests() quando um novo prazo é adicionado.
     
     ## @var messagesReceivedNeededToBeReplied
-    #  Uma lista contendo mensagens que precisam ser respondidas. O laço da thread principal do programa é que será a responsável por verificar essa lista.
+    #  Uma fila contendo mensagens que precisam ser respondidas. A thread que executa handleMessages() é a responsável por consumir essa fila.
     #  Cada mensagem é representada por um dicionário, contendo o seguinte formato:
     #  
     #  {'MessageID': x, 'Message': x, 'FromAddress': x}
     #
     #  Definição dos campos:\n
     #  - MessageID: ID da mensagem recebida, que precisará ser respondida com o mesmo identificador. -> inteiro
-    #  - Message: Mensagem recebida. -> string\n
+    #  - Message: Mensagem recebida, como uma lista de campos (ver wire.py). -> lista\n
     #  - FromAddress: O endereço do Peer que enviou a mensagem, no formato ('ip', porta). -> (string, inteiro).
     
+    ## @var wireFormats
+    #  Um dicionário, indexado pelo endereço de outro peer (ou do Rendezvous), com o formato (wire.TEXT ou wire.BINARY) usado nas mensagens enviadas a ele.
+    #
+    #  Na primeira mensagem enviada a um endereço, o peer o registra como wire.TEXT e envia também a requisição Wire|<versão>, em texto.
+    #  Peers que conhecem o formato binário respondem Wire|<versão>, e a partir daí o endereço passa a ser wire.BINARY. Peers antigos
+    #  ignoram a requisição, e continuam recebendo mensagens de texto. Receber uma mensagem binária de um endereço também o marca como wire.BINARY.
+    
+    ## @var batchLookups
+    #  Um dicionário, indexado pelo ID da pesquisa, contendo as pesquisas em lote iniciadas por lookupMany() que ainda esperam por respostas.
+    #  Cada pesquisa é representada por uma tupla (chaves que ainda não foram encontradas, {chave: (ID do responsável, endereço do responsável)}).
+    #  Quando todas as chaves são encontradas, a pesquisa é completada como uma requisição comum (ver pendingRequests).
+    
     ## @var messageID
-    #  O próximo ID que será alocado à próxima mensagem (que requer resposta) enviada por este Peer.
+    #  O próximo ID que será alocado à próxima mensagem (que requer resposta) enviada por este Peer. O primeiro é aleatório, para que um
+    #  peer reiniciado no mesmo endereço não receba as respostas guardadas para o peer anterior (ver replyCache).
     
     ## @var lock
-    #  O Lock utilizado para preservar modificações em certos elementos da classe, como a lista de mensagens recebidas.
+    #  O Lock utilizado para preservar modificações em certos elementos da classe, como a lista de mensagens recebidas. É um
+    #  metrics.TimedLock, que mede o tempo de espera das aquisições.
     
     ## @var K
     #  O número máximo de nós na rede.
@@ -101,10 +151,77 @@ class Peer:
     ## @var method
     #  O método de como os IDs serão distribuídos na DHT. Caso seja 1, os IDs estarão na faixa [0,K]. Caso seja 2, os IDs estarão em potência de 2 (1, 2, 4, 8, ..., 2^K).
     
+    ## @var fingers
+    #  A finger table do peer: uma lista de tuplas (ID, endereço), onde a i-ésima entrada é o peer responsável pela posição (posição deste peer + 2^i) no anel,
+    #  ou \c None caso ele ainda não seja conhecido. É construída quando o peer entra na DHT e atualizada periodicamente pela thread que executa refreshFingers().
+    
+    ## @var useFingers
+    #  Caso seja \c True, as pesquisas são encaminhadas pela finger table (O(log N) saltos). Caso seja \c False, as pesquisas percorrem o anel vizinho a vizinho.
+    
+    ## @var interactive
+    #  Caso seja \c True, o peer lê consultas da entrada padrão (ver listenForInput()).
+    
+    ## @var storagePath
+    #  O caminho do arquivo de log em que o peer armazena os valores das chaves das quais é o responsável (ver storage.LogStore).
+    
+    ## @var store
+    #  O storage.LogStore do peer, ou \c None enquanto ele não tiver sido aberto (ver openStore()).
+    
+    ## @var incomingValues
+    #  Os valores divididos em pedaços que ainda estão sendo recebidos (ver storage.handleRequest()).
+    
+    ## @var syncNeeded
+    #  O threading.Event que acorda a thread que executa antiEntropy() quando a vizinhança do peer muda (ver neighbourhoodChanged()).
+    
+    ## @var ownerCache
+    #  O cache.OwnerCache com os responsáveis pelas chaves já pesquisadas por lookup() e lookupMany(). Suas entradas são invalidadas quando
+    #  a vizinhança do peer muda (ver neighbourhoodChanged()), e a entrada de uma chave é descartada quando o responsável guardado
+    #  responde NotResponsible ou não responde (ver sendToOwner()).
+    
+    ## @var metrics
+    #  O metrics.Metrics do peer: as mensagens enviadas e recebidas, os RTTs das requisições, os timeouts, os saltos das pesquisas,
+    #  as profundidades das filas e a espera pelo lock. As métricas são enviadas em resposta à mensagem Stats (ver statsReport()).
+    
+    ## @var metricsPath
+    #  O caminho do arquivo em que as métricas são escritas, uma linha JSON a cada metricsInterval segundos, ou \c None.
+    
+    ## @var metricsInterval
+    #  O intervalo, em segundos, entre as escritas no arquivo de métricas.
+    
+    ## @var snapshotPath
+    #  O caminho do arquivo em que o estado do peer (ID, vizinhos e finger table, ver peerState()) é escrito a cada snapshot.INTERVAL
+    #  segundos (quando muda), ou \c None. Ao reiniciar, o peer volta ao anel a partir desse estado (ver rejoin()).
+    
+    ## @var savedSnapshot
+    #  O último estado escrito no arquivo de estado, em JSON (ver snapshot.save()).
+    
+    ## @var loadReports
+    #  \c True caso o Rendezvous já tenha respondido a uma mensagem Load, \c False caso ele não entenda a mensagem (um Rendezvous antigo,
+    #  que deixa de recebê-la) e \c None antes da primeira resposta (ver reportLoad()).
+    
+    ## @var lastReceived
+    #  O número total de mensagens recebidas pelo peer no último envio da sua carga.
+    
+    ## @var hotKeys
+    #  O hotkeys.HotKeys do peer (as chaves populares e os responsáveis recebidos com a mensagem Cache, ver pushHotKey()), ou \c None.
+    
     ## O construtor padrão.
     #  @param address O endereço de rede correspondente ao peer.
     #  @param rendezvousAddress O endereço do rendezvous.
-    def __init__(self, address, rendezvousAddress):
+    #  @param useFingers Caso seja \c True, as pesquisas são encaminhadas pela finger table.
+    #  @param interactive Caso seja \c True, o peer lê consultas da entrada padrão.
+    #  @param storagePath O caminho do arquivo de log do peer. Caso seja \c None, o arquivo dht-<ip>-<porta>.log do diretório atual é usado.
+    #  @param neighbourListSize O número máximo de entradas das listas de sucessores e de antecessores (pelo menos 2).
+    #  @param suspicionThreshold O nível de suspeita a partir do qual um vizinho é considerado morto (ver detector.PhiAccrualDetector.threshold).
+    #  @param metricsPath O caminho do arquivo de métricas, ou \c None para não escrevê-lo.
+    #  @param metricsInterval O intervalo, em segundos, entre as escritas no arquivo de métricas.
+    #  @param useRetransmission Caso seja \c True, as requisições são reenviadas enquanto não forem respondidas.
+    #  @param snapshotPath O caminho do arquivo de estado do peer, ou \c None para não escrevê-lo.
+    #  @param hotKeyThreshold O número de pesquisas a partir do qual uma chave é considerada popular (ver hotkeys.py), ou \c None para
+    #  não enviar nem guardar os responsáveis das chaves populares.
+    def __init__(self, address, rendezvousAddress, useFingers = True, interactive = True, storagePath = None, neighbourListSize = 4,
+                 suspicionThreshold = 8.0, metricsPath = None, metricsInterval = 10.0, useRetransmission = True, snapshotPath = None,
+                 hotKeyThreshold = hotkeys.THRESHOLD):
         self.address = address
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind(self.address)
@@ -119,219 +236,619 @@ class Peer:
         self.previousAddress = None
         self.previousPreviousAddress = None
         
+        self.successors = []
+        self.predecessors = []
+        self.neighbourListSize = max(2, neighbourListSize)
+        self.legacyNeighbours = set()
+        self.failureDetector = detector.PhiAccrualDetector(suspicionThreshold)
+        
         self.rendezvousAddress = rendezvousAddress
         
+        self.fingers = []
+        self.useFingers = useFingers
+        self.interactive = interactive
+        
+        self.storagePath = storagePath if storagePath != None else 'dht-%s-%d.log' % address
+        self.store = None
+        self.incomingValues = {}
+        self.ownerCache = cache.OwnerCache()
+        self.hotKeys = hotkeys.HotKeys(hotKeyThreshold) if hotKeyThreshold != None else None
+        self.syncNeeded = threading.Event()
+        
         self.messagesToBeSent = Queue.Queue()         # formato: {'MessageID': x, 'Message': x, 'ToAddress': x, 'Timeout': x} ou {'MessageID': x, 'Message': x, 'ToAddress': x}
-        self.messagesReceived = {}                    # formato: {'MessageID': x, 'HasTimeout': x, 'Message': x, 'FromAddress': x, 'Acknowledged': x}
-        self.messagesReceivedNeededToBeReplied = []   # formato: {'MessageID': x, 'Message': x, 'FromAddress': x}
-        self.messageID = 0
+        self.pendingRequests = {}                     # formato: {MessageID: common.Future}
+        self.requestDeadlines = []                    # formato: [(instante, MessageID)]
+        self.deadlinesCondition = threading.Condition()
+        self.messagesReceivedNeededToBeReplied = Queue.Queue() # formato: {'MessageID': x, 'Message': x, 'FromAddress': x}
+        self.batchLookups = {}                        # formato: {ID da pesquisa: (set de chaves, {chave: (ID, endereço)})}
+        self.wireFormats = {}                         # formato: {endereço: wire.TEXT ou wire.BINARY}
+        self.messageID = random.randrange(2**31)
         
-        self.lock = threading.Lock()
+        self.inFlight = {}                            # formato: {MessageID: [endereço, dados, tipo, timeout, espera, envio, reenviada]}
+        self.useRetransmission = useRetransmission
+        self.rttEstimator = retransmit.RTTEstimator()
+        self.replyCache = retransmit.ReplyCache()
+        
+        self.metrics = metrics.Metrics()
+        self.metrics.gauges = {'messagesToBeSent': self.messagesToBeSent.qsize,
+                               'messagesReceivedNeededToBeReplied': self.messagesReceivedNeededToBeReplied.qsize,
+                               'pendingRequests': lambda: len(self.pendingRequests)}
+        self.metricsPath = metricsPath
+        self.metricsInterval = metricsInterval
+        self.snapshotPath = snapshotPath
+        self.savedSnapshot = None
+        self.loadReports = None
+        self.lastReceived = 0
+        
+        self.lock = metrics.TimedLock(self.metrics, 'lock')
             
     
     ## Manda uma mensagem para um endereço dado, esperando por uma resposta.
-    #  @var sendMsg A mensagem que será enviada.
+    #  @var sendMsg A mensagem que será enviada, como uma lista de campos (ver wire.py).
     #  @var address O endereço de destino, no formato: ('ip', porta).
     #  @var timeout O tempo, em segundos, de espera máximo por uma resposta.
     #  @var optMessageID O ID da mensagem que será enviada. Caso não seja passada, um ID único será gerado.
-    #  @return A responta da mensagem já cortada (por '|').
+    #  @return A resposta da mensagem, como uma lista de campos.
     def sendRequest(self, sendMsg, address, timeout, optMessageID = None):
-        thisMessageID = None
+        return self.startRequest(sendMsg, address, timeout, optMessageID).result()
+    
+    ## Manda uma mensagem para um endereço dado, sem esperar pela resposta.
+    #
+    #  A mensagem é apenas colocada na fila de envio, e a resposta (ou o timeout) é entregue pelo common.Future retornado,
+    #  que pode ser ignorado ou receber um callback (ver common.Future.addCallback()).
+    #
+    #  @var sendMsg A mensagem que será enviada, como uma lista de campos (ver wire.py).
+    #  @var address O endereço de destino, no formato: ('ip', porta).
+    #  @var timeout O tempo, em segundos, de espera máximo por uma resposta.
+    #  @var optMessageID O ID da mensagem que será enviada. Caso não seja passada, um ID único será gerado.
+    #  @return O common.Future que receberá a resposta, como uma lista de campos.
+    def startRequest(self, sendMsg, address, timeout, optMessageID = None):
+        future = common.Future()
         
-        if optMessageID != None:
-            with self.lock:
+        with self.lock:
+            if optMessageID != None:
                 thisMessageID = optMessageID
-                self.messagesToBeSent.put({'MessageID': thisMessageID, 'Message': sendMsg, 'ToAddress': address, 'Timeout': timeout})
-        else:
-            with self.lock:
+            else:
                 thisMessageID = self.messageID
-                self.messagesToBeSent.put({'MessageID': thisMessageID, 'Message': sendMsg, 'ToAddress': address, 'Timeout': timeout})
                 self.messageID += 1
+            
+            self.pendingRequests[thisMessageID] = future
+            self.messagesToBeSent.put({'MessageID': thisMessageID, 'Message': sendMsg, 'ToAddress': address, 'Timeout': timeout})
         
-        while not thisMessageID in self.messagesReceived:
-            pass
-        
-        response = self.messagesReceived[thisMessageID]
-        
-        if len(response) == 5: # significando que não houve timeout (a mensagem de timeout tem 2 de tamanho)
-            while response['Acknowledged'] == False:
-                pass
-        
+        return future
+    
+    ## Completa uma requisição pendente, caso ela ainda esteja esperando por uma resposta.
+    #  @var requestID O ID da requisição.
+    #  @var message A mensagem de resposta (uma lista de campos), ou \c None caso tenha ocorrido timeout.
+    def completeRequest(self, requestID, message):
         with self.lock:
-            del self.messagesReceived[thisMessageID]
+            future = self.pendingRequests.pop(requestID, None)
+            sent = self.inFlight.pop(requestID, None)
         
-        if len(response) == 2: # timeout
-            raise socket.timeout
+        if future == None: # a requisição já foi completada (ex.: resposta que chegou depois do timeout)
+            return
+        
+        if sent != None and message != None and not sent[6]: # apenas as requisições que não foram reenviadas medem o RTT
+            self.rttEstimator.sample(sent[0], time.time() - sent[5])
+        self.metrics.requestCompleted(requestID, message == None)
+        if message == None:
+            future.setException(socket.timeout())
         else:
-            return response['Message'].split('|')
+            future.setResult(message)
     
     ## Manda uma mensagem para um endereço dado, sem esperar por uma resposta.
     #  @var replyID O ID da mensagem que o destino irá receber para identificar essa mensagem.
-    #  @var sendMsg A mensagem que será enviada.
+    #  @var sendMsg A mensagem que será enviada, como uma lista de campos (ver wire.py).
     #  @var address O endereço de destino, no formato: ('ip', porta).
     def replyTo(self, replyID, sendMsg, address):
+        self.replyCache.store(address, replyID, sendMsg)
         with self.lock:
             self.messagesToBeSent.put({'MessageID': replyID, 'Message': sendMsg, 'ToAddress': address})
+    
+    ## Verifica se uma requisição recebida é repetida (ver replyCache), reenviando a resposta guardada, caso haja uma.
+    #  @param msgID O ID da requisição.
+    #  @param name O tipo da requisição.
+    #  @param address O endereço de quem enviou a requisição.
+    #  @return \c True caso a requisição seja repetida, e não deva ser tratada de novo.
+    def isDuplicate(self, msgID, name, address):
+        duplicate, reply = self.replyCache.check(address, msgID, name)
+        if duplicate:
+            self.metrics.duplicateReceived(name)
+            if reply != None:
+                self.replyTo(msgID, reply, address)
+        return duplicate
                      
 
     ## Realiza o contato inicial com o Rendezvous.
     #
     #  O peer contata o Rendezvous pedindo por um ID e o endereço (IP:Porta) do Peer root.
-    #  Caso o Peer atual seja selecionado como root, o Rendezvous retorna "root" ao invés do endereço.\n\n
+    #  Caso o Peer atual seja selecionado como root, o Rendezvous retorna "root" ao invés do endereço. O Rendezvous também sugere
+    #  os peers entre os quais o Peer atual deve ser inserido (o antecessor e o sucessor do seu ID no anel), de forma que o peer
+    #  encontra o seu lugar na DHT com uma única requisição, ao invés de percorrer o anel a partir do root.\n\n
     #  As mensagens trocadas são:\n\n
     #
-    #  Peer:       hello \n
-    #  Rendezvous: ID|<id_do_peer>|root                     (caso seja root) \n 
-    #              ID|<id_do_peer>|('<ip_root>', <porta>)   (caso não seja root) \n
+    #  Peer:       hello|neighbours \n
+    #  Rendezvous: ID|<id_do_peer>|root|<K>|<método>                                                   (caso seja root) \n 
+    #              ID|<id_do_peer>|('<ip_root>', <porta>)|<K>|<método>|<antecessor>|<sucessor>   (caso não seja root) \n
     #  Peer:       ACK|<id_do_peer> \n
     #  Rendezvous: ACK|<id_do_peer>
     #
-    #  @return o endereço do root.
-    def firstContactWithRendezvous(self):
+    #  Caso o Rendezvous não responda ao hello|neighbours (ex.: um Rendezvous antigo), o peer envia apenas hello, e recebe a resposta sem as sugestões.
+    #  Caso também não responda ao hello e o peer tenha um estado salvo (ex.: o Rendezvous está reiniciando), o peer volta com o ID salvo.
+    #
+    #  @param saved O estado salvo do peer (ver loadSnapshot()), ou \c None.
+    #  @return Os endereços dos peers a partir dos quais o lugar do peer na DHT será procurado: os peers sugeridos e, por último, o root.
+    def firstContactWithRendezvous(self, saved = None):
         # enviando um hello e esperando por uma resposta
-        rootAddress = None
+        candidates = []
         
         try:
-            response = common.sendAndWaitForResponse('hello', 0.2, 10, self.rendezvousAddress, self.sock)
-        except:
-            raise
-        else:
-            data_splitted = response.split('|')
-            if len(data_splitted) == 5 and data_splitted[0] == 'ID':
-                self.id = int(data_splitted[1])
-                self.isRoot = True if data_splitted[2] == 'root' else False
-                
-                # obtendo o endereço do root
-                rootAddress = self.address if self.isRoot else common.strToAddr(data_splitted[2])
-                
-                print 'Got ID', data_splitted[1]
-                print 'root is', 'itself' if self.isRoot else rootAddress
-                
-                self.K = int(data_splitted[3])
-                self.method = int(data_splitted[4])
-                
-                # enviando um ACK e esperando por uma resposta
-                try:
-                    response = common.sendAndWaitForResponse('ACK|%s' % self.id, 0.2, 10, self.rendezvousAddress, self.sock)
-                except:
+            response = common.sendAndWaitForResponse('hello|neighbours', 0.2, 1.0, self.rendezvousAddress, self.sock)
+        except socket.timeout:
+            try:
+                response = common.sendAndWaitForResponse('hello', 0.2, 10 if saved == None else 2.0, self.rendezvousAddress, self.sock)
+            except socket.timeout:
+                if saved == None:
                     raise
-                else:
-                    data_splitted = response.split('|')
-                    if len(data_splitted) == 2 and data_splitted[0] == 'ACK':
-                        print 'Got an ACK from server, registered as ID', self.id
+                print 'Rendezvous unavailable, rejoining with the saved ID', saved['id']
+                self.id, self.K, self.method = saved['id'], saved['K'], saved['method']
+                self.isRoot = saved['nextAddress'] == self.address
+                return [saved['previousAddress'], saved['nextAddress']]
         
-        return rootAddress
+        data_splitted = response.split('|')
+        if len(data_splitted) >= 5 and data_splitted[0] == 'ID':
+            self.id = int(data_splitted[1])
+            self.isRoot = True if data_splitted[2] == 'root' else False
+            
+            # obtendo o endereço do root
+            rootAddress = self.address if self.isRoot else common.strToAddr(data_splitted[2])
+            candidates = [common.strToAddr(hint) for hint in data_splitted[5:]] + [rootAddress]
+            
+            print 'Got ID', data_splitted[1]
+            print 'root is', 'itself' if self.isRoot else rootAddress
+            
+            self.K = int(data_splitted[3])
+            self.method = int(data_splitted[4])
+            
+            # enviando um ACK e esperando por uma resposta
+            try:
+                response = common.sendAndWaitForResponse('ACK|%s' % self.id, 0.2, 10, self.rendezvousAddress, self.sock)
+            except:
+                raise
+            else:
+                data_splitted = response.split('|')
+                if len(data_splitted) == 2 and data_splitted[0] == 'ACK':
+                    print 'Got an ACK from server, registered as ID', self.id
+        
+        return candidates
 
-    ## Atualiza os ponteiros de vizinhança dos peers vizinhos (inclusive vizinhos de vizinhos)
+    ## Monta o estado do peer que é escrito no arquivo de estado (ver snapshotPath).
+    def peerState(self):
+        with self.lock:
+            return {'address': self.address, 'rendezvousAddress': self.rendezvousAddress, 'id': self.id, 'K': self.K, 'method': self.method,
+                    'previousID': self.previousID, 'previousAddress': self.previousAddress, 'nextID': self.nextID, 'nextAddress': self.nextAddress,
+                    'successors': self.successors, 'predecessors': self.predecessors, 'fingers': self.fingers}
+    
+    ## Lê o estado escrito por peerState() em uma execução anterior do peer.
+    #  @return O estado, com os endereços no formato ('ip', porta), ou \c None caso não haja um estado salvo para este endereço e Rendezvous.
+    def loadSnapshot(self):
+        state = snapshot.load(self.snapshotPath) if self.snapshotPath != None else None
+        if state == None:
+            return None
+        
+        try:
+            entries = lambda values: [(int(value[0]), snapshot.toAddress(value[1])) if value != None else None for value in values]
+            saved = {'id': int(state['id']), 'K': int(state['K']), 'method': int(state['method']),
+                     'previousID': int(state['previousID']), 'previousAddress': snapshot.toAddress(state['previousAddress']),
+                     'nextID': int(state['nextID']), 'nextAddress': snapshot.toAddress(state['nextAddress']),
+                     'successors': entries(state['successors']), 'predecessors': entries(state['predecessors']), 'fingers': entries(state['fingers'])}
+            if snapshot.toAddress(state['address']) != self.address or snapshot.toAddress(state['rendezvousAddress']) != self.rendezvousAddress:
+                return None
+        except (KeyError, TypeError, ValueError, IndexError):
+            print 'Ignoring the corrupted snapshot at', self.snapshotPath
+            return None
+        return saved
+    
+    ## Volta ao anel entre o antecessor e o sucessor salvos (ver loadSnapshot()), caso eles ainda sejam os vizinhos deste peer.
+    #
+    #  Os dois recebem uma requisição Request ao mesmo tempo, e são aceitos caso ainda tenham os IDs salvos e ainda apontem um para o outro ou
+    #  para este peer (que pode ainda não ter sido removido do anel). Nesse caso, o peer retoma os seus vizinhos, as suas listas de vizinhos e
+    #  a sua posição em um único RTT, sem percorrer o anel. Deve ser seguida por allocate().
+    #
+    #  @param saved O estado salvo.
+    #  @return \c True caso os vizinhos salvos tenham sido aceitos, e \c False caso o peer precise procurar o seu lugar no anel.
+    def rejoin(self, saved):
+        previousAddress, nextAddress = saved['previousAddress'], saved['nextAddress']
+        if self.address in (previousAddress, nextAddress):
+            return False
+        
+        request = ['Request', 'ID', 'previousID', 'previousAddress', 'previousPreviousAddress', 'nextID', 'nextAddress', 'nextNextAddress']
+        futures = dict((address, self.startRequest(request, address, 3.0)) for address in set([previousAddress, nextAddress]))
+        replies = {}
+        for address, future in futures.iteritems():
+            try:
+                reply = future.result()
+            except socket.timeout:
+                return False
+            if len(reply) != 8 or reply[0] != 'Reply':
+                return False
+            replies[address] = ExternalPeer(address, int(reply[1]), int(reply[2]), common.strToAddr(reply[3]), common.strToAddr(reply[4]),
+                                            int(reply[5]), common.strToAddr(reply[6]), common.strToAddr(reply[7]))
+        
+        predecessor, successor = replies[previousAddress], replies[nextAddress]
+        if predecessor.id != saved['previousID'] or successor.id != saved['nextID']:
+            return False
+        if not (predecessor.nextAddress, predecessor.nextID) in ((self.address, self.id), (successor.address, successor.id)):
+            return False
+        if not (successor.previousAddress, successor.previousID) in ((self.address, self.id), (predecessor.address, predecessor.id)):
+            return False
+        
+        isSecondElement = predecessor is successor
+        with self.lock:
+            self.nextID = successor.id
+            self.nextAddress = successor.address
+            self.nextNextAddress = successor.nextAddress if not isSecondElement else self.address
+            self.previousID = predecessor.id
+            self.previousAddress = predecessor.address
+            self.previousPreviousAddress = predecessor.previousAddress if not isSecondElement else self.address
+            self.successors, self.predecessors = saved['successors'], saved['predecessors']
+            self.resetNeighbourLists()
+        return True
+    
+    ## Retoma a finger table salva (ver loadSnapshot()), mantendo apenas as entradas cujos peers ainda respondem com o ID salvo.
+    #
+    #  Cada endereço da finger table recebe uma requisição Request|ID, todas ao mesmo tempo. As entradas descartadas ficam vazias, e são
+    #  preenchidas por refreshFingers().
+    #
+    #  @param saved O estado salvo.
+    def restoreFingers(self, saved):
+        fingers = saved['fingers']
+        if len(fingers) != len(common.fingerTargets(self.id, self.K, self.method)):
+            return
+        
+        futures = dict((finger[1], self.startRequest(['Request', 'ID'], finger[1], 1.0)) for finger in fingers
+                       if finger != None and finger[1] != self.address)
+        ids = {self.address: self.id}
+        for address, future in futures.iteritems():
+            try:
+                ids[address] = int(future.result()[1])
+            except (socket.timeout, IndexError, ValueError):
+                pass
+        self.fingers = [finger if finger != None and ids.get(finger[1]) == finger[0] else None for finger in fingers]
+    
+    ## Envia a carga do peer (as mensagens recebidas por segundo desde o último envio) ao Rendezvous, que a usa para escolher o ID dos
+    #  próximos peers (ver rendezvous.Rendezvous.allocateByLoad()).
+    #
+    #  Peer: Load|<id_do_peer>|<mensagens_por_segundo>   Rendezvous: Loaded
+    #
+    #  @param seconds O tempo, em segundos, desde o último envio.
+    def reportLoad(self, seconds):
+        received = sum(self.metrics.received.values())
+        load = int((received - self.lastReceived) / seconds)
+        self.lastReceived = received
+        if self.loadReports == False:
+            return
+        
+        def loadReported(future):
+            try:
+                future.result()
+                self.loadReports = True
+            except socket.timeout:
+                if self.loadReports == None:
+                    self.loadReports = False
+        self.startRequest(['Load', self.id, load], self.rendezvousAddress, 3.0).addCallback(loadReported)
+    
+    ## Atualiza os ponteiros de vizinhança dos peers vizinhos (inclusive vizinhos de vizinhos) e espera pelas respostas (ver startAllocate()).
+    #  @throw socket.timeout Caso algum dos vizinhos não responda. Os demais vizinhos são atualizados mesmo assim.
     def allocate(self):
-        if self.address != self.previousAddress:
-            setMsg = 'Set|nextID|' + str(self.id) + '|nextAddress|' + repr(self.address) + '|nextNextAddress|' + repr(self.nextAddress)
-            # print 'Sending to '+ repr(self.previousAddress) +': ' + setMsg
-            self.sendRequest(setMsg, self.previousAddress, 3.0)
-        
-        if self.address != self.previousPreviousAddress:
-            setMsg = 'Set|nextNextAddress|' + repr(self.address)
-            # print 'Sending to '+ repr(self.previousPreviousAddress) +': ' + setMsg
-            self.sendRequest(setMsg, self.previousPreviousAddress, 3.0)
-        
-        if self.address != self.nextAddress:
-            setMsg = 'Set|previousID|' + str(self.id) + '|previousAddress|' + repr(self.address) + '|previousPreviousAddress|' + repr(self.previousAddress)
-            # print 'Sending to '+ repr(self.nextAddress) +': ' + setMsg
-            self.sendRequest(setMsg, self.nextAddress, 3.0)
-        
-        if self.address != self.nextNextAddress:
-            setMsg = 'Set|previousPreviousAddress|' + repr(self.address)
-            # print 'Sending to '+ repr(self.nextNextAddress) +': ' + setMsg
-            self.sendRequest(setMsg, self.nextNextAddress, 3.0)
+        self.finishAllocate(self.startAllocate())
+    
+    ## Envia as mensagens Set que atualizam os ponteiros de vizinhança dos peers vizinhos (ver neighbours.allocationUpdates()), sem esperar pelas respostas.
+    #
+    #  As mensagens são enviadas ao mesmo tempo, e as atualizações para o mesmo vizinho vão em uma única mensagem, de forma que a atualização
+    #  custa um único RTT (e no máximo um timeout), e não um por vizinho.
+    #
+    #  @return Os common.Future das mensagens Set.
+    def startAllocate(self):
+        with self.lock:
+            updates = neighbours.allocationUpdates(self.id, self.address, self.previousAddress, self.previousPreviousAddress,
+                                                   self.nextAddress, self.nextNextAddress)
+        return [self.startRequest(setMsg, address, 3.0) for address, setMsg in updates]
+    
+    ## Espera pelas respostas das mensagens Set enviadas por startAllocate().
+    #  @param futures Os common.Future retornados por startAllocate().
+    #  @throw socket.timeout Caso algum dos vizinhos não responda.
+    def finishAllocate(self, futures):
+        for future in futures:
+            future.wait()
+        for future in futures:
+            future.result()
                         
             
-    ## Função que rodará numa thread para salvar as mensagens recebidas em self.messagesReceivedNeededToBeReplied ou self.messagesReceived, de acordo com o tipo de mensagem.
+    ## Função que rodará numa thread para receber as mensagens do socket do peer (ver receiveMessage()).
     def saveReceivedMessages(self):
         self.sock.settimeout(None)
         while True:
             data, addressReceived = self.sock.recvfrom(common.MAX)
-            response_splitted = data.split('|')
-            
-            # print 'Got message from ' + repr(addressReceived) + ': ' + '|'.join(response_splitted)
-            
-            willWaitForReply = response_splitted.pop(0) == 'True'
-            responseID = int(response_splitted.pop(0))
-                        
-            with self.lock:
-                if willWaitForReply:                    
-                    self.messagesReceivedNeededToBeReplied.append({'MessageID': responseID, 'Message': '|'.join(response_splitted), 'FromAddress': addressReceived})
-                else:
-                    if not responseID in self.messagesReceived: # se chegou depois, ignorar e não colocar em self.messagesReceived
-                        self.messagesReceived[responseID] = {'MessageID': responseID, 'HasTimeout': False, 'Message': '|'.join(response_splitted), 'FromAddress': addressReceived, 'Acknowledged': False}
+            self.receiveMessage(data, addressReceived)
+    
+    ## Salva uma mensagem recebida em self.messagesReceivedNeededToBeReplied ou completa a requisição pendente correspondente (ver pendingRequests),
+    #  de acordo com o tipo de mensagem. Só é chamada pela thread que executa saveReceivedMessages().
+    #  @param data A mensagem, codificada (ver wire.py).
+    #  @param addressReceived O endereço de quem enviou a mensagem.
+    def receiveMessage(self, data, addressReceived):
+        try:
+            willWaitForReply, responseID, response_splitted = wire.decode(data)
+        except ValueError:
+            willWaitForReply = None
+        
+        if willWaitForReply == None:
+            print 'Uh oh, unknown message coming from' + repr(addressReceived) + ':', repr(data)
+            return
+        
+        self.failureDetector.heartbeat(addressReceived, time.time())
+        self.metrics.messageReceived(response_splitted[0], len(data))
+        
+        # print 'Got message from ' + repr(addressReceived) + ': ' + wire.toText(response_splitted)
+        
+        if wire.isBinary(data):
+            self.wireFormats[addressReceived] = wire.BINARY
+        
+        # negociação do formato das mensagens (ver wireFormats)
+        if response_splitted[0] == 'Wire':
+            self.wireFormats[addressReceived] = wire.BINARY
+            if willWaitForReply:
+                self.replyTo(responseID, ['Wire', wire.VERSION], addressReceived)
+            return
+        
+        # as métricas são respondidas por esta thread, para que continuem disponíveis mesmo com a fila do laço principal cheia
+        if response_splitted[0] == 'Stats':
+            if willWaitForReply:
+                self.replyTo(responseID, ['StatsReport', self.statsReport()], addressReceived)
+            return
+        
+        if willWaitForReply and self.isDuplicate(responseID, response_splitted[0], addressReceived):
+            return
+        
+        # Search e Found (e as suas versões com várias chaves) são confirmados assim que chegam, e não pelo laço principal, para que
+        # a confirmação não espere pelas mensagens que estão na fila do laço principal.
+        if willWaitForReply and response_splitted[0] in ('Search', 'Found', 'SearchMany', 'FoundMany'):
+            self.replyTo(responseID, ['Searching' if response_splitted[0] in ('Search', 'SearchMany') else 'FoundACK'], addressReceived)
+                    
+        if willWaitForReply:
+            self.messagesReceivedNeededToBeReplied.put({'MessageID': responseID, 'Message': response_splitted, 'FromAddress': addressReceived})
+        else:
+            self.completeRequest(responseID, response_splitted)
 
                         
     ## Função que rodará numa thread para enviar as mensagens contidas na fila self.messagesToBeSent.
     def sendQueuedMessages(self):        
         while True:
-            if not self.messagesToBeSent.empty():
-                obj = self.messagesToBeSent.get()
-                requestID = obj['MessageID']
-                msg = obj['Message']
-                address = obj['ToAddress']
-                timeout = obj['Timeout'] if 'Timeout' in obj else None
-                                              
-                waitForReply = timeout != None
-                msg = ('True' if waitForReply else 'False') + '|' + str(requestID) + '|' + msg
+            obj = self.messagesToBeSent.get()
+            if 'Retransmit' in obj:
+                self.retransmitRequest(obj['Retransmit'])
+                continue
+            
+            requestID = obj['MessageID']
+            msg = obj['Message']
+            address = obj['ToAddress']
+            timeout = obj['Timeout'] if 'Timeout' in obj else None
+                                          
+            waitForReply = timeout != None
+            
+            if not address in self.wireFormats:
+                # primeira mensagem para este endereço: pergunta se ele entende o formato binário (ver wireFormats)
+                self.wireFormats[address] = wire.TEXT
+                with self.lock:
+                    probeID = self.messageID
+                    self.messageID += 1
+                probe = wire.encodeText(['Wire', wire.VERSION], True, probeID)
+                self.sock.sendto(probe, address)
+                self.metrics.messageSent('Wire', len(probe))
+            
+            # print 'Sending to ' + repr(address) + ': ' + wire.toText(msg)
+            
+            binary = self.wireFormats[address] == wire.BINARY or msg[0] in wire.BINARY_ONLY
+            data = wire.encode(msg, waitForReply, requestID, binary)
+            if waitForReply: # antes do envio, pois a resposta pode chegar antes do fim desta iteração
+                self.metrics.requestSent(requestID, msg[0])
+                if self.useRetransmission:
+                    rto = self.rttEstimator.timeout(address)
+                    now = time.time()
+                    self.inFlight[requestID] = [address, data, msg[0], now + timeout, rto, now, False]
+                    timeout = min(rto, timeout)
+            self.sock.sendto(data, address)
+            self.metrics.messageSent(msg[0], len(data))
+                               
+            if waitForReply:
+                self.addDeadline(requestID, timeout)
+    
+    ## Reenvia uma requisição que ainda não foi respondida, dobrando o tempo de espera até o próximo reenvio (ver inFlight).
+    #  Só é chamada pela thread que executa sendQueuedMessages().
+    #  @param requestID O ID da requisição.
+    def retransmitRequest(self, requestID):
+        sent = self.inFlight.get(requestID)
+        if sent == None: # a requisição foi completada enquanto o reenvio esperava na fila
+            return
+        
+        address, data, name, deadline = sent[:4]
+        sent[4] = min(2 * sent[4], retransmit.MAX_RTO)
+        sent[6] = True
+        self.sock.sendto(data, address)
+        self.metrics.messageSent(name, len(data))
+        self.metrics.requestRetransmitted(name)
+        self.addDeadline(requestID, max(0.0, min(sent[4], deadline - time.time())))
+    
+    ## Define o prazo para que uma requisição pendente receba a sua resposta.
+    #  @var requestID O ID da requisição (ver pendingRequests).
+    #  @var timeout O tempo, em segundos, a partir de agora, até que a requisição dê timeout.
+    def addDeadline(self, requestID, timeout):
+        with self.deadlinesCondition:
+            heapq.heappush(self.requestDeadlines, (time.time() + timeout, requestID))
+            self.deadlinesCondition.notify()
+    
+    ## Função que rodará numa thread para completar com timeout as requisições cujo prazo (ver requestDeadlines) foi atingido.
+    def expireRequests(self):
+        while True:
+            with self.deadlinesCondition:
+                # os prazos das requisições que já foram respondidas são descartados, para que a thread não acorde à toa
+                while len(self.requestDeadlines) > 0 and not self.requestDeadlines[0][1] in self.pendingRequests:
+                    heapq.heappop(self.requestDeadlines)
                 
-                # print 'Sending to ' + repr(address) + ': ' + msg
+                if len(self.requestDeadlines) == 0:
+                    self.deadlinesCondition.wait()
+                    continue
                 
-                self.sock.sendto(msg, address)
-                                   
-                if waitForReply:
-                    intervalCheckForResponse = 0.1 # irá verificar por resposta a cada 100ms
-                    isTimeout = False
-                    elapsedTime = 0.0 # em segundos
-                    while not requestID in self.messagesReceived:
-                        time.sleep(intervalCheckForResponse)
-                        elapsedTime += intervalCheckForResponse
-                        if elapsedTime >= timeout:
-                            isTimeout = True
-                            break
-
-                    with self.lock:
-                        if isTimeout:
-                            self.messagesReceived[requestID] = {'MessageID': requestID, 'HasTimeout': True}
-                        else:
-                            self.messagesReceived[requestID]['Acknowledged'] = True
+                deadline, requestID = self.requestDeadlines[0]
+                if deadline > time.time():
+                    self.deadlinesCondition.wait(deadline - time.time())
+                    continue
+                
+                heapq.heappop(self.requestDeadlines)
+            
+            # antes do timeout, o prazo atingido é o do próximo reenvio, feito pela thread que envia as mensagens
+            sent = self.inFlight.get(requestID)
+            if sent != None and sent[3] > time.time():
+                self.messagesToBeSent.put({'Retransmit': requestID})
+            else:
+                self.completeRequest(requestID, None)
                     
                     
-    ## Função que rodará numa thread para pingar, de 3 em 3 segundos, o Peer sucessor. Caso dê timeout, o peer será removido, atualizando os vizinhos e informando o Rendezvous.
-    def pingNext(self):
+    ## Função que rodará numa thread para estabilizar as listas de vizinhos do peer (ver neighbours.py).
+    #
+    #  A cada neighbours.TICK segundos, as entradas de successors e de predecessors das quais nenhuma mensagem chegou há mais do que o
+    #  intervalo esperado (ver neighbours.heartbeatIntervals()) são pingadas, e as entradas cujo nível de suspeita passou do limite
+    #  (ver failureDetector) são substituídas pelas próximas entradas das listas, sem nenhuma requisição a mais, de forma que o tempo
+    #  de reparo não cresce quando vários peers vizinhos falham juntos. A cada neighbours.REFRESH_INTERVAL segundos, o sucessor e o
+    #  antecessor também enviam as suas listas. Os vizinhos mortos removidos são informados ao Rendezvous, e os novos vizinhos são
+    #  atualizados com allocate().
+    def stabilize(self):
+        pings = {}          # formato: {endereço: common.Future do último Ping}
+        lists = {}          # formato: {endereço: common.Future da última requisição Neighbours}
+        lastRefresh = 0.0
         while True:
-            time.sleep(3.0) # executar de 3 em 3s
-                        
-            if self.address != self.nextAddress:
-                try:
-                    result = self.sendRequest('Ping', self.nextAddress, 3.0)
-                except socket.timeout:
-                    # remover peer sucessor
-                    self.sendRequest('Removed|' + str(self.nextID), self.rendezvousAddress, 3.0)
-                    
-                    if self.nextNextAddress != self.address:                        
-                        reply = self.sendRequest('Request|ID|nextAddress', self.nextNextAddress, 3.0)
-                        
-                        with self.lock:
-                            self.previousPreviousAddress = self.address if self.previousPreviousAddress == self.nextAddress else self.previousPreviousAddress # tratando o caso de quando há 3 peers na DHT
-                            self.nextID = int(reply[1])
-                            self.nextAddress = self.nextNextAddress
-                            self.nextNextAddress = common.strToAddr(reply[2])
-                                                
-                        self.allocate()
-                    else:
-                        with self.lock:
-                            self.nextID = self.id
-                            self.nextAddress = self.address
-                            self.nextNextAddress = self.address
-                            self.previousID = self.id
-                            self.previousAddress = self.address
-                            self.previousPreviousAddress = self.address
-       
+            time.sleep(neighbours.TICK)
+            
+            with self.lock:
+                successors, predecessors = self.successors, self.predecessors
+            if successors[0][1] == self.address:
+                continue
+            
+            now = time.time()
+            intervals = neighbours.heartbeatIntervals(self.address, successors, predecessors)
+            self.failureDetector.retain(intervals)
+            for address, interval in intervals.iteritems():
+                self.failureDetector.monitor(address, interval, now)
+                if now - self.failureDetector.lastHeartbeat(address) >= interval and (not address in pings or pings[address].wait(0)):
+                    pings[address] = self.startRequest(['Ping'], address, 3.0)
+            pings = dict((address, future) for address, future in pings.iteritems() if address in intervals)
+            
+            if now - lastRefresh >= neighbours.REFRESH_INTERVAL:
+                lastRefresh = now
+                for entry in (successors[0], predecessors[0]):
+                    if not entry[1] in lists:
+                        request = neighbours.LEGACY_REQUEST if entry[1] in self.legacyNeighbours else ['Neighbours']
+                        lists[entry[1]] = self.startRequest(request, entry[1], 3.0)
+            
+            dead = self.failureDetector.suspected(now)
+            replies = {}
+            for address, future in lists.items():
+                if not future.wait(0):
+                    continue
+                
+                del lists[address]
+                reply = neighbours.decode(future.value) if future.exception == None else None
+                if reply != None:
+                    replies[address] = reply
+                elif not address in dead:
+                    self.legacyNeighbours.add(address) # continua mandando mensagens, mas não respondeu à mensagem Neighbours
+            
+            if len(dead) == 0 and len(replies) == 0:
+                continue
+            
+            with self.lock:
+                oldPreviousID, oldNextID = self.previousID, self.nextID
+                removed = self.applyNeighbours(dead, replies)
+            
+            self.neighbourhoodChanged(oldPreviousID, oldNextID)
+            if len(removed) > 0:
+                for removedID, removedAddress in removed:
+                    self.startRequest(['Removed', removedID], self.rendezvousAddress, 3.0)
+                
+                # os Sets são enviados por outra thread, para que um novo vizinho que também morreu seja detectado sem esperar pelos timeouts
+                thread_allocate = threading.Thread(target=self.reallocate)
+                thread_allocate.daemon = True
+                thread_allocate.start()
+    
+    ## Atualiza os vizinhos depois que stabilize() substitui um sucessor (ver allocate()), ignorando os vizinhos que não respondem.
+    def reallocate(self):
+        try:
+            self.allocate()
+        except socket.timeout:
+            print 'Timeout while updating the neighbours of peer', self.id
+    
+    ## Aplica o resultado de uma rodada da estabilização (ver neighbours.stabilize()) às listas e aos ponteiros de vizinhança do peer.
+    #
+    #  Deve ser chamada com \c lock adquirido. nextNextAddress e previousPreviousAddress, usados pelo protocolo de entrada (ver allocate()),
+    #  passam a ser as segundas entradas das listas.
+    #
+    #  @param dead O conjunto dos endereços suspeitos.
+    #  @param replies Um dicionário {endereço: (sucessores, antecessores)} com as listas recebidas dos vizinhos.
+    #  @return Os vizinhos removidos, tuplas (ID, endereço) (ver neighbours.replaceDead()).
+    def applyNeighbours(self, dead, replies):
+        oldNextAddress, oldPreviousAddress = self.nextAddress, self.previousAddress
+        self.successors, self.predecessors, removed = neighbours.stabilize(self.id, self.address, self.successors, self.predecessors,
+                                                                           dead, replies, self.neighbourListSize)
+        self.nextID, self.nextAddress = self.successors[0]
+        self.previousID, self.previousAddress = self.predecessors[0]
+        
+        if len(self.successors) > 1:
+            self.nextNextAddress = self.successors[1][1]
+        elif self.nextAddress != oldNextAddress or self.nextNextAddress in dead:
+            self.nextNextAddress = self.address # tratando o caso de quando restam 2 peers na DHT
+        
+        if len(self.predecessors) > 1:
+            self.previousPreviousAddress = self.predecessors[1][1]
+        elif self.previousAddress != oldPreviousAddress or self.previousPreviousAddress in dead:
+            self.previousPreviousAddress = self.address
+        
+        return removed
+    
+    ## Refaz successors e predecessors depois que nextID/nextAddress ou previousID/previousAddress mudam (ex.: uma mensagem Set), mantendo
+    #  as entradas antigas que ainda estão depois dos novos vizinhos (ver neighbours.buildList()). Deve ser chamada com \c lock adquirido.
+    def resetNeighbourLists(self):
+        self.successors = neighbours.buildList(self.id, (self.nextID, self.nextAddress), self.successors, self.neighbourListSize, True)
+        self.predecessors = neighbours.buildList(self.id, (self.previousID, self.previousAddress), self.predecessors, self.neighbourListSize, False)
                              
+    ## Invalida as entradas de ownerCache afetadas por uma mudança na vizinhança do peer, e antecipa a sincronização das chaves com os
+    #  novos vizinhos (ver antiEntropy()).
+    #
+    #  Quando o antecessor muda de A para B, o responsável pelas chaves entre A e B (e pelas chaves deste peer) pode ter mudado; da mesma forma,
+    #  quando o sucessor muda, o responsável pelas chaves entre este peer e o sucessor antigo ou o novo pode ter mudado.
+    #
+    #  @param oldPreviousID O ID do antecessor antes da mudança.
+    #  @param oldNextID O ID do sucessor antes da mudança.
+    def neighbourhoodChanged(self, oldPreviousID, oldNextID):
+        if self.id == None:
+            return
+        
+        if self.previousID != oldPreviousID:
+            for previousID in (oldPreviousID, self.previousID):
+                if previousID != None:
+                    self.ownerCache.invalidate(previousID, self.id)
+                    if self.hotKeys != None:
+                        self.hotKeys.invalidate(previousID, self.id)
+        
+        if self.nextID != oldNextID:
+            for nextID in (oldNextID, self.nextID):
+                if nextID != None:
+                    self.ownerCache.invalidate(self.id, nextID)
+                    if self.hotKeys != None:
+                        self.hotKeys.invalidate(self.id, nextID)
+        
+        if self.previousID != oldPreviousID or self.nextID != oldNextID:
+            self.syncNeeded.set()
+    
     ## Dado uma string, tem como saída um número 0 e K, tendo como base o algoritmo de Hash MD5.
     #
     #  Caso o método de criação de IDs seja o de potência de 2 (i.e. self.method == 2), a saída dessa função será uma potência de 2.
@@ -339,52 +856,646 @@ class Peer:
     #  @param key A string em que será aplicado a função de Hash.
     #  @return O resultado do hash módulo K.
     def hashKey(self, key):
-        md5Result = hashlib.md5(str(key))
-        md5ResultDec = int(md5Result.hexdigest(), 16)
-        hashResult = md5ResultDec % self.K
-        return hashResult if self.method == 1 else 2**hashResult
+        return common.hashKey(key, self.K, self.method)
 
 
+    ## Verifica se este peer é o responsável por uma chave, ou seja, se a chave está no intervalo (previousID, id] do anel.
+    #
+    #  @param key A chave (já passada por hashKey()).
+    #  @return Retorna \c True caso este peer seja o responsável pela chave, e \c False caso contrário.
+    def isResponsible(self, key):
+        return common.inInterval(key, self.previousID, self.id)
+    
+    ## Escolhe o endereço do próximo salto de uma pesquisa por uma chave da qual este peer não é o responsável.
+    #
+    #  Com a finger table, a pesquisa é encaminhada para o sucessor caso ele seja o responsável, e caso contrário
+    #  para o finger mais distante que ainda precede a chave. Sem a finger table, a pesquisa anda um vizinho por vez.
+    #
+    #  @param key A chave pesquisada.
+    #  @return O endereço do próximo peer, no formato ('ip', porta).
+    def nextHop(self, key):
+        if not self.useFingers:
+            return self.previousAddress if self.id > key else self.nextAddress
+        
+        if common.inInterval(key, self.id, self.nextID):
+            return self.nextAddress
+        
+        fingerAddress = common.closestPrecedingFinger(self.id, key, self.fingers)
+        return fingerAddress if fingerAddress != None else self.nextAddress
+    
+    ## Encaminha uma pesquisa para o próximo salto.
+    #
+    #  @param keySearch A chave pesquisada.
+    #  @param addressSearching O endereço do peer que iniciou a pesquisa.
+    #  @param queryID O ID da pesquisa, escolhido pelo peer que a iniciou.
+    #  @param hops O número de saltos feitos pela pesquisa até o próximo peer.
+    def forwardSearch(self, keySearch, addressSearching, queryID, hops):
+        self.forwardMessage(['Search', keySearch, addressSearching, queryID, hops], self.nextHop(keySearch))
+    
+    ## Envia uma pesquisa (Search ou SearchMany) para o próximo salto, sem esperar pela confirmação.
+    #
+    #  A confirmação é acompanhada por um callback (ver startRequest()): caso o finger escolhido não responda, ele é removido
+    #  da finger table e a pesquisa é encaminhada para o sucessor. Assim, a thread que executa handleMessages() nunca fica
+    #  parada esperando por um salto, e um peer pode encaminhar muitas pesquisas ao mesmo tempo.
+    #
+    #  @param message A pesquisa, como uma lista de campos.
+    #  @param address O endereço do próximo salto (ver nextHop()).
+    def forwardMessage(self, message, address):
+        def onForwarded(future):
+            if future.exception == None or address == self.nextAddress:
+                return # a falha do sucessor é tratada por stabilize()
+            
+            self.fingers = [finger if finger == None or finger[1] != address else None for finger in self.fingers]
+            self.startRequest(message, self.nextAddress, 3.0)
+        
+        self.startRequest(message, address, 3.0).addCallback(onForwarded)
+    
+    ## Conta uma pesquisa respondida por este peer e, caso a chave seja popular, envia o seu responsável ao salto anterior com a mensagem
+    #  Cache (ver hotkeys.py), sem esperar pela resposta. Caso o salto anterior não responda, a mensagem não lhe é mais enviada.
+    #
+    #  @param key A chave pesquisada.
+    #  @param address O endereço do salto anterior (o peer que encaminhou a pesquisa).
+    #  @param ownerID O ID do responsável.
+    #  @param ownerAddress O endereço do responsável.
+    #  @param previousID O ID do antecessor do responsável.
+    #  @param ttl O TTL, em segundos, do responsável enviado. Caso seja \c None (o responsável é este peer), é o TTL de hotKeys.
+    def pushHotKey(self, key, address, ownerID, ownerAddress, previousID, ttl = None):
+        if self.hotKeys == None or not self.hotKeys.record(key, address, self.address):
+            return
+        
+        def onPushed(future):
+            if future.exception != None:
+                self.hotKeys.refuse(address)
+        message = hotkeys.cacheMessage(key, ownerID, ownerAddress, previousID, ttl if ttl != None else self.hotKeys.ttl)
+        self.startRequest(message, address, 3.0).addCallback(onPushed)
+    
+    ## Pesquisa qual peer da DHT é o responsável por uma chave.
+    #
+    #  Caso o responsável esteja em ownerCache, ele é retornado sem que nenhuma mensagem seja enviada. Caso contrário, o resultado da pesquisa
+    #  é guardado em ownerCache, junto com a faixa do anel (antecessor do responsável, responsável] informada na mensagem Found.
+    #
+    #  @param keySearch A chave pesquisada (já passada por hashKey()).
+    #  @param timeout O tempo, em segundos, de espera máximo pelo resultado.
+    #  @param useCache Caso seja \c False, a pesquisa é feita pela rede mesmo que o responsável esteja em ownerCache.
+    #  @return Uma tupla (ID do responsável, endereço do responsável, número de saltos feitos pela pesquisa). O número de saltos é 0 quando
+    #  o resultado vem de ownerCache.
+    def lookup(self, keySearch, timeout = 10.0, useCache = True):
+        if self.isResponsible(keySearch):
+            return (self.id, self.address, 0)
+        
+        if useCache:
+            owner = self.ownerCache.get(keySearch)
+            if owner != None:
+                return (owner[0], owner[1], 0)
+        
+        start = time.time()
+        future = common.Future()
+        with self.lock:
+            queryID = self.messageID
+            self.messageID += 1
+            self.pendingRequests[queryID] = future
+        
+        message = ['Search', keySearch, self.address, queryID, 0]
+        self.messagesReceivedNeededToBeReplied.put({'MessageID': 0, 'Message': message, 'FromAddress': self.address})
+        
+        self.addDeadline(queryID, timeout)
+        try:
+            resultMessage = future.result()
+        except socket.timeout:
+            self.metrics.lookupCompleted(None, time.time() - start)
+            raise
+        
+        ownerAddress = common.strToAddr(resultMessage[2])
+        ownerID = int(resultMessage[3])
+        hops = int(resultMessage[4]) if len(resultMessage) > 4 else 0
+        ownerPreviousID = int(resultMessage[5]) if len(resultMessage) > 5 else None # peers antigos não informam o antecessor
+        self.ownerCache.put(keySearch, ownerID, ownerAddress, ownerPreviousID)
+        self.metrics.lookupCompleted(hops, time.time() - start)
+        return (ownerID, ownerAddress, hops)
+    
+    ## Pesquisa, de uma só vez, quais peers da DHT são os responsáveis por várias chaves.
+    #
+    #  Ao invés de uma pesquisa por chave, as chaves são agrupadas pelo próximo salto e enviadas em mensagens SearchMany
+    #  (com até common.MAX_KEYS chaves cada). Cada peer que recebe uma SearchMany responde de uma só vez (com uma mensagem FoundMany)
+    #  pelas chaves das quais é o responsável, e reagrupa as demais pelo seu próximo salto (ver searchMany()).
+    #  As chaves cujos responsáveis estão em ownerCache não são pesquisadas, e os responsáveis encontrados são guardados em ownerCache.
+    #
+    #  @param keys As chaves pesquisadas (strings, que ainda serão passadas por hashKey()).
+    #  @param timeout O tempo, em segundos, de espera máximo pelos resultados.
+    #  @return Um dicionário {chave: (ID do responsável, endereço do responsável)}. As chaves cujos responsáveis não foram encontrados
+    #  antes do timeout ficam de fora do dicionário.
+    def lookupMany(self, keys, timeout = 10.0):
+        keysByHash = {}
+        for key in keys:
+            keysByHash.setdefault(self.hashKey(key), []).append(key)
+        
+        results = {}
+        remaining = set()
+        for keySearch in keysByHash:
+            if self.isResponsible(keySearch):
+                results[keySearch] = (self.id, self.address)
+                continue
+            
+            owner = self.ownerCache.get(keySearch)
+            if owner != None:
+                results[keySearch] = owner
+            else:
+                remaining.add(keySearch)
+        
+        if len(remaining) > 0:
+            future = common.Future()
+            with self.lock:
+                queryID = self.messageID
+                self.messageID += 1
+                self.pendingRequests[queryID] = future
+                self.batchLookups[queryID] = (remaining, results)
+            
+            message = ['SearchMany', self.address, queryID, 0] + sorted(remaining)
+            self.messagesReceivedNeededToBeReplied.put({'MessageID': 0, 'Message': message, 'FromAddress': self.address})
+            
+            self.addDeadline(queryID, timeout)
+            try:
+                future.result()
+            except socket.timeout:
+                pass
+            
+            with self.lock:
+                self.batchLookups.pop(queryID, None)
+                results = dict(results)
+        
+        return dict((key, results[keySearch]) for keySearch, sameHashKeys in keysByHash.iteritems() if keySearch in results for key in sameHashKeys)
+    
+    ## Trata uma pesquisa por várias chaves (ver lookupMany()).
+    #
+    #  As chaves das quais este peer é o responsável são respondidas ao peer que iniciou a pesquisa em uma única mensagem FoundMany,
+    #  e as demais são agrupadas pelo próximo salto, em uma mensagem SearchMany por grupo.
+    #
+    #  @param keys As chaves pesquisadas.
+    #  @param addressSearching O endereço do peer que iniciou a pesquisa.
+    #  @param queryID O ID da pesquisa, escolhido pelo peer que a iniciou.
+    #  @param hops O número de saltos feitos pela pesquisa até este peer.
+    def searchMany(self, keys, addressSearching, queryID, hops):
+        owned = []
+        groups = {}
+        for key in keys:
+            if self.isResponsible(key):
+                owned.append(key)
+            else:
+                groups.setdefault(self.nextHop(key), []).append(key)
+        
+        for i in range(0, len(owned), common.MAX_KEYS):
+            self.startRequest(['FoundMany', queryID, self.address, self.id, hops] + owned[i:i + common.MAX_KEYS], addressSearching, 3.0)
+        
+        for address, group in groups.iteritems():
+            for i in range(0, len(group), common.MAX_KEYS):
+                self.forwardMessage(['SearchMany', addressSearching, queryID, hops + 1] + group[i:i + common.MAX_KEYS], address)
+    
+    ## Registra os responsáveis encontrados para uma pesquisa em lote, completando-a quando todas as chaves tiverem sido encontradas.
+    #
+    #  @param queryID O ID da pesquisa (ver batchLookups).
+    #  @param ownerID O ID do responsável pelas chaves.
+    #  @param ownerAddress O endereço do responsável pelas chaves.
+    #  @param keys As chaves.
+    def completeBatch(self, queryID, ownerID, ownerAddress, keys):
+        with self.lock:
+            batch = self.batchLookups.get(queryID)
+            if batch == None: # a pesquisa já terminou (ex.: timeout)
+                return
+            
+            remaining, results = batch
+            for key in keys:
+                if key in remaining:
+                    remaining.discard(key)
+                    results[key] = (ownerID, ownerAddress)
+            done = len(remaining) == 0
+        
+        for key in keys:
+            self.ownerCache.put(key, ownerID, ownerAddress)
+        
+        if done:
+            self.completeRequest(queryID, results)
+    
+    ## Abre o armazenamento local do peer, caso ainda não tenha sido aberto, e começa a compactá-lo periodicamente.
+    #  @return O storage.LogStore do peer.
+    def openStore(self):
+        with self.lock:
+            if self.store == None:
+                self.store = storage.LogStore(self.storagePath, merkle.MerkleTree(lambda key: common.ringPosition(self.hashKey(key), self.method), self.K + 1))
+                
+                thread_compaction = threading.Thread(target=self.store.runCompaction)
+                thread_compaction.daemon = True
+                thread_compaction.start()
+            return self.store
+    
+    ## Envia a primeira requisição de uma operação de armazenamento (Put, Get ou Delete) para o peer responsável por uma chave.
+    #
+    #  O responsável é procurado com lookup(), que pode usar ownerCache. Caso o responsável responda NotResponsible ou não responda,
+    #  a entrada da chave é descartada de ownerCache e a requisição é enviada mais uma vez, para o responsável encontrado por uma nova pesquisa.
+    #
+    #  @param key A chave (uma string, que ainda será passada por hashKey()).
+    #  @param message A requisição. Caso este peer seja o responsável, ela não é enviada.
+    #  @param timeout O tempo, em segundos, de espera máximo pelo resultado da pesquisa.
+    #  @return Uma tupla (endereço do responsável, resposta). A resposta é \c None caso a requisição não tenha sido enviada.
+    #  @throw socket.timeout Caso o responsável não seja encontrado ou não responda.
+    #  @throw RuntimeError Caso nem o responsável encontrado pela nova pesquisa se considere o responsável (ex.: o anel está mudando).
+    def sendToOwner(self, key, message, timeout):
+        if len(key) > common.MAX_KEY_LENGTH:
+            raise ValueError('key too long (%d bytes)' % len(key))
+        
+        keySearch = self.hashKey(key)
+        for useCache in (True, False):
+            ownerID, ownerAddress, hops = self.lookup(keySearch, timeout, useCache)
+            if ownerAddress == self.address:
+                return (ownerAddress, None)
+            
+            try:
+                reply = self.sendRequest(message, ownerAddress, 3.0)
+            except socket.timeout:
+                self.ownerCache.forget(keySearch)
+                if not useCache:
+                    raise
+                continue
+            
+            if reply[0] != 'NotResponsible':
+                return (ownerAddress, reply)
+            self.ownerCache.forget(keySearch)
+        
+        raise RuntimeError('No peer claims to be responsible for ' + key)
+    
+    ## Armazena um valor na DHT, no peer responsável pela chave.
+    #
+    #  Valores maiores do que common.MAX_CHUNK são enviados em vários pedaços, um de cada vez.
+    #
+    #  @param key A chave (uma string).
+    #  @param value O valor (uma string).
+    #  @param timeout O tempo, em segundos, de espera máximo pela pesquisa do responsável.
+    #  @throw socket.timeout Caso o responsável não seja encontrado ou não responda.
+    #  @throw RuntimeError Caso nenhum peer se considere o responsável pela chave (ver sendToOwner()), ou caso o responsável recuse um
+    #  dos pedaços (NotResponsible, quando o responsável muda durante o envio, ou Invalid).
+    #  @throw ValueError Caso a chave ou o valor sejam grandes demais (ver common.MAX_KEY_LENGTH e common.MAX_VALUE).
+    def put(self, key, value, timeout = 10.0):
+        if len(key) > common.MAX_KEY_LENGTH:
+            raise ValueError('key too long (%d bytes)' % len(key))
+        if len(value) > common.MAX_VALUE:
+            raise ValueError('value too long (%d bytes)' % len(value))
+        
+        with self.lock:
+            transferID = self.messageID
+            self.messageID += 1
+        
+        count = max(1, (len(value) + common.MAX_CHUNK - 1) // common.MAX_CHUNK)
+        ownerAddress, reply = self.sendToOwner(key, ['Put', key, transferID, 0, count, value[:common.MAX_CHUNK]], timeout)
+        if ownerAddress == self.address:
+            self.openStore().put(key, value)
+            return
+        
+        for index in range(1, count):
+            if reply[0] != 'Stored':
+                break
+            chunk = value[index * common.MAX_CHUNK:(index + 1) * common.MAX_CHUNK]
+            reply = self.sendRequest(['Put', key, transferID, index, count, chunk], ownerAddress, 3.0)
+        
+        if reply[0] != 'Stored':
+            raise RuntimeError('The owner of ' + key + ' refused the value (' + reply[0] + ')')
+    
+    ## Lê um valor armazenado na DHT.
+    #
+    #  Valores maiores do que common.MAX_CHUNK são lidos em vários pedaços. Caso o valor seja sobrescrito durante a leitura,
+    #  ela é recomeçada.
+    #
+    #  @param key A chave (uma string).
+    #  @param timeout O tempo, em segundos, de espera máximo pela pesquisa do responsável.
+    #  @return O valor, ou \c None caso a chave não exista.
+    #  @throw socket.timeout Caso o responsável não seja encontrado ou não responda.
+    #  @throw RuntimeError Caso nenhum peer se considere o responsável pela chave, ou caso o valor mude a cada nova leitura.
+    def get(self, key, timeout = 10.0):
+        ownerAddress, reply = self.sendToOwner(key, ['Get', key, 0], timeout)
+        if ownerAddress == self.address:
+            return self.openStore().get(key)
+        
+        for attempt in range(3):
+            if attempt > 0:
+                reply = self.sendRequest(['Get', key, 0], ownerAddress, 3.0)
+            if reply[0] != 'Value':
+                return None
+            
+            count, version = int(reply[2]), int(reply[3])
+            chunks = [reply[4]]
+            for index in range(1, count):
+                reply = self.sendRequest(['Get', key, index], ownerAddress, 3.0)
+                if reply[0] != 'Value' or int(reply[3]) != version:
+                    break
+                chunks.append(reply[4])
+            else:
+                return ''.join(chunks)
+        
+        raise RuntimeError('The value of ' + key + ' kept changing while being read')
+    
+    ## Remove uma chave da DHT.
+    #  @param key A chave (uma string).
+    #  @param timeout O tempo, em segundos, de espera máximo pela pesquisa do responsável.
+    #  @return \c True caso a chave existisse, e \c False caso contrário.
+    #  @throw socket.timeout Caso o responsável não seja encontrado ou não responda.
+    #  @throw RuntimeError Caso nenhum peer se considere o responsável pela chave (ver sendToOwner()).
+    def delete(self, key, timeout = 10.0):
+        ownerAddress, reply = self.sendToOwner(key, ['Delete', key], timeout)
+        if ownerAddress == self.address:
+            return self.openStore().delete(key)
+        return int(reply[1]) == 1
+    
+    ## Traz de um vizinho as chaves da faixa deste peer, (previousID, id], que o vizinho guarda e este peer não (ver merkle.py).
+    #
+    #  Os resumos da árvore de Merkle do vizinho são comparados com os deste peer nível a nível, descendo apenas pelos nós diferentes, e
+    #  as chaves das folhas diferentes que faltam são buscadas em lotes. No final, o vizinho descarta as chaves da faixa das quais
+    #  não é o responsável. Caso o vizinho não guarde nenhuma chave da faixa, uma única requisição é feita.
+    #
+    #  @param address O endereço do vizinho.
+    #  @param timeout O tempo, em segundos, de espera máximo por cada resposta.
+    #  @return O número de chaves trazidas.
+    #  @throw socket.timeout Caso o vizinho não responda.
+    def syncRange(self, address, timeout = 3.0):
+        with self.lock:
+            start, end = common.ringPosition(self.previousID, self.method), common.ringPosition(self.id, self.method)
+        
+        reply = self.sendRequest(['Digest', start, end, 0, 0], address, timeout)
+        root = (int(reply[1]), int(reply[2]))
+        if root[0] == 0:
+            return 0
+        
+        store = self.openStore()
+        tree = store.tree
+        with store.lock:
+            nodes = [0] if tree.summary(0, 0, start, end) != root else []
+        for level in range(1, merkle.DEPTH + 1):
+            if len(nodes) == 0:
+                break
+            children = [child for node in nodes for child in range(node * merkle.BRANCHING, (node + 1) * merkle.BRANCHING)
+                        if tree.overlap(*(tree.bounds(level, child) + (start, end))) > 0]
+            nodes = []
+            for index in range(0, len(children), merkle.MAX_NODES):
+                batch = children[index:index + merkle.MAX_NODES]
+                reply = self.sendRequest(['Digest', start, end, level] + batch, address, timeout)
+                with store.lock:
+                    for i, node in enumerate(batch):
+                        theirs = (int(reply[1 + 2 * i]), int(reply[2 + 2 * i]))
+                        if theirs[0] > 0 and theirs != tree.summary(level, node, start, end):
+                            nodes.append(node)
+        
+        # as chaves que os dois guardam com valores diferentes ficam com o valor deste peer, que é quem recebe as escritas
+        missing = []
+        offset = 0
+        while len(nodes) > 0:
+            reply = self.sendRequest(['Entries', start, end, offset] + nodes[:merkle.MAX_NODES], address, timeout)
+            nodes, offset = nodes[int(reply[1]):], int(reply[2])
+            with store.lock:
+                missing += [str(key) for key in reply[3::2] if tree.entry(str(key)) == None]
+        
+        fetched = 0
+        while len(missing) > 0:
+            keys = merkle.batches(missing, common.MAX_KEYS)[0]
+            reply = self.sendRequest(['Fetch', 0] + keys, address, timeout)
+            entries = [reply[i:i + 4] for i in range(1, len(reply), 4)]
+            missing = missing[max(1, len(entries)):]
+            for key, count, version, chunk in entries:
+                key, count, version = str(key), int(count), int(version)
+                chunks = [chunk]
+                for index in range(1, count):
+                    chunkReply = self.sendRequest(['Fetch', index, key], address, timeout)
+                    if int(chunkReply[2]) == 0 or int(chunkReply[3]) != version:
+                        break # o valor mudou ou foi removido: fica para a próxima sincronização
+                    chunks.append(chunkReply[4])
+                if count > 0 and len(chunks) == count and store.putIfAbsent(key, ''.join(chunks)):
+                    fetched += 1
+        
+        self.sendRequest(['Handoff', start, end, root[0], root[1]], address, timeout)
+        return fetched
+    
+    ## Função que rodará numa thread para sincronizar as chaves deste peer com o sucessor e com o antecessor (ver syncRange()), assim
+    #  que o peer entra na DHT, a cada merkle.SYNC_INTERVAL segundos e logo depois que a vizinhança do peer muda. Os vizinhos antigos
+    #  (ver legacyNeighbours) são ignorados.
+    def antiEntropy(self):
+        while True:
+            with self.lock:
+                addresses = set([self.nextAddress, self.previousAddress]) - set([self.address]) - self.legacyNeighbours
+            for address in addresses:
+                try:
+                    fetched = self.syncRange(address)
+                except socket.timeout:
+                    continue
+                if fetched > 0:
+                    print 'Fetched', fetched, 'keys from', address
+            
+            self.syncNeeded.wait(merkle.SYNC_INTERVAL)
+            self.syncNeeded.clear()
+    
+    ## Pesquisa pelo responsável da i-ésima chave-alvo da finger table (ver common.fingerTargets()).
+    #
+    #  Quando a chave-alvo cai entre este peer e o seu sucessor, o próprio sucessor é o responsável e nenhuma mensagem é enviada.
+    #
+    #  @param i O índice da entrada.
+    #  @return Uma tupla (ID, endereço) do responsável, ou \c None caso a pesquisa dê timeout.
+    def findFinger(self, i):
+        target = common.fingerTargets(self.id, self.K, self.method)[i]
+        if self.isResponsible(target):
+            return (self.id, self.address)
+        if common.inInterval(target, self.id, self.nextID):
+            return (self.nextID, self.nextAddress)
+        
+        try:
+            ownerID, ownerAddress, hops = self.lookup(target, 3.0, False)
+        except socket.timeout:
+            return None
+        return (ownerID, ownerAddress)
+    
+    ## Função que rodará numa thread para construir a finger table assim que o peer entra na DHT (apenas as entradas vazias, caso ela
+    #  tenha sido retomada de um estado salvo, ver restoreFingers()) e, depois disso, atualizar uma de suas entradas a cada 3 segundos.
+    def refreshFingers(self):
+        size = len(common.fingerTargets(self.id, self.K, self.method))
+        fingers = self.fingers if len(self.fingers) == size else [None] * size
+        self.fingers = [finger if finger != None else self.findFinger(i) for i, finger in enumerate(fingers)]
+        
+        i = 0
+        while True:
+            time.sleep(3.0)
+            finger = self.findFinger(i)
+            fingers = list(self.fingers)
+            fingers[i] = finger
+            self.fingers = fingers
+            i = (i + 1) % size
+    
     ## Função que rodará numa thread para receber entrada do usuário e fazer a pesquisa por qual peer na DHT possui a entrada do usuário.
+    #
+    #  As linhas "put <chave> <valor>", "get <chave>" e "delete <chave>" armazenam, leem e removem valores da DHT, e a linha "stats"
+    #  imprime as métricas do peer (ver statsReport()).
     def listenForInput(self):
         time.sleep(2)
         while True:
             query = raw_input('Consulte por: ')
+            command = query.split(' ', 2)
+            
+            if command[0] in ('put', 'get', 'delete') and len(command) == (3 if command[0] == 'put' else 2):
+                try:
+                    if command[0] == 'put':
+                        self.put(command[1], command[2])
+                        print 'Stored ' + command[1]
+                    elif command[0] == 'get':
+                        value = self.get(command[1])
+                        print (command[1] + ' = ' + value) if value != None else (command[1] + ' not found')
+                    else:
+                        print ('Deleted ' + command[1]) if self.delete(command[1]) else (command[1] + ' not found')
+                except socket.timeout:
+                    print 'Timeout while accessing ' + command[1]
+                except (RuntimeError, ValueError) as error:
+                    print str(error)
+                continue
+            
+            if query == 'cache':
+                print 'Owner cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions, %(invalidations)d invalidations, %(size)d entries' % self.ownerCache.stats()
+                if self.hotKeys != None:
+                    print 'Hot keys: %(hits)d searches answered from the cache, %(pushes)d sent, %(received)d received, %(size)d entries' % self.hotKeys.stats()
+                continue
+            
+            if query == 'stats':
+                print self.statsReport()
+                continue
+            
             keySearch = self.hashKey(query)
-            sendMsgId = None
-            acked = False
-            found = False
-            ownerID = None
-            ownerAddress = None
-
-            if (self.id >= keySearch and (self.previousID < keySearch or self.id < self.previousID)) or self.id == self.previousID or (self.id <= keySearch and self.id < self.previousID):
-                ownerID = self.id
-                ownerAddress = self.address
-            else:
-                queryID = None
-                with self.lock:
-                    queryID = self.messageID
-                    self.messageID += 1
-
-                message = 'Search|' + str(keySearch) + '|' + repr(self.address) + '|' + str(queryID)
-                self.messagesReceivedNeededToBeReplied.append({'MessageID': 0, 'Message': message, 'FromAddress': self.address})
-
-                while not queryID in self.messagesReceived:
-                    pass
+            
+            try:
+                ownerID, ownerAddress, hops = self.lookup(keySearch)
+            except socket.timeout:
+                print 'Timeout while searching for ' + query + ' (key = ' + str(keySearch) + ')'
+                continue
 
-                result = self.messagesReceived.pop(queryID)
-                resultMessage = result['Message'].split('|')
+            print 'The peer with ID ' + str(ownerID) + ' ' + repr(ownerAddress) + ' has the file ' + query + ' (key = ' + str(keySearch) + ', ' + str(hops) + ' hops)'
 
-                ownerAddress = common.strToAddr(resultMessage[2])
-                ownerID = int(resultMessage[3])
+      
+    ## Função que rodará numa thread para tratar as mensagens de outros Peers que precisam ser respondidas (ver messagesReceivedNeededToBeReplied).
+    #
+    #  Uma mensagem mal formada (ex.: campos faltando ou que não são números) é respondida com Invalid, ao invés de interromper a thread,
+    #  o que deixaria o peer sem responder a mais nenhuma requisição.
+    def handleMessages(self):
+        while True:
+            obj = self.messagesReceivedNeededToBeReplied.get()
+            start = time.time()
+            msgID = obj['MessageID']
+            data_splitted = obj['Message']
+            address = obj['FromAddress']
+            
+            try:
+                self.handleMessage(msgID, data_splitted, address)
+            except (ValueError, IndexError, TypeError):
+                print 'Uh oh, malformed message coming from' + repr(address) + ':', repr(wire.toText(data_splitted))
+                self.replyTo(msgID, ['Invalid'], address)
+            
+            self.metrics.messageHandled(time.time() - start)
+    
+    ## Trata uma mensagem de outro Peer que precisa ser respondida.
+    #  @param msgID O ID da mensagem, usado na resposta.
+    #  @param data_splitted A mensagem, já dividida em campos.
+    #  @param address O endereço de quem enviou a mensagem.
+    def handleMessage(self, msgID, data_splitted, address):
+        if len(data_splitted) > 1 and data_splitted[0] == 'Request':
+            fields = [('address', self.address), ('ID', self.id),
+                      ('previousID', self.previousID), ('previousAddress', self.previousAddress), ('previousPreviousAddress', self.previousPreviousAddress),
+                      ('nextID', self.nextID), ('nextAddress', self.nextAddress), ('nextNextAddress', self.nextNextAddress)]
+            reply = ['Reply'] + [value for field, value in fields if field in data_splitted]
+                                      
+            self.replyTo(msgID, reply, address)
+            
+        elif len(data_splitted) > 1 and data_splitted[0] == 'Set':
+            
+            # os campos vêm em pares (nome, valor), e são todos lidos antes de serem aplicados, para que um campo mal formado não
+            # deixe a vizinhança pela metade
+            updates = []
+            for i in range(1, len(data_splitted) - 1, 2):
+                field, value = data_splitted[i], data_splitted[i + 1]
+                if field in ('previousID', 'nextID'):
+                    updates.append((field, int(value)))
+                elif field in ('previousAddress', 'previousPreviousAddress', 'nextAddress', 'nextNextAddress'):
+                    updates.append((field, common.parseAddress(value)))
+            
+            with self.lock:
+                oldPreviousID, oldNextID = self.previousID, self.nextID
+                for field, value in updates:
+                    setattr(self, field, value)
+                self.resetNeighbourLists()
+            
+            self.neighbourhoodChanged(oldPreviousID, oldNextID)
+            reply = ['Setted']
+            
+            self.replyTo(msgID, reply, address)
+            
+        elif data_splitted[0] == 'Ping':
+            reply = ['Pinged']
+            self.replyTo(msgID, reply, address)
+        
+        elif data_splitted[0] == 'Neighbours':
+            with self.lock:
+                reply = neighbours.encode(self.successors, self.predecessors)
+            self.replyTo(msgID, reply, address)
+            
+        elif data_splitted[0] == 'Search':
+            keySearch = int(data_splitted[1])
+            addressSearching = common.parseAddress(data_splitted[2])
+            queryID = int(data_splitted[3])
+            hops = int(data_splitted[4]) if len(data_splitted) > 4 else 0
+            
+            if self.isResponsible(keySearch):
+                # encontrou
+                reply = ['Found', queryID, self.address, self.id, hops, self.previousID]
+                self.startRequest(reply, addressSearching, 3.0)
+                self.pushHotKey(keySearch, address, self.id, self.address, self.previousID)
+            else:
+                # o responsável por uma chave popular, recebido de um peer mais próximo dele (ver hotkeys.py)
+                cached = self.hotKeys.get(keySearch) if self.hotKeys != None else None
+                if cached != None:
+                    reply = ['Found', queryID, cached[1], cached[0], hops, cached[2]]
+                    self.startRequest(reply, addressSearching, 3.0)
+                    self.pushHotKey(keySearch, address, *cached)
+                else:
+                    self.forwardSearch(keySearch, addressSearching, queryID, hops + 1)
 
-            print 'The peer with ID ' + str(ownerID) + ' ' + repr(ownerAddress) + ' has the file ' + query + ' (key = ' + str(keySearch) + ')'
+        elif data_splitted[0] == 'Found':
+            queryResultID = int(data_splitted[1])
+            self.completeRequest(queryResultID, data_splitted)
+        
+        elif data_splitted[0] in ('Put', 'Get', 'Delete'):
+            reply = storage.handleRequest(self.openStore(), self.incomingValues, data_splitted, address, lambda key: self.isResponsible(self.hashKey(key)))
+            self.replyTo(msgID, reply, address)
+        
+        elif data_splitted[0] in merkle.REQUESTS:
+            reply = merkle.handleRequest(self.store, data_splitted, lambda key: self.isResponsible(self.hashKey(key)))
+            self.replyTo(msgID, reply, address)
+        
+        elif data_splitted[0] == 'Cache':
+            reply = hotkeys.handleCache(self.hotKeys, data_splitted) if self.hotKeys != None else ['Cached']
+            self.replyTo(msgID, reply, address)
+        
+        elif data_splitted[0] == 'SearchMany':
+            addressSearching = common.parseAddress(data_splitted[1])
+            queryID = int(data_splitted[2])
+            hops = int(data_splitted[3])
+            self.searchMany([int(key) for key in data_splitted[4:]], addressSearching, queryID, hops)
+        
+        elif data_splitted[0] == 'FoundMany':
+            self.completeBatch(int(data_splitted[1]), int(data_splitted[3]), common.parseAddress(data_splitted[2]), [int(key) for key in data_splitted[5:]])
+        else:
+            print 'Uh oh, unknown message coming from' + repr(address) + ':', repr(wire.toText(data_splitted))
+    
+    ## Monta o relatório das métricas do peer (ver metrics.report()).
+    #  @return O relatório, em JSON.
+    def statsReport(self):
+        return metrics.report(self.metrics, self.address, self.id)
 
-      
     ## Executa as funcionalidades do Peer.
     def run(self):
         self.sock.settimeout(None)        
-        rootAddress = self.firstContactWithRendezvous()
+        saved = self.loadSnapshot()
+        candidates = self.firstContactWithRendezvous(saved)
+        if saved != None and saved['id'] != self.id:
+            print 'Got a new ID, discarding the saved state'
+            saved = None
         
         thread_receiveMessages = threading.Thread(target=self.saveReceivedMessages)
         thread_receiveMessages.daemon = True
@@ -394,6 +1505,11 @@ class Peer:
         thread_sendMessages.daemon = True
         thread_sendMessages.start()
         
+        thread_expireRequests = threading.Thread(target=self.expireRequests)
+        thread_expireRequests.daemon = True
+        thread_expireRequests.start()
+        
+        allocation = []
         if self.isRoot:
             self.nextID = self.id
             self.nextAddress = self.address
@@ -402,16 +1518,29 @@ class Peer:
             self.previousID = self.id
             self.previousAddress = self.address
             self.previousPreviousAddress = self.address
+            
+            with self.lock:
+                self.resetNeighbourLists()
+        elif saved != None and self.rejoin(saved):
+            print 'Rejoining with ID', self.id, 'between', self.previousID, 'and', self.nextID
+            allocation = self.startAllocate()
         else:
-            # procurando o lugar para ser adicionado na DHT e se alocando
-            currAddress = rootAddress
+            # procurando o lugar para ser adicionado na DHT e se alocando, a partir dos peers sugeridos pelo Rendezvous (normalmente o
+            # primeiro já é o antecessor) e, caso eles não respondam, a partir do root
+            currAddress = candidates.pop(0)
             allocated = False
             while not allocated:
-                request = 'Request|ID|previousID|previousAddress|previousPreviousAddress|nextID|nextAddress|nextNextAddress'
-                data_splitted = self.sendRequest(request, currAddress, 3.0)
+                request = ['Request', 'ID', 'previousID', 'previousAddress', 'previousPreviousAddress', 'nextID', 'nextAddress', 'nextNextAddress']
+                try:
+                    data_splitted = self.sendRequest(request, currAddress, 3.0)
+                except socket.timeout:
+                    if len(candidates) == 0:
+                        raise
+                    currAddress = candidates.pop(0)
+                    continue
                 
                 if len(data_splitted) != 8 or data_splitted[0] != 'Reply':
-                    print >>sys.stderr, 'Got an unknown message from peer at address', repr(currAddress), ':', '|'.join(data_splitted)
+                    print >>sys.stderr, 'Got an unknown message from peer at address', repr(currAddress), ':', wire.toText(data_splitted)
                     exit(2)
                                 
                 currPeer = ExternalPeer(currAddress, int(data_splitted[1]),
@@ -430,9 +1559,10 @@ class Peer:
                             self.previousID = currPeer.id
                             self.previousAddress = currPeer.address
                             self.previousPreviousAddress = currPeer.previousAddress if not isSecondElement else self.address
+                            self.resetNeighbourLists()
                         
                         print 'Inserting peer with ID', self.id, 'between', self.previousID, 'and', self.nextID
-                        self.allocate()                        
+                        allocation = self.startAllocate()
                         allocated = True
                     else:
                         currAddress = currPeer.nextAddress
@@ -448,9 +1578,10 @@ class Peer:
                             self.previousID = currPeer.previousID
                             self.previousAddress = currPeer.previousAddress
                             self.previousPreviousAddress = currPeer.previousPreviousAddress if not isSecondElement else self.address
+                            self.resetNeighbourLists()
                         
                         print 'Inserting peer with ID', self.id, 'between', self.previousID, 'and', self.nextID
-                        self.allocate()                        
+                        allocation = self.startAllocate()
                         allocated = True
                     else:
                         currAddress = currPeer.previousAddress
@@ -459,106 +1590,64 @@ class Peer:
                     exit(3)
         
         
-        thread_ping = threading.Thread(target=self.pingNext)
-        thread_ping.daemon = True
-        thread_ping.start()
+        thread_stabilize = threading.Thread(target=self.stabilize)
+        thread_stabilize.daemon = True
+        thread_stabilize.start()
+        
+        if self.useFingers:
+            if saved != None:
+                self.restoreFingers(saved)
+            thread_fingers = threading.Thread(target=self.refreshFingers)
+            thread_fingers.daemon = True
+            thread_fingers.start()
         
-        thread_IO = threading.Thread(target=self.listenForInput)
-        thread_IO.daemon = True
-        thread_IO.start()
+        if self.interactive:
+            thread_IO = threading.Thread(target=self.listenForInput)
+            thread_IO.daemon = True
+            thread_IO.start()
+        
+        thread_handleMessages = threading.Thread(target=self.handleMessages)
+        thread_handleMessages.daemon = True
+        thread_handleMessages.start()
         
-        # Loop ouvindo por contato de outros Peers
         print '\nListening at', self.sock.getsockname()
-        while True:            
-            while len(self.messagesReceivedNeededToBeReplied) == 0:
-                pass
-            
-            with self.lock:
-                obj = self.messagesReceivedNeededToBeReplied.pop()
-                msgID = obj['MessageID']
-                data = obj['Message']
-                address = obj['FromAddress']
-                        
-            data_splitted = data.split('|')
-                        
-            if len(data_splitted) > 1 and data_splitted[0] == 'Request':
-                reply = 'Reply'
-                reply += ('|' + repr(self.address)) if 'address' in data_splitted else ''
-                reply += ('|' + str(self.id)) if 'ID' in data_splitted else ''
-                reply += ('|' + str(self.previousID)) if 'previousID' in data_splitted else ''
-                reply += ('|' + repr(self.previousAddress)) if 'previousAddress' in data_splitted else ''
-                reply += ('|' + repr(self.previousPreviousAddress)) if 'previousPreviousAddress' in data_splitted else ''
-                reply += ('|' + str(self.nextID)) if 'nextID' in data_splitted else ''
-                reply += ('|' + repr(self.nextAddress)) if 'nextAddress' in data_splitted else ''
-                reply += ('|' + repr(self.nextNextAddress)) if 'nextNextAddress' in data_splitted else ''
-                                          
-                self.replyTo(msgID, reply, address)
-                
-            elif len(data_splitted) > 1 and data_splitted[0] == 'Set':
-                
-                with self.lock:
-                    if 'previousID' in data_splitted:
-                        self.previousID = int(data_splitted[data_splitted.index('previousID') + 1])
-            
-                    if 'previousAddress' in data_splitted:
-                        self.previousAddress = common.strToAddr(data_splitted[data_splitted.index('previousAddress') + 1])
-            
-                    if 'previousPreviousAddress' in data_splitted:
-                        self.previousPreviousAddress = common.strToAddr(data_splitted[data_splitted.index('previousPreviousAddress') + 1])
-            
-                    if 'nextID' in data_splitted:
-                        self.nextID = int(data_splitted[data_splitted.index('nextID') + 1])
-                
-                    if 'nextAddress' in data_splitted:
-                        self.nextAddress = common.strToAddr(data_splitted[data_splitted.index('nextAddress') + 1])
-                
-                    if 'nextNextAddress' in data_splitted:
-                        self.nextNextAddress = common.strToAddr(data_splitted[data_splitted.index('nextNextAddress') + 1])
-                
-                reply = 'Setted'
-                
-                self.replyTo(msgID, reply, address)
-                
-            elif data_splitted[0] == 'Ping':
-                reply = 'Pinged'
-                self.replyTo(msgID, reply, address)
-                
-            elif data_splitted[0] == 'Search':
-                keySearch = int(data_splitted[1])
-                addressSearching = common.strToAddr(data_splitted[2])
-                queryID = int(data_splitted[3])
-                
-                if self.address != addressSearching:
-                    self.replyTo(msgID, 'Searching', address) # mandando um ACK para o Peer que pediu pela pesquisa
-                
-                if (self.id >= keySearch and (self.previousID < keySearch or self.id < self.previousID)) or self.id == self.previousID or (self.id <= keySearch and self.id < self.previousID):
-                    # encontrou
-                    reply = 'Found|' + str(queryID) + '|' + str(self.address) + '|' + str(self.id)
-                    self.sendRequest(reply, addressSearching, 3.0)
-                    
-                elif self.id > keySearch:
-                    # enviar request para self.previousAddress
-                    reply = 'Search|' + str(keySearch) + '|' + repr(addressSearching) + '|' + str(queryID)                    
-                    self.sendRequest(reply, self.previousAddress, 3.0)
-                                        
-                elif self.id < keySearch:
-                    # enviar request para self.nextAddress
-                    reply = 'Search|' + str(keySearch) + '|' + repr(addressSearching) + '|' + str(queryID)                    
-                    self.sendRequest(reply, self.nextAddress, 3.0)
-
-            elif data_splitted[0] == 'Found':
-                queryResultID = int(data_splitted[1])
-                self.messagesReceived[queryResultID] = {'MessageID': queryResultID, 'HasTimeout': False, 'Message': data, 'FromAddress': common.strToAddr(data_splitted[2]), 'Acknowledged': True}
-                
-                self.replyTo(msgID, 'FoundACK', address)
-            else:
-                print 'Uh oh, unknown message coming from' + repr(address) + ':', repr(data)
+        
+        # as respostas às mensagens Set da entrada (ver startAllocate()) são esperadas só agora, de forma que a estabilização, a finger
+        # table e o tratamento das mensagens começam enquanto os vizinhos são atualizados
+        try:
+            self.finishAllocate(allocation)
+        except socket.timeout:
+            print 'Timeout while updating the neighbours of peer', self.id
+        
+        # a sincronização começa depois que os vizinhos sabem deste peer, para que eles descartem as chaves que passaram a ser dele
+        thread_antiEntropy = threading.Thread(target=self.antiEntropy)
+        thread_antiEntropy.daemon = True
+        thread_antiEntropy.start()
+        
+        # a thread principal apenas espera, amostrando as filas a cada segundo, enviando a carga ao Rendezvous (ver reportLoad()) e
+        # escrevendo as métricas (ver metricsPath), para que o peer continue podendo ser interrompido com Ctrl+C
+        lastDump = lastLoad = time.time()
+        lastSnapshot = 0.0
+        while True:
+            time.sleep(1.0)
+            self.metrics.sample()
+            if time.time() - lastLoad >= LOAD_INTERVAL:
+                self.reportLoad(time.time() - lastLoad)
+                lastLoad = time.time()
+            if self.metricsPath != None and time.time() - lastDump >= self.metricsInterval:
+                metrics.dump(self.metricsPath, self.statsReport())
+                lastDump = time.time()
+            if self.snapshotPath != None and time.time() - lastSnapshot >= snapshot.INTERVAL:
+                self.savedSnapshot = snapshot.save(self.snapshotPath, self.peerState(), self.savedSnapshot)
+                lastSnapshot = time.time()
 
                    
-if len(sys.argv) == 5:
-    peer = Peer((sys.argv[1], int(sys.argv[2])), (sys.argv[3], int(sys.argv[4])))
-    peer.run()
-else:
-    print >>sys.stderr, 'usage: peer.py ip_address port rendezvous_ip_address rendezvous_port'
-    sys.exit(1)
-    
\ No newline at end of file
+if __name__ == '__main__':
+    if len(sys.argv) in (5, 6, 7, 8):
+        peer = Peer((sys.argv[1], int(sys.argv[2])), (sys.argv[3], int(sys.argv[4])), storagePath = sys.argv[5] if len(sys.argv) >= 6 else None,
+                    metricsPath = sys.argv[6] if len(sys.argv) >= 7 and sys.argv[6] != '-' else None,
+                    snapshotPath = sys.argv[7] if len(sys.argv) == 8 else None)
+        peer.run()
+    else:
+        print >>sys.stderr, 'usage: peer.py ip_address port rendezvous_ip_address rendezvous_port [storage_file [metrics_file|- [snapshot_file]]]'
+        sys.exit(1)
@@ -1,8 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import common
-import socket, sys, random, math  
+import common, wire, metrics, snapshot
+import socket, sys, random, math, time, bisect, heapq
+
+## O número máximo de posições do anel percorridas, em cada direção, para encontrar os vizinhos sugeridos a um novo peer (ver Rendezvous.neighbourHints()).
+HINT_SCAN = 8
+
+## O número de Pings enviados a cada peer do registro restaurado de um arquivo de estado (ver Rendezvous.revalidate()).
+REVALIDATION_PINGS = 3
+
+## O intervalo, em segundos, entre os Pings da revalidação. Os peers que não responderam depois de REVALIDATION_PINGS intervalos são removidos.
+REVALIDATION_INTERVAL = 1.0
+
+## A idade máxima, em segundos, da carga informada por um peer com a mensagem Load (ver Rendezvous.allocateByLoad()). Os peers informam a
+#  sua carga a cada peer.LOAD_INTERVAL segundos.
+LOAD_TTL = 30.0
+
+## As políticas de atribuição dos IDs aos novos peers (ver Rendezvous.assignment).
+ASSIGNMENTS = ('gap', 'random')
 
 ## Representa as funcionalidades de um Rendezvous
 class Rendezvous:
@@ -12,11 +28,26 @@ class Rendezvous:
     ## @var sock
     #  O socket associado ao peer.
     
-    ## @var peers
-    #  A lista de peers alocados
+    ## @var peersByAddress
+    #  Os peers alocados, indexados pelo endereço (no formato de string, ver Peer.address).
+    
+    ## @var peersByID
+    #  Os peers alocados, indexados pelo ID.
+    
+    ## @var ring
+    #  A lista ordenada dos IDs dos peers alocados (a ordem do anel), mantida com o módulo bisect.
     
     ## @var available_ids
-    #  A lista de IDs disponíveis
+    #  O IDPool com os IDs disponíveis.
+    
+    ## @var printInterval
+    #  O intervalo mínimo, em segundos, entre duas impressões do anel (ver ringChanged()), ou \c None para não imprimi-lo.
+    
+    ## @var lastPrint
+    #  O instante da última impressão do anel.
+    
+    ## @var pendingPrint
+    #  \c True caso o anel tenha mudado desde a última impressão.
     
     ## @var root
     #  O peer raiz da DHT.
@@ -27,101 +58,490 @@ class Rendezvous:
     ## @var method
     #  O método de como os IDs serão distribuídos na DHT. Caso seja 1, os IDs estarão na faixa [0,K]. Caso seja 2, os IDs estarão em potência de 2 (1, 2, 4, 8, ..., 2^K).
     
+    ## @var metrics
+    #  O metrics.Metrics do rendezvous: as mensagens enviadas e recebidas, por tipo, e o tempo gasto tratando cada uma. As métricas são
+    #  enviadas em resposta à mensagem Stats.
+    
+    ## @var snapshotPath
+    #  O caminho do arquivo em que o registro dos peers é escrito a cada snapshot.INTERVAL segundos (quando muda), ou \c None. Ao reiniciar,
+    #  o Rendezvous restaura o registro desse arquivo (ver restore()), de forma que os peers continuam com os seus IDs e novos peers
+    #  continuam entrando no mesmo anel.
+    
+    ## @var savedSnapshot
+    #  O último registro escrito no arquivo de estado, em JSON (ver snapshot.save()).
+    
+    ## @var nextSnapshot
+    #  O instante da próxima escrita do arquivo de estado.
+    
+    ## @var unconfirmed
+    #  Um dicionário, indexado pelo endereço (no formato de string), com os IDs dos peers restaurados do arquivo de estado que ainda não
+    #  mandaram nenhuma mensagem ao Rendezvous desde que ele reiniciou (ver revalidate()).
+    
+    ## @var pingsLeft
+    #  O número de Pings da revalidação que ainda serão enviados aos peers de \c unconfirmed.
+    
+    ## @var nextRevalidation
+    #  O instante da próxima rodada da revalidação.
+    
+    ## @var assignment
+    #  A política de atribuição dos IDs aos novos peers (exceto os nós virtuais, ver allocateVirtual()): 'gap' para dividir ao meio o
+    #  maior arco do anel (ver allocateGap()), ou 'random' para sortear um ID entre os disponíveis.
+    
+    ## @var lastLoad
+    #  O instante da última mensagem Load recebida.
+    
+    ## @var gaps
+    #  Um heap com os arcos do anel, como tuplas (-tamanho, ID do início, ID do fim), usado por largestGap(). Os arcos que deixaram de
+    #  existir (ex.: divididos por um novo peer) só são descartados quando chegam ao topo do heap.
+    
     ## O construtor padrão.
     #
     #  @param address O endereço de rede correspondente ao rendezvous.
     #  @param K O número máximo de nós na rede.
     #  @param method O método de como os IDs serão distribuídos na DHT. Caso seja 1, os IDs estarão na faixa [0,K]. Caso seja 2, os IDs estarão em potência de 2 (1, 2, 4, 8, ..., 2^K).
-    def __init__(self, address, K, method):
+    #  @param printInterval O intervalo mínimo, em segundos, entre duas impressões do anel, ou \c None para não imprimi-lo.
+    #  @param sock O socket do rendezvous, já ligado a \c address, ou \c None para criar um socket UDP (ex.: ver asyncpeer.AsyncRendezvous).
+    #  @param snapshotPath O caminho do arquivo de estado (ver snapshotPath), ou \c None.
+    #  @param assignment A política de atribuição dos IDs (ver assignment).
+    def __init__(self, address, K, method, printInterval = 1.0, sock = None, snapshotPath = None, assignment = 'gap'):
         self.address = address
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(self.address)
-        self.peers = []
-        self.available_ids = [2**x for x in range(0, K+1)] if method == 2 else range(0, K+1)        
+        if sock == None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(self.address)
+        self.sock = sock
+        self.peersByAddress = {}
+        self.peersByID = {}
+        self.ring = []
+        self.available_ids = IDPool([2**x for x in range(0, K+1)] if method == 2 else range(0, K+1))
         self.root = None
         self.K = K
         self.method = method
+        self.printInterval = printInterval
+        self.lastPrint = 0.0
+        self.pendingPrint = False
+        self.metrics = metrics.Metrics()
+        self.metrics.gauges = {'peers': lambda: len(self.ring), 'availableIDs': lambda: len(self.available_ids)}
+        self.assignment = assignment
+        self.gaps = []
+        self.lastLoad = 0.0
+        
+        self.snapshotPath = snapshotPath
+        self.savedSnapshot = None
+        self.nextSnapshot = 0.0
+        self.unconfirmed = {}
+        self.pingsLeft = 0
+        self.nextRevalidation = 0.0
+        if snapshotPath != None:
+            state = snapshot.load(snapshotPath)
+            if state != None and state.get('K') == K and state.get('method') == method:
+                self.restore(state)
+            elif state != None:
+                print 'Ignoring the snapshot at', snapshotPath, '(different K or method)'
     
     ## Imprime todos os IDs que já foram alocados a Peers
     def printPeers(self):
         print '\nAllocated Peers:'
         print '->',
-        for peer in self.peers:
-            if peer == self.root:
-                print str(peer.id) + ' (root) ->',
+        for id in self.ring:
+            if self.peersByID[id] == self.root:
+                print str(id) + ' (root) ->',
             else:
-                print str(peer.id) + ' ->',
+                print str(id) + ' ->',
         print '\n\n'  
-            
-    ## Executa as funcionalidades do Rendezvous.
-    def run(self):
-        print 'Listening at', self.sock.getsockname()
+    
+    ## Registra que o anel mudou, imprimindo-o caso a última impressão tenha sido há pelo menos printInterval segundos.
+    #
+    #  Caso contrário, a impressão fica pendente (ver pendingPrint) e é feita por uma chamada posterior, de forma que, durante
+    #  a entrada de muitos peers, o anel é impresso no máximo uma vez por intervalo.
+    def ringChanged(self):
+        if self.printInterval == None:
+            return
         
-        while True:
-            data, address = self.sock.recvfrom(common.MAX)
-            data_splitted = data.split('|')
+        now = time.time()
+        if now - self.lastPrint >= self.printInterval:
+            self.printPeers()
+            self.lastPrint = now
+            self.pendingPrint = False
+        else:
+            self.pendingPrint = True
             
-            # print 'Got a message from', address
-
-            # Recebendo um "hello" de algum peer
-            if len(data_splitted) == 1 and data_splitted[0] == 'hello':
-                existing = [peer for peer in self.peers if peer.address == repr(address)]
-                already_exists = len(existing) > 0
-
-                current_id = 0
-                if not already_exists:
-                    random_index = random.randint(0, len(self.available_ids) - 1)
-                    current_id = self.available_ids.pop(random_index)
-                                        
-                    self.peers.append(Peer(current_id, repr(address)))
-                    self.peers.sort(key=lambda x: x.id)
-                    
-                    # print 'hello from a new peer, sending id', current_id
-                else:
-                    current_id = existing[0].id
-                    # print 'hello from an already existing peer, sending id', current_id
+    ## Sugere, a um novo peer, os peers entre os quais ele deve ser inserido no anel.
+    #
+    #  São o antecessor e o sucessor mais próximos do ID no anel que já confirmaram o seu ID (ver Peer.valid). Peers que ainda
+    #  não confirmaram são pulados, pois podem ainda não estar na DHT, e a busca para depois de HINT_SCAN posições em cada direção.
+    #
+    #  O novo peer procura o seu lugar a partir do primeiro peer sugerido (ver peer.Peer.run()), o que termina com uma única
+    #  requisição quando ele é o antecessor, exceto quando o antecessor dá a volta no anel (o novo ID é o menor de todos):
+    #  nesse caso, o sucessor é sugerido primeiro.
+    #
+    #  @param id O ID do novo peer (já registrado em \c ring).
+    #  @return A lista de endereços (no formato de string, ver Peer.address) dos peers sugeridos, com no máximo dois elementos.
+    def neighbourHints(self, id):
+        position = bisect.bisect_left(self.ring, id)
+        neighbours = []
+        for direction in (-1, 1):
+            for step in range(1, min(HINT_SCAN, len(self.ring) - 1) + 1):
+                peer = self.peersByID[self.ring[(position + direction * step) % len(self.ring)]]
+                if peer.valid:
+                    if not peer in neighbours:
+                        neighbours.append(peer)
+                    break
+        
+        if len(neighbours) == 2 and neighbours[0].id > id:
+            neighbours.reverse()
+        return [peer.address for peer in neighbours]
+    
+    ## Trata uma mensagem recebida de um peer, enviando a resposta correspondente.
+    #
+    #  O contato inicial (hello e ACK) é sempre feito em texto. Peers que enviam hello|neighbours recebem, ao final da resposta,
+    #  os endereços dos peers entre os quais devem ser inseridos (ver neighbourHints()); peers antigos enviam apenas hello, e
+    #  recebem a resposta original. Os nós virtuais de um peer físico (ver asyncpeer.startVirtualNodes()) enviam
+    #  hello|neighbours|vnode|<endereço do peer físico>|<índice>, e recebem um ID calculado a partir desses campos (ver allocateVirtual()),
+    #  ao invés de um ID aleatório. As requisições Removed e Stats (as métricas do Rendezvous, ver metrics.py) são respondidas no mesmo
+    #  formato (texto ou binário, ver wire.py) em que chegaram, e a requisição Wire, que um peer envia para saber se o Rendezvous
+    #  entende o formato binário, é respondida com a versão suportada. A requisição Load|<id>|<carga> registra a carga do peer (ver
+    #  allocateByLoad()) e é respondida com Loaded, e a requisição Peers|<número>, de um cliente que não faz parte do anel (ver
+    #  client.py), é respondida com PeerList|<K>|<método>|<endereço>|... (ver entryPeers()). Uma requisição cujos campos numéricos
+    #  não são números é respondida com Invalid.
+    #
+    #  @param data A mensagem recebida.
+    #  @param address O endereço do peer que enviou a mensagem.
+    def handleMessage(self, data, address):
+        try:
+            waitForReply, messageID, data_splitted = wire.decode(data)
+        except ValueError:
+            print 'Unknown message from ' + repr(address) + ': ' + repr(data)
+            return
+        
+        self.metrics.messageReceived(data_splitted[0], len(data))
+        # print 'Got a message from', address
+        
+        if len(self.unconfirmed) > 0:
+            self.unconfirmed.pop(repr(address), None) # qualquer mensagem confirma um peer restaurado (ver revalidate())
+
+        # Recebendo um "hello" de algum peer
+        if waitForReply == None and data_splitted[0] == 'hello' and (len(data_splitted) == 1 or data_splitted[1:] == ['neighbours'] or
+                                                                       (len(data_splitted) == 5 and data_splitted[1:3] == ['neighbours', 'vnode'] and data_splitted[4].isdigit())):
+            existing = self.peersByAddress.get(repr(address))
+            virtual = len(data_splitted) == 5
 
-                # Enviando o ID do peer.
-                # Também envia "root" caso seja o 1o peer a entrar na rede ou o endereço do root caso contrário
-                message = 'ID|%s|' % str(current_id)
+            current_id = 0
+            if existing == None:
+                if len(self.available_ids) == 0:
+                    print 'No IDs available for ' + repr(address)
+                    return
                 
-                if len(self.peers) == 1:
-                    self.root = self.peers[0]
-                    message += 'root'
+                if virtual:
+                    current_id = self.allocateVirtual(data_splitted[3], int(data_splitted[4]))
+                elif self.assignment == 'gap' and len(self.ring) > 0:
+                    current_id = self.allocateGap()
                 else:
-                    message += self.root.address
+                    current_id = self.available_ids.allocate()
                 
-                message += '|' + str(self.K) + '|' + str(self.method)
+                peer = Peer(current_id, repr(address), data_splitted[3] if virtual else None)
+                self.peersByAddress[peer.address] = peer
+                self.peersByID[current_id] = peer
+                self.insertPeer(current_id)
+                
+                # print 'hello from a new peer, sending id', current_id
+            else:
+                current_id = existing.id
+                # print 'hello from an already existing peer, sending id', current_id
 
-                self.sock.sendto(message, address)
-        
-            # quando o rendezvous recebe um ACK de algum peer
-            elif len(data_splitted) == 2 and data_splitted[0] == 'ACK':
-                # print 'Got an ACK from peer', data_splitted[1]
-                existing = [peer for peer in self.peers if peer.id == int(data_splitted[1])]
-                already_exists = len(existing) > 0
+            # Enviando o ID do peer.
+            # Também envia "root" caso seja o 1o peer a entrar na rede ou o endereço do root caso contrário
+            message = 'ID|%s|' % str(current_id)
             
-                if not already_exists:
-                    raise RuntimeError('The server does not acknowledge the ID' % data_splitted[1])
+            if len(self.ring) == 1:
+                self.root = self.peersByID[current_id]
+                message += 'root'
+            else:
+                message += self.root.address
             
-                peer = existing[0]
-                peer.valid = True
-                self.sock.sendto(data, address) # Enviando o mesmo ACK que foi recebido
-                self.printPeers()
-            elif len(data_splitted) == 4 and data_splitted[2] == 'Removed':
-                messageID = int(data_splitted[1])
-                idRemoved = int(data_splitted[3])
-                print 'Peer with ID ' + str(idRemoved) + ' being removed'
-                
-                self.peers = filter(lambda x: x.id != idRemoved, self.peers)
-                self.available_ids.append(idRemoved)
-                  
-                self.available_ids.append(idRemoved)             
-                self.peers.sort(key=lambda x: x.id)
-                self.sock.sendto('False|' + str(messageID) + '|Removed', address)
-                self.printPeers()
-            else:                
-                print 'Unknown message from ' + repr(address) + ': ' + data
+            message += '|' + str(self.K) + '|' + str(self.method)
+            
+            if len(data_splitted) >= 2:
+                for hint in self.neighbourHints(current_id):
+                    message += '|' + hint
+
+            self.send(message, 'ID', address)
+    
+        # quando o rendezvous recebe um ACK de algum peer
+        elif waitForReply == None and len(data_splitted) == 2 and data_splitted[0] == 'ACK':
+            # print 'Got an ACK from peer', data_splitted[1]
+            try:
+                peer = self.peersByID.get(int(data_splitted[1]))
+            except ValueError: # um ACK mal formado não tem ID de mensagem para ser respondido, então é ignorado
+                print 'Malformed ACK from ' + repr(address) + ': ' + wire.toText(data_splitted)
+                return
+            if peer == None: # ex.: um ACK atrasado de um peer que já foi removido
+                print 'The server does not acknowledge the ID ' + str(data_splitted[1])
+                return
+        
+            peer.valid = True
+            self.send(data, 'ACK', address) # Enviando o mesmo ACK que foi recebido
+            self.ringChanged()
+        elif waitForReply and len(data_splitted) == 2 and data_splitted[0] == 'Removed':
+            try:
+                idRemoved = int(data_splitted[1])
+            except ValueError:
+                self.send(wire.encode(['Invalid'], False, messageID, wire.isBinary(data)), 'Invalid', address)
+                return
+            print 'Peer with ID ' + str(idRemoved) + ' being removed'
+            
+            self.removePeer(idRemoved)
+            self.send(wire.encode(['Removed'], False, messageID, wire.isBinary(data)), 'Removed', address)
+            self.ringChanged()
+        elif waitForReply and len(data_splitted) == 3 and data_splitted[0] == 'Load':
+            try:
+                peer, load = self.peersByID.get(int(data_splitted[1])), int(data_splitted[2])
+            except ValueError:
+                self.send(wire.encode(['Invalid'], False, messageID, wire.isBinary(data)), 'Invalid', address)
+                return
+            if peer != None:
+                peer.load = load
+                peer.loadTime = self.lastLoad = time.time()
+            self.send(wire.encode(['Loaded'], False, messageID, wire.isBinary(data)), 'Loaded', address)
+        elif waitForReply and len(data_splitted) == 2 and data_splitted[0] == 'Peers':
+            try:
+                count = int(data_splitted[1])
+            except ValueError:
+                self.send(wire.encode(['Invalid'], False, messageID, wire.isBinary(data)), 'Invalid', address)
+                return
+            reply = ['PeerList', self.K, self.method] + self.entryPeers(count)
+            self.send(wire.encode(reply, False, messageID, wire.isBinary(data)), 'PeerList', address)
+        elif waitForReply and data_splitted[0] == 'Wire':
+            self.send(wire.encodeText(['Wire', wire.VERSION], False, messageID), 'Wire', address)
+        elif waitForReply and data_splitted[0] == 'Stats':
+            report = metrics.report(self.metrics, self.address, None)
+            self.send(wire.encode(['StatsReport', report], False, messageID, wire.isBinary(data)), 'StatsReport', address)
+        elif waitForReply == False and data_splitted[0] == 'Pinged':
+            pass # resposta à revalidação (ver revalidate())
+        else:                
+            print 'Unknown message from ' + repr(address) + ': ' + wire.toText(data_splitted)
+
+    ## Sorteia os peers pelos quais um cliente entra na DHT (ver client.Client).
+    #
+    #  Os peers são sorteados entre os que já confirmaram o seu ID (ver Peer.valid), espalhados pelo anel, de forma que os clientes
+    #  dividem as suas pesquisas entre vários peers.
+    #
+    #  @param count O número máximo de peers.
+    #  @return A lista de endereços (no formato de string, ver Peer.address) dos peers.
+    def entryPeers(self, count):
+        ids = random.sample(self.ring, min(len(self.ring), 4 * max(1, count)))
+        return [self.peersByID[id].address for id in ids if self.peersByID[id].valid][:count]
+    
+    ## Envia uma mensagem a um peer, registrando-a nas métricas.
+    #  @param data A mensagem codificada.
+    #  @param name O tipo da mensagem.
+    #  @param address O endereço do peer.
+    def send(self, data, name, address):
+        self.sock.sendto(data, address)
+        self.metrics.messageSent(name, len(data))
+
+    ## Aloca o ID de um nó virtual.
+    #
+    #  O ID é o da posição preferida do nó virtual (ver common.virtualNodePosition()) ou, caso ela já esteja ocupada, o da primeira
+    #  posição livre depois dela no anel. Como as posições preferidas são hashes, os nós virtuais de cada peer físico ficam espalhados
+    #  pelo anel, e o número de chaves por peer físico fica mais uniforme conforme o número de nós virtuais cresce.
+    #
+    #  @param physical O endereço do peer físico (no formato de string, ver Peer.physical).
+    #  @param index O índice do nó virtual no peer físico.
+    #  @return O ID alocado (deve haver pelo menos um ID disponível).
+    def allocateVirtual(self, physical, index):
+        position = common.virtualNodePosition(physical, index, self.K)
+        while True:
+            id = position if self.method == 1 else 2**position
+            if self.available_ids.take(id):
+                return id
+            position = (position + 1) % (self.K + 1)
+
+    ## Calcula o tamanho de um arco do anel, em posições (ver common.ringPosition()).
+    #  @param start O ID do peer que começa o arco (exclusivo).
+    #  @param end O ID do peer que termina o arco (inclusivo), responsável pelas chaves do arco. Caso seja igual a \c start, o arco é o anel inteiro.
+    def arcLength(self, start, end):
+        if start == end:
+            return self.K + 1
+        return (common.ringPosition(end, self.method) - common.ringPosition(start, self.method)) % (self.K + 1)
+    
+    ## Adiciona um arco do anel ao heap \c gaps.
+    #  @param start O ID do início do arco.
+    #  @param end O ID do fim do arco.
+    def pushGap(self, start, end):
+        heapq.heappush(self.gaps, (-self.arcLength(start, end), start, end))
+    
+    ## Insere um ID no anel, dividindo o arco em que ele cai em dois.
+    #  @param id O ID (que ainda não está no anel).
+    def insertPeer(self, id):
+        bisect.insort(self.ring, id)
+        if len(self.ring) == 1:
+            self.pushGap(id, id)
+            return
+        
+        position = bisect.bisect_left(self.ring, id)
+        self.pushGap(self.ring[position - 1], id)
+        self.pushGap(id, self.ring[(position + 1) % len(self.ring)])
+    
+    ## Encontra o maior arco do anel, descartando do topo de \c gaps os arcos que deixaram de existir.
+    #
+    #  Um arco ainda existe quando os seus dois peers ainda estão no anel, um seguido do outro. Quando o heap passa a ter muito mais
+    #  arcos descartados do que arcos existentes, ele é reconstruído a partir do anel.
+    #
+    #  @return Uma tupla (tamanho, ID do início, ID do fim), com o anel não vazio.
+    def largestGap(self):
+        if len(self.gaps) == 0 or len(self.gaps) > 4 * len(self.ring) + 16:
+            self.gaps = [(-self.arcLength(self.ring[i - 1], id), self.ring[i - 1], id) for i, id in enumerate(self.ring)]
+            heapq.heapify(self.gaps)
+        
+        while True:
+            length, start, end = self.gaps[0]
+            if start in self.peersByID and self.ring[bisect.bisect_right(self.ring, start) % len(self.ring)] == end:
+                return -length, start, end
+            heapq.heappop(self.gaps)
+    
+    ## Aloca o ID de um novo peer dividindo ao meio o maior arco do anel ou, caso algum peer tenha informado a sua carga, o arco do peer
+    #  mais carregado (ver allocateByLoad()).
+    #
+    #  O novo peer fica responsável pela primeira metade do arco, e o peer que terminava o arco fica com a segunda. Com IDs sorteados,
+    #  o maior arco cresce com log(N) vezes o arco médio; dividindo sempre o maior, ele fica em no máximo duas vezes o arco médio.
+    #
+    #  @return O ID alocado (deve haver pelo menos um ID disponível, e o anel não pode estar vazio).
+    def allocateGap(self):
+        length, start, end = self.allocateByLoad() or self.largestGap()
+        position = (common.ringPosition(start, self.method) + length // 2) % (self.K + 1)
+        id = position if self.method == 1 else 2**position
+        if length < 2 or not self.available_ids.take(id):
+            return self.available_ids.allocate()
+        return id
+    
+    ## Escolhe o arco dividido por allocateGap() a partir da carga informada pelos peers (ver Peer.load).
+    #
+    #  A carga dos peers que não a informaram há menos de LOAD_TTL segundos é estimada pelo tamanho do seu arco, com a carga média por
+    #  posição dos peers que a informaram. Percorre o anel inteiro, e só é usado enquanto algum peer informa a sua carga (ver lastLoad).
+    #
+    #  @return Uma tupla (tamanho, ID do início, ID do fim) com o arco do peer mais carregado, ou \c None caso nenhum peer tenha informado
+    #          a sua carga.
+    def allocateByLoad(self):
+        oldest = time.time() - LOAD_TTL
+        if self.lastLoad < oldest:
+            return None
+        
+        arcs = [(self.arcLength(self.ring[i - 1], id), self.ring[i - 1], id) for i, id in enumerate(self.ring)]
+        reported = [(self.peersByID[arc[2]].load, arc[0]) for arc in arcs if self.peersByID[arc[2]].loadTime >= oldest]
+        if len(reported) == 0:
+            return None
+        
+        density = float(sum(load for load, length in reported)) / max(1, sum(length for load, length in reported))
+        load = lambda arc: self.peersByID[arc[2]].load if self.peersByID[arc[2]].loadTime >= oldest else arc[0] * density
+        return max((arc for arc in arcs if arc[0] >= 2), key = lambda arc: (load(arc), arc[0]))
+    
+    ## Monta o estado que é escrito no arquivo de estado: K, o método, o ID do root e os peers (ID, endereço, peer físico e estado).
+    def registryState(self):
+        peers = [[id, self.peersByID[id].address, self.peersByID[id].physical, self.peersByID[id].valid] for id in self.ring]
+        return {'K': self.K, 'method': self.method, 'root': self.root.id if self.root != None else None, 'peers': peers}
+    
+    ## Restaura o registro dos peers a partir do estado escrito por registryState(), e começa a revalidá-lo (ver revalidate()).
+    #  @param state O estado.
+    def restore(self, state):
+        for id, address, physical, valid in state['peers']:
+            peer = Peer(id, str(address), str(physical) if physical != address else None)
+            peer.valid = valid
+            self.peersByAddress[peer.address] = peer
+            self.peersByID[id] = peer
+            self.available_ids.take(id)
+            self.unconfirmed[peer.address] = id
+        
+        self.ring = sorted(self.peersByID)
+        self.gaps = []
+        self.root = self.peersByID.get(state['root'])
+        if self.root == None and len(self.ring) > 0:
+            self.root = self.peersByID[self.ring[0]]
+        self.pingsLeft = REVALIDATION_PINGS
+        print 'Restored', len(self.ring), 'peers from', self.snapshotPath
+    
+    ## Revalida o registro restaurado do arquivo de estado, pingando os peers que ainda não mandaram nenhuma mensagem.
+    #
+    #  Cada peer restaurado recebe até REVALIDATION_PINGS Pings, um a cada REVALIDATION_INTERVAL segundos, e é confirmado por qualquer
+    #  mensagem que chegue do seu endereço (ex.: a resposta ao Ping, ou o hello de um peer que reiniciou). Os peers que não foram
+    #  confirmados depois disso (ex.: peers que saíram da DHT enquanto o Rendezvous estava fora do ar) são removidos do registro.
+    #
+    #  @param now O instante atual.
+    def revalidate(self, now):
+        if self.pingsLeft == 0:
+            for id in self.unconfirmed.values():
+                print 'Peer with ID ' + str(id) + ' did not answer, being removed'
+                self.removePeer(id)
+            self.unconfirmed = {}
+            self.ringChanged()
+            return
+        
+        for address in self.unconfirmed:
+            self.send(wire.encodeText(['Ping'], True, self.pingsLeft), 'Ping', common.strToAddr(address))
+        self.pingsLeft -= 1
+        self.nextRevalidation = now + REVALIDATION_INTERVAL
+    
+    ## Faz as tarefas periódicas do Rendezvous que estiverem atrasadas: a impressão pendente do anel (ver ringChanged()), a escrita do
+    #  arquivo de estado e a revalidação do registro restaurado.
+    def runTimers(self):
+        now = time.time()
+        if self.pendingPrint and now - self.lastPrint >= self.printInterval:
+            self.ringChanged()
+        if self.snapshotPath != None and now >= self.nextSnapshot:
+            self.savedSnapshot = snapshot.save(self.snapshotPath, self.registryState(), self.savedSnapshot)
+            self.nextSnapshot = now + snapshot.INTERVAL
+        if len(self.unconfirmed) > 0 and now >= self.nextRevalidation:
+            self.revalidate(now)
+    
+    ## Calcula o tempo, em segundos, até a próxima tarefa periódica (ver runTimers()), ou \c None caso não haja nenhuma.
+    #
+    #  O tempo nunca é zero, pois socket.settimeout(0) tornaria o socket não bloqueante.
+    def nextTimeout(self):
+        deadlines = []
+        if self.pendingPrint:
+            deadlines.append(self.lastPrint + self.printInterval)
+        if self.snapshotPath != None:
+            deadlines.append(self.nextSnapshot)
+        if len(self.unconfirmed) > 0:
+            deadlines.append(self.nextRevalidation)
+        return max(0.001, min(deadlines) - time.time()) if len(deadlines) > 0 else None
+    
+    ## Remove um peer do registro, devolvendo o seu ID aos IDs disponíveis.
+    #
+    #  Caso o peer removido seja o raiz, o seu sucessor no anel passa a ser o raiz. IDs que não estão alocados (ex.: um peer
+    #  removido duas vezes, por vizinhos diferentes) são ignorados.
+    #
+    #  @param id O ID do peer.
+    def removePeer(self, id):
+        peer = self.peersByID.pop(id, None)
+        if peer == None:
+            return
+        
+        del self.peersByAddress[peer.address]
+        position = bisect.bisect_left(self.ring, id)
+        del self.ring[position]
+        self.available_ids.release(id)
+        if len(self.ring) > 0:
+            self.pushGap(self.ring[position - 1], self.ring[position % len(self.ring)])
+        
+        if peer == self.root:
+            self.root = self.peersByID[self.ring[bisect.bisect_left(self.ring, id) % len(self.ring)]] if len(self.ring) > 0 else None
+
+    ## Executa as funcionalidades do Rendezvous.
+    def run(self):
+        print 'Listening at', self.sock.getsockname()
+        
+        while True:
+            # a espera termina a tempo de fazer as tarefas periódicas (ex.: uma impressão do anel pendente)
+            self.sock.settimeout(self.nextTimeout())
+            try:
+                data, address = self.sock.recvfrom(common.MAX)
+            except socket.timeout:
+                self.runTimers()
+                continue
+            start = time.time()
+            self.handleMessage(data, address)
+            self.metrics.messageHandled(time.time() - start)
+            self.runTimers()
                 
                           
 ## Representa a estrutura de um Peer visto pelo Rendezvous.
@@ -137,20 +557,92 @@ class Peer:
     #  Caso seja \c True, ele é visto como válido no Rendezvous.
     #  Caso seja \c False, é visto como inválido.
     #  Um peer é válido quando o nó correspondente ao peer reconhece qual é o seu ID e informou essa confirmação ao Rendezvous.
+
+    ## @var physical
+    #  O endereço do peer físico ao qual o peer pertence, caso ele seja um nó virtual, ou o próprio \c address, caso contrário.
+    
+    ## @var load
+    #  A última carga informada pelo peer com a mensagem Load (as mensagens recebidas por segundo), ou \c None.
+    
+    ## @var loadTime
+    #  O instante em que o peer informou a sua carga pela última vez.
     
     ## O construtor padrão.
     #
     #  @param id O ID que será alocado ao peer.
     #  @param address O endereço de rede correspondente ao peer.
-    def __init__(self, id, address):
+    #  @param physical O endereço do peer físico, caso o peer seja um nó virtual, ou \c None.
+    def __init__(self, id, address, physical = None):
         self.id = id
         self.address = address
         self.valid = False
+        self.physical = physical if physical != None else address
+        self.load = None
+        self.loadTime = 0.0
         
+
+## Um conjunto de IDs disponíveis, com alocação aleatória e devolução em O(1).
+class IDPool:
+    ## @var ids
+    #  A lista dos IDs disponíveis, em qualquer ordem.
+    
+    ## @var positions
+    #  A posição de cada ID disponível em \c ids.
+    
+    ## O construtor padrão.
+    #  @param ids Os IDs inicialmente disponíveis.
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.positions = dict((id, i) for i, id in enumerate(self.ids))
+    
+    ## Retira um ID aleatório do conjunto.
+    #
+    #  O ID sorteado é trocado de lugar com o último da lista, que então é removido, para não deslocar os demais.
+    #
+    #  @return O ID.
+    def allocate(self):
+        i = random.randint(0, len(self.ids) - 1)
+        id = self.ids[i]
+        last = self.ids.pop()
+        if last != id:
+            self.ids[i] = last
+            self.positions[last] = i
+        del self.positions[id]
+        return id
+    
+    ## Retira um ID específico do conjunto.
+    #
+    #  O último ID da lista ocupa o lugar do ID retirado, como em allocate().
+    #
+    #  @param id O ID.
+    #  @return \c True caso o ID estivesse disponível, e \c False caso contrário.
+    def take(self, id):
+        i = self.positions.pop(id, None)
+        if i == None:
+            return False
+        last = self.ids.pop()
+        if last != id:
+            self.ids[i] = last
+            self.positions[last] = i
+        return True
+    
+    ## Devolve um ID ao conjunto. IDs que já estão disponíveis são ignorados.
+    #  @param id O ID.
+    def release(self, id):
+        if not id in self.positions:
+            self.positions[id] = len(self.ids)
+            self.ids.append(id)
+    
+    ## Retorna o número de IDs disponíveis.
+    def __len__(self):
+        return len(self.ids)
                
-if len(sys.argv) == 5:
-    rendezvous = Rendezvous((sys.argv[1], int(sys.argv[2])), int(sys.argv[3]), int(sys.argv[4]))
-    rendezvous.run()
-else:
-    print >>sys.stderr, 'usage: rendezvous.py ip_address port K method<1 or 2>'
-    sys.exit(1)
+if __name__ == '__main__':
+    if len(sys.argv) in (5, 6, 7) and (len(sys.argv) < 7 or sys.argv[6] in ASSIGNMENTS):
+        rendezvous = Rendezvous((sys.argv[1], int(sys.argv[2])), int(sys.argv[3]), int(sys.argv[4]),
+                                snapshotPath = sys.argv[5] if len(sys.argv) >= 6 and sys.argv[5] != '-' else None,
+                                assignment = sys.argv[6] if len(sys.argv) == 7 else 'gap')
+        rendezvous.run()
+    else:
+        print >>sys.stderr, 'usage: rendezvous.py ip_address port K method<1 or 2> [snapshot_file|- [gap|random]]'
+        sys.exit(1)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file retransmit.py
+#  A retransmissão das requisições entre peers e a supressão das requisições repetidas.
+#
+#  Quem envia uma requisição a reenvia, com os mesmos bytes e o mesmo ID, enquanto não recebe a resposta: o primeiro reenvio acontece
+#  depois do tempo de retransmissão estimado para o destino (ver RTTEstimator), e cada reenvio seguinte espera o dobro do anterior,
+#  até o timeout da requisição. Assim, um datagrama perdido custa alguns RTTs, e não o timeout inteiro.
+#
+#  Quem recebe guarda as respostas enviadas em um ReplyCache, indexado por (endereço de quem enviou, ID da mensagem). Uma requisição
+#  repetida recebe a resposta guardada de novo, sem ser executada outra vez, o que importa para as mensagens que não podem ser
+#  repetidas (ex.: Set, Search e Found, cuja repetição encaminharia a pesquisa de novo). Uma repetição que chega antes da resposta
+#  ficar pronta é descartada.
+#
+#  Os peers e os clientes que rodam sobre um eventloop.EventLoop (asyncpeer.AsyncPeer e client.Client) enviam as suas requisições e
+#  reenvios com o Requester.
+
+import wire
+import threading, time
+
+## O tempo de retransmissão, em segundos, para destinos dos quais ainda não há nenhuma medida de RTT.
+INITIAL_RTO = 0.2
+
+## O menor tempo de retransmissão, em segundos.
+MIN_RTO = 0.05
+
+## O maior tempo de retransmissão, em segundos.
+MAX_RTO = 2.0
+
+## O tempo máximo, em segundos, durante o qual as respostas ficam no ReplyCache. Cada resposta fica pelo menos a metade desse tempo,
+#  que deve ser maior que o maior timeout das requisições (10 segundos, ver peer.Peer.put()).
+REPLY_TTL = 30.0
+
+## O número máximo de entradas do ReplyCache.
+REPLY_CAPACITY = 8192
+
+## Estima o tempo de retransmissão de cada destino a partir dos RTTs medidos, como no TCP (RFC 6298).
+#
+#  Para cada destino são mantidos o RTT suavizado (SRTT) e a sua variação (RTTVAR), e o tempo de retransmissão é SRTT + 4 * RTTVAR,
+#  limitado a [MIN_RTO, MAX_RTO]. Só são medidas as requisições respondidas sem reenvio (algoritmo de Karn), pois não se sabe a qual
+#  envio uma resposta de uma requisição reenviada corresponde.
+class RTTEstimator:
+    ## @var estimates
+    #  Um dicionário {endereço: (SRTT, RTTVAR)}, em segundos.
+
+    ## O construtor padrão.
+    def __init__(self):
+        self.estimates = {}
+
+    ## Registra um RTT medido.
+    #  @param address O endereço do destino.
+    #  @param rtt O RTT, em segundos.
+    def sample(self, address, rtt):
+        estimate = self.estimates.get(address)
+        if estimate == None:
+            self.estimates[address] = (rtt, rtt / 2)
+        else:
+            srtt, rttvar = estimate
+            self.estimates[address] = (0.875 * srtt + 0.125 * rtt, 0.75 * rttvar + 0.25 * abs(srtt - rtt))
+
+    ## Calcula o tempo de espera antes do primeiro reenvio de uma requisição.
+    #  @param address O endereço do destino.
+    #  @return O tempo, em segundos.
+    def timeout(self, address):
+        estimate = self.estimates.get(address)
+        if estimate == None:
+            return INITIAL_RTO
+        return min(MAX_RTO, max(MIN_RTO, estimate[0] + 4 * estimate[1]))
+
+## As respostas enviadas por um peer, indexadas por (endereço de quem enviou a requisição, ID da mensagem), para que requisições
+#  repetidas (ex.: reenviadas por retransmissão) não sejam executadas de novo. Pode ser usado por várias threads.
+#
+#  Cada entrada guarda também o tipo da requisição, e uma requisição com o mesmo ID mas outro tipo é tratada como nova. As entradas
+#  ficam em duas gerações, dois dicionários: as novas entram na atual, e as duas são consultadas. A cada \c ttl / 2 segundos (ou quando a
+#  geração atual chega a \c capacity / 2 entradas), a geração anterior é descartada e a atual passa a ser a anterior, de forma que cada
+#  entrada é mantida entre \c ttl / 2 e \c ttl segundos, sem nenhum percurso pelas entradas.
+class ReplyCache:
+    ## @var current
+    #  A geração atual, um dicionário {(endereço, ID da mensagem): [tipo da requisição, resposta ou \c None]}. A resposta é \c None
+    #  enquanto a requisição está sendo tratada.
+
+    ## @var previous
+    #  A geração anterior, no mesmo formato de \c current.
+
+    ## @var rotated
+    #  O instante em que a geração atual foi criada.
+
+    ## @var ttl
+    #  O tempo máximo, em segundos, durante o qual as entradas são mantidas (ver REPLY_TTL).
+
+    ## @var capacity
+    #  O número máximo de entradas.
+
+    ## @var clock
+    #  A função que retorna o instante atual, em segundos.
+
+    ## @var lock
+    #  O Lock que protege o cache.
+
+    ## O construtor padrão.
+    #  @param ttl O tempo máximo, em segundos, durante o qual as entradas são mantidas.
+    #  @param capacity O número máximo de entradas.
+    #  @param clock A função que retorna o instante atual, em segundos (ex.: eventloop.EventLoop.time).
+    def __init__(self, ttl = REPLY_TTL, capacity = REPLY_CAPACITY, clock = time.time):
+        self.current = {}
+        self.previous = {}
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self.rotated = clock()
+        self.lock = threading.Lock()
+
+    ## Verifica se uma requisição é repetida e, caso não seja, a registra como em tratamento.
+    #  @param address O endereço de quem enviou a requisição.
+    #  @param messageID O ID da requisição.
+    #  @param name O tipo da requisição.
+    #  @return Uma tupla (repetida, resposta): (\c False, \c None) para uma requisição nova, (\c True, resposta guardada) para uma
+    #  requisição repetida já respondida, e (\c True, \c None) para uma requisição repetida ainda em tratamento.
+    def check(self, address, messageID, name):
+        key = (address, messageID)
+        now = self.clock()
+        with self.lock:
+            if now - self.rotated >= self.ttl / 2 or len(self.current) >= self.capacity / 2:
+                self.previous = self.current
+                self.current = {}
+                self.rotated = now
+
+            entry = self.current.get(key) or self.previous.get(key)
+            if entry != None and entry[0] == name:
+                return (True, entry[1])
+
+            self.current[key] = [name, None]
+            return (False, None)
+
+    ## Guarda a resposta de uma requisição registrada por check().
+    #  @param address O endereço de quem enviou a requisição.
+    #  @param messageID O ID da requisição.
+    #  @param reply A resposta, como uma lista de campos.
+    def store(self, address, messageID, reply):
+        key = (address, messageID)
+        with self.lock:
+            entry = self.current.get(key) or self.previous.get(key)
+            if entry != None:
+                entry[1] = reply
+
+## O envio, o reenvio e o término das requisições de quem roda sobre um eventloop.EventLoop (ver asyncpeer.AsyncPeer e client.Client).
+#
+#  A classe que o herda deve ter os atributos loop (o eventloop.EventLoop), sock, metrics (um metrics.Metrics), wireFormats (um
+#  dicionário {endereço: wire.TEXT ou wire.BINARY}), messageID (o ID da próxima mensagem), pendingRequests (um dicionário {ID:
+#  (callback, eventloop.Timer)}), inFlight (um dicionário {ID: [endereço, mensagem codificada, tipo, prazo, tempo de retransmissão,
+#  instante do envio, reenviada]}), useRetransmission e rttEstimator (um RTTEstimator).
+class Requester:
+    ## Codifica e envia uma mensagem, no formato negociado com o destino (ver wireFormats).
+    #  @param sendMsg A mensagem, como uma lista de campos.
+    #  @param waitForReply \c True para uma requisição, e \c False para uma resposta.
+    #  @param messageID O ID da mensagem.
+    #  @param address O endereço de destino, no formato: ('ip', porta).
+    #  @return A mensagem codificada.
+    def send(self, sendMsg, waitForReply, messageID, address):
+        if not address in self.wireFormats:
+            # primeira mensagem para este endereço: pergunta se ele entende o formato binário
+            self.wireFormats[address] = wire.TEXT
+            probe = wire.encodeText(['Wire', wire.VERSION], True, self.messageID)
+            self.sock.sendto(probe, address)
+            self.metrics.messageSent('Wire', len(probe))
+            self.messageID += 1
+
+        binary = self.wireFormats[address] == wire.BINARY or sendMsg[0] in wire.BINARY_ONLY
+        data = wire.encode(sendMsg, waitForReply, messageID, binary)
+        self.sock.sendto(data, address)
+        self.metrics.messageSent(sendMsg[0], len(data))
+        return data
+
+    ## Manda uma mensagem para um endereço dado, esperando por uma resposta.
+    #  @param sendMsg A mensagem que será enviada, como uma lista de campos.
+    #  @param address O endereço de destino, no formato: ('ip', porta).
+    #  @param timeout O tempo, em segundos, de espera máximo por uma resposta.
+    #  @param callback A função que receberá a resposta (uma lista de campos), ou \c None caso ocorra timeout.
+    def sendRequest(self, sendMsg, address, timeout, callback):
+        requestID = self.messageID
+        self.messageID += 1
+        self.metrics.requestSent(requestID, sendMsg[0])
+        data = self.send(sendMsg, True, requestID, address)
+        if self.useRetransmission:
+            rto = self.rttEstimator.timeout(address)
+            self.inFlight[requestID] = [address, data, sendMsg[0], self.loop.time() + timeout, rto, self.loop.time(), False]
+            self.pendingRequests[requestID] = (callback, self.loop.callLater(min(rto, timeout), self.retransmitRequest, requestID))
+        else:
+            self.pendingRequests[requestID] = (callback, self.loop.callLater(timeout, self.completeRequest, requestID, None))
+
+    ## Reenvia uma requisição que ainda não foi respondida, dobrando o tempo de espera até o próximo reenvio, ou a completa com
+    #  timeout caso o seu prazo tenha terminado (ver peer.Peer.retransmitRequest()).
+    #  @param requestID O ID da requisição.
+    def retransmitRequest(self, requestID):
+        sent = self.inFlight.get(requestID)
+        if sent == None:
+            return
+
+        address, data, name, deadline = sent[:4]
+        now = self.loop.time()
+        if now >= deadline:
+            self.completeRequest(requestID, None)
+            return
+
+        sent[4] = min(2 * sent[4], MAX_RTO)
+        sent[6] = True
+        self.sock.sendto(data, address)
+        self.metrics.messageSent(name, len(data))
+        self.metrics.requestRetransmitted(name)
+        callback = self.pendingRequests[requestID][0]
+        self.pendingRequests[requestID] = (callback, self.loop.callLater(min(sent[4], deadline - now), self.retransmitRequest, requestID))
+
+    ## Completa uma requisição pendente, caso ela ainda esteja esperando por uma resposta.
+    #  @param requestID O ID da requisição.
+    #  @param message A mensagem de resposta (uma lista de campos), ou \c None caso tenha ocorrido timeout.
+    def completeRequest(self, requestID, message):
+        entry = self.pendingRequests.pop(requestID, None)
+        if entry == None:
+            return
+
+        callback, timer = entry
+        timer.cancel()
+        sent = self.inFlight.pop(requestID, None)
+        if sent != None and message != None and not sent[6]: # apenas as requisições que não foram reenviadas medem o RTT
+            self.rttEstimator.sample(sent[0], self.loop.time() - sent[5])
+        self.metrics.requestCompleted(requestID, message == None)
+        callback(message)
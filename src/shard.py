@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file shard.py
+#  Um Peer que usa vários núcleos: o peer e alguns processos de trabalho compartilham a mesma porta UDP (SO_REUSEPORT), e o kernel
+#  distribui os datagramas recebidos entre os seus sockets pelo endereço de quem os enviou.
+#
+#  Os processos de trabalho tratam sozinhos as pesquisas (Search), que são a maior parte do tráfego de um peer que encaminha muitas
+#  pesquisas: confirmam, respondem Found ou encaminham para o próximo salto, a partir de uma cópia do estado do anel (ID, antecessor,
+#  sucessor e finger table) que o peer envia sempre que ele muda. As demais mensagens, incluindo as respostas às requisições do peer,
+#  são repassadas ao peer junto com o endereço de quem as enviou, e tratadas como se tivessem chegado ao seu próprio socket. Assim, o
+#  estado do anel e os valores armazenados continuam tendo um único dono (o peer), e só as pesquisas são tratadas em paralelo.
+#
+#  Cada processo de trabalho envia as suas requisições (as pesquisas encaminhadas e as mensagens Found) por um socket próprio, de forma
+#  que as confirmações voltam diretamente para ele. As mensagens tratadas pelos processos de trabalho não aparecem nas métricas do peer.
+#  SO_REUSEPORT só existe no Linux (a partir do 3.9).
+
+import common, wire, retransmit
+from peer import Peer
+from snapshot import toAddress
+import socket, os, sys, time, json, select, heapq, random, threading, multiprocessing
+
+## O valor de SO_REUSEPORT no Linux, que o módulo socket do Python 2 não define.
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
+## O intervalo, em segundos, entre as verificações de mudanças no estado do anel (ver ShardedPeer.publishRing()).
+SNAPSHOT_INTERVAL = 0.1
+
+## O intervalo máximo, em segundos, entre dois envios do estado do anel para os processos de trabalho, mesmo sem mudanças (caso um
+#  datagrama com o estado tenha se perdido).
+SNAPSHOT_REFRESH = 1.0
+
+## O tempo máximo, em segundos, de espera pela confirmação de uma requisição de um processo de trabalho (o mesmo de peer.Peer.forwardMessage()).
+REQUEST_TIMEOUT = 3.0
+
+## Cria um socket UDP que compartilha o endereço com outros sockets do mesmo usuário (SO_REUSEPORT).
+#  @param address O endereço, no formato ('ip', porta).
+#  @return O socket.
+def reusableSocket(address):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind(address)
+    return sock
+
+## Uma DHT Peer cujas pesquisas são tratadas também por processos de trabalho (ver RelayWorker), na mesma porta.
+class ShardedPeer(Peer):
+    ## @var workerCount
+    #  O número de processos de trabalho.
+
+    ## @var workers
+    #  Os processos de trabalho (multiprocessing.Process).
+
+    ## @var workerAddresses
+    #  Os endereços dos sockets próprios dos processos de trabalho, os únicos dos quais internalSock aceita mensagens repassadas.
+
+    ## @var internalSock
+    #  O socket pelo qual o peer recebe as mensagens repassadas pelos processos de trabalho e envia a eles o estado do anel.
+
+    ## @var restarts
+    #  O número de processos de trabalho que morreram e foram recriados (ver superviseWorkers()).
+
+    ## O construtor padrão.
+    #  @param address O endereço de rede correspondente ao peer.
+    #  @param rendezvousAddress O endereço do rendezvous.
+    #  @param workers O número de processos de trabalho.
+    #  @param options Os demais parâmetros de peer.Peer.__init__().
+    def __init__(self, address, rendezvousAddress, workers = 2, **options):
+        Peer.__init__(self, address, rendezvousAddress, **options)
+
+        # o socket criado por Peer é trocado por um que compartilha a porta com os processos de trabalho
+        self.sock.close()
+        self.sock = reusableSocket(address)
+
+        self.internalSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.internalSock.bind((address[0], 0))
+        self.workerCount = workers
+        self.workers = []
+        self.workerAddresses = []
+        self.restarts = 0
+
+    ## Recebe as mensagens do socket do peer e as repassadas pelos processos de trabalho, na mesma thread (ver peer.Peer.receiveMessage()).
+    def saveReceivedMessages(self):
+        self.sock.settimeout(None)
+        while True:
+            readable = select.select([self.sock, self.internalSock], [], [])[0]
+            if self.sock in readable:
+                data, addressReceived = self.sock.recvfrom(common.MAX)
+                self.receiveMessage(data, addressReceived)
+
+            if self.internalSock in readable:
+                envelope, workerAddress = self.internalSock.recvfrom(common.MAX)
+                if workerAddress in self.workerAddresses:
+                    ip, port, data = envelope.split('|', 2)
+                    self.receiveMessage(data, (ip, int(port)))
+
+    ## Monta o estado do anel enviado aos processos de trabalho.
+    #  @return O estado, em JSON, ou \c None enquanto o peer ainda não entrou na DHT.
+    def ringSnapshot(self):
+        with self.lock:
+            if self.id == None or self.previousID == None or self.nextAddress == None:
+                return None
+            ring = {'id': self.id, 'previousID': self.previousID, 'previousAddress': self.previousAddress, 'nextID': self.nextID,
+                    'nextAddress': self.nextAddress, 'useFingers': self.useFingers, 'fingers': self.fingers}
+
+        # os processos de trabalho usam o formato binário com os destinos que o peer já sabe que o entendem
+        destinations = set([self.previousAddress, self.nextAddress] + [finger[1] for finger in ring['fingers'] if finger != None])
+        ring['binary'] = sorted(address for address in destinations if self.wireFormats.get(address) == wire.BINARY)
+        return json.dumps(ring, sort_keys = True)
+
+    ## Função que rodará numa thread para enviar o estado do anel aos processos de trabalho sempre que ele mudar (e a cada SNAPSHOT_REFRESH
+    #  segundos), recriando os processos de trabalho que morreram (ver superviseWorkers()).
+    def publishRing(self):
+        lastSnapshot = None
+        lastSent = 0.0
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL)
+            if self.superviseWorkers():
+                lastSnapshot = None # o novo processo só começa a tratar pesquisas quando recebe o estado do anel
+            snapshot = self.ringSnapshot()
+            if snapshot == None or (snapshot == lastSnapshot and time.time() - lastSent < SNAPSHOT_REFRESH):
+                continue
+
+            for address in self.workerAddresses:
+                self.internalSock.sendto(snapshot, address)
+            lastSnapshot = snapshot
+            lastSent = time.time()
+
+    ## Cria um processo de trabalho.
+    #  @param index A posição do processo em workers e workerAddresses (um processo que morreu é substituído na mesma posição).
+    def startWorker(self, index):
+        worker = RelayWorker(self.address, self.internalSock.getsockname(), self.useRetransmission, [self.sock, self.internalSock])
+        process = multiprocessing.Process(target = worker.run)
+        process.daemon = True
+        process.start()
+
+        workerAddress = worker.sock.getsockname()
+        worker.sock.close()
+        if index == len(self.workers):
+            self.workers.append(process)
+            self.workerAddresses.append(workerAddress)
+        else:
+            self.workers[index] = process
+            self.workerAddresses[index] = workerAddress
+
+    ## Recria os processos de trabalho que morreram. Enquanto um processo está morto, o kernel distribui os datagramas da porta
+    #  compartilhada entre os sockets que restam, então as pesquisas não se perdem, mas passam a ser tratadas por menos processos.
+    #
+    #  Os novos processos são criados depois que o peer já tem threads; como eles só usam os seus próprios sockets, nenhum lock
+    #  herdado das threads do peer é usado.
+    #
+    #  @return \c True caso algum processo tenha sido recriado.
+    def superviseWorkers(self):
+        restarted = False
+        for index, process in enumerate(list(self.workers)):
+            if not process.is_alive():
+                print >>sys.stderr, 'Worker %d of peer %s died (exit code %s), restarting it' % (index, repr(self.address), process.exitcode)
+                self.startWorker(index)
+                self.restarts += 1
+                restarted = True
+        return restarted
+
+    ## Cria os processos de trabalho e executa as funcionalidades do Peer.
+    def run(self):
+        # os processos são criados antes de qualquer thread
+        for i in range(self.workerCount):
+            self.startWorker(i)
+
+        thread_publishRing = threading.Thread(target=self.publishRing)
+        thread_publishRing.daemon = True
+        thread_publishRing.start()
+
+        Peer.run(self)
+
+## Um processo de trabalho de um ShardedPeer: trata as pesquisas que chegam à porta compartilhada e repassa as demais mensagens ao peer.
+#
+#  Tudo é feito por uma única thread, que espera pelos dois sockets e pelos prazos das requisições (ver deadlines) com select().
+class RelayWorker:
+    ## @var address
+    #  O endereço do peer, compartilhado com os processos de trabalho.
+
+    ## @var ownerAddress
+    #  O endereço de ShardedPeer.internalSock, para onde as mensagens são repassadas.
+
+    ## @var sock
+    #  O socket próprio do processo, pelo qual as requisições são enviadas e o estado do anel é recebido. É criado no processo do peer,
+    #  para que o peer saiba o seu endereço.
+
+    ## @var publicSock
+    #  O socket na porta compartilhada, ou \c None enquanto o estado do anel ainda não foi recebido.
+
+    ## @var inherited
+    #  Os sockets do peer herdados pelo processo, que são fechados assim que ele começa.
+
+    ## @var ownerPID
+    #  O PID do processo do peer. O processo de trabalho termina quando o peer morre.
+
+    ## @var id
+    #  O ID do peer, segundo o último estado do anel recebido (assim como previousID, previousAddress, nextID, nextAddress,
+    #  useFingers e fingers, ver peer.Peer).
+
+    ## @var wireFormats
+    #  Os formatos das mensagens entendidos por cada endereço (ver peer.Peer.wireFormats). Os endereços desconhecidos recebem texto.
+
+    ## @var pending
+    #  As requisições esperando pela confirmação, indexadas pelo ID da mensagem. Cada requisição é uma lista [endereço, mensagem
+    #  codificada, instante do timeout, tempo de espera até o próximo reenvio, instante do primeiro envio, \c True caso já tenha sido
+    #  reenviada, mensagem (lista de campos), endereço para onde a mensagem é enviada caso o destino não responda ou \c None].
+
+    ## @var deadlines
+    #  Um heap de tuplas (instante, ID da mensagem), com os prazos dos próximos reenvios e dos timeouts das requisições em pending.
+
+    ## @var messageID
+    #  O próximo ID de mensagem (ver peer.Peer.messageID).
+
+    ## @var useRetransmission
+    #  Caso seja \c True, as requisições são reenviadas enquanto não forem confirmadas (ver retransmit.py).
+
+    ## @var rttEstimator
+    #  O retransmit.RTTEstimator do processo.
+
+    ## @var replyCache
+    #  O retransmit.ReplyCache com as confirmações enviadas pelo processo.
+
+    ## O construtor padrão.
+    #  @param address O endereço do peer.
+    #  @param ownerAddress O endereço de ShardedPeer.internalSock.
+    #  @param useRetransmission Caso seja \c True, as requisições são reenviadas enquanto não forem confirmadas.
+    #  @param inherited Os sockets do peer, que serão fechados no processo de trabalho.
+    def __init__(self, address, ownerAddress, useRetransmission = True, inherited = []):
+        self.address = address
+        self.ownerAddress = ownerAddress
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address[0], 0))
+        self.publicSock = None
+        self.inherited = inherited
+
+        self.id = None
+        self.previousID = None
+        self.previousAddress = None
+        self.nextID = None
+        self.nextAddress = None
+        self.useFingers = True
+        self.fingers = []
+        self.ownerPID = os.getpid()
+
+        self.wireFormats = {}
+        self.pending = {}
+        self.deadlines = []
+        self.useRetransmission = useRetransmission
+        self.rttEstimator = retransmit.RTTEstimator()
+        self.replyCache = retransmit.ReplyCache()
+
+    ## Executa o processo de trabalho, até que o peer morra.
+    def run(self):
+        for sock in self.inherited:
+            sock.close()
+        self.messageID = random.randrange(2**31)
+        self.sock.setblocking(False)
+
+        while os.getppid() == self.ownerPID:
+            sockets = [self.sock] if self.publicSock == None else [self.sock, self.publicSock]
+            timeout = max(0.0, self.deadlines[0][0] - time.time()) if len(self.deadlines) > 0 else SNAPSHOT_REFRESH
+            readable = select.select(sockets, [], [], timeout)[0]
+
+            # cada socket é esvaziado antes de voltar para select()
+            if self.publicSock in readable:
+                for data, address in self.drain(self.publicSock):
+                    self.receiveMessage(data, address)
+            if self.sock in readable:
+                for data, address in self.drain(self.sock):
+                    if address == self.ownerAddress:
+                        self.applySnapshot(data)
+                    else:
+                        self.receiveReply(data, address)
+            self.expireRequests()
+
+    ## Lê todas as mensagens que já chegaram a um socket não bloqueante.
+    #  @param sock O socket.
+    #  @return Um gerador de tuplas (mensagem, endereço).
+    def drain(self, sock):
+        while True:
+            try:
+                yield sock.recvfrom(common.MAX)
+            except socket.error:
+                return
+
+    ## Aplica o estado do anel enviado pelo peer (ver ShardedPeer.ringSnapshot()), passando a escutar na porta compartilhada, caso ainda não escute.
+    #  @param data O estado, em JSON.
+    def applySnapshot(self, data):
+        ring = json.loads(data)
+        self.id = ring['id']
+        self.previousID = ring['previousID']
+        self.previousAddress = toAddress(ring['previousAddress'])
+        self.nextID = ring['nextID']
+        self.nextAddress = toAddress(ring['nextAddress'])
+        self.useFingers = ring['useFingers']
+        self.fingers = [(finger[0], toAddress(finger[1])) if finger != None else None for finger in ring['fingers']]
+        for address in ring['binary']:
+            self.wireFormats[toAddress(address)] = wire.BINARY
+
+        if self.publicSock == None:
+            self.publicSock = reusableSocket(self.address)
+            self.publicSock.setblocking(False)
+
+    ## Trata uma mensagem que chegou à porta compartilhada: as pesquisas são tratadas aqui, e as demais mensagens são repassadas ao peer.
+    #  @param data A mensagem, codificada.
+    #  @param address O endereço de quem enviou a mensagem.
+    def receiveMessage(self, data, address):
+        try:
+            willWaitForReply, msgID, fields = wire.decode(data)
+        except ValueError:
+            willWaitForReply = None
+
+        if willWaitForReply != True or fields[0] != 'Search':
+            self.sock.sendto('%s|%d|' % address + data, self.ownerAddress)
+            return
+
+        try:
+            keySearch = int(fields[1])
+            addressSearching = common.parseAddress(fields[2])
+            queryID = int(fields[3])
+            hops = int(fields[4]) if len(fields) > 4 else 0
+        except (ValueError, IndexError, TypeError):
+            return # uma pesquisa mal formada é descartada, ao invés de derrubar o processo
+
+        if wire.isBinary(data):
+            self.wireFormats[address] = wire.BINARY
+
+        # a pesquisa é confirmada assim que chega, e uma pesquisa repetida só recebe a confirmação de novo (ver peer.Peer.receiveMessage())
+        duplicate, reply = self.replyCache.check(address, msgID, 'Search')
+        if not duplicate:
+            self.replyCache.store(address, msgID, ['Searching'])
+        self.publicSock.sendto(wire.encode(['Searching'], False, msgID, self.wireFormats.get(address) == wire.BINARY), address)
+        if duplicate:
+            return
+
+        if common.inInterval(keySearch, self.previousID, self.id):
+            self.startRequest(['Found', queryID, self.address, self.id, hops, self.previousID], addressSearching, None)
+        else:
+            nextAddress = self.nextHop(keySearch)
+            self.startRequest(['Search', keySearch, addressSearching, queryID, hops + 1], nextAddress,
+                              self.nextAddress if nextAddress != self.nextAddress else None)
+
+    ## Trata uma mensagem que chegou ao socket próprio do processo: as confirmações das requisições e as perguntas pelo formato das mensagens.
+    #  @param data A mensagem, codificada.
+    #  @param address O endereço de quem enviou a mensagem.
+    def receiveReply(self, data, address):
+        try:
+            willWaitForReply, msgID, fields = wire.decode(data)
+        except ValueError:
+            return
+
+        if wire.isBinary(data) or fields[0] == 'Wire':
+            self.wireFormats[address] = wire.BINARY
+
+        if willWaitForReply == True and fields[0] == 'Wire':
+            self.sock.sendto(wire.encodeText(['Wire', wire.VERSION], False, msgID), address)
+        elif willWaitForReply == False:
+            sent = self.pending.pop(msgID, None)
+            if sent != None and not sent[5]: # apenas as requisições que não foram reenviadas medem o RTT
+                self.rttEstimator.sample(address, time.time() - sent[4])
+
+    ## Escolhe o endereço do próximo salto de uma pesquisa, da mesma forma que peer.Peer.nextHop().
+    #  @param key A chave pesquisada.
+    #  @return O endereço do próximo peer.
+    def nextHop(self, key):
+        if not self.useFingers:
+            return self.previousAddress if self.id > key else self.nextAddress
+
+        if common.inInterval(key, self.id, self.nextID):
+            return self.nextAddress
+
+        fingerAddress = common.closestPrecedingFinger(self.id, key, self.fingers)
+        return fingerAddress if fingerAddress != None else self.nextAddress
+
+    ## Envia uma requisição pelo socket próprio do processo, que será reenviada até ser confirmada ou até REQUEST_TIMEOUT segundos.
+    #  @param message A requisição, como uma lista de campos.
+    #  @param address O endereço de destino.
+    #  @param fallbackAddress O endereço para onde a requisição é enviada caso o destino não responda (como em peer.Peer.forwardMessage()), ou \c None.
+    def startRequest(self, message, address, fallbackAddress):
+        requestID = self.messageID
+        self.messageID += 1
+        data = wire.encode(message, True, requestID, self.wireFormats.get(address) == wire.BINARY)
+
+        now = time.time()
+        rto = self.rttEstimator.timeout(address) if self.useRetransmission else REQUEST_TIMEOUT
+        self.pending[requestID] = [address, data, now + REQUEST_TIMEOUT, rto, now, False, message, fallbackAddress]
+        heapq.heappush(self.deadlines, (now + min(rto, REQUEST_TIMEOUT), requestID))
+        self.sock.sendto(data, address)
+
+    ## Reenvia as requisições cujos prazos de reenvio chegaram, e descarta as que deram timeout.
+    def expireRequests(self):
+        now = time.time()
+        while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+            requestID = heapq.heappop(self.deadlines)[1]
+            sent = self.pending.get(requestID)
+            if sent == None: # já confirmada
+                continue
+
+            if sent[2] > now:
+                sent[3] = min(2 * sent[3], retransmit.MAX_RTO)
+                sent[5] = True
+                self.sock.sendto(sent[1], sent[0])
+                heapq.heappush(self.deadlines, (min(now + sent[3], sent[2]), requestID))
+                continue
+
+            del self.pending[requestID]
+            if sent[7] != None: # o finger escolhido não respondeu: a pesquisa é encaminhada para o sucessor
+                self.startRequest(sent[6], sent[7], None)
+
+if __name__ == '__main__':
+    if len(sys.argv) in (6, 7, 8):
+        peer = ShardedPeer((sys.argv[1], int(sys.argv[2])), (sys.argv[3], int(sys.argv[4])), int(sys.argv[5]),
+                           storagePath = sys.argv[6] if len(sys.argv) >= 7 else None, metricsPath = sys.argv[7] if len(sys.argv) == 8 else None)
+        peer.run()
+    else:
+        print >>sys.stderr, 'usage: shard.py ip_address port rendezvous_ip_address rendezvous_port workers [storage_file [metrics_file]]'
+        sys.exit(1)
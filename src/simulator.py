@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file simulator.py
+#  Um simulador que roda um Rendezvous e centenas ou milhares de peers (asyncpeer.AsyncPeer) em um único processo, sobre uma rede
+#  em memória, com latência, perda e reordenação configuráveis.
+#
+#  O simulador é de eventos discretos: SimulatedLoop é um eventloop.EventLoop cujo relógio é virtual e avança direto para o próximo
+#  temporizador, de forma que segundos de DHT são simulados em milissegundos e, com a mesma semente, toda execução produz os mesmos
+#  resultados. Os peers e o rendezvous são os mesmos que rodam sobre UDP; apenas os sockets (ver SimulatedSocket) são trocados,
+#  por meio de eventloop.EventLoop.createSocket(). O peer com threads (peer.Peer) usa sockets bloqueantes e não roda no simulador.
+
+import eventloop, wire
+from asyncpeer import AsyncPeer, AsyncRendezvous
+import collections, heapq, random, socket, errno, os, shutil, tempfile
+
+## O tamanho máximo de um datagrama UDP sobre IPv4, acima do qual SimulatedSocket.sendto() falha, como um socket real.
+MAX_DATAGRAM = 65507
+
+## O endereço do Rendezvous das simulações.
+RENDEZVOUS_ADDRESS = ('10.0.0.1', 1086)
+
+## Um eventloop.EventLoop com relógio virtual, que executa os temporizadores em ordem sem esperar por eles.
+#
+#  Os sockets registrados com addReader() são SimulatedSockets, que chamam o callback quando um datagrama é entregue pela
+#  Network, ela mesma por meio de temporizadores deste laço.
+class SimulatedLoop(eventloop.EventLoop):
+    ## @var now
+    #  O instante atual do relógio virtual, em segundos (começa em 0).
+
+    ## @var network
+    #  A Network em que os sockets criados por createSocket() são ligados.
+
+    ## O construtor padrão.
+    def __init__(self):
+        self.readers = {}
+        self.timers = []
+        self.timerSequence = 0
+        self.poller = None
+        self.running = False
+        self.now = 0.0
+        self.network = None
+
+    ## Retorna o instante atual do relógio virtual, em segundos.
+    def time(self):
+        return self.now
+
+    ## Cria um SimulatedSocket ligado a um endereço da rede em memória.
+    #  @param address O endereço, no formato ('ip', porta).
+    #  @return O socket.
+    def createSocket(self, address):
+        return self.network.bind(address)
+
+    ## Registra um SimulatedSocket no laço (ver eventloop.EventLoop.addReader()).
+    #  @param sock O socket.
+    #  @param callback A função que será chamada, sem argumentos, quando houver datagramas para serem lidos do socket.
+    def addReader(self, sock, callback):
+        sock.onReadable = callback
+
+    ## Remove um SimulatedSocket do laço.
+    #  @param sock O socket.
+    def removeReader(self, sock):
+        sock.onReadable = None
+
+    ## Executa os temporizadores, em ordem, até o instante \c when (ou até stop() ser chamado), avançando o relógio virtual.
+    #  @param when O instante final, em segundos do relógio virtual.
+    def runUntil(self, when):
+        self.running = True
+        while self.running and len(self.timers) > 0:
+            timer = self.timers[0]
+            if timer.cancelled:
+                heapq.heappop(self.timers)
+                continue
+            if timer.when > when:
+                break
+
+            heapq.heappop(self.timers)
+            self.now = max(self.now, timer.when)
+            timer.callback(*timer.args)
+
+        if self.running:
+            self.now = max(self.now, when)
+        self.running = False
+
+    ## Executa os temporizadores dos próximos segundos do relógio virtual.
+    #  @param seconds O tempo, em segundos, que será simulado.
+    def runFor(self, seconds):
+        self.runUntil(self.now + seconds)
+
+    ## Executa o laço até que stop() seja chamado ou não haja mais temporizadores.
+    def run(self):
+        self.runUntil(float('inf'))
+
+## A rede em memória, que entrega os datagramas entre os SimulatedSockets depois de um atraso.
+#
+#  Cada datagrama leva \c latency segundos, mais um atraso aleatório de até \c jitter segundos, e é descartado com probabilidade
+#  \c loss. Com probabilidade \c reorder, um datagrama é segurado por até \c reorderDelay segundos a mais, chegando depois de
+#  datagramas enviados após ele. Os datagramas enviados são contados pelo tipo da mensagem (ver messageName()).
+class Network:
+    ## @var loop
+    #  O SimulatedLoop da rede.
+
+    ## @var latency
+    #  O atraso mínimo de cada datagrama, em segundos.
+
+    ## @var jitter
+    #  O atraso aleatório máximo somado a \c latency, em segundos.
+
+    ## @var loss
+    #  A probabilidade de um datagrama ser descartado.
+
+    ## @var reorder
+    #  A probabilidade de um datagrama ser segurado por até \c reorderDelay segundos a mais.
+
+    ## @var reorderDelay
+    #  O atraso máximo, em segundos, dos datagramas segurados.
+
+    ## @var random
+    #  O random.Random da rede, com a semente dada ao construtor.
+
+    ## @var sockets
+    #  Um dicionário {endereço: SimulatedSocket} com os sockets ligados.
+
+    ## @var sent
+    #  Um collections.Counter com o número de datagramas enviados por tipo de mensagem.
+
+    ## @var bytesSent
+    #  O número de bytes enviados.
+
+    ## @var dropped
+    #  O número de datagramas descartados (pela perda ou por não haver um socket no destino).
+
+    ## O construtor padrão.
+    #  @param loop O SimulatedLoop da rede.
+    #  @param latency O atraso mínimo de cada datagrama, em segundos.
+    #  @param jitter O atraso aleatório máximo somado a \c latency, em segundos.
+    #  @param loss A probabilidade de um datagrama ser descartado.
+    #  @param reorder A probabilidade de um datagrama ser segurado por mais tempo.
+    #  @param reorderDelay O atraso máximo, em segundos, dos datagramas segurados.
+    #  @param seed A semente dos sorteios da rede.
+    def __init__(self, loop, latency = 0.001, jitter = 0.0, loss = 0.0, reorder = 0.0, reorderDelay = 0.05, seed = 0):
+        self.loop = loop
+        loop.network = self
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.reorderDelay = reorderDelay
+        self.random = random.Random(seed)
+        self.sockets = {}
+        self.sent = collections.Counter()
+        self.bytesSent = 0
+        self.dropped = 0
+
+    ## Cria um socket ligado a um endereço.
+    #  @param address O endereço, no formato ('ip', porta).
+    #  @return O SimulatedSocket.
+    #  @throw socket.error Caso o endereço já esteja em uso.
+    def bind(self, address):
+        if address in self.sockets:
+            raise socket.error(errno.EADDRINUSE, 'Address already in use')
+        sock = SimulatedSocket(self, address)
+        self.sockets[address] = sock
+        return sock
+
+    ## Envia um datagrama, agendando a sua entrega.
+    #  @param source O endereço de origem.
+    #  @param data O datagrama.
+    #  @param destination O endereço de destino.
+    def send(self, source, data, destination):
+        self.sent[messageName(data)] += 1
+        self.bytesSent += len(data)
+        if self.loss > 0 and self.random.random() < self.loss:
+            self.dropped += 1
+            return
+
+        delay = self.latency
+        if self.jitter > 0:
+            delay += self.random.uniform(0, self.jitter)
+        if self.reorder > 0 and self.random.random() < self.reorder:
+            delay += self.random.uniform(0, self.reorderDelay)
+        self.loop.callLater(delay, self.deliver, source, data, destination)
+
+    ## Entrega um datagrama ao socket de destino, caso ele ainda exista.
+    #  @param source O endereço de origem.
+    #  @param data O datagrama.
+    #  @param destination O endereço de destino.
+    def deliver(self, source, data, destination):
+        sock = self.sockets.get(destination)
+        if sock == None:
+            self.dropped += 1
+            return
+        sock.receive(data, source)
+
+    ## Retorna o número total de datagramas enviados.
+    def totalSent(self):
+        return sum(self.sent.values())
+
+## Retorna o tipo de uma mensagem (o seu primeiro campo, ex.: Search), usado para contar os datagramas enviados.
+#  @param data A mensagem, em qualquer um dos formatos de wire.py.
+def messageName(data):
+    try:
+        return wire.decode(data)[2][0]
+    except (ValueError, IndexError):
+        return '?'
+
+## Um socket UDP da rede em memória, com a mesma interface (não bloqueante) usada pelos AsyncPeer e pelo AsyncRendezvous.
+class SimulatedSocket:
+    ## @var network
+    #  A Network do socket.
+
+    ## @var address
+    #  O endereço do socket.
+
+    ## @var inbox
+    #  Um deque com os datagramas recebidos e ainda não lidos, tuplas (dados, endereço de origem).
+
+    ## @var onReadable
+    #  A função chamada quando um datagrama é recebido (ver SimulatedLoop.addReader()), ou \c None.
+
+    ## @var crashed
+    #  \c True depois de crash(): o socket não envia nem recebe mais nada, sem erros para quem o usa.
+
+    ## @var closed
+    #  \c True depois de close().
+
+    ## O construtor padrão.
+    #  @param network A Network do socket.
+    #  @param address O endereço do socket.
+    def __init__(self, network, address):
+        self.network = network
+        self.address = address
+        self.inbox = collections.deque()
+        self.onReadable = None
+        self.crashed = False
+        self.closed = False
+
+    def setblocking(self, flag):
+        pass
+
+    def settimeout(self, timeout):
+        pass
+
+    def getsockname(self):
+        return self.address
+
+    ## Envia um datagrama.
+    #  @param data O datagrama.
+    #  @param address O endereço de destino.
+    #  @throw socket.error Caso o socket esteja fechado ou o datagrama seja maior que MAX_DATAGRAM.
+    def sendto(self, data, address):
+        if self.closed:
+            raise socket.error(errno.EBADF, 'Bad file descriptor')
+        if len(data) > MAX_DATAGRAM:
+            raise socket.error(errno.EMSGSIZE, 'Message too long')
+        if not self.crashed:
+            self.network.send(self.address, data, address)
+
+    ## Lê o próximo datagrama recebido.
+    #  @param maxSize O tamanho máximo do datagrama (ignorado).
+    #  @return Uma tupla (dados, endereço de origem).
+    #  @throw socket.error Com errno.EAGAIN, caso não haja datagramas (como um socket não bloqueante).
+    def recvfrom(self, maxSize):
+        if len(self.inbox) == 0:
+            raise socket.error(errno.EAGAIN, 'Resource temporarily unavailable')
+        return self.inbox.popleft()
+
+    ## Recebe um datagrama entregue pela rede.
+    #  @param data O datagrama.
+    #  @param source O endereço de origem.
+    def receive(self, data, source):
+        self.inbox.append((data, source))
+        if self.onReadable != None:
+            self.onReadable()
+
+    ## Simula a queda do processo dono do socket: o endereço deixa de existir na rede, e os envios seguintes são descartados.
+    def crash(self):
+        self.crashed = True
+        self.inbox.clear()
+        self.network.sockets.pop(self.address, None)
+
+    ## Fecha o socket, liberando o endereço.
+    def close(self):
+        self.crash()
+        self.closed = True
+
+## Uma simulação: um SimulatedLoop, uma Network, um AsyncRendezvous e os peers, com as operações usadas pelos benchmarks.
+#
+#  Os sorteios do Rendezvous (IDs) e dos benchmarks usam o módulo random, cuja semente é definida pelo construtor; os da rede usam
+#  o random.Random da Network. Os arquivos de log dos peers ficam em um diretório temporário, removido por close().
+class Simulation:
+    ## @var loop
+    #  O SimulatedLoop.
+
+    ## @var network
+    #  A Network.
+
+    ## @var rendezvous
+    #  O asyncpeer.AsyncRendezvous.
+
+    ## @var peers
+    #  A lista dos peers vivos (AsyncPeer), na ordem em que foram criados.
+
+    ## @var peerOptions
+    #  Os argumentos nomeados passados ao construtor de cada AsyncPeer.
+
+    ## @var nextPeer
+    #  O número do próximo peer criado, usado para calcular o seu endereço.
+
+    ## @var storageDirectory
+    #  O diretório temporário com os arquivos de log dos peers.
+
+    ## O construtor padrão.
+    #  @param K O número máximo de nós na rede.
+    #  @param method O método de distribuição dos IDs (1 ou 2).
+    #  @param seed A semente dos sorteios da simulação.
+    #  @param networkOptions Os argumentos nomeados passados à Network (latency, jitter, loss, reorder, reorderDelay).
+    #  @param peerOptions Os argumentos nomeados passados a cada AsyncPeer (ex.: useFingers, neighbourListSize).
+    def __init__(self, K, method, seed = 0, networkOptions = {}, peerOptions = {}):
+        random.seed(seed)
+        self.loop = SimulatedLoop()
+        self.network = Network(self.loop, seed = seed, **networkOptions)
+        self.rendezvous = AsyncRendezvous(self.loop, RENDEZVOUS_ADDRESS, K, method, None)
+        self.rendezvous.start()
+        self.peers = []
+        self.peerOptions = peerOptions
+        self.nextPeer = 0
+        self.storageDirectory = tempfile.mkdtemp(prefix = 'dht-simulation-')
+
+    ## Cria um peer (ainda não iniciado) com o próximo endereço livre.
+    #  @return O AsyncPeer.
+    def createPeer(self):
+        i = self.nextPeer
+        self.nextPeer += 1
+        address = ('10.%d.%d.%d' % (1 + (i >> 16 & 255), i >> 8 & 255, i & 255), 3000)
+        return AsyncPeer(self.loop, address, RENDEZVOUS_ADDRESS, storagePath = os.path.join(self.storageDirectory, 'dht-%s-%d.log' % address),
+                         **self.peerOptions)
+
+    ## Coloca novos peers na DHT, um após o outro (como asyncpeer.startPeers()).
+    #
+    #  Cada peer começa a entrar quando o anterior termina ou, caso ele não consiga (ex.: com perda de mensagens), depois de
+    #  \c peerTimeout segundos; os peers que não entraram são derrubados (ver crash()).
+    #
+    #  @param count O número de peers.
+    #  @param peerTimeout O tempo máximo, em segundos do relógio virtual, de espera pela entrada de cada peer.
+    #  @return Uma tupla (tempo, em segundos do relógio virtual, até o fim das entradas, número de peers que entraram).
+    def join(self, count, peerTimeout = 30.0):
+        start = self.loop.time()
+        peers = []
+
+        def startNext(previous = None):
+            if previous != None and previous is not peers[-1]:
+                return # o temporizador de um peer que já entrou, ou a entrada de um peer que já foi abandonado
+            if len(peers) == count:
+                self.loop.stop()
+                return
+
+            peer = self.createPeer()
+            peers.append(peer)
+            self.peers.append(peer)
+            peer.start(lambda: startNext(peer))
+            self.loop.callLater(peerTimeout, lambda: startNext(peer) if not peer.joined else None)
+
+        startNext()
+        self.loop.run()
+        self.crash([peer for peer in peers if not peer.joined])
+        return (self.loop.time() - start, sum(1 for peer in peers if peer.joined))
+
+    ## Derruba peers, que param de enviar e de receber mensagens sem avisar ninguém.
+    #  @param peers Os peers.
+    def crash(self, peers):
+        for peer in peers:
+            peer.sock.crash()
+            self.peers.remove(peer)
+
+    ## Roda a simulação até que uma condição seja verdadeira, verificando-a a cada \c interval segundos do relógio virtual.
+    #  @param condition Uma função, sem argumentos, que retorna \c True quando a espera deve terminar.
+    #  @param timeout O tempo máximo de espera, em segundos do relógio virtual.
+    #  @param interval O intervalo entre as verificações, em segundos do relógio virtual.
+    #  @return O tempo, em segundos do relógio virtual, até a condição ser verdadeira, ou \c None caso o tempo máximo seja atingido.
+    def waitFor(self, condition, timeout, interval = 0.05):
+        start = self.loop.time()
+        while not condition():
+            if self.loop.time() - start >= timeout:
+                return None
+            self.loop.runFor(interval)
+        return self.loop.time() - start
+
+    ## Verifica se os ponteiros de todos os peers vivos (nextID e previousID) e o registro do Rendezvous correspondem ao anel dos peers vivos.
+    def consistent(self):
+        ids = sorted(peer.id for peer in self.peers)
+        byID = dict((peer.id, peer) for peer in self.peers)
+        for i, id in enumerate(ids):
+            if byID[id].nextID != ids[(i + 1) % len(ids)] or byID[id].previousID != ids[i - 1]:
+                return False
+        return self.rendezvous.ring == ids
+
+    ## Faz várias pesquisas, ao mesmo tempo, a partir de peers e de chaves sorteados, sem o cache de responsáveis.
+    #
+    #  @param count O número de pesquisas.
+    #  @param timeout O tempo máximo de cada pesquisa, em segundos do relógio virtual.
+    #  @return Uma lista de tuplas (correta, saltos, latência em segundos do relógio virtual), com \c None nos dois últimos campos das
+    #  pesquisas sem resposta. Uma pesquisa é correta quando o responsável encontrado é o peer vivo responsável pela chave.
+    def lookups(self, count, timeout = 10.0):
+        results = []
+
+        def onFound(key, start, result):
+            if result == None:
+                results.append((False, None, None))
+            else:
+                owner = [peer for peer in self.peers if peer.isResponsible(key)]
+                results.append((len(owner) == 1 and owner[0].id == result[0], result[2], self.loop.time() - start))
+            if len(results) == count:
+                self.loop.stop()
+
+        for i in range(count):
+            peer = random.choice(self.peers)
+            key = peer.hashKey('key-%d' % random.randint(0, 2**31))
+            peer.lookup(key, lambda result, key = key, start = self.loop.time(): onFound(key, start, result), timeout, False)
+
+        self.loop.runFor(timeout + 1.0)
+        return results
+
+    ## Remove o diretório temporário com os arquivos de log dos peers.
+    def close(self):
+        for peer in self.peers:
+            if peer.store != None:
+                peer.store.close()
+        shutil.rmtree(self.storageDirectory, True)
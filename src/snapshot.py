@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file snapshot.py
+#  Os arquivos de estado usados para reiniciar rapidamente um peer (ver peer.Peer.snapshotPath) ou o Rendezvous
+#  (ver rendezvous.Rendezvous.snapshotPath).
+#
+#  O estado é um dicionário convertido para JSON, escrito em um arquivo temporário que então substitui o anterior, de forma que um
+#  processo interrompido durante a escrita deixa o arquivo anterior intacto. Como o JSON não tem tuplas, os endereços voltam como
+#  listas, e são convertidos com toAddress().
+
+import json, os
+
+## O intervalo, em segundos, entre duas escritas do estado (que só são feitas quando ele muda).
+INTERVAL = 5.0
+
+## Escreve o estado em um arquivo, caso ele tenha mudado desde a última escrita.
+#
+#  @param path O caminho do arquivo.
+#  @param state O estado (um dicionário que pode ser convertido para JSON).
+#  @param previous O estado escrito da última vez, como retornado por save(), ou \c None.
+#  @return O estado escrito, em JSON.
+def save(path, state, previous = None):
+    data = json.dumps(state, sort_keys = True)
+    if data != previous:
+        temporaryPath = path + '.tmp'
+        with open(temporaryPath, 'wb') as snapshotFile:
+            snapshotFile.write(data)
+            snapshotFile.flush()
+            os.fsync(snapshotFile.fileno())
+        os.rename(temporaryPath, path)
+    return data
+
+## Lê o estado escrito por save().
+#  @param path O caminho do arquivo.
+#  @return O estado, ou \c None caso o arquivo não exista ou esteja corrompido.
+def load(path):
+    try:
+        with open(path, 'rb') as snapshotFile:
+            state = json.load(snapshotFile)
+    except (IOError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
+
+## Converte um endereço lido de um estado para o formato ('ip', porta).
+#  @param value O endereço, como uma lista [ip, porta], ou \c None.
+def toAddress(value):
+    return (str(value[0]), int(value[1])) if value != None else None
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import common
+import os, mmap, struct, threading, time, zlib
+
+## O cabeçalho de cada registro do log: CRC32 (do restante do registro), tipo do registro, tamanho da chave e tamanho do valor.
+RECORD = struct.Struct('!IBHI')
+
+## Registro que associa um valor a uma chave.
+PUT = 1
+
+## Registro que remove uma chave.
+DELETE = 2
+
+## O número mínimo de bytes de registros obsoletos no log para que a compactação seja feita (ver LogStore.needsCompaction()).
+COMPACTION_MIN_GARBAGE = 1 << 20
+
+## O tempo, em segundos, depois do qual um valor que ainda não recebeu todos os seus pedaços é descartado (ver handleRequest()).
+TRANSFER_TIMEOUT = 60.0
+
+## O número máximo de pedaços de um valor (ver common.MAX_VALUE).
+MAX_CHUNKS = (common.MAX_VALUE + common.MAX_CHUNK - 1) // common.MAX_CHUNK
+
+## Um armazenamento de pares chave/valor em um único arquivo de log, em que os registros só são adicionados ao final.
+#
+#  Cada put() ou delete() adiciona um registro ao final do log, e um índice em memória guarda, para cada chave, a posição do seu
+#  valor mais recente no arquivo. As leituras são feitas por um mmap do arquivo, sem cópias além do valor retornado.
+#
+#  Valores sobrescritos e chaves removidas deixam registros obsoletos no log, que são descartados por compact(): os registros
+#  válidos são copiados para um novo arquivo, que substitui o anterior. A cópia é feita sem bloquear as outras operações,
+#  que só esperam pela troca dos arquivos no final.
+#
+#  Ao abrir um log existente, o índice é reconstruído lendo todos os registros. Um registro incompleto ou corrompido no final do
+#  arquivo (ex.: o processo foi interrompido durante uma escrita) é descartado.
+class LogStore:
+    ## @var path
+    #  O caminho do arquivo de log.
+
+    ## @var file
+    #  O arquivo de log, aberto para adicionar registros ao final.
+
+    ## @var map
+    #  O mmap (somente leitura) do arquivo de log, ou \c None caso o arquivo esteja vazio. É refeito quando o arquivo cresce além dele.
+
+    ## @var index
+    #  Um dicionário, indexado pela chave, contendo tuplas (posição do valor no arquivo, tamanho do valor).
+
+    ## @var size
+    #  O tamanho, em bytes, do arquivo de log.
+
+    ## @var garbage
+    #  O número de bytes do log ocupados por registros obsoletos.
+
+    ## @var lock
+    #  O Lock que protege o índice e o arquivo.
+
+    ## @var compactionLock
+    #  O Lock que impede que duas compactações sejam feitas ao mesmo tempo.
+
+    ## @var tree
+    #  A merkle.MerkleTree com as chaves armazenadas, atualizada a cada registro adicionado, ou \c None. A compactação não a altera,
+    #  pois os registros copiados mantêm os seus CRCs.
+
+    ## O construtor padrão. Abre (ou cria) o arquivo de log e reconstrói o índice.
+    #  @param path O caminho do arquivo de log.
+    #  @param tree Uma merkle.MerkleTree vazia, que passará a conter as chaves armazenadas, ou \c None.
+    def __init__(self, path, tree = None):
+        self.path = path
+        self.tree = tree
+        self.lock = threading.Lock()
+        self.compactionLock = threading.Lock()
+        self.map = None
+        self.open()
+
+    ## Abre o arquivo de log e reconstrói o índice a partir dos registros.
+    def open(self):
+        self.file = open(self.path, 'a+b')
+        self.index = {}
+        self.garbage = 0
+        self.size = os.path.getsize(self.path)
+        self.remap()
+
+        offset = 0
+        while offset < self.size:
+            record = self.parseRecord(self.map, offset, self.size)
+            if record == None:
+                # registro incompleto ou corrompido: o restante do arquivo é descartado
+                self.file.truncate(offset)
+                self.size = offset
+                self.remap()
+                break
+
+            kind, key, valueOffset, valueLength, end = record
+            self.applyRecord(self.index, kind, key, valueOffset, valueLength, end - offset)
+            offset = end
+
+        if self.tree != None:
+            for key, (valueOffset, valueLength) in self.index.iteritems():
+                self.tree.update(key, struct.unpack_from('!I', self.map, valueOffset - len(key) - RECORD.size)[0])
+
+    ## Refaz o mmap do arquivo de log, para que ele inclua os registros adicionados desde o último mmap.
+    def remap(self):
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else None
+
+    ## Lê um registro do log.
+    #
+    #  @param data O conteúdo do log (ex.: o mmap do arquivo).
+    #  @param offset A posição do registro.
+    #  @param end O fim da região válida de \c data.
+    #  @return Uma tupla (tipo, chave, posição do valor, tamanho do valor, posição seguinte ao registro), ou \c None caso o registro
+    #  esteja incompleto ou corrompido.
+    def parseRecord(self, data, offset, end):
+        if offset + RECORD.size > end:
+            return None
+
+        crc, kind, keyLength, valueLength = RECORD.unpack_from(data, offset)
+        keyOffset = offset + RECORD.size
+        valueOffset = keyOffset + keyLength
+        recordEnd = valueOffset + valueLength
+        if kind not in (PUT, DELETE) or recordEnd > end:
+            return None
+        if zlib.crc32(data[offset + 4:recordEnd]) & 0xFFFFFFFF != crc:
+            return None
+        return kind, data[keyOffset:valueOffset], valueOffset, valueLength, recordEnd
+
+    ## Aplica um registro a um índice, contabilizando os registros que se tornaram obsoletos em garbage.
+    #
+    #  @param index O índice.
+    #  @param kind O tipo do registro (PUT ou DELETE).
+    #  @param key A chave do registro.
+    #  @param valueOffset A posição do valor no arquivo.
+    #  @param valueLength O tamanho do valor.
+    #  @param recordLength O tamanho do registro inteiro.
+    def applyRecord(self, index, kind, key, valueOffset, valueLength, recordLength):
+        previous = index.pop(key, None)
+        if previous != None:
+            self.garbage += RECORD.size + len(key) + previous[1]
+
+        if kind == PUT:
+            index[key] = (valueOffset, valueLength)
+        else:
+            self.garbage += recordLength
+
+    ## Codifica um registro.
+    #  @param kind O tipo do registro (PUT ou DELETE).
+    #  @param key A chave.
+    #  @param value O valor (uma string vazia para DELETE).
+    #  @return O registro (uma string).
+    def encodeRecord(self, kind, key, value):
+        body = RECORD.pack(0, kind, len(key), len(value))[4:] + key + value
+        return struct.pack('!I', zlib.crc32(body) & 0xFFFFFFFF) + body
+
+    ## Adiciona um registro ao final do log e o aplica ao índice. Precisa ser chamada com o lock.
+    #  @param kind O tipo do registro (PUT ou DELETE).
+    #  @param key A chave.
+    #  @param value O valor.
+    def append(self, kind, key, value):
+        record = self.encodeRecord(kind, key, value)
+        self.file.write(record)
+        self.file.flush()
+        self.applyRecord(self.index, kind, key, self.size + RECORD.size + len(key), len(value), len(record))
+        self.size += len(record)
+        if self.tree != None:
+            self.tree.update(key, struct.unpack_from('!I', record)[0] if kind == PUT else None)
+
+    ## Lê uma região do log, refazendo o mmap caso ela tenha sido escrita depois dele. Precisa ser chamada com o lock.
+    #  @param offset A posição da região.
+    #  @param length O tamanho da região.
+    def read(self, offset, length):
+        if self.map == None or offset + length > len(self.map):
+            self.remap()
+        return self.map[offset:offset + length]
+
+    ## Associa um valor a uma chave.
+    #  @param key A chave (uma string de até 65535 bytes).
+    #  @param value O valor (uma string).
+    def put(self, key, value):
+        if len(key) > 0xFFFF:
+            raise ValueError('key too long (%d bytes)' % len(key))
+        with self.lock:
+            self.append(PUT, key, value)
+
+    ## Associa um valor a uma chave, caso ela ainda não exista.
+    #  @param key A chave (uma string de até 65535 bytes).
+    #  @param value O valor (uma string).
+    #  @return \c True caso o valor tenha sido gravado, e \c False caso a chave já existisse.
+    def putIfAbsent(self, key, value):
+        if len(key) > 0xFFFF:
+            raise ValueError('key too long (%d bytes)' % len(key))
+        with self.lock:
+            if key in self.index:
+                return False
+            self.append(PUT, key, value)
+            return True
+
+    ## Retorna o valor associado a uma chave.
+    #  @param key A chave.
+    #  @return O valor, ou \c None caso a chave não exista.
+    def get(self, key):
+        with self.lock:
+            entry = self.index.get(key)
+            return self.read(entry[0], entry[1]) if entry != None else None
+
+    ## Lê um trecho do valor associado a uma chave (ex.: um pedaço de um valor maior do que um datagrama).
+    #
+    #  @param key A chave.
+    #  @param start A posição do trecho dentro do valor.
+    #  @param length O tamanho máximo do trecho.
+    #  @return Uma tupla (trecho, tamanho total do valor, versão), ou \c None caso a chave não exista. A versão muda sempre que o
+    #  valor é sobrescrito, o que permite verificar se trechos lidos em momentos diferentes pertencem ao mesmo valor.
+    def readRange(self, key, start, length):
+        with self.lock:
+            entry = self.index.get(key)
+            if entry == None:
+                return None
+            valueOffset, valueLength = entry
+            start = max(0, min(start, valueLength))
+            return self.read(valueOffset + start, min(length, valueLength - start)), valueLength, valueOffset
+
+    ## Remove uma chave.
+    #  @param key A chave.
+    #  @return \c True caso a chave existisse, e \c False caso contrário.
+    def delete(self, key):
+        with self.lock:
+            if not key in self.index:
+                return False
+            self.append(DELETE, key, '')
+            return True
+
+    ## Retorna o número de chaves armazenadas.
+    def __len__(self):
+        return len(self.index)
+
+    ## Retorna uma lista com as chaves armazenadas.
+    def keys(self):
+        with self.lock:
+            return self.index.keys()
+
+    ## Verifica se há registros obsoletos suficientes no log para que valha a pena compactá-lo.
+    def needsCompaction(self):
+        return self.garbage >= COMPACTION_MIN_GARBAGE and 2 * self.garbage >= self.size
+
+    ## Compacta o log, descartando os registros obsoletos.
+    #
+    #  Os valores mais recentes de cada chave são copiados para um novo arquivo a partir de uma cópia do índice, sem o lock:
+    #  como o log só cresce, a região já escrita não muda durante a cópia. No final, com o lock, os registros adicionados durante a
+    #  cópia também são copiados, e o novo arquivo substitui o anterior.
+    #
+    #  Caso outra compactação esteja em andamento, não faz nada.
+    def compact(self):
+        if not self.compactionLock.acquire(False):
+            return
+        try:
+            self.compactLog()
+        finally:
+            self.compactionLock.release()
+
+    ## Faz a compactação do log (ver compact()).
+    def compactLog(self):
+        with self.lock:
+            snapshot = dict(self.index)
+            snapshotSize = self.size
+            if self.map == None or len(self.map) < self.size:
+                self.remap()
+            source = self.map
+
+        compactPath = self.path + '.compact'
+        out = open(compactPath, 'wb')
+        index = {}
+        offset = 0
+        for key, (valueOffset, valueLength) in snapshot.iteritems():
+            record = self.encodeRecord(PUT, key, source[valueOffset:valueOffset + valueLength])
+            out.write(record)
+            index[key] = (offset + RECORD.size + len(key), valueLength)
+            offset += len(record)
+
+        with self.lock:
+            self.garbage = 0
+            if self.size > snapshotSize:
+                tail = self.read(snapshotSize, self.size - snapshotSize)
+                position = 0
+                while position < len(tail):
+                    kind, key, valueOffset, valueLength, end = self.parseRecord(tail, position, len(tail))
+                    out.write(tail[position:end])
+                    self.applyRecord(index, kind, key, offset + valueOffset - position, valueLength, end - position)
+                    offset += end - position
+                    position = end
+
+            out.flush()
+            os.fsync(out.fileno())
+            out.close()
+            self.file.close()
+            os.rename(compactPath, self.path)
+
+            self.file = open(self.path, 'a+b')
+            self.index = index
+            self.size = offset
+            self.remap()
+
+    ## Função que rodará numa thread para compactar o log sempre que houver registros obsoletos suficientes (ver needsCompaction()).
+    #  @param interval O intervalo, em segundos, entre as verificações.
+    def runCompaction(self, interval = 10.0):
+        while True:
+            time.sleep(interval)
+            if self.needsCompaction():
+                self.compact()
+
+    ## Grava em disco os registros ainda em buffers do sistema operacional.
+    def sync(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    ## Fecha o arquivo de log.
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.map = None
+
+## Trata uma requisição de armazenamento (Put, Get ou Delete) recebida por um peer, e retorna a resposta.
+#
+#  As mensagens são:\n\n
+#
+#  Put|<chave>|<ID da transferência>|<índice do pedaço>|<número de pedaços>|<pedaço do valor>   ->   Stored \n
+#  Get|<chave>|<índice do pedaço>   ->   Value|<índice do pedaço>|<número de pedaços>|<versão>|<pedaço do valor>   ou   NotFound \n
+#  Delete|<chave>   ->   Deleted|<1 caso a chave existisse, 0 caso contrário>
+#
+#  Qualquer uma delas é respondida com NotResponsible caso o peer não seja (mais) o responsável pela chave, o que acontece quando
+#  quem a enviou usou um responsável desatualizado (ver cache.OwnerCache), e com Invalid caso o índice ou o número de pedaços esteja
+#  fora dos limites (no máximo MAX_CHUNKS pedaços de até common.MAX_CHUNK bytes).
+#
+#  Valores maiores do que common.MAX_CHUNK são divididos em pedaços. Os pedaços de um Put são guardados em \c transfers até que
+#  todos cheguem, e só então o valor é gravado. Os pedaços de um Get são lidos um a um, e a versão permite a quem os pede verificar
+#  que todos pertencem ao mesmo valor (ver LogStore.readRange()).
+#
+#  @param store O LogStore do peer.
+#  @param transfers Um dicionário, indexado por (endereço de origem, ID da transferência), contendo tuplas (instante de início,
+#  lista de pedaços) dos valores que ainda estão sendo recebidos.
+#  @param message A requisição, como uma lista de campos.
+#  @param address O endereço de quem enviou a requisição.
+#  @param isResponsible Uma função que recebe uma chave (uma string) e retorna \c True caso o peer seja o responsável por ela.
+#  @return A resposta, como uma lista de campos.
+def handleRequest(store, transfers, message, address, isResponsible):
+    key = str(message[1])
+    if not isResponsible(key):
+        return ['NotResponsible']
+
+    if message[0] == 'Put':
+        transferID, index, count, chunk = int(message[2]), int(message[3]), int(message[4]), str(message[5])
+        if not 0 <= index < count <= MAX_CHUNKS or len(chunk) > common.MAX_CHUNK:
+            return ['Invalid']
+        if count == 1:
+            store.put(key, chunk)
+            return ['Stored']
+
+        now = time.time()
+        if not (address, transferID) in transfers:
+            # descartando transferências abandonadas (ex.: quem enviava o valor saiu da DHT)
+            for transfer in [transfer for transfer, (started, chunks) in transfers.iteritems() if now - started > TRANSFER_TIMEOUT]:
+                del transfers[transfer]
+            transfers[(address, transferID)] = (now, [None] * count)
+
+        chunks = transfers[(address, transferID)][1]
+        if len(chunks) != count:
+            return ['Invalid']
+        chunks[index] = chunk
+        if not None in chunks:
+            del transfers[(address, transferID)]
+            store.put(key, ''.join(chunks))
+        return ['Stored']
+
+    elif message[0] == 'Get':
+        index = int(message[2])
+        if index < 0:
+            return ['Invalid']
+        result = store.readRange(key, index * common.MAX_CHUNK, common.MAX_CHUNK)
+        if result == None:
+            return ['NotFound']
+        chunk, length, version = result
+        count = max(1, (length + common.MAX_CHUNK - 1) // common.MAX_CHUNK)
+        if index >= count:
+            return ['Invalid']
+        return ['Value', index, count, version, chunk]
+
+    else:
+        return ['Deleted', 1 if store.delete(key) else 0]
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## @file wire.py
+#  Codificação das mensagens trocadas entre peers e com o Rendezvous.
+#
+#  Internamente, uma mensagem é uma lista de campos, cujo primeiro elemento é o tipo da mensagem (ex.: ['Search', 42, ('127.0.0.1', 2045), 7, 0]).
+#  Os campos podem ser strings, inteiros não negativos, endereços no formato ('ip', porta) ou \c None.
+#
+#  Existem dois formatos de codificação:
+#
+#  - Texto (o formato original): os campos separados por '|', precedidos por 'True|<id>|' (requisição que espera resposta)
+#    ou 'False|<id>|' (resposta). As mensagens do contato inicial com o Rendezvous (hello, ID e ACK) não têm esse prefixo.
+#    Inteiros são escritos com str() e endereços com repr(). Ao decodificar, todos os campos são strings.
+#  - Binário (versão VERSION): um cabeçalho fixo HEADER (MAGIC, versão, tipo da mensagem, flags, ID da mensagem e número de campos),
+#    seguido por um byte de tag por campo e pelos valores dos campos, empacotados com um único struct.Struct (ver bodyStruct()).
+#    Inteiros ocupam 4 bytes, endereços IPv4 ocupam 6 bytes (IP + porta) e os nomes de NAMES ocupam 1 byte. Dados de tamanho
+#    variável (strings, nomes de host e inteiros fora de [0, 2^32)) têm o seu tamanho no corpo e o seu conteúdo no final da mensagem.
+#    Ao decodificar, os campos já vêm com os seus tipos (int, tupla, ...).
+#
+#  Como os campos de texto precisam ser convertidos (com int() e common.strToAddr()) e os binários já vêm convertidos,
+#  quem trata as mensagens sempre aplica essas conversões, que não fazem nada sobre valores já convertidos.
+
+import socket, struct
+
+## A versão do formato binário.
+VERSION = 1
+
+## O primeiro byte de toda mensagem binária. Não é um caractere ASCII, então não pode ser o início de uma mensagem de texto.
+MAGIC = 0xD7
+
+## MAGIC, como um caractere.
+MAGIC_CHAR = chr(MAGIC)
+
+## O cabeçalho das mensagens binárias: MAGIC, versão, tipo da mensagem (índice em NAMES), flags, ID da mensagem e número de campos.
+HEADER = struct.Struct('!BBBBIH')
+
+## Flag: a mensagem é uma requisição, que espera por uma resposta (equivalente ao prefixo 'True|').
+FLAG_REQUEST = 0x01
+
+## Flag: a mensagem é uma resposta (equivalente ao prefixo 'False|').
+FLAG_REPLY = 0x02
+
+## Identificador do formato de texto.
+TEXT = 0
+
+## Identificador do formato binário.
+BINARY = 1
+
+## Os nomes (tipos de mensagem e nomes de campos) codificados em 1 byte, pelo seu índice. A lista só pode crescer no final.
+NAMES = [None, 'Request', 'Reply', 'Set', 'Setted', 'Ping', 'Pinged', 'Search', 'Searching', 'Found', 'FoundACK', 'Removed', 'Wire',
+         'hello', 'ID', 'ACK', 'root',
+         'address', 'previousID', 'previousAddress', 'previousPreviousAddress', 'nextID', 'nextAddress', 'nextNextAddress',
+         'SearchMany', 'FoundMany', 'Put', 'Stored', 'Get', 'Value', 'NotFound', 'Delete', 'Deleted', 'NotResponsible',
+         'Neighbours', 'NeighbourList', 'Stats', 'StatsReport',
+         'Digest', 'Digests', 'Entries', 'EntryList', 'Fetch', 'Fetched', 'Handoff', 'HandedOff',
+         'Load', 'Loaded', 'Cache', 'Cached', 'Peers', 'PeerList', 'Invalid']
+
+## Os tipos de mensagem que só existem em peers que entendem o formato binário. Como podem carregar dados arbitrários (inclusive '|'),
+#  essas mensagens são sempre codificadas em binário, mesmo antes da negociação do formato terminar.
+BINARY_ONLY = frozenset(['Put', 'Stored', 'Get', 'Value', 'NotFound', 'Delete', 'Deleted', 'NotResponsible',
+                         'Digest', 'Digests', 'Entries', 'EntryList', 'Fetch', 'Fetched', 'Handoff', 'HandedOff', 'Invalid'])
+
+## O índice de cada nome de NAMES.
+NAME_CODES = dict((name, code) for code, name in enumerate(NAMES) if name != None)
+
+TAG_INT = 'i'
+TAG_BIG_INT = 'b'
+TAG_ADDRESS = 'a'
+TAG_HOST_ADDRESS = 'h'
+TAG_NAME = 'n'
+TAG_STRING = 's'
+TAG_NONE = '0'
+
+## O formato (do módulo struct) do valor de cada tag no corpo da mensagem.
+TAG_FORMATS = {TAG_INT: 'I', TAG_BIG_INT: 'H', TAG_ADDRESS: '4sH', TAG_HOST_ADDRESS: 'HH', TAG_NAME: 'B', TAG_STRING: 'H', TAG_NONE: ''}
+
+## Os struct.Struct já criados por bodyStruct(), indexados pela sequência de tags.
+bodyStructs = {}
+
+## Retorna o struct.Struct que empacota os valores de uma sequência de tags.
+#
+#  Como as mensagens de um mesmo tipo costumam ter os mesmos tipos de campos, o Struct é criado uma única vez para cada sequência.
+#
+#  @param tags A sequência de tags (uma string, com um caractere por campo).
+def bodyStruct(tags):
+    body = bodyStructs.get(tags)
+    if body == None:
+        body = struct.Struct('!' + ''.join([TAG_FORMATS[tag] for tag in tags]))
+        bodyStructs[tags] = body
+    return body
+
+## Codifica uma mensagem.
+#
+#  @param fields A lista de campos da mensagem.
+#  @param waitForReply \c True para uma requisição, \c False para uma resposta e \c None para mensagens sem ID (contato inicial com o Rendezvous).
+#  @param messageID O ID da mensagem (ignorado caso \c waitForReply seja \c None).
+#  @param binary \c True para usar o formato binário, e \c False para usar o formato de texto.
+#  @return A mensagem codificada (uma string).
+def encode(fields, waitForReply, messageID, binary):
+    return encodeBinary(fields, waitForReply, messageID) if binary else encodeText(fields, waitForReply, messageID)
+
+## Codifica uma mensagem no formato de texto (ver encode()).
+def encodeText(fields, waitForReply, messageID):
+    text = '|'.join([repr(field) if isinstance(field, tuple) else str(field) for field in fields])
+    if waitForReply == None:
+        return text
+    return ('True|' if waitForReply else 'False|') + str(messageID) + '|' + text
+
+## Codifica uma mensagem no formato binário (ver encode()).
+def encodeBinary(fields, waitForReply, messageID):
+    kind = NAME_CODES.get(fields[0], 0)
+    flags = 0 if waitForReply == None else (FLAG_REQUEST if waitForReply else FLAG_REPLY)
+    tags = []
+    values = []
+    trailer = []
+
+    for field in (fields[1:] if kind != 0 else fields):
+        fieldType = type(field)
+        if fieldType is int or fieldType is long:
+            if 0 <= field <= 0xFFFFFFFF:
+                tags.append(TAG_INT)
+                values.append(field)
+            else:
+                field = str(field)
+                tags.append(TAG_BIG_INT)
+                values.append(len(field))
+                trailer.append(field)
+        elif fieldType is tuple:
+            try:
+                values.append(socket.inet_aton(field[0]))
+                tags.append(TAG_ADDRESS)
+            except socket.error: # não é um IPv4 (ex.: 'localhost')
+                tags.append(TAG_HOST_ADDRESS)
+                values.append(len(field[0]))
+                trailer.append(field[0])
+            values.append(field[1])
+        elif field == None:
+            tags.append(TAG_NONE)
+        elif field in NAME_CODES:
+            tags.append(TAG_NAME)
+            values.append(NAME_CODES[field])
+        else:
+            field = str(field)
+            tags.append(TAG_STRING)
+            values.append(len(field))
+            trailer.append(field)
+
+    tags = ''.join(tags)
+    return HEADER.pack(MAGIC, VERSION, kind, flags, messageID if messageID != None else 0, len(tags)) + tags + bodyStruct(tags).pack(*values) + ''.join(trailer)
+
+## Verifica se uma mensagem recebida está no formato binário.
+#  @param data A mensagem recebida.
+def isBinary(data):
+    return data[:1] == MAGIC_CHAR and len(data) >= HEADER.size
+
+## Decodifica uma mensagem, em qualquer um dos dois formatos.
+#
+#  @param data A mensagem recebida.
+#  @return Uma tupla (waitForReply, messageID, fields), no mesmo formato dos parâmetros de encode().
+#  Para mensagens de texto sem o prefixo 'True|<id>|' ou 'False|<id>|', \c waitForReply e \c messageID são \c None.
+#  @throw ValueError Caso a mensagem esteja mal formada ou use uma versão desconhecida do formato binário.
+def decode(data):
+    return decodeBinary(data) if data[:1] == MAGIC_CHAR and len(data) >= HEADER.size else decodeText(data)
+
+## Decodifica uma mensagem no formato de texto (ver decode()).
+def decodeText(data):
+    fields = data.split('|')
+    if len(fields) >= 3 and fields[0] in ('True', 'False'):
+        return fields[0] == 'True', int(fields[1]), fields[2:]
+    return None, None, fields
+
+## Decodifica uma mensagem no formato binário (ver decode()).
+def decodeBinary(data):
+    try:
+        magic, version, kind, flags, messageID, count = HEADER.unpack_from(data)
+        if version != VERSION or kind >= len(NAMES):
+            raise ValueError('unsupported binary message (version %d, type %d)' % (version, kind))
+
+        offset = HEADER.size + count
+        tags = data[HEADER.size:offset]
+        if count > 0:
+            body = bodyStructs.get(tags) or bodyStruct(tags)
+            values = body.unpack_from(data, offset)
+            offset += body.size
+    except (KeyError, struct.error):
+        raise ValueError('malformed binary message')
+
+    waitForReply = None
+    if flags & (FLAG_REQUEST | FLAG_REPLY):
+        waitForReply = (flags & FLAG_REQUEST) != 0
+    else:
+        messageID = None
+
+    fields = [NAMES[kind]] if kind != 0 else []
+    i = 0
+    for tag in tags:
+        if tag == TAG_INT:
+            fields.append(values[i])
+            i += 1
+        elif tag == TAG_ADDRESS:
+            fields.append((socket.inet_ntoa(values[i]), values[i + 1]))
+            i += 2
+        elif tag == TAG_NAME:
+            fields.append(NAMES[values[i]] if values[i] < len(NAMES) else None)
+            i += 1
+        elif tag == TAG_NONE:
+            fields.append(None)
+        else: # os dados de tamanho variável ficam no final da mensagem
+            length = values[i]
+            value = data[offset:offset + length]
+            offset += length
+            if tag == TAG_BIG_INT:
+                fields.append(int(value))
+            elif tag == TAG_STRING:
+                fields.append(value)
+            else:
+                fields.append((value, values[i + 1]))
+                i += 1
+            i += 1
+
+    if offset != len(data):
+        raise ValueError('malformed binary message')
+    return waitForReply, messageID, fields
+
+## Retorna a representação em texto de uma mensagem (ex.: para ser impressa).
+#  @param fields A lista de campos da mensagem.
+def toText(fields):
+    return encodeText(fields, None, None)